@@ -0,0 +1,220 @@
+# app/cli.py
+"""Lệnh quản trị chạy ngoài web server
+
+Chạy: python -m app.cli <lệnh> [tham số]
+"""
+import argparse
+import asyncio
+import json
+import signal
+import sys
+
+from sqlalchemy import select
+
+from app.database import SessionLocal, engine, init_db
+from app.models import user, activity, activity_best_effort, activity_cell, activity_detail, activity_rollup, activity_stream, email_outbox, personal_record, sync_job, training_load, webhook_event, worker_lease  # noqa: F401 (đăng ký bảng)
+from app.models.activity import Activity
+from app.models.activity_stream import ActivityStream
+from app.services import (
+    best_effort_service, geo_service, import_service, rollup_service, strava_service, stream_service, sync_service,
+    training_load_service
+)
+
+
+async def migrate(args) -> int:
+    """Tạo bảng, cột và index còn thiếu; chạy một lần trước khi khởi động các worker"""
+    await init_db()
+    # Đóng kết nối của event loop này (tiến trình có thể chạy tiếp web server trên loop khác)
+    await engine.dispose()
+    print("Database schema is up to date")
+    return 0
+
+
+async def rebuild_rollups(args) -> int:
+    """Tính lại bảng rollup từ bảng activities"""
+    await init_db()
+    async with SessionLocal() as db:
+        rows = await rollup_service.rebuild(db, args.user_id)
+        await db.commit()
+    print(f"Rebuilt {rows} rollup rows")
+    return 0
+
+
+async def check_rollups(args) -> int:
+    """Kiểm tra rollup khớp với phép tổng hợp từ đầu; mã thoát 1 nếu có khác biệt"""
+    await init_db()
+    async with SessionLocal() as db:
+        mismatches = await rollup_service.check(db, args.user_id)
+    for mismatch in mismatches[:args.limit]:
+        print(json.dumps(mismatch, ensure_ascii=False))
+    print(f"{len(mismatches)} mismatched rollup rows")
+    return 1 if mismatches else 0
+
+
+async def rebuild_geo_index(args) -> int:
+    """Tính lại bảng ô lưới địa lý từ polyline đã lưu (sau khi đổi GEO_CELL_DEGREES)"""
+    await init_db()
+    async with SessionLocal() as db:
+        rows = await geo_service.rebuild(db, args.user_id)
+        await db.commit()
+    print(f"Rebuilt {rows} activity cells")
+    return 0
+
+
+async def rebuild_best_efforts(args) -> int:
+    """Tính best effort cho các hoạt động đã có streams nhưng chưa tính (hoặc tính theo phiên bản cũ), rồi tính lại kỷ lục"""
+    await init_db()
+    computed = 0
+    while True:
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(Activity.id)
+                .where(best_effort_service.outdated(args.user_id), Activity.id.in_(select(ActivityStream.activity_id)))
+                .order_by(Activity.id)
+                .limit(args.batch_size)
+            )
+            activity_ids = list(result.scalars())
+            if not activity_ids:
+                break
+            await stream_service.compute_best_efforts(db, activity_ids)
+            await db.commit()
+        computed += len(activity_ids)
+    async with SessionLocal() as db:
+        records = await best_effort_service.rebuild(db, args.user_id)
+        await db.commit()
+    print(f"Computed best efforts for {computed} activities, {records} personal records")
+    return 0
+
+
+async def check_records(args) -> int:
+    """Kiểm tra bảng kỷ lục khớp với kỷ lục tính lại từ best effort; mã thoát 1 nếu có khác biệt"""
+    await init_db()
+    async with SessionLocal() as db:
+        mismatches = await best_effort_service.check(db, args.user_id)
+    for mismatch in mismatches[:args.limit]:
+        print(json.dumps(mismatch, ensure_ascii=False, default=str))
+    print(f"{len(mismatches)} mismatched personal records")
+    return 1 if mismatches else 0
+
+
+async def rebuild_training_load(args) -> int:
+    """Tính lại từ đầu chuỗi tải tập luyện (sau khi đổi các cài đặt TRAINING_*)"""
+    await init_db()
+    async with SessionLocal() as db:
+        users = await training_load_service.rebuild(db, args.user_id)
+        await db.commit()
+    print(f"Rebuilt training load for {users} users")
+    return 0
+
+
+async def check_training_load(args) -> int:
+    """Kiểm tra chuỗi tải tập luyện (tính tăng dần) khớp với tính lại từ đầu; mã thoát 1 nếu có khác biệt"""
+    await init_db()
+    async with SessionLocal() as db:
+        mismatches = await training_load_service.check(db, args.user_id)
+    for mismatch in mismatches[:args.limit]:
+        print(json.dumps(mismatch, ensure_ascii=False))
+    print(f"{len(mismatches)} mismatched training load series")
+    return 1 if mismatches else 0
+
+
+async def import_archive(args) -> int:
+    """Nhập file ZIP export của Strava cho một người dùng; in báo cáo dạng JSON"""
+    await init_db()
+    import_service.start_pool(args.workers)
+    try:
+        with open(args.path, "rb") as source:
+            report = await import_service.import_archive(source, args.user_id)
+    finally:
+        await import_service.shutdown_pool()
+    print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+    return 0
+
+
+async def sync_worker(args) -> int:
+    """Chạy worker đồng bộ định kỳ như một tiến trình riêng (có thể chạy nhiều tiến trình)"""
+    await init_db()
+    strava_service.start_client()
+    try:
+        if args.once:
+            cycle = await sync_service.run_cycle(args.worker_id)
+            print(json.dumps(cycle.to_dict()))
+            return 1 if cycle.failed else 0
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await sync_service.run_sync_worker(stop, args.worker_id)
+        return 0
+    finally:
+        await strava_service.close_client()
+
+
+async def sync_status(args) -> int:
+    """In trạng thái hàng đợi đồng bộ và các chu kỳ gần nhất"""
+    await init_db()
+    async with SessionLocal() as db:
+        status = await sync_service.get_status(db)
+    print(json.dumps(status))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("migrate", help="tạo bảng, cột và index còn thiếu")
+    command.set_defaults(handler=migrate)
+
+    command = commands.add_parser("rebuild-rollups", help="tính lại bảng tổng hợp tuần/tháng/năm")
+    command.add_argument("--user-id", type=int, default=None)
+    command.set_defaults(handler=rebuild_rollups)
+
+    command = commands.add_parser("check-rollups", help="so sánh bảng tổng hợp với dữ liệu gốc")
+    command.add_argument("--user-id", type=int, default=None)
+    command.add_argument("--limit", type=int, default=20, help="số khác biệt tối đa được in ra")
+    command.set_defaults(handler=check_rollups)
+
+    command = commands.add_parser("rebuild-geo-index", help="tính lại ô lưới địa lý từ polyline của hoạt động")
+    command.add_argument("--user-id", type=int, default=None)
+    command.set_defaults(handler=rebuild_geo_index)
+
+    command = commands.add_parser("rebuild-best-efforts", help="tính best effort từ streams đã lưu và tính lại kỷ lục")
+    command.add_argument("--user-id", type=int, default=None)
+    command.add_argument("--batch-size", type=int, default=200)
+    command.set_defaults(handler=rebuild_best_efforts)
+
+    command = commands.add_parser("check-records", help="so sánh bảng kỷ lục cá nhân với best effort")
+    command.add_argument("--user-id", type=int, default=None)
+    command.add_argument("--limit", type=int, default=20, help="số khác biệt tối đa được in ra")
+    command.set_defaults(handler=check_records)
+
+    command = commands.add_parser("rebuild-training-load", help="tính lại chuỗi tải tập luyện (CTL/ATL/TSB)")
+    command.add_argument("--user-id", type=int, default=None)
+    command.set_defaults(handler=rebuild_training_load)
+
+    command = commands.add_parser("check-training-load", help="so sánh chuỗi tải tập luyện với tính lại từ đầu")
+    command.add_argument("--user-id", type=int, default=None)
+    command.add_argument("--limit", type=int, default=20, help="số khác biệt tối đa được in ra")
+    command.set_defaults(handler=check_training_load)
+
+    command = commands.add_parser("import-archive", help="nhập file ZIP export tài khoản Strava")
+    command.add_argument("--user-id", type=int, required=True)
+    command.add_argument("--workers", type=int, default=None, help="số tiến trình parse file")
+    command.add_argument("path")
+    command.set_defaults(handler=import_archive)
+
+    command = commands.add_parser("sync-worker", help="đồng bộ định kỳ mọi người dùng đã liên kết Strava")
+    command.add_argument("--worker-id", default=None, help="mặc định: hostname:pid")
+    command.add_argument("--once", action="store_true", help="chạy một chu kỳ rồi thoát")
+    command.set_defaults(handler=sync_worker)
+
+    command = commands.add_parser("sync-status", help="trạng thái hàng đợi đồng bộ")
+    command.set_defaults(handler=sync_status)
+
+    args = parser.parse_args(argv)
+    return asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,17 +8,155 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # Cài đặt máy chủ (python -m app.server)
+    DEBUG: bool = False
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WORKERS: int = 1  # số tiến trình worker uvicorn
+    SERVER_LOOP: str = "auto"  # "auto" (uvloop nếu đã cài), "uvloop" hoặc "asyncio"
+    SERVER_HTTP: str = "auto"  # "auto" (httptools nếu đã cài), "httptools" hoặc "h11"
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE: int = 5  # giây giữ kết nối keep-alive rảnh
+    SERVER_ACCESS_LOG: bool = False
+    MIGRATE_ON_STARTUP: bool = True  # app.server tắt cờ này cho worker sau khi đã migrate một lần
+    WORKER_LEASE_SECONDS: int = 60  # lease của tác vụ nền chỉ chạy ở một tiến trình
+
+    # Cài đặt băm mật khẩu (bcrypt chạy trong pool riêng, ngoài event loop)
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_EXECUTOR: str = "thread"  # "thread" hoặc "process"
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    # Cache principal đã xác thực (theo token)
+    PRINCIPAL_CACHE_TTL: int = 60
+    PRINCIPAL_CACHE_SIZE: int = 10000
+
+    # Metric Prometheus tại /metrics (middleware, truy vấn DB, Strava, bcrypt)
+    METRICS_ENABLED: bool = True
+
+    # Cài đặt cơ sở dữ liệu
+    DATABASE_URL: str = "sqlite+aiosqlite:///./strava_app.db"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+
     # Cài đặt Email
     EMAIL_FROM: str = "your-email@example.com"
     EMAIL_USERNAME: str = "your-email@example.com"
     EMAIL_PASSWORD: str = "your-email-password"
     SMTP_SERVER: str = "smtp.gmail.com"
     SMTP_PORT: int = 587
+    SMTP_STARTTLS: bool = True
+    SMTP_TIMEOUT: float = 30.0
+
+    # Cài đặt gửi email nền: outbox trong DB, worker gửi theo lô qua pool kết nối SMTP dùng lại
+    EMAIL_WORKER_ENABLED: bool = True
+    SMTP_POOL_SIZE: int = 2
+    SMTP_IDLE_TIMEOUT: float = 60.0  # kết nối rảnh lâu hơn được kiểm tra bằng NOOP trước khi dùng
+    EMAIL_BATCH_SIZE: int = 100
+    EMAIL_POLL_INTERVAL: float = 5.0
+    EMAIL_LEASE_SECONDS: int = 300  # lô chưa gửi xong sau thời gian này được worker khác nhận lại
+    EMAIL_MAX_ATTEMPTS: int = 6
+    EMAIL_RETRY_DELAY: int = 30  # backoff: 30s, 60s, 120s... tối đa EMAIL_RETRY_MAX_DELAY
+    EMAIL_RETRY_MAX_DELAY: int = 3600
 
     # Cài đặt Strava
     STRAVA_CLIENT_ID: str = ""
     STRAVA_CLIENT_SECRET: str = ""
     STRAVA_REDIRECT_URI = "http://localhost:8000"
+    STRAVA_BASE_URL: str = "https://www.strava.com"
+
+    # Cài đặt HTTP client dùng chung cho Strava
+    STRAVA_HTTP_MAX_CONNECTIONS: int = 100
+    STRAVA_HTTP_MAX_KEEPALIVE: int = 20
+    STRAVA_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    STRAVA_HTTP_TIMEOUT: float = 10.0
+    STRAVA_HTTP2: bool = False
+
+    # Cài đặt bộ lập lịch request theo hạn mức (rate limit) của Strava
+    STRAVA_MAX_CONCURRENCY: int = 20
+    STRAVA_BACKGROUND_RESERVE: float = 0.2  # phần hạn mức 15 phút dành cho request của người dùng
+    STRAVA_MAX_RETRIES: int = 3
+    STRAVA_BACKOFF_BASE: float = 0.5
+    STRAVA_BACKOFF_MAX: float = 30.0
+    STRAVA_INTERACTIVE_MAX_WAIT: float = 5.0  # quá thời gian này request của người dùng nhận 429
+
+    # Cài đặt làm mới token Strava. Strava chỉ cấp token mới khi token cũ còn
+    # dưới 1 giờ, nên tác vụ nền làm mới ở mốc đó; request chỉ tự làm mới khi
+    # token gần như hết hạn.
+    TOKEN_REFRESHER_ENABLED: bool = True
+    TOKEN_REFRESH_INTERVAL: float = 60.0
+    TOKEN_REFRESH_AHEAD: int = 3600
+    TOKEN_REFRESH_INLINE_MARGIN: int = 600
+    TOKEN_REFRESH_BATCH: int = 100
+    TOKEN_REFRESH_CONCURRENCY: int = 5
+
+    # Cài đặt webhook (push subscription) của Strava
+    STRAVA_WEBHOOK_VERIFY_TOKEN: str = "STRAVA"
+    STRAVA_WEBHOOK_SUBSCRIPTION_ID: int = 0  # 0: không kiểm tra subscription_id
+    WEBHOOK_WORKER_ENABLED: bool = True
+    WEBHOOK_BATCH_SIZE: int = 100
+    WEBHOOK_POLL_INTERVAL: float = 5.0
+    WEBHOOK_MAX_ATTEMPTS: int = 5
+    WEBHOOK_RETRY_DELAY: int = 30
+    WEBHOOK_FETCH_CONCURRENCY: int = 5
+
+    # Cài đặt đọc hoạt động: trong cửa sổ này (giây) kể từ lần đồng bộ gần nhất,
+    # request trả lời từ DB mà không gọi Strava; 0 để luôn đồng bộ
+    ACTIVITY_FRESHNESS_SECONDS: int = 60
+
+    # Cài đặt cache chi tiết hoạt động (/activities/{id}/details): bảng activity_details trong DB,
+    # phía trước là LRU trong từng tiến trình. Chi tiết cũ hơn ACTIVITY_DETAIL_MAX_AGE giây hoặc
+    # đã bị đánh dấu (hoạt động thay đổi) vẫn được trả về ngay, rồi tải lại nền từ Strava
+    ACTIVITY_DETAIL_MAX_AGE: int = 7 * 24 * 3600  # 0: chỉ tải lại khi hoạt động thay đổi
+    ACTIVITY_DETAIL_CACHE_SIZE: int = 2000
+    ACTIVITY_DETAIL_CACHE_TTL: int = 60  # thay đổi ghi ở tiến trình khác có hiệu lực sau tối đa chừng này giây
+    ACTIVITY_DETAIL_RETRY_DELAY: int = 60  # không thử tải lại cùng hoạt động sớm hơn sau một lần lỗi
+
+    # Cài đặt danh sách lịch sử và xuất dữ liệu hoạt động
+    HISTORY_PAGE_SIZE: int = 50
+    EXPORT_BATCH_SIZE: int = 1000  # số dòng đọc mỗi lần từ cursor phía server
+
+    # Cài đặt chỉ mục địa lý: kích thước ô lưới (độ) phủ polyline của hoạt động;
+    # đổi giá trị thì chạy lại `python -m app.cli rebuild-geo-index`
+    GEO_CELL_DEGREES: float = 0.005
+    GEO_MAX_RADIUS: int = 50_000  # bán kính tối đa (mét) của /activities/near
+
+    # Cài đặt tải tập luyện (CTL/ATL/TSB): tải theo công suất so với FTP, theo nhịp tim
+    # (TRIMP) hoặc theo moving_time; đổi giá trị thì chạy lại `python -m app.cli rebuild-training-load`
+    TRAINING_FTP: float = 250.0
+    TRAINING_MAX_HEARTRATE: float = 190.0
+    TRAINING_REST_HEARTRATE: float = 60.0
+    TRAINING_LOAD_PER_HOUR: float = 50.0  # tải mỗi giờ khi không có công suất và nhịp tim
+    TRAINING_CTL_DAYS: int = 42  # hằng số thời gian (ngày) của fitness
+    TRAINING_ATL_DAYS: int = 7  # hằng số thời gian (ngày) của fatigue
+    TRAINING_LOAD_MAX_DAYS: int = 3660  # số ngày tối đa mỗi request /activities/training-load
+
+    # Cài đặt nhập file export (ZIP) của Strava
+    IMPORT_WORKERS: int = 4  # số tiến trình parse GPX/TCX/FIT
+    IMPORT_MAX_IN_FLIGHT: int = 16  # số file đang đọc/parse cùng lúc (giới hạn bộ nhớ)
+    IMPORT_BATCH_SIZE: int = 100  # số hoạt động mỗi lần ghi DB
+
+    # Cài đặt đồng bộ lịch sử hoạt động (backfill)
+    BACKFILL_PER_PAGE: int = 200
+    BACKFILL_CONCURRENCY: int = 8
+    # Lease backfill (lưu trên strava_sync_jobs) được gia hạn sau mỗi cửa sổ trang; đủ dài để
+    # chờ hết cửa sổ hạn mức 15 phút của Strava mà worker khác không nhận lại
+    BACKFILL_LEASE_SECONDS: int = 900
+
+    # Cài đặt worker đồng bộ định kỳ mọi người dùng đã liên kết Strava (trong lifespan
+    # hoặc tiến trình riêng `python -m app.cli sync-worker`); job nhận theo lease
+    SYNC_WORKER_ENABLED: bool = True
+    SYNC_INTERVAL: int = 3600
+    SYNC_JITTER: float = 0.1  # dao động ±10% của SYNC_INTERVAL
+    SYNC_POLL_INTERVAL: float = 30.0
+    SYNC_BATCH_SIZE: int = 50  # số job nhận mỗi chu kỳ
+    SYNC_CONCURRENCY: int = 4  # số người dùng đồng bộ cùng lúc trong một worker
+    SYNC_LEASE_SECONDS: int = 300
+    SYNC_RETRY_DELAY: int = 60  # backoff khi lỗi: 60s, 120s... tối đa SYNC_RETRY_MAX_DELAY
+    SYNC_RETRY_MAX_DELAY: int = 6 * 3600
+    SYNC_STREAMS_PER_RUN: int = 20  # số hoạt động chưa có streams được tải (kèm best effort) sau mỗi lần đồng bộ
 
 
     class Config:
@@ -1,21 +1,55 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import auth, strava, activities
-from app.database import engine
-from app.models import user, activity
-import uvicorn
-import traceback
+from contextlib import asynccontextmanager
+import asyncio
+from app.routes import auth, strava, activities, webhook, metrics
+from app.config import settings
+from app.database import engine, init_db
+from app.models import user, activity, activity_best_effort, activity_cell, activity_detail, activity_rollup, activity_stream, email_outbox, personal_record, sync_job, training_load, webhook_event, worker_lease
+from app.services import email_service, import_service, strava_service, sync_service, webhook_service
+from app.utils.instrumentation import MetricsMiddleware, instrument_engine
+from app.utils.security import shutdown_hash_executor
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tạo bảng trong DB (app.server đã migrate một lần trước khi khởi động các worker)
+    if settings.MIGRATE_ON_STARTUP:
+        await init_db()
+
+    # Khởi tạo HTTP client dùng chung cho các lời gọi Strava
+    strava_service.start_client()
+    # Pool tiến trình parse file nhập (tạo trước khi có request)
+    import_service.start_pool()
+
+    # Các tác vụ nền
+    stop = asyncio.Event()
+    tasks = []
+    if settings.TOKEN_REFRESHER_ENABLED:
+        tasks.append(asyncio.create_task(strava_service.run_token_refresher(stop)))
+    if settings.WEBHOOK_WORKER_ENABLED:
+        tasks.append(asyncio.create_task(webhook_service.run_webhook_worker(stop)))
+    if settings.EMAIL_WORKER_ENABLED:
+        tasks.append(asyncio.create_task(email_service.run_email_worker(stop)))
+    if settings.SYNC_WORKER_ENABLED:
+        tasks.append(asyncio.create_task(sync_service.run_sync_worker(stop)))
+
+    yield
+
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await strava_service.close_client()
+    await import_service.shutdown_pool()
+    shutdown_hash_executor()
 
-# Tạo bảng trong DB
-user.Base.metadata.create_all(bind=engine)
-activity.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="Strava Integration API",
     description="API backend cho ứng dụng tích hợp với Strava",
     version="1.0.0",
-    debug=True  # Bật chế độ debug
+    debug=settings.DEBUG,
+    lifespan=lifespan
 )
 
 # Cấu hình CORS
@@ -30,10 +64,18 @@ app.add_middleware(
 app.include_router(auth.router)
 app.include_router(strava.router)
 app.include_router(activities.router)
+app.include_router(webhook.router)
+
+# Đo độ trễ theo route, truy vấn DB và xuất tại /metrics (middleware ngoài cùng)
+if settings.METRICS_ENABLED:
+    instrument_engine(engine.sync_engine)
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics.router)
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to Strava Integration API"}
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    from app.server import main
+    main()
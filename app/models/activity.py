@@ -1,11 +1,21 @@
 # app/models/activity.py
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, Text
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 
 class Activity(Base):
     __tablename__ = "activities"
+    __table_args__ = (
+        # Lọc theo khoảng thời gian của một người dùng: user_id = ? AND start_date BETWEEN ? AND ?
+        Index("ix_activities_user_start", "user_id", "start_date"),
+        # Danh sách lọc theo loại: so khớp bằng trên type trước khoảng start_date. Index chỉ
+        # phục vụ phần lọc và sắp xếp (start_date, id); các cột của danh sách vẫn đọc từ bảng theo rowid
+        Index("ix_activities_user_type_start", "user_id", "type", "start_date"),
+        # Tìm hoạt động bắt đầu gần một điểm: user_id = ? AND start_lat BETWEEN ? AND ?,
+        # start_lng được lọc ngay trên index
+        Index("ix_activities_user_start_latlng", "user_id", "start_lat", "start_lng"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     strava_id = Column(String, unique=True, index=True)
@@ -19,5 +29,13 @@ class Activity(Base):
     total_elevation_gain = Column(Float)
     average_speed = Column(Float)
     max_speed = Column(Float)
+    average_heartrate = Column(Float)
+    average_watts = Column(Float)
+    start_lat = Column(Float)
+    start_lng = Column(Float)
+    end_lat = Column(Float)
+    end_lng = Column(Float)
+    summary_polyline = Column(Text)
+    best_efforts_version = Column(Integer)  # phiên bản định nghĩa mốc khi tính best effort; NULL nếu chưa tính
 
     user = relationship("User", back_populates="activities")
\ No newline at end of file
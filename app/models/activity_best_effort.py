@@ -0,0 +1,22 @@
+# app/models/activity_best_effort.py
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index
+from app.database import Base
+
+
+class ActivityBestEffort(Base):
+    """Thành tích tốt nhất của một hoạt động cho mỗi mốc (1k, 5k... thời gian; 5min, 20min... công suất)
+
+    Tính từ streams khi streams được lưu (xem best_effort_service).
+    """
+    __tablename__ = "activity_best_efforts"
+    __table_args__ = (
+        # Tính lại kỷ lục của một người dùng cho một mốc
+        Index("ix_activity_best_efforts_user_effort", "user_id", "effort", "value"),
+    )
+
+    activity_id = Column(Integer, ForeignKey("activities.id"), primary_key=True)
+    effort = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    value = Column(Float)  # giây (mốc quãng đường) hoặc watt trung bình (mốc thời gian)
+    start_offset = Column(Integer)  # giây tính từ đầu hoạt động
+    end_offset = Column(Integer)
@@ -0,0 +1,21 @@
+# app/models/activity_cell.py
+from sqlalchemy import Column, Integer, ForeignKey, Index
+from app.database import Base
+
+
+class ActivityCell(Base):
+    """Các ô lưới (GEO_CELL_DEGREES độ) mà polyline của một hoạt động đi qua
+
+    Được ghi lại mỗi khi polyline thay đổi (xem geo_service); truy vấn trùng
+    tuyến đường chỉ đọc bảng này, không giải mã polyline.
+    """
+    __tablename__ = "activity_cells"
+    __table_args__ = (
+        # Xóa và đếm số ô theo hoạt động
+        Index("ix_activity_cells_activity", "activity_id"),
+    )
+
+    # Khóa chính (user_id, cell, activity_id) là index phủ cho user_id = ? AND cell IN (...)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    cell = Column(Integer, primary_key=True)
+    activity_id = Column(Integer, ForeignKey("activities.id"), primary_key=True)
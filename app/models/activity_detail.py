@@ -0,0 +1,17 @@
+# app/models/activity_detail.py
+from sqlalchemy import Boolean, Column, Integer, LargeBinary, ForeignKey
+from app.database import Base
+
+
+class ActivityDetail(Base):
+    """Chi tiết hoạt động lấy từ Strava (/activities/{id}: mô tả, gear, lap, split, segment effort...)
+
+    Lưu JSON nén zlib; stale được bật khi hoạt động thay đổi và chi tiết cần được tải lại
+    (bản cũ vẫn được trả về trong lúc tải lại, xem detail_service).
+    """
+    __tablename__ = "activity_details"
+
+    activity_id = Column(Integer, ForeignKey("activities.id"), primary_key=True)
+    data = Column(LargeBinary)  # zlib(JSON)
+    fetched_at = Column(Integer)  # epoch lúc tải từ Strava
+    stale = Column(Boolean, nullable=False, default=False)
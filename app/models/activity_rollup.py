@@ -0,0 +1,20 @@
+# app/models/activity_rollup.py
+from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from app.database import Base
+
+
+class ActivityRollup(Base):
+    """Tổng hợp hoạt động theo người dùng, kỳ (tuần/tháng/năm) và loại hoạt động
+
+    Được cập nhật tăng dần mỗi khi hoạt động được ghi hoặc xóa (xem rollup_service).
+    """
+    __tablename__ = "activity_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    period = Column(String, primary_key=True)  # week, month, year
+    period_start = Column(String, primary_key=True)  # ngày bắt đầu kỳ (YYYY-MM-DD, UTC; tuần bắt đầu từ thứ Hai)
+    type = Column(String, primary_key=True)
+    count = Column(Integer, default=0)
+    distance = Column(Float, default=0.0)
+    moving_time = Column(Integer, default=0)
+    total_elevation_gain = Column(Float, default=0.0)
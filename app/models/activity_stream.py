@@ -0,0 +1,14 @@
+# app/models/activity_stream.py
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey
+from app.database import Base
+
+
+class ActivityStream(Base):
+    """Một kênh dữ liệu chuỗi thời gian của hoạt động, lưu thành mảng kiểu cố định nén zlib"""
+    __tablename__ = "activity_streams"
+
+    activity_id = Column(Integer, ForeignKey("activities.id"), primary_key=True)
+    channel = Column(String, primary_key=True)  # time, distance, latlng, altitude, heartrate, cadence, watts
+    dtype = Column(String)  # kiểu phần tử NumPy, ví dụ "<i4"
+    length = Column(Integer)  # số điểm
+    data = Column(LargeBinary)  # zlib(mảng đã đóng gói)
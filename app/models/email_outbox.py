@@ -0,0 +1,25 @@
+# app/models/email_outbox.py
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class EmailOutbox(Base):
+    """Email chờ gửi, lưu bền vững để worker nền gửi theo lô qua kết nối SMTP dùng lại"""
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_available", "status", "available_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    text_body = Column(Text, nullable=False)
+    html_body = Column(Text, nullable=True)
+    status = Column(String, default="pending")  # pending, sent, failed
+    attempts = Column(Integer, default=0)
+    available_at = Column(Integer, default=0)  # epoch; thời điểm được gửi (thử lại) hoặc hết hạn lease
+    claim_token = Column(String, nullable=True, index=True)  # lô của worker đang gửi
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(Integer, nullable=True)
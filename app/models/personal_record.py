@@ -0,0 +1,21 @@
+# app/models/personal_record.py
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from app.database import Base
+
+
+class PersonalRecord(Base):
+    """Kỷ lục cá nhân theo người dùng, loại hoạt động và mốc
+
+    Được cập nhật tăng dần khi best effort của hoạt động thay đổi (xem best_effort_service).
+    Bằng nhau thì hoạt động sớm hơn giữ kỷ lục.
+    """
+    __tablename__ = "personal_records"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    type = Column(String, primary_key=True)
+    effort = Column(String, primary_key=True)
+    activity_id = Column(Integer, ForeignKey("activities.id"))
+    value = Column(Float)
+    start_date = Column(DateTime)  # start_date của hoạt động giữ kỷ lục
+    start_offset = Column(Integer)
+    end_offset = Column(Integer)
@@ -0,0 +1,28 @@
+# app/models/sync_job.py
+from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from app.database import Base
+
+
+class SyncJob(Base):
+    """Lịch đồng bộ định kỳ với Strava của một người dùng, nhận theo lease bởi các worker"""
+    __tablename__ = "strava_sync_jobs"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    next_run_at = Column(Integer, default=0, index=True)  # epoch; thời điểm đến hạn đồng bộ
+    last_run_at = Column(Integer, nullable=True)
+    last_success_at = Column(Integer, nullable=True)
+    last_duration = Column(Float, nullable=True)  # giây
+    failures = Column(Integer, default=0)  # số lần lỗi liên tiếp (quyết định backoff)
+    last_error = Column(String, nullable=True)
+    lease_owner = Column(String, nullable=True)  # worker đang giữ job
+    lease_expires_at = Column(Integer, nullable=True)
+
+    # Backfill (POST /strava/sync hoặc worker đồng bộ): lease riêng để mọi tiến trình thấy
+    # cùng một tiến độ và không chạy hai backfill cho một người dùng
+    backfill_owner = Column(String, nullable=True)
+    backfill_expires_at = Column(Integer, nullable=True)
+    backfill_pages = Column(Integer, nullable=True)
+    backfill_activities = Column(Integer, nullable=True)
+    backfill_started_at = Column(Float, nullable=True)
+    backfill_finished_at = Column(Float, nullable=True)
+    backfill_error = Column(String, nullable=True)
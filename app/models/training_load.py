@@ -0,0 +1,23 @@
+# app/models/training_load.py
+from sqlalchemy import Column, Integer, Date, ForeignKey, LargeBinary
+from app.database import Base
+
+
+class TrainingLoad(Base):
+    """Chuỗi tải tập luyện theo ngày (UTC) của một người dùng: tải, CTL và ATL từ start_day
+
+    Mỗi chuỗi là một mảng float64 nén zlib, phần tử i ứng với ngày start_day + i.
+    Khi hoạt động được thêm, sửa hoặc xóa, dirty_from lùi về ngày sớm nhất bị ảnh
+    hưởng và version tăng, rồi chuỗi được tính lại từ dirty_from trở đi ngay trong
+    transaction đó (xem training_load_service).
+    """
+    __tablename__ = "training_loads"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    start_day = Column(Date)  # ngày của phần tử đầu tiên; NULL nếu chưa tính
+    days = Column(Integer, nullable=False, default=0)
+    loads = Column(LargeBinary)
+    ctl = Column(LargeBinary)
+    atl = Column(LargeBinary)
+    dirty_from = Column(Date)  # NULL: chuỗi đã khớp với bảng activities
+    version = Column(Integer, nullable=False, default=0)
@@ -13,9 +13,12 @@ class User(Base):
     hashed_password = Column(String)
     is_active = Column(Boolean, default=False)
     is_verified = Column(Boolean, default=False)
+    strava_athlete_id = Column(Integer, nullable=True, index=True)
     strava_access_token = Column(String, nullable=True)
     strava_refresh_token = Column(String, nullable=True)
     strava_token_expires_at = Column(Integer, nullable=True)
+    strava_sync_watermark = Column(Integer, nullable=True)  # start_date (epoch) mới nhất đã đồng bộ
+    last_synced_at = Column(Integer, nullable=True)  # thời điểm (epoch) đồng bộ gần nhất với Strava
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     verification_code = Column(String, nullable=True)
 
@@ -0,0 +1,22 @@
+# app/models/webhook_event.py
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class WebhookEvent(Base):
+    """Sự kiện push subscription của Strava, lưu bền vững để worker xử lý theo lô"""
+    __tablename__ = "strava_webhook_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    object_type = Column(String)  # "activity" hoặc "athlete"
+    object_id = Column(BigInteger)
+    aspect_type = Column(String)  # "create", "update" hoặc "delete"
+    owner_id = Column(BigInteger)
+    updates = Column(Text, nullable=True)  # JSON
+    event_time = Column(Integer)
+    status = Column(String, default="pending", index=True)  # pending, done, failed
+    attempts = Column(Integer, default=0)
+    available_at = Column(Integer, default=0)  # epoch; thời điểm được thử lại sau lỗi
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
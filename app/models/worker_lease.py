@@ -0,0 +1,12 @@
+# app/models/worker_lease.py
+from sqlalchemy import Column, Integer, String
+from app.database import Base
+
+
+class WorkerLease(Base):
+    """Lease của tác vụ nền chỉ được chạy ở một tiến trình tại một thời điểm (webhook, làm mới token)"""
+    __tablename__ = "worker_leases"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)  # hostname:pid của tiến trình đang giữ lease
+    expires_at = Column(Integer, nullable=False)  # epoch
@@ -1,11 +1,18 @@
 # app/routes/activities.py
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import date, datetime, timedelta
+from app.config import settings
 from app.database import get_db
-from app.services import auth_service, strava_service
-from app.models.user import User
+from app.services import (
+    auth_service, activity_service, best_effort_service, detail_service, export_service, geo_service, import_service,
+    rollup_service, stream_service, training_load_service
+)
 from app.models.activity import Activity
+from app.utils import serialization
+from app.utils.etag import compute_etag, etag_matches
 from typing import List, Optional
 from pydantic import BaseModel
 
@@ -29,79 +36,372 @@ class ActivityResponse(BaseModel):
         orm_mode = True
 
 
-@router.get("/today", response_model=List[ActivityResponse])
-async def get_today_activities(
-        current_user: User = Depends(auth_service.get_current_user),
-        db: Session = Depends(get_db)
-):
-    """Lấy các hoạt động trong ngày hiện tại"""
-    if not current_user.strava_access_token:
-        raise HTTPException(status_code=400, detail="No Strava account linked")
+class HistoryPage(BaseModel):
+    items: List[ActivityResponse]
+    next_cursor: Optional[str]
+
+
+class NearbyActivityResponse(ActivityResponse):
+    start_lat: float
+    start_lng: float
+    distance_from_point: float  # mét
+
+
+class OverlappingActivityResponse(ActivityResponse):
+    overlap: float  # tỷ lệ tuyến đã cho mà hoạt động đi qua
+    activity_overlap: float  # tỷ lệ tuyến của hoạt động nằm dọc tuyến đã cho
+
+
+class BestEffortResponse(BaseModel):
+    effort: str
+    distance: Optional[float]  # mốc quãng đường (mét)
+    elapsed_time: Optional[float]  # giây
+    duration: Optional[int]  # mốc thời gian (giây)
+    average_watts: Optional[float]
+    start_offset: int  # giây tính từ đầu hoạt động
+    end_offset: int
+
+
+class ActivityBestEffortResponse(BestEffortResponse):
+    personal_record: bool
+
+
+class PersonalRecordResponse(BestEffortResponse):
+    type: str
+    activity_id: int
+    start_date: datetime
+
+
+class TrainingLoadResponse(BaseModel):
+    date: date
+    load: float  # tải của các hoạt động trong ngày
+    ctl: float  # fitness: trung bình lũy thừa của tải, hằng số TRAINING_CTL_DAYS ngày
+    atl: float  # fatigue: hằng số TRAINING_ATL_DAYS ngày
+    tsb: float  # form: CTL - ATL của ngày hôm trước
+
+
+class SummaryResponse(BaseModel):
+    period: str
+    period_start: date
+    type: str
+    count: int
+    distance: float
+    moving_time: int
+    total_elevation_gain: float
 
-    # Kiểm tra và làm mới token nếu cần
-    current_user = await strava_service.check_and_refresh_token(current_user, db)
+    class Config:
+        orm_mode = True
 
-    # Lấy hoạt động từ Strava
+
+async def _list_activities(
+        accept: Optional[str],
+        if_none_match: Optional[str],
+        current_user: auth_service.CurrentUser,
+        db: AsyncSession,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        activity_type: Optional[str] = None,
+        limit: Optional[int] = None
+):
     today = date.today()
     today_start = datetime.combine(today, datetime.min.time())
-    today_end = datetime.combine(today, datetime.max.time())
 
     try:
-        # Lấy và lưu hoạt động mới từ Strava
-        activities = await strava_service.get_activities(
-            current_user.strava_access_token,
-            after=int(today_start.timestamp())
-        )
-
-        # Lưu các hoạt động vào DB nếu chưa tồn tại
-        for activity_data in activities:
-            existing = db.query(Activity).filter(
-                Activity.strava_id == str(activity_data["id"])
-            ).first()
-
-            if not existing:
-                new_activity = Activity(
-                    strava_id=str(activity_data["id"]),
-                    user_id=current_user.id,
-                    name=activity_data["name"],
-                    type=activity_data["type"],
-                    start_date=datetime.fromisoformat(activity_data["start_date"].replace("Z", "+00:00")),
-                    distance=activity_data["distance"],
-                    moving_time=activity_data["moving_time"],
-                    elapsed_time=activity_data["elapsed_time"],
-                    total_elevation_gain=activity_data["total_elevation_gain"],
-                    average_speed=activity_data["average_speed"],
-                    max_speed=activity_data["max_speed"]
-                )
-                db.add(new_activity)
-
-        db.commit()
-
-        # Truy vấn các hoạt động trong ngày từ DB
-        today_activities = db.query(Activity).filter(
-            Activity.user_id == current_user.id,
-            Activity.start_date >= today_start,
-            Activity.start_date <= today_end
-        ).all()
-
-        return today_activities
+        # Lấy và lưu hoạt động mới từ Strava nếu khoảng ngày gồm hôm nay và dữ liệu trong DB đã cũ
+        covers_today = (start is None or start <= today) and (end is None or end >= today)
+        if covers_today and current_user.strava_access_token and not activity_service.is_fresh(current_user):
+            # Trả kết nối của request về pool trong lúc chờ lần đồng bộ (dùng session riêng)
+            await db.close()
+            await activity_service.sync_recent_activities(current_user.id, after=int(today_start.timestamp()))
+
+        # Truy vấn các hoạt động trong khoảng ngày từ DB (chỉ các cột trả về)
+        result = await db.execute(activity_service.as_rows(
+            activity_service.range_query(current_user.id, start, end, activity_type, limit)
+        ))
+        rows = result.all()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch activities: {str(e)}")
 
+    media_type = serialization.negotiate(accept)
+    etag = serialization.variant_etag(compute_etag(tuple(row) for row in rows), media_type)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={**headers, "Vary": "Accept"})
+
+    return serialization.render(
+        serialization.rows_to_dicts(activity_service.EXPORT_COLUMNS, rows), media_type, headers=headers
+    )
+
+
+@router.get("", response_model=List[ActivityResponse])
+async def list_activities(
+        start: Optional[date] = Query(None, alias="from"),
+        end: Optional[date] = Query(None, alias="to"),
+        activity_type: Optional[str] = Query(None, alias="type"),
+        limit: int = Query(1000, ge=1, le=5000),
+        accept: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Lấy các hoạt động trong khoảng ngày from..to (gồm cả hai đầu), có thể lọc theo loại
+
+    Khi khoảng ngày gồm hôm nay, chỉ gọi Strava nếu lần đồng bộ gần nhất đã ra khỏi
+    cửa sổ tươi; kết quả kèm ETag để client gửi lại qua If-None-Match và nhận 304.
+    Gửi Accept: application/msgpack để nhận MessagePack thay vì JSON.
+    """
+    return await _list_activities(accept, if_none_match, current_user, db, start, end, activity_type, limit)
+
+
+@router.get("/today", response_model=List[ActivityResponse])
+async def get_today_activities(
+        accept: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Lấy các hoạt động trong ngày hiện tại (tương đương /activities?from=<hôm nay>&to=<hôm nay>)"""
+    if not current_user.strava_access_token:
+        raise HTTPException(status_code=400, detail="No Strava account linked")
+
+    today = date.today()
+    return await _list_activities(accept, if_none_match, current_user, db, today, today)
+
+
+@router.get("/history", response_model=HistoryPage)
+async def get_activity_history(
+        cursor: Optional[str] = None,
+        limit: int = Query(settings.HISTORY_PAGE_SIZE, ge=1, le=500),
+        order: str = Query("desc", regex="^(asc|desc)$"),
+        accept: Optional[str] = Header(None),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Lấy toàn bộ lịch sử hoạt động theo trang; truyền next_cursor của trang trước để lấy trang sau"""
+    result = await db.execute(activity_service.as_rows(
+        activity_service.history_query(current_user.id, cursor, limit, order == "desc")
+    ))
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = activity_service.encode_cursor(rows[-1].start_date, rows[-1].id)
+    items = serialization.rows_to_dicts(activity_service.EXPORT_COLUMNS, rows)
+    return serialization.render({"items": items, "next_cursor": next_cursor}, serialization.negotiate(accept))
+
+
+@router.get("/export")
+async def export_activities(
+        export_format: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$"),
+        gzip: bool = False,
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user)
+):
+    """Xuất toàn bộ hoạt động dạng NDJSON hoặc CSV, truyền theo luồng (có thể nén gzip)"""
+    headers = {"Content-Disposition": f'attachment; filename="activities.{export_format}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_service.export_chunks(current_user.id, export_format, gzip),
+        media_type=export_service.FORMATS[export_format],
+        headers=headers,
+    )
+
+
+@router.post("/import")
+async def import_activities(
+        archive: UploadFile = File(...),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user)
+):
+    """Nhập file ZIP export tài khoản Strava (activities.csv kèm các file GPX/TCX/FIT)"""
+    report = await import_service.import_archive(archive.file, current_user.id)
+    await archive.close()
+    return report.to_dict()
+
+
+@router.get("/summary", response_model=List[SummaryResponse])
+async def get_current_summary(
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Tổng hợp tuần, tháng và năm hiện tại (UTC) theo loại hoạt động"""
+    return await rollup_service.get_current(db, current_user.id, datetime.utcnow().date())
+
+
+@router.get("/summary/{period}", response_model=List[SummaryResponse])
+async def get_period_summary(
+        period: str,
+        start: Optional[date] = Query(None, alias="from"),
+        end: Optional[date] = Query(None, alias="to"),
+        activity_type: Optional[str] = Query(None, alias="type"),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Tổng hợp theo từng tuần, tháng hoặc năm trong khoảng from..to"""
+    if period not in rollup_service.PERIODS:
+        raise HTTPException(status_code=404, detail="Unknown summary period")
+    return await rollup_service.get_summary(db, current_user.id, period, start, end, activity_type)
+
+
+@router.get("/near", response_model=List[NearbyActivityResponse])
+async def get_activities_near(
+        lat: float = Query(..., ge=-90, le=90),
+        lng: float = Query(..., ge=-180, le=180),
+        radius: float = Query(1000, gt=0, le=settings.GEO_MAX_RADIUS),
+        activity_type: Optional[str] = Query(None, alias="type"),
+        limit: int = Query(50, ge=1, le=500),
+        accept: Optional[str] = Header(None),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Các hoạt động bắt đầu trong bán kính `radius` mét quanh (lat, lng), gần nhất trước"""
+    items = await geo_service.find_near(
+        db, current_user.id, activity_service.EXPORT_COLUMNS, lat, lng, radius, activity_type, limit
+    )
+    return serialization.render(items, serialization.negotiate(accept))
+
+
+@router.get("/overlap", response_model=List[OverlappingActivityResponse])
+async def get_overlapping_activities(
+        polyline: str = Query(..., min_length=1, description="tuyến đường dạng encoded polyline"),
+        min_overlap: float = Query(0.5, ge=0, le=1),
+        activity_type: Optional[str] = Query(None, alias="type"),
+        limit: int = Query(50, ge=1, le=500),
+        accept: Optional[str] = Header(None),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Các hoạt động có tuyến đường trùng với polyline đã cho (theo ô lưới đã lập chỉ mục khi ghi)
+
+    `overlap` là tỷ lệ tuyến đã cho mà hoạt động đi qua, chỉ trả về khi >= min_overlap.
+    """
+    route = geo_service.parse_route(polyline)
+    items = await geo_service.find_overlapping(
+        db, current_user.id, activity_service.EXPORT_COLUMNS, route, min_overlap, activity_type, limit
+    )
+    return serialization.render(items, serialization.negotiate(accept))
+
+
+@router.get("/records", response_model=List[PersonalRecordResponse], response_model_exclude_none=True)
+async def get_personal_records(
+        activity_type: Optional[str] = Query(None, alias="type"),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Kỷ lục cá nhân theo loại hoạt động: thời gian tốt nhất 1k/5k/10k/half marathon, công suất 5/20/60 phút"""
+    return await best_effort_service.get_records(db, current_user.id, activity_type)
+
+
+@router.get("/training-load", response_model=List[TrainingLoadResponse])
+async def get_training_load(
+        start: Optional[date] = Query(None, alias="from"),
+        end: Optional[date] = Query(None, alias="to"),
+        accept: Optional[str] = Header(None),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Tải tập luyện theo ngày (UTC) kèm CTL, ATL và TSB trong khoảng from..to (mặc định 90 ngày đến hôm nay)"""
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=89)
+    items = await training_load_service.get_training_load(db, current_user.id, start, end)
+    return serialization.render(items, serialization.negotiate(accept))
+
 
 @router.get("/{activity_id}", response_model=ActivityResponse)
 async def get_activity_detail(
         activity_id: int,
-        current_user: User = Depends(auth_service.get_current_user),
-        db: Session = Depends(get_db)
+        accept: Optional[str] = Header(None),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
 ):
     """Lấy chi tiết của một hoạt động cụ thể"""
-    activity = db.query(Activity).filter(
+    result = await db.execute(activity_service.as_rows(select(Activity).where(
+        Activity.id == activity_id,
+        Activity.user_id == current_user.id
+    )))
+    row = result.first()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Activity not found")
+
+    return serialization.render(dict(zip(activity_service.EXPORT_COLUMNS, row)), serialization.negotiate(accept))
+
+
+@router.get("/{activity_id}/details")
+async def get_activity_details(
+        activity_id: int,
+        accept: Optional[str] = Header(None),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Chi tiết của hoạt động từ Strava (mô tả, gear, lap, split, segment effort...), qua cache
+
+    Chỉ lần xem đầu gọi Strava; header X-Cache cho biết kết quả: hit, stale (trả bản cũ
+    và tải lại ở nền sau khi hoạt động thay đổi) hoặc miss.
+    """
+    details, status = await detail_service.get_details(db, current_user, activity_id)
+    return serialization.render(
+        details, serialization.negotiate(accept), headers={"X-Cache": status, "Cache-Control": "private, no-cache"}
+    )
+
+
+@router.get("/{activity_id}/streams")
+async def get_activity_streams(
+        activity_id: int,
+        keys: Optional[str] = None,
+        x: str = "time",
+        resolution: int = Query(1000, ge=2, le=100000),
+        method: str = "lttb",
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Lấy streams (chuỗi thời gian) của một hoạt động, giảm mẫu theo độ phân giải yêu cầu
+
+    `keys`: các kênh cách nhau bởi dấu phẩy; `method`: lttb, minmax hoặc none.
+    """
+    result = await db.execute(select(Activity).where(
+        Activity.id == activity_id,
+        Activity.user_id == current_user.id
+    ))
+    activity = result.scalars().first()
+
+    if not activity:
+        raise HTTPException(status_code=404, detail="Activity not found")
+
+    return await stream_service.get_stream_view(
+        db, current_user, activity, stream_service.parse_channels(keys), x, resolution, method
+    )
+
+
+@router.get("/{activity_id}/best-efforts", response_model=List[ActivityBestEffortResponse],
+            response_model_exclude_none=True)
+async def get_activity_best_efforts(
+        activity_id: int,
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Best effort của một hoạt động (tính từ streams; tải streams từ Strava ở lần đầu)"""
+    result = await db.execute(select(Activity).where(
         Activity.id == activity_id,
         Activity.user_id == current_user.id
-    ).first()
+    ))
+    activity = result.scalars().first()
 
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
 
-    return activity
\ No newline at end of file
+    if activity.best_efforts_version != best_effort_service.VERSION:
+        if await stream_service.has_streams(db, activity.id):
+            # Streams có từ trước khi tính best effort (hoặc định nghĩa mốc đã đổi)
+            await stream_service.compute_best_efforts(db, [activity.id])
+            await db.commit()
+        else:
+            if not current_user.strava_access_token:
+                raise HTTPException(status_code=400, detail="No Strava account linked")
+            await db.close()
+            # Lưu streams sẽ tính luôn best effort
+            await stream_service.ensure_streams(current_user, activity)
+
+    return await best_effort_service.get_activity_efforts(db, activity_id)
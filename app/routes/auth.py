@@ -1,7 +1,8 @@
 # app/routes/auth.py
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.services import auth_service, email_service
 from app.models.user import User
@@ -28,24 +29,26 @@ class VerifyEmail(BaseModel):
 
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     try:
         # Kiểm tra email đã tồn tại chưa
-        db_user = db.query(User).filter(User.email == user.email).first()
+        result = await db.execute(select(User).where(User.email == user.email))
+        db_user = result.scalars().first()
         if db_user:
             raise HTTPException(status_code=400, detail="Email already registered")
 
         # Tạo mã xác nhận và lưu người dùng
         verification_code = auth_service.generate_verification_code()
-        new_user = auth_service.create_user(db, user, verification_code)
+        new_user = await auth_service.create_user(db, user, verification_code)
 
-        # Tạm thời bỏ qua phần gửi email
-        # await email_service.send_verification_email(user.email, verification_code)
+        # Email xác nhận được đưa vào outbox cùng transaction, worker nền sẽ gửi
+        await email_service.enqueue_verification_email(db, user.email, verification_code)
 
         # Tạm thời đánh dấu tài khoản đã xác nhận
         new_user.is_verified = True
         new_user.is_active = True
-        db.commit()
+        await db.commit()
+        email_service.notify()
 
         return {"message": "User created successfully", "verification_code": verification_code}
     except Exception as e:
@@ -53,8 +56,9 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         raise
 
 @router.post("/verify-email")
-async def verify_email(verify_data: VerifyEmail, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == verify_data.email).first()
+async def verify_email(verify_data: VerifyEmail, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(User).where(User.email == verify_data.email))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -65,14 +69,15 @@ async def verify_email(verify_data: VerifyEmail, db: Session = Depends(get_db)):
     user.is_verified = True
     user.is_active = True
     user.verification_code = None
-    db.commit()
+    await db.commit()
+    auth_service.invalidate_user(user.id)
 
     return {"message": "Email verified successfully"}
 
 
 @router.post("/login")
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = auth_service.authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await auth_service.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -91,5 +96,9 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
 
 
 @router.post("/logout")
-async def logout(current_user: User = Depends(auth_service.get_current_user)):
+async def logout(
+        token: str = Depends(auth_service.oauth2_scheme),
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user)
+):
+    auth_service.invalidate_token(token)
     return {"message": "Successfully logged out"}
\ No newline at end of file
@@ -0,0 +1,11 @@
+# app/routes/metrics.py
+from fastapi import APIRouter, Response
+from app.utils.metrics import render
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Metric của tiến trình theo định dạng text của Prometheus"""
+    return Response(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
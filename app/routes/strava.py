@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.services import auth_service, strava_service
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db, SessionLocal
+from app.services import auth_service, strava_service, backfill_service
+from app.services.strava_scheduler import scheduler
 from app.models.user import User
 from pydantic import BaseModel
 
@@ -13,7 +14,7 @@ class StravaAuthResponse(BaseModel):
 
 
 @router.get("/authorize")
-async def authorize_strava(current_user: User = Depends(auth_service.get_current_user)):
+async def authorize_strava(current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user)):
     """Trả về URL để người dùng ủy quyền với Strava"""
     auth_url = strava_service.get_authorization_url()
     return {"authorization_url": auth_url}
@@ -77,28 +78,33 @@ async def strava_callback_get(
 @router.post("/callback")
 async def strava_callback_post(
         auth_response: StravaAuthResponse,
-        current_user: User = Depends(auth_service.get_current_user),
-        db: Session = Depends(get_db)
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
 ):
     """Xử lý callback POST từ ứng dụng sau khi người dùng ủy quyền"""
     try:
         tokens = await strava_service.exchange_code_for_token(auth_response.code)
 
         # Lưu token vào DB
-        current_user.strava_access_token = tokens["access_token"]
-        current_user.strava_refresh_token = tokens["refresh_token"]
-        current_user.strava_token_expires_at = tokens["expires_at"]
-        db.commit()
+        user = await db.get(User, current_user.id)
+        user.strava_athlete_id = tokens.get("athlete", {}).get("id")
+        user.strava_access_token = tokens["access_token"]
+        user.strava_refresh_token = tokens["refresh_token"]
+        user.strava_token_expires_at = tokens["expires_at"]
+        await db.commit()
+        auth_service.invalidate_user(user.id)
 
         return {"message": "Strava account linked successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to link Strava account: {str(e)}")
 
 
 @router.delete("/disconnect")
 async def disconnect_strava(
-        current_user: User = Depends(auth_service.get_current_user),
-        db: Session = Depends(get_db)
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
 ):
     """Ngắt kết nối tài khoản Strava"""
     if not current_user.strava_access_token:
@@ -108,11 +114,70 @@ async def disconnect_strava(
         await strava_service.deauthorize(current_user.strava_access_token)
 
         # Xóa thông tin token
-        current_user.strava_access_token = None
-        current_user.strava_refresh_token = None
-        current_user.strava_token_expires_at = None
-        db.commit()
+        user = await db.get(User, current_user.id)
+        user.strava_access_token = None
+        user.strava_refresh_token = None
+        user.strava_token_expires_at = None
+        await db.commit()
+        auth_service.invalidate_user(user.id)
 
         return {"message": "Strava account disconnected successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to disconnect Strava account: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=f"Failed to disconnect Strava account: {str(e)}")
+
+
+async def _run_backfill(user_id: int, progress: backfill_service.BackfillProgress):
+    """Chạy backfill trong session DB riêng, tách khỏi request"""
+    try:
+        async with SessionLocal() as db:
+            user = await db.get(User, user_id)
+            if user is None:
+                progress.error = "User not found"
+                return
+            await backfill_service.backfill_user(user, db, progress=progress)
+    except Exception as e:
+        progress.error = progress.error or str(e)
+        print(f"Error in backfill for user {user_id}: {str(e)}")
+    finally:
+        # Lỗi trước khi backfill_user chạy cũng phải trả lease backfill (nếu không các lần sync sau nhận 409)
+        if progress.running:
+            async with SessionLocal() as db:
+                await backfill_service.finish(db, progress)
+
+
+@router.post("/sync", status_code=202)
+async def start_sync(
+        background_tasks: BackgroundTasks,
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Bắt đầu đồng bộ lịch sử hoạt động kể từ lần đồng bộ gần nhất"""
+    if not current_user.strava_access_token:
+        raise HTTPException(status_code=400, detail="No Strava account linked")
+    progress = await backfill_service.reserve(db, current_user.id, current_user.strava_sync_watermark)
+    if progress is None:
+        raise HTTPException(status_code=409, detail="Sync already in progress")
+
+    background_tasks.add_task(_run_backfill, current_user.id, progress)
+    return {"message": "Sync started", "watermark": current_user.strava_sync_watermark}
+
+
+@router.get("/sync")
+async def get_sync_progress(
+        current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Lấy tiến độ đồng bộ lịch sử hoạt động"""
+    progress = await backfill_service.get_progress(db, current_user.id)
+    if progress is None:
+        return {"running": False, "watermark": current_user.strava_sync_watermark}
+    return progress.to_dict()
+
+
+
+@router.get("/rate-limit")
+async def get_rate_limit(current_user: auth_service.CurrentUser = Depends(auth_service.get_current_user)):
+    """Hạn mức Strava còn lại và độ sâu hàng đợi của bộ lập lịch"""
+    return scheduler.snapshot()
@@ -0,0 +1,42 @@
+# app/routes/webhook.py
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import get_db
+from app.services import webhook_service
+from pydantic import BaseModel
+
+router = APIRouter(prefix="/strava/webhook", tags=["Strava Webhook"])
+
+
+class StravaEvent(BaseModel):
+    object_type: str
+    object_id: int
+    aspect_type: str
+    owner_id: int
+    subscription_id: int
+    event_time: int
+    updates: Optional[dict] = None
+
+
+@router.get("")
+async def validate_subscription(
+        hub_mode: str = Query(..., alias="hub.mode"),
+        hub_challenge: str = Query(..., alias="hub.challenge"),
+        hub_verify_token: str = Query(..., alias="hub.verify_token")
+):
+    """Xác thực callback khi tạo push subscription với Strava"""
+    if hub_mode != "subscribe" or hub_verify_token != settings.STRAVA_WEBHOOK_VERIFY_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid verify token")
+    return {"hub.challenge": hub_challenge}
+
+
+@router.post("")
+async def receive_event(event: StravaEvent, db: AsyncSession = Depends(get_db)):
+    """Nhận sự kiện từ Strava và đưa vào hàng đợi; Strava yêu cầu phản hồi trong 2 giây"""
+    if settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID and event.subscription_id != settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID:
+        raise HTTPException(status_code=403, detail="Unknown subscription")
+
+    await webhook_service.enqueue_event(db, event.dict())
+    return {"status": "ok"}
@@ -0,0 +1,62 @@
+# app/server.py
+"""Điểm khởi động production: migrate DB một lần rồi chạy uvicorn với nhiều worker
+
+Chạy: python -m app.server [--workers N] [--host HOST] [--port PORT]
+
+Các giá trị mặc định lấy từ Settings (WORKERS, HOST, PORT, SERVER_LOOP,
+SERVER_HTTP...). Schema được tạo ở tiến trình cha trước khi khởi động worker nên
+các worker không chạy DDL đồng thời; tác vụ nền chỉ được chạy ở một tiến trình
+(webhook, làm mới token) dùng lease trong DB, các tác vụ còn lại nhận việc theo
+claim/lease nên chạy song song an toàn.
+"""
+import argparse
+import asyncio
+import os
+
+import uvicorn
+
+from app.config import settings
+
+
+async def migrate():
+    """Tạo bảng, cột và index còn thiếu (chỉ nạp model, không nạp toàn bộ ứng dụng)"""
+    from app.database import engine, init_db
+    from app.models import user, activity, activity_best_effort, activity_cell, activity_detail, activity_rollup, activity_stream, email_outbox, personal_record, sync_job, training_load, webhook_event, worker_lease  # noqa: F401 (đăng ký bảng)
+
+    await init_db()
+    # Kết nối gắn với event loop này; worker trong cùng tiến trình sẽ chạy trên loop khác
+    await engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.server")
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument("--workers", type=int, default=settings.WORKERS)
+    parser.add_argument("--no-migrate", action="store_true", help="bỏ qua bước tạo bảng/cột còn thiếu")
+    args = parser.parse_args(argv)
+
+    if not args.no_migrate:
+        asyncio.run(migrate())
+
+    # Worker (kể cả khi chạy trong chính tiến trình này) không cần migrate lại
+    os.environ["MIGRATE_ON_STARTUP"] = "false"
+    settings.MIGRATE_ON_STARTUP = False
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=settings.SERVER_LOOP,
+        http=settings.SERVER_HTTP,
+        backlog=settings.SERVER_BACKLOG,
+        timeout_keep_alive=settings.SERVER_KEEPALIVE,
+        access_log=settings.SERVER_ACCESS_LOG,
+        log_level="debug" if settings.DEBUG else "info",
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
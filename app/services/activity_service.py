@@ -0,0 +1,312 @@
+# app/services/activity_service.py
+import base64
+import time
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Row, Select, delete, select, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import SessionLocal
+from app.models.activity import Activity
+from app.models.user import User
+from app.services import (
+    auth_service, best_effort_service, detail_service, geo_service, rollup_service, strava_service, stream_service,
+    training_load_service
+)
+from app.utils.singleflight import SingleFlight
+
+# Các cột được làm mới khi hoạt động đã tồn tại (người dùng sửa tên, quãng đường...)
+UPDATABLE_COLUMNS = (
+    "name",
+    "type",
+    "start_date",
+    "distance",
+    "moving_time",
+    "elapsed_time",
+    "total_elevation_gain",
+    "average_speed",
+    "max_speed",
+    "average_heartrate",
+    "average_watts",
+    "start_lat",
+    "start_lng",
+    "end_lat",
+    "end_lng",
+    "summary_polyline",
+)
+
+
+# Các cột trong file xuất (NDJSON/CSV), theo thứ tự
+EXPORT_COLUMNS = (
+    "id",
+    "strava_id",
+    "name",
+    "type",
+    "start_date",
+    "distance",
+    "moving_time",
+    "elapsed_time",
+    "total_elevation_gain",
+    "average_speed",
+    "max_speed",
+)
+
+
+def parse_start_date(value: str) -> datetime:
+    """Chuyển start_date ISO 8601 của Strava sang datetime"""
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _latlng(value) -> Tuple[Optional[float], Optional[float]]:
+    # Strava trả về [] (không phải null) cho hoạt động không có GPS
+    return (value[0], value[1]) if value and len(value) == 2 else (None, None)
+
+
+def activity_row(data: dict, user_id: int) -> dict:
+    """Chuyển activity summary của Strava thành một dòng của bảng activities"""
+    start_lat, start_lng = _latlng(data.get("start_latlng"))
+    end_lat, end_lng = _latlng(data.get("end_latlng"))
+    return {
+        "strava_id": str(data["id"]),
+        "user_id": user_id,
+        "name": data["name"],
+        "type": data["type"],
+        "start_date": parse_start_date(data["start_date"]),
+        "distance": data["distance"],
+        "moving_time": data["moving_time"],
+        "elapsed_time": data["elapsed_time"],
+        "total_elevation_gain": data["total_elevation_gain"],
+        "average_speed": data["average_speed"],
+        "max_speed": data["max_speed"],
+        "average_heartrate": data.get("average_heartrate"),
+        "average_watts": data.get("average_watts"),
+        "start_lat": start_lat,
+        "start_lng": start_lng,
+        "end_lat": end_lat,
+        "end_lng": end_lng,
+        "summary_polyline": (data.get("map") or {}).get("summary_polyline") or None,
+    }
+
+
+def summary_changed(before: Row, row: dict) -> bool:
+    """Dòng mới (từ activity_row) khác trạng thái đã lưu ở một cột UPDATABLE_COLUMNS"""
+    # SQLite lưu start_date không kèm múi giờ
+    after = {**row, "start_date": row["start_date"].replace(tzinfo=None)}
+    return any(getattr(before, column) != after[column] for column in UPDATABLE_COLUMNS)
+
+
+def range_query(
+        user_id: int,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        activity_type: Optional[str] = None,
+        limit: Optional[int] = None
+) -> Select:
+    """Truy vấn hoạt động của người dùng trong khoảng ngày [start, end], theo thứ tự start_date
+
+    Dùng index (user_id, start_date), hoặc (user_id, type, start_date) khi lọc theo loại.
+    """
+    stmt = select(Activity).where(Activity.user_id == user_id)
+    if start is not None:
+        stmt = stmt.where(Activity.start_date >= datetime.combine(start, datetime.min.time()))
+    if end is not None:
+        stmt = stmt.where(Activity.start_date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    if activity_type is not None:
+        stmt = stmt.where(Activity.type == activity_type)
+    stmt = stmt.order_by(Activity.start_date, Activity.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def as_rows(stmt: Select) -> Select:
+    """Đổi truy vấn đối tượng Activity thành truy vấn các cột EXPORT_COLUMNS (dòng thuần, không tạo đối tượng ORM)"""
+    return stmt.with_only_columns(*(getattr(Activity, column) for column in EXPORT_COLUMNS))
+
+
+def encode_cursor(start_date: datetime, activity_id: int) -> str:
+    """Mã hóa vị trí (start_date, id) của dòng cuối trang thành cursor"""
+    return base64.urlsafe_b64encode(f"{start_date.isoformat()}|{activity_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Giải mã cursor thành (start_date, id); cursor không hợp lệ trả về 400"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        start_date, activity_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(start_date), int(activity_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def history_query(user_id: int, cursor: Optional[str], limit: int, descending: bool = True) -> Select:
+    """Trang tiếp theo của lịch sử hoạt động theo keyset (start_date, id), lấy dư một dòng
+
+    Không dùng OFFSET: mỗi trang là một lần tìm trên index (user_id, start_date)
+    nên chi phí không tăng theo độ sâu của trang.
+    """
+    key = tuple_(Activity.start_date, Activity.id)
+    stmt = select(Activity).where(Activity.user_id == user_id)
+    if cursor:
+        position = decode_cursor(cursor)
+        stmt = stmt.where(key < position if descending else key > position)
+    if descending:
+        stmt = stmt.order_by(Activity.start_date.desc(), Activity.id.desc())
+    else:
+        stmt = stmt.order_by(Activity.start_date, Activity.id)
+    return stmt.limit(limit + 1)
+
+
+async def iter_activity_rows(user_id: int, batch_size: int = None) -> AsyncIterator[List[Row]]:
+    """Đọc toàn bộ hoạt động của người dùng theo lô từ cursor phía server, trong session riêng
+
+    Chọn cột thay vì đối tượng ORM để identity map không lớn dần theo số dòng.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    async with SessionLocal() as db:
+        result = await db.stream(
+            select(*(getattr(Activity, column) for column in EXPORT_COLUMNS))
+            .where(Activity.user_id == user_id)
+            .order_by(Activity.start_date, Activity.id)
+            .execution_options(yield_per=batch_size)
+        )
+        async for rows in result.partitions():
+            yield rows
+
+
+async def ingest_activities(db: AsyncSession, user_id: int, activities: Iterable[dict]) -> List[dict]:
+    """Ghi một lô hoạt động Strava bằng một câu lệnh INSERT ... ON CONFLICT DO UPDATE
+
+    Rollup được cập nhật trong cùng transaction: trừ giá trị cũ của các hoạt
+    động đã tồn tại rồi cộng giá trị mới; ô lưới địa lý được ghi lại cho các
+    hoạt động có polyline mới hoặc thay đổi; chuỗi tải tập luyện được tính lại
+    từ ngày sớm nhất có tải thay đổi; chi tiết đã cache của hoạt động thay đổi
+    bị đánh dấu cũ. Không commit; người gọi quyết định ranh giới transaction.
+    """
+    rows = list({row["strava_id"]: row for row in (activity_row(a, user_id) for a in activities)}.values())
+    if not rows:
+        return rows
+
+    batch = Activity.strava_id.in_([row["strava_id"] for row in rows])
+    # Trạng thái trước khi upsert của các hoạt động đã tồn tại: chỉ lập chỉ mục lại phần thay đổi
+    result = await db.execute(
+        select(Activity.strava_id, Activity.id, *(getattr(Activity, column) for column in UPDATABLE_COLUMNS))
+        .where(batch)
+    )
+    previous = {row.strava_id: row for row in result.all()}
+    await rollup_service.subtract(db, batch, [user_id])
+
+    # Chèn qua bảng (Core), không qua ORM: ORM bỏ các giá trị None khỏi từng dòng nên một lô
+    # lẫn hoạt động có và không có công suất/nhịp tim/GPS bị tách thành nhiều câu lệnh
+    stmt = insert(Activity.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Activity.strava_id],
+        set_={column: stmt.excluded[column] for column in UPDATABLE_COLUMNS},
+    )
+    await db.execute(stmt, rows)
+
+    await rollup_service.add(db, batch)
+    await geo_service.update_cells(
+        db, user_id, rows, {strava_id: row.summary_polyline for strava_id, row in previous.items()}
+    )
+    # Đổi loại hoặc ngày của hoạt động đã có best effort làm thay đổi kỷ lục theo loại
+    # (SQLite lưu start_date không kèm múi giờ)
+    await best_effort_service.activities_changed(db, [
+        before.id for before, row in ((previous.get(row["strava_id"]), row) for row in rows)
+        if before is not None
+        and (before.type, before.start_date) != (row["type"], row["start_date"].replace(tzinfo=None))
+    ])
+    # Hoạt động mới hoặc đổi ngày/tải: tính lại chuỗi tải từ ngày sớm nhất (cũ hoặc mới)
+    changed_days = []
+    for row in rows:
+        before = previous.get(row["strava_id"])
+        load = (row["start_date"].replace(tzinfo=None), row["moving_time"], row["average_heartrate"], row["average_watts"])
+        if before is None:
+            changed_days.append(load[0].date())
+        elif (before.start_date, before.moving_time, before.average_heartrate, before.average_watts) != load:
+            changed_days.append(min(before.start_date, load[0]).date())
+    if changed_days:
+        await training_load_service.update_series(db, {user_id: min(changed_days)})
+    await detail_service.invalidate(db, [
+        before.id for before, row in ((previous.get(row["strava_id"]), row) for row in rows)
+        if before is not None and summary_changed(before, row)
+    ])
+    return rows
+
+
+async def delete_activities(db: AsyncSession, strava_ids: Iterable) -> int:
+    """Xóa các hoạt động theo strava_id (kèm streams, chi tiết, ô lưới, best effort, rollup và tải tập luyện),
+    trả về số hoạt động đã xóa
+
+    Không commit; người gọi quyết định ranh giới transaction.
+    """
+    strava_ids = [str(strava_id) for strava_id in strava_ids]
+    if not strava_ids:
+        return 0
+    result = await db.execute(
+        select(Activity.id, Activity.user_id, Activity.start_date).where(Activity.strava_id.in_(strava_ids))
+    )
+    found = result.all()
+    if not found:
+        return 0
+    activity_ids = [row.id for row in found]
+
+    await rollup_service.subtract(db, Activity.id.in_(activity_ids), {row.user_id for row in found})
+    await stream_service.delete_streams(db, activity_ids)
+    await detail_service.delete_details(db, activity_ids)
+    await geo_service.delete_cells(db, activity_ids)
+    await best_effort_service.delete_efforts(db, activity_ids)
+    changed_days = {}
+    for row in found:
+        if row.start_date is not None:
+            day = row.start_date.date()
+            changed_days[row.user_id] = min(changed_days.get(row.user_id, day), day)
+    result = await db.execute(
+        delete(Activity).where(Activity.id.in_(activity_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    # Sau khi xóa: chuỗi tải được tính lại từ các hoạt động còn lại
+    await training_load_service.update_series(db, changed_days)
+    return result.rowcount
+
+
+# Các lần đồng bộ đang chạy theo (user_id, after)
+_sync_flights = SingleFlight()
+
+
+def is_fresh(user) -> bool:
+    """Dữ liệu trong DB của người dùng còn nằm trong cửa sổ tươi (không cần gọi Strava)"""
+    if user.last_synced_at is None:
+        return False
+    return time.time() - user.last_synced_at < settings.ACTIVITY_FRESHNESS_SECONDS
+
+
+async def _sync_recent_activities(user_id: int, after: int):
+    async with SessionLocal() as db:
+        user = await db.get(User, user_id)
+        if user is None:
+            # Người dùng bị xóa trong lúc chờ
+            raise HTTPException(status_code=404, detail="User not found")
+        user = await strava_service.check_and_refresh_token(user, db)
+
+        # Ghi thời điểm bắt đầu gọi Strava: hoạt động tải lên trong lúc gọi sẽ
+        # được lấy ở lần đồng bộ sau
+        started_at = int(time.time())
+        # Đọc hết các trang: chỉ đánh dấu đã đồng bộ khi không còn hoạt động nào chưa lấy
+        async for _, activities in strava_service.iter_activity_pages(user.strava_access_token, after=after):
+            if activities:
+                await ingest_activities(db, user.id, activities)
+        user.last_synced_at = started_at
+        await db.commit()
+    auth_service.invalidate_user(user_id)
+
+
+async def sync_recent_activities(user_id: int, after: int):
+    """Đồng bộ các hoạt động từ `after` (epoch) và cập nhật last_synced_at
+
+    Các request đồng thời của cùng người dùng dùng chung một lần gọi Strava.
+    """
+    await _sync_flights.do((user_id, after), lambda: _sync_recent_activities(user_id, after))
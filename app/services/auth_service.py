@@ -1,24 +1,112 @@
 # app/services/auth_service.py
+from dataclasses import dataclass
+from typing import Dict, Optional, Set
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
 from app.database import get_db
 from app.models.user import User
-from app.utils.security import verify_password, get_password_hash, decode_token
+from app.utils.cache import TTLCache
+from app.utils.metrics import Collector
+from app.utils.security import get_password_hash_async, verify_and_update_password_async, decode_token
 import random
 import string
+import time
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
+@dataclass(frozen=True)
+class CurrentUser:
+    """Ảnh chụp nhẹ của người dùng đã xác thực, được cache theo token"""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    is_verified: bool
+    strava_access_token: Optional[str]
+    strava_refresh_token: Optional[str]
+    strava_token_expires_at: Optional[int]
+    strava_sync_watermark: Optional[int]
+    last_synced_at: Optional[int]
+
+    @classmethod
+    def from_user(cls, user: User) -> "CurrentUser":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            is_active=user.is_active,
+            is_verified=user.is_verified,
+            strava_access_token=user.strava_access_token,
+            strava_refresh_token=user.strava_refresh_token,
+            strava_token_expires_at=user.strava_token_expires_at,
+            strava_sync_watermark=user.strava_sync_watermark,
+            last_synced_at=user.last_synced_at,
+        )
+
+
+# Token -> CurrentUser; chỉ mục user_id -> các token để hủy cache theo người dùng
+_tokens_by_user: Dict[int, Set[str]] = {}
+# Tăng mỗi lần hủy cache, tránh lưu lại snapshot đã đọc trước khi bị hủy
+_invalidations = 0
+
+
+def _forget_token(token: str, principal: CurrentUser):
+    tokens = _tokens_by_user.get(principal.id)
+    if tokens is not None:
+        tokens.discard(token)
+        if not tokens:
+            del _tokens_by_user[principal.id]
+
+
+principal_cache = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+    on_evict=_forget_token,
+)
+
+Collector("principal_cache_size", "Authenticated principals currently cached", (), lambda: {(): len(principal_cache)})
+Collector(
+    "principal_cache_events", "Principal cache hits, misses, evictions and invalidations", ("event",),
+    lambda: {
+        ("hit",): principal_cache.hits,
+        ("miss",): principal_cache.misses,
+        ("eviction",): principal_cache.evictions,
+        ("invalidation",): _invalidations,
+    },
+    metric_type="counter",
+)
+
+
+def invalidate_token(token: str):
+    """Xóa principal của một token khỏi cache (ví dụ khi đăng xuất)"""
+    global _invalidations
+    _invalidations += 1
+    principal_cache.pop(token)
+
+
+def invalidate_user(user_id: int):
+    """Xóa mọi principal của người dùng khỏi cache khi token Strava, trạng thái xác nhận hoặc mật khẩu thay đổi"""
+    global _invalidations
+    _invalidations += 1
+    for token in list(_tokens_by_user.get(user_id, ())):
+        principal_cache.pop(token)
+
+
 def generate_verification_code(length=6):
     """Tạo mã xác nhận ngẫu nhiên"""
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
 
-def create_user(db: Session, user_data, verification_code):
-    """Tạo người dùng mới với mã xác nhận"""
-    hashed_password = get_password_hash(user_data.password)
+async def create_user(db: AsyncSession, user_data, verification_code):
+    """Tạo người dùng mới với mã xác nhận
+
+    Không commit: người gọi commit cùng email xác nhận trong outbox để không mất email khi lỗi giữa chừng.
+    """
+    hashed_password = await get_password_hash_async(user_data.password)
     db_user = User(
         email=user_data.email,
         username=user_data.username,
@@ -26,20 +114,35 @@ def create_user(db: Session, user_data, verification_code):
         verification_code=verification_code
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
     return db_user
 
 
-def authenticate_user(db: Session, username: str, password: str):
+async def get_user_by_username(db: AsyncSession, username: str):
+    """Tìm người dùng theo tên đăng nhập"""
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
     """Xác thực người dùng bằng tên đăng nhập và mật khẩu"""
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.hashed_password):
+    user = await get_user_by_username(db, username)
+    if not user:
+        return False
+
+    verified, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not verified:
         return False
+
+    # Băm lại mật khẩu nếu cost của bcrypt đã thay đổi
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        invalidate_user(user.id)
     return user
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     """Lấy người dùng hiện tại từ token JWT"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -47,13 +150,30 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     payload = decode_token(token)
+    if payload is None:
+        raise credentials_exception
     username: str = payload.get("sub")
     if username is None:
         raise credentials_exception
 
-    user = db.query(User).filter(User.username == username).first()
+    invalidations = _invalidations
+    user = await get_user_by_username(db, username)
     if user is None:
         raise credentials_exception
 
-    return user
+    principal = CurrentUser.from_user(user)
+    if invalidations != _invalidations:
+        return principal
+
+    # Không cache quá thời điểm token hết hạn
+    ttl = min(settings.PRINCIPAL_CACHE_TTL, payload.get("exp", 0) - time.time())
+    principal_cache.set(token, principal, ttl=ttl)
+    if token in principal_cache:
+        _tokens_by_user.setdefault(user.id, set()).add(token)
+
+    return principal
@@ -0,0 +1,173 @@
+# app/services/backfill_service.py
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from typing import Callable, Optional
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.sync_job import SyncJob
+from app.models.user import User
+from app.services import auth_service, strava_service, activity_service, lease_service
+from app.services.strava_scheduler import BACKGROUND
+
+
+@dataclass
+class BackfillProgress:
+    """Tiến độ đồng bộ lịch sử hoạt động của một người dùng"""
+    user_id: int
+    pages: int = 0
+    activities: int = 0
+    watermark: Optional[int] = None
+    running: bool = True
+    error: Optional[str] = None
+    started_at: float = 0.0
+    finished_at: Optional[float] = None
+    owner: Optional[str] = None  # lease backfill trên strava_sync_jobs, không trả ra API
+
+    def to_dict(self):
+        values = asdict(self)
+        values.pop("owner")
+        return values
+
+
+async def get_progress(db: AsyncSession, user_id: int) -> Optional[BackfillProgress]:
+    """Lấy tiến độ backfill gần nhất của người dùng (giống nhau ở mọi worker)"""
+    row = (await db.execute(
+        select(SyncJob, User.strava_sync_watermark)
+        .join(User, User.id == SyncJob.user_id)
+        .where(SyncJob.user_id == user_id)
+        .execution_options(populate_existing=True)
+    )).first()
+    if row is None or row[0].backfill_started_at is None:
+        return None
+    job, watermark = row
+    running = job.backfill_owner is not None and job.backfill_expires_at >= int(time.time())
+    error = job.backfill_error
+    if job.backfill_owner is not None and not running:
+        # Tiến trình chạy backfill đã dừng mà không trả lease
+        error = error or "Backfill interrupted"
+    return BackfillProgress(
+        user_id=user_id, pages=job.backfill_pages or 0, activities=job.backfill_activities or 0,
+        watermark=watermark, running=running, error=error,
+        started_at=job.backfill_started_at, finished_at=job.backfill_finished_at,
+    )
+
+
+async def reserve(db: AsyncSession, user_id: int, watermark: int = None) -> Optional[BackfillProgress]:
+    """Nhận lease backfill của người dùng, trả về None nếu đang có backfill chạy (ở bất kỳ worker nào)
+
+    Lease nằm trên dòng strava_sync_jobs của người dùng (tạo mới nếu chưa có); như
+    lease_service.acquire, lệnh upsert chỉ ghi đè khi lease trống hoặc đã hết hạn.
+    """
+    now = time.time()
+    owner = f"{lease_service.default_owner()}:{uuid.uuid4().hex[:8]}"
+    values = {
+        "backfill_owner": owner,
+        "backfill_expires_at": int(now) + settings.BACKFILL_LEASE_SECONDS,
+        "backfill_pages": 0,
+        "backfill_activities": 0,
+        "backfill_started_at": now,
+        "backfill_finished_at": None,
+        "backfill_error": None,
+    }
+    stmt = insert(SyncJob).values(user_id=user_id, next_run_at=int(now) + settings.SYNC_INTERVAL, **values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SyncJob.user_id],
+        set_=values,
+        where=or_(SyncJob.backfill_owner.is_(None), SyncJob.backfill_expires_at < int(now)),
+    )
+    await db.execute(stmt)
+    await db.commit()
+    if await db.scalar(select(SyncJob.backfill_owner).where(SyncJob.user_id == user_id)) != owner:
+        return None
+    return BackfillProgress(user_id=user_id, watermark=watermark, started_at=now, owner=owner)
+
+
+async def _save(db: AsyncSession, progress: BackfillProgress, **values) -> bool:
+    """Ghi tiến độ và gia hạn lease (chưa commit); False nếu lease đã thuộc tiến trình khác"""
+    result = await db.execute(
+        update(SyncJob)
+        .where(SyncJob.user_id == progress.user_id, SyncJob.backfill_owner == progress.owner)
+        .values(backfill_pages=progress.pages, backfill_activities=progress.activities, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+async def finish(db: AsyncSession, progress: BackfillProgress):
+    """Trả lease backfill và lưu kết quả cuối (progress.error nếu lỗi)"""
+    progress.running = False
+    progress.finished_at = time.time()
+    await _save(
+        db, progress, backfill_owner=None, backfill_expires_at=None,
+        backfill_finished_at=progress.finished_at, backfill_error=progress.error and progress.error[:500],
+    )
+    await db.commit()
+
+
+async def backfill_user(
+        user: User,
+        db: AsyncSession,
+        per_page: int = None,
+        concurrency: int = None,
+        on_progress: Callable[[BackfillProgress], None] = None,
+        progress: BackfillProgress = None
+) -> BackfillProgress:
+    """Đồng bộ toàn bộ lịch sử hoạt động kể từ watermark của người dùng
+
+    Các trang được tải song song theo từng cửa sổ `concurrency` trang với cùng
+    tham số `after`, dừng ở trang đầu tiên không đầy. Khi có `after`, Strava trả
+    về theo thứ tự start_date tăng dần nên watermark được lưu sau mỗi cửa sổ;
+    nếu tiến trình bị dừng giữa chừng, lần chạy sau sẽ tiếp tục từ watermark.
+    """
+    per_page = per_page or settings.BACKFILL_PER_PAGE
+    concurrency = concurrency or settings.BACKFILL_CONCURRENCY
+
+    if progress is None:
+        progress = await reserve(db, user.id, user.strava_sync_watermark)
+        if progress is None:
+            raise RuntimeError("Backfill already running for this user")
+
+    try:
+        user = await strava_service.check_and_refresh_token(user, db, priority=BACKGROUND)
+        after = user.strava_sync_watermark or 0
+        started_at = int(time.time())
+        pages = strava_service.iter_activity_pages(
+            user.strava_access_token, after=after, per_page=per_page, concurrency=concurrency, priority=BACKGROUND
+        )
+        async for read, batch in pages:
+            progress.pages += read
+            if batch:
+                rows = await activity_service.ingest_activities(db, user.id, batch)
+                latest = max(int(row["start_date"].timestamp()) for row in rows)
+                user.strava_sync_watermark = max(user.strava_sync_watermark or 0, latest)
+                progress.activities += len(batch)
+                progress.watermark = user.strava_sync_watermark
+
+            # Tiến độ và gia hạn lease cùng transaction với các hoạt động vừa ghi
+            expires_at = int(time.time()) + settings.BACKFILL_LEASE_SECONDS
+            if not await _save(db, progress, backfill_expires_at=expires_at):
+                raise RuntimeError("Backfill lease lost to another worker")
+            await db.commit()
+            if batch:
+                auth_service.invalidate_user(user.id)
+
+            if on_progress:
+                on_progress(progress)
+
+        # Đồng bộ đầy đủ: các request đọc trong cửa sổ tươi không cần gọi lại Strava
+        user.last_synced_at = started_at
+        await db.commit()
+        auth_service.invalidate_user(user.id)
+    except BaseException as e:
+        # Kể cả khi bị hủy: bỏ cửa sổ đang ghi dở trước khi lưu kết quả
+        await db.rollback()
+        progress.error = str(e) or type(e).__name__
+        raise
+    finally:
+        await finish(db, progress)
+
+    return progress
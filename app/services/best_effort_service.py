@@ -0,0 +1,300 @@
+# app/services/best_effort_service.py
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import and_, case, delete, func, or_, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.activity import Activity
+from app.models.activity_best_effort import ActivityBestEffort
+from app.models.personal_record import PersonalRecord
+
+# Mốc quãng đường (mét): thời gian ngắn nhất để đi hết quãng đường
+DISTANCE_EFFORTS = {"1k": 1000.0, "5k": 5000.0, "10k": 10000.0, "half_marathon": 21097.5}
+# Mốc thời gian (giây): công suất trung bình cao nhất trong khoảng thời gian
+POWER_EFFORTS = {"5min": 300, "20min": 1200, "60min": 3600}
+EFFORTS = tuple(DISTANCE_EFFORTS) + tuple(POWER_EFFORTS)
+
+# Tăng khi đổi định nghĩa mốc hoặc cách tính: các hoạt động có phiên bản cũ được tính lại
+VERSION = 1
+
+# Các kênh streams cần cho việc tính
+CHANNELS = ("time", "distance", "watts")
+
+# Khoảng trống giữa hai mẫu watts dài hơn chừng này (giây) được coi là dừng (công suất 0)
+POWER_MAX_GAP = 5
+
+RECORD_COLUMNS = ("user_id", "type", "effort", "activity_id", "value", "start_date", "start_offset", "end_offset")
+
+
+def best_times(time: np.ndarray, distance: np.ndarray) -> Dict[str, Tuple[float, int, int]]:
+    """Thời gian ngắn nhất cho mỗi mốc quãng đường: {mốc: (giây, giây bắt đầu, giây kết thúc)}
+
+    Với mỗi điểm bắt đầu i, điểm kết thúc sớm nhất j có distance[j] >= distance[i] + D
+    được tìm bằng searchsorted trên quãng đường cộng dồn (hai con trỏ, vector hóa).
+    """
+    if len(time) < 2:
+        return {}
+    # Quãng đường GPS có thể giảm nhẹ: ép không giảm để searchsorted hợp lệ
+    distance = np.maximum.accumulate(distance.astype(np.float64))
+    time = time.astype(np.int64)
+    efforts = {}
+    for name, target in DISTANCE_EFFORTS.items():
+        if distance[-1] - distance[0] < target:
+            continue
+        end = np.searchsorted(distance, distance + target, side="left")
+        start = np.flatnonzero(end < len(distance))
+        elapsed = time[end[start]] - time[start]
+        best = int(np.argmin(elapsed))
+        i, j = int(start[best]), int(end[start[best]])
+        efforts[name] = (float(elapsed[best]), int(time[i] - time[0]), int(time[j] - time[0]))
+    return efforts
+
+
+def power_by_second(time: np.ndarray, watts: np.ndarray) -> np.ndarray:
+    """Công suất theo từng giây từ đầu hoạt động: giữ giá trị mẫu tới mẫu sau, trừ khi khoảng trống dài (dừng)"""
+    seconds = time.astype(np.int64) - int(time[0])
+    watts = watts.astype(np.float64)
+    gaps = np.diff(seconds)
+    fill = np.where(gaps <= POWER_MAX_GAP, watts[:-1], 0.0)
+    power = np.repeat(fill, np.maximum(gaps, 0))
+    # Giây của chính mẫu luôn mang giá trị của mẫu (mẫu sau cùng giây ghi đè mẫu trước)
+    power[seconds[:-1][gaps > 0]] = watts[:-1][gaps > 0]
+    return np.append(power, watts[-1])
+
+
+def best_powers(time: np.ndarray, watts: np.ndarray) -> Dict[str, Tuple[float, int, int]]:
+    """Công suất trung bình cao nhất cho mỗi mốc thời gian: {mốc: (watt, giây bắt đầu, giây kết thúc)}
+
+    Tổng mọi cửa sổ T giây lấy từ hiệu của tổng cộng dồn theo giây: O(thời lượng) mỗi mốc.
+    """
+    if len(time) < 2:
+        return {}
+    power = power_by_second(time, watts)
+    cumulative = np.concatenate([[0.0], np.cumsum(power)])
+    efforts = {}
+    for name, duration in POWER_EFFORTS.items():
+        if len(power) < duration:
+            continue
+        sums = cumulative[duration:] - cumulative[:-duration]
+        best = int(np.argmax(sums))
+        efforts[name] = (float(sums[best] / duration), best, best + duration)
+    return efforts
+
+
+def compute(streams: Dict[str, np.ndarray]) -> Dict[str, Tuple[float, int, int]]:
+    """Mọi best effort của một hoạt động từ streams (time, distance, watts), một lượt mỗi kênh"""
+    time = streams.get("time")
+    if time is None or len(time) < 2 or np.any(np.diff(time) < 0):
+        return {}
+    efforts = {}
+    distance = streams.get("distance")
+    if distance is not None and len(distance) == len(time):
+        efforts.update(best_times(time, distance))
+    watts = streams.get("watts")
+    if watts is not None and len(watts) == len(time):
+        efforts.update(best_powers(time, watts))
+    return efforts
+
+
+def _score(effort, value):
+    # Giá trị nhỏ hơn là tốt hơn: thời gian giữ nguyên, công suất đổi dấu
+    return case((effort.in_(list(POWER_EFFORTS)), -value), else_=value)
+
+
+def _best_rows(where):
+    """Dòng kỷ lục (theo RECORD_COLUMNS) của mỗi (người dùng, loại, mốc) từ các best effort thỏa `where`"""
+    activity_type = func.coalesce(Activity.type, "")
+    ranked = (
+        select(
+            ActivityBestEffort.user_id,
+            activity_type.label("type"),
+            ActivityBestEffort.effort,
+            ActivityBestEffort.activity_id,
+            ActivityBestEffort.value,
+            Activity.start_date,
+            ActivityBestEffort.start_offset,
+            ActivityBestEffort.end_offset,
+            func.row_number().over(
+                partition_by=(ActivityBestEffort.user_id, activity_type, ActivityBestEffort.effort),
+                order_by=(_score(ActivityBestEffort.effort, ActivityBestEffort.value), Activity.start_date,
+                          ActivityBestEffort.activity_id),
+            ).label("rank"),
+        )
+        .join(Activity, Activity.id == ActivityBestEffort.activity_id)
+        .where(where)
+        .subquery()
+    )
+    return select(*(ranked.c[column] for column in RECORD_COLUMNS)).where(ranked.c.rank == 1)
+
+
+async def _held_keys(db: AsyncSession, activity_ids: List[int]) -> Set[tuple]:
+    result = await db.execute(
+        select(PersonalRecord.user_id, PersonalRecord.type, PersonalRecord.effort)
+        .where(PersonalRecord.activity_id.in_(activity_ids))
+    )
+    return set(result.all())
+
+
+async def _refresh(db: AsyncSession, activity_ids: List[int], held: Set[tuple]):
+    """Cập nhật kỷ lục sau khi best effort của các hoạt động thay đổi
+
+    Kỷ lục do chính các hoạt động này giữ (có thể đã kém đi hoặc mất) được tính
+    lại từ bảng best effort; các mốc khác chỉ thay khi best effort mới tốt hơn.
+    """
+    if held:
+        keys = list(held)
+        await db.execute(
+            delete(PersonalRecord).where(
+                tuple_(PersonalRecord.user_id, PersonalRecord.type, PersonalRecord.effort).in_(keys)
+            ),
+            execution_options={"synchronize_session": False},
+        )
+        activity_type = func.coalesce(Activity.type, "")
+        await db.execute(insert(PersonalRecord).from_select(RECORD_COLUMNS, _best_rows(
+            tuple_(ActivityBestEffort.user_id, activity_type, ActivityBestEffort.effort).in_(keys)
+        )))
+
+    stmt = insert(PersonalRecord).from_select(RECORD_COLUMNS, _best_rows(ActivityBestEffort.activity_id.in_(activity_ids)))
+    new, current = _score(stmt.excluded.effort, stmt.excluded.value), _score(PersonalRecord.effort, PersonalRecord.value)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PersonalRecord.user_id, PersonalRecord.type, PersonalRecord.effort],
+        set_={column: stmt.excluded[column] for column in RECORD_COLUMNS[3:]},
+        where=or_(
+            new < current,
+            and_(new == current, tuple_(stmt.excluded.start_date, stmt.excluded.activity_id)
+                 < tuple_(PersonalRecord.start_date, PersonalRecord.activity_id)),
+        ),
+    )
+    await db.execute(stmt)
+
+
+async def save_efforts(db: AsyncSession, streams: Dict[int, Dict[str, np.ndarray]]):
+    """Tính và ghi best effort của các hoạt động {activity_id: {kênh: mảng}}, cập nhật kỷ lục
+
+    Không commit; người gọi quyết định ranh giới transaction.
+    """
+    if not streams:
+        return
+    activity_ids = list(streams)
+    computed = await asyncio.to_thread(lambda: {activity_id: compute(streams[activity_id]) for activity_id in activity_ids})
+    owners = dict((await db.execute(select(Activity.id, Activity.user_id).where(Activity.id.in_(activity_ids)))).all())
+
+    held = await _held_keys(db, activity_ids)
+    await db.execute(
+        delete(ActivityBestEffort).where(ActivityBestEffort.activity_id.in_(activity_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    rows = [
+        {"activity_id": activity_id, "effort": effort, "user_id": owners[activity_id], "value": value,
+         "start_offset": start, "end_offset": end}
+        for activity_id, efforts in computed.items() if activity_id in owners
+        for effort, (value, start, end) in efforts.items()
+    ]
+    if rows:
+        await db.execute(insert(ActivityBestEffort), rows)
+    await db.execute(
+        update(Activity).where(Activity.id.in_(activity_ids)).values(best_efforts_version=VERSION),
+        execution_options={"synchronize_session": False},
+    )
+    await _refresh(db, activity_ids, held)
+
+
+async def activities_changed(db: AsyncSession, activity_ids: List[int]):
+    """Cập nhật kỷ lục sau khi loại hoặc ngày của các hoạt động thay đổi. Không commit"""
+    if activity_ids:
+        await _refresh(db, activity_ids, await _held_keys(db, activity_ids))
+
+
+async def delete_efforts(db: AsyncSession, activity_ids: List[int]):
+    """Xóa best effort của các hoạt động và tính lại các kỷ lục chúng đang giữ. Không commit"""
+    if not activity_ids:
+        return
+    held = await _held_keys(db, activity_ids)
+    await db.execute(
+        delete(ActivityBestEffort).where(ActivityBestEffort.activity_id.in_(activity_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    await _refresh(db, activity_ids, held)
+
+
+def outdated(user_id: int = None):
+    """Điều kiện chọn các hoạt động chưa tính best effort hoặc tính theo phiên bản cũ"""
+    where = or_(Activity.best_efforts_version.is_(None), Activity.best_efforts_version < VERSION)
+    return where if user_id is None else and_(where, Activity.user_id == user_id)
+
+
+async def rebuild(db: AsyncSession, user_id: int = None) -> int:
+    """Tính lại bảng kỷ lục từ bảng best effort (toàn bộ hoặc một người dùng), trả về số kỷ lục
+
+    Không commit; người gọi quyết định ranh giới transaction.
+    """
+    stmt = delete(PersonalRecord)
+    where = ActivityBestEffort.user_id.is_not(None)
+    if user_id is not None:
+        stmt = stmt.where(PersonalRecord.user_id == user_id)
+        where = ActivityBestEffort.user_id == user_id
+    await db.execute(stmt, execution_options={"synchronize_session": False})
+    await db.execute(insert(PersonalRecord).from_select(RECORD_COLUMNS, _best_rows(where)))
+    count = select(func.count()).select_from(PersonalRecord)
+    if user_id is not None:
+        count = count.where(PersonalRecord.user_id == user_id)
+    return await db.scalar(count)
+
+
+async def check(db: AsyncSession, user_id: int = None) -> List[dict]:
+    """So sánh bảng kỷ lục với kỷ lục tính lại từ đầu, trả về các khác biệt"""
+    where = ActivityBestEffort.user_id.is_not(None) if user_id is None else ActivityBestEffort.user_id == user_id
+    expected = {tuple(row[:3]): tuple(row[3:]) for row in (await db.execute(_best_rows(where))).all()}
+    stmt = select(*(getattr(PersonalRecord, column) for column in RECORD_COLUMNS))
+    if user_id is not None:
+        stmt = stmt.where(PersonalRecord.user_id == user_id)
+    actual = {tuple(row[:3]): tuple(row[3:]) for row in (await db.execute(stmt)).all()}
+    return [
+        {"user_id": key[0], "type": key[1], "effort": key[2], "expected": expected.get(key), "actual": actual.get(key)}
+        for key in sorted(expected.keys() | actual.keys())
+        if expected.get(key) != actual.get(key)
+    ]
+
+
+def _effort_dict(effort: str, value: float, start_offset: int, end_offset: int) -> dict:
+    if effort in DISTANCE_EFFORTS:
+        return {"effort": effort, "distance": DISTANCE_EFFORTS[effort], "elapsed_time": value,
+                "start_offset": start_offset, "end_offset": end_offset}
+    return {"effort": effort, "duration": POWER_EFFORTS[effort], "average_watts": round(value, 1),
+            "start_offset": start_offset, "end_offset": end_offset}
+
+
+async def get_records(db: AsyncSession, user_id: int, activity_type: Optional[str] = None) -> List[dict]:
+    """Kỷ lục cá nhân của người dùng theo loại hoạt động, theo thứ tự các mốc"""
+    stmt = select(*(getattr(PersonalRecord, column) for column in RECORD_COLUMNS)).where(PersonalRecord.user_id == user_id)
+    if activity_type is not None:
+        stmt = stmt.where(PersonalRecord.type == activity_type)
+    rows = (await db.execute(stmt)).all()
+    rows.sort(key=lambda row: (row.type, EFFORTS.index(row.effort) if row.effort in EFFORTS else len(EFFORTS)))
+    return [
+        {"type": row.type, "activity_id": row.activity_id, "start_date": row.start_date,
+         **_effort_dict(row.effort, row.value, row.start_offset, row.end_offset)}
+        for row in rows if row.effort in EFFORTS
+    ]
+
+
+async def get_activity_efforts(db: AsyncSession, activity_id: int) -> List[dict]:
+    """Best effort của một hoạt động, đánh dấu mốc nào đang là kỷ lục cá nhân"""
+    result = await db.execute(
+        select(ActivityBestEffort.effort, ActivityBestEffort.value, ActivityBestEffort.start_offset,
+               ActivityBestEffort.end_offset, PersonalRecord.activity_id)
+        .join(Activity, Activity.id == ActivityBestEffort.activity_id)
+        .outerjoin(PersonalRecord, and_(
+            PersonalRecord.user_id == ActivityBestEffort.user_id,
+            PersonalRecord.type == func.coalesce(Activity.type, ""),
+            PersonalRecord.effort == ActivityBestEffort.effort,
+        ))
+        .where(ActivityBestEffort.activity_id == activity_id)
+    )
+    rows = sorted(result.all(), key=lambda row: EFFORTS.index(row.effort) if row.effort in EFFORTS else len(EFFORTS))
+    return [
+        {**_effort_dict(effort, value, start_offset, end_offset), "personal_record": holder == activity_id}
+        for effort, value, start_offset, end_offset, holder in rows if effort in EFFORTS
+    ]
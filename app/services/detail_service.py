@@ -0,0 +1,227 @@
+# app/services/detail_service.py
+"""Cache đọc-xuyên (read-through) chi tiết hoạt động từ Strava
+
+Thứ tự tra cứu: LRU trong tiến trình -> bảng activity_details -> Strava. Lần xem đầu
+tải từ Strava đúng một lần (các request đồng thời dùng chung lời gọi); webhook lưu
+luôn chi tiết vừa tải khi áp dụng sự kiện. Khi hoạt động thay đổi (đồng bộ, webhook)
+chi tiết bị đánh dấu cũ: bản cũ vẫn được trả về ngay và được tải lại ở nền.
+"""
+import asyncio
+import time
+import zlib
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import SessionLocal
+from app.models.activity import Activity
+from app.models.activity_detail import ActivityDetail
+from app.services import strava_service
+from app.services.strava_scheduler import BACKGROUND, INTERACTIVE
+from app.utils.cache import TTLCache
+from app.utils.metrics import Collector, Counter
+from app.utils.singleflight import SingleFlight
+
+# Các trường của DetailedActivity được lưu (phần summary đã có trong bảng activities)
+DETAIL_FIELDS = (
+    "description",
+    "calories",
+    "device_name",
+    "gear_id",
+    "gear",
+    "average_cadence",
+    "average_heartrate",
+    "max_heartrate",
+    "average_watts",
+    "weighted_average_watts",
+    "kilojoules",
+    "laps",
+    "splits_metric",
+    "splits_standard",
+    "segment_efforts",
+    "best_efforts",
+)
+
+
+class Entry(NamedTuple):
+    user_id: int
+    strava_id: str
+    fetched_at: int
+    stale: bool
+    details: dict
+
+
+memory = TTLCache(maxsize=settings.ACTIVITY_DETAIL_CACHE_SIZE, ttl=settings.ACTIVITY_DETAIL_CACHE_TTL)
+# Hoạt động vừa tải lại lỗi: không thử lại trước ACTIVITY_DETAIL_RETRY_DELAY giây
+_failed = TTLCache(maxsize=settings.ACTIVITY_DETAIL_CACHE_SIZE, ttl=settings.ACTIVITY_DETAIL_RETRY_DELAY)
+# Các lần tải từ Strava đang chạy theo activity_id; tác vụ tải lại nền theo activity_id
+_fetch_flights = SingleFlight()
+_revalidating: Dict[int, asyncio.Task] = {}
+# Tăng mỗi lần hủy cache, tránh lưu vào LRU bản đã đọc từ DB trước khi bị hủy
+_invalidations = 0
+
+DETAIL_READS = Counter("activity_detail_reads", "Activity detail reads by cache result", ("result",))
+Collector("activity_detail_cache_size", "Activity details cached in memory", (), lambda: {(): len(memory)})
+
+
+def _pack(details: dict) -> bytes:
+    return zlib.compress(orjson.dumps(details), 6)
+
+
+def _unpack(blob: bytes) -> dict:
+    return orjson.loads(zlib.decompress(blob))
+
+
+def project(activity_id: int, strava_id: str, data: dict) -> dict:
+    """Chi tiết trả về cho client: id của hoạt động và các trường DETAIL_FIELDS có trong phản hồi Strava"""
+    details = {"id": activity_id, "strava_id": strava_id}
+    details.update({field: data[field] for field in DETAIL_FIELDS if field in data})
+    return details
+
+
+def _forget(activity_ids: Iterable[int]):
+    global _invalidations
+    _invalidations += 1
+    for activity_id in activity_ids:
+        memory.pop(activity_id)
+
+
+def is_expired(entry: Entry, now: float = None) -> bool:
+    """Chi tiết đã bị đánh dấu cũ hoặc quá ACTIVITY_DETAIL_MAX_AGE"""
+    if entry.stale:
+        return True
+    max_age = settings.ACTIVITY_DETAIL_MAX_AGE
+    return bool(max_age) and (now or time.time()) - entry.fetched_at > max_age
+
+
+async def save_details(db: AsyncSession, activities: List[dict]) -> Dict[int, dict]:
+    """Lưu chi tiết từ các phản hồi /activities/{id} của Strava (hoạt động đã có trong DB)
+
+    Trả về {activity_id: chi tiết}. Không commit; người gọi quyết định ranh giới transaction.
+    """
+    by_strava_id = {str(data["id"]): data for data in activities}
+    if not by_strava_id:
+        return {}
+    result = await db.execute(
+        select(Activity.id, Activity.strava_id).where(Activity.strava_id.in_(list(by_strava_id)))
+    )
+    saved = {row.id: project(row.id, row.strava_id, by_strava_id[row.strava_id]) for row in result.all()}
+    if not saved:
+        return saved
+    now = int(time.time())
+    stmt = insert(ActivityDetail)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ActivityDetail.activity_id],
+        set_={column: stmt.excluded[column] for column in ("data", "fetched_at", "stale")},
+    )
+    await db.execute(stmt, [
+        {"activity_id": activity_id, "data": _pack(details), "fetched_at": now, "stale": False}
+        for activity_id, details in saved.items()
+    ])
+    _forget(saved)
+    return saved
+
+
+async def invalidate(db: AsyncSession, activity_ids: Iterable[int]):
+    """Đánh dấu chi tiết của các hoạt động đã thay đổi là cũ (giữ bản cũ để trả về trong lúc tải lại)
+
+    Không commit; người gọi quyết định ranh giới transaction.
+    """
+    activity_ids = list(activity_ids)
+    if not activity_ids:
+        return
+    await db.execute(
+        update(ActivityDetail).where(ActivityDetail.activity_id.in_(activity_ids)).values(stale=True),
+        execution_options={"synchronize_session": False},
+    )
+    _forget(activity_ids)
+
+
+async def delete_details(db: AsyncSession, activity_ids: Iterable[int]):
+    """Xóa chi tiết của các hoạt động. Không commit; người gọi quyết định ranh giới transaction"""
+    activity_ids = list(activity_ids)
+    if not activity_ids:
+        return
+    await db.execute(
+        delete(ActivityDetail).where(ActivityDetail.activity_id.in_(activity_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    _forget(activity_ids)
+
+
+async def _fetch(user, activity_id: int, strava_id: str, priority: int, refresh: bool) -> dict:
+    async with SessionLocal() as db:
+        if not refresh:
+            # Tiến trình khác có thể đã tải xong trong lúc chờ
+            row = (await db.execute(
+                select(ActivityDetail.data).where(ActivityDetail.activity_id == activity_id)
+            )).first()
+            if row is not None:
+                return _unpack(row.data)
+        user = await strava_service.check_and_refresh_token(user, db, priority=priority)
+        data = await strava_service.get_activity(user.strava_access_token, int(strava_id), priority=priority)
+        saved = await save_details(db, [data])
+        await db.commit()
+    if activity_id not in saved:
+        # Hoạt động bị xóa trong lúc tải
+        raise HTTPException(status_code=404, detail="Activity not found")
+    return saved[activity_id]
+
+
+async def _revalidate(user, activity_id: int, strava_id: str):
+    try:
+        await _fetch_flights.do(activity_id, lambda: _fetch(user, activity_id, strava_id, BACKGROUND, True))
+    except Exception as e:
+        _failed.set(activity_id, True)
+        print(f"Error refreshing details of activity {activity_id}: {str(e)}")
+
+
+def _schedule_revalidation(user, activity_id: int, strava_id: str):
+    """Tải lại chi tiết ở nền (một lần cho mỗi hoạt động, không thử lại ngay sau khi lỗi)"""
+    if not user.strava_access_token or activity_id in _revalidating or _failed.get(activity_id):
+        return
+    task = asyncio.ensure_future(_revalidate(user, activity_id, strava_id))
+    _revalidating[activity_id] = task
+    task.add_done_callback(lambda _: _revalidating.pop(activity_id, None))
+
+
+async def get_details(db: AsyncSession, user, activity_id: int) -> Tuple[dict, str]:
+    """Chi tiết hoạt động của người dùng và kết quả tra cache: "hit", "stale" hoặc "miss"
+
+    "stale": trả bản cũ ngay và tải lại ở nền; "miss": chưa có trong DB, tải từ Strava
+    (các request đồng thời của cùng hoạt động dùng chung một lời gọi).
+    """
+    entry: Optional[Entry] = memory.get(activity_id)
+    if entry is None or entry.user_id != user.id:
+        generation = _invalidations
+        row = (await db.execute(
+            select(Activity.strava_id, ActivityDetail.data, ActivityDetail.fetched_at, ActivityDetail.stale)
+            .outerjoin(ActivityDetail, ActivityDetail.activity_id == Activity.id)
+            .where(Activity.id == activity_id, Activity.user_id == user.id)
+        )).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Activity not found")
+        if row.data is None:
+            if not user.strava_access_token:
+                raise HTTPException(status_code=400, detail="No Strava account linked")
+            # Trả kết nối của request về pool trong lúc chờ Strava (lần tải dùng session riêng)
+            await db.close()
+            details = await _fetch_flights.do(
+                activity_id, lambda: _fetch(user, activity_id, row.strava_id, INTERACTIVE, False)
+            )
+            DETAIL_READS.inc(("miss",))
+            return details, "miss"
+        entry = Entry(user.id, row.strava_id, row.fetched_at, row.stale, _unpack(row.data))
+        if generation == _invalidations:
+            memory.set(activity_id, entry)
+
+    if is_expired(entry):
+        _schedule_revalidation(user, activity_id, entry.strava_id)
+        DETAIL_READS.inc(("stale",))
+        return entry.details, "stale"
+    DETAIL_READS.inc(("hit",))
+    return entry.details, "hit"
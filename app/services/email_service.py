@@ -1,16 +1,35 @@
 # app/services/email_service.py
+import asyncio
 import smtplib
+import time
+import uuid
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
+from app.database import SessionLocal
+from app.models.email_outbox import EmailOutbox
+from app.utils.metrics import Counter, Histogram
+from app.utils.smtp_pool import MESSAGE_ERRORS, SMTPPool
 
+EMAILS = Counter("emails", "Outbox email delivery attempts by result", ("result",))
+EMAIL_BATCH_SECONDS = Histogram("email_batch_duration_seconds", "Time to send one outbox batch over the SMTP pool")
 
-async def send_verification_email(to_email: str, verification_code: str):
-    """Gửi email xác nhận đến người dùng"""
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "Xác nhận tài khoản Strava Integration"
-    message["From"] = settings.EMAIL_FROM
-    message["To"] = to_email
+# Đánh thức worker ngay khi có email mới (tạo khi worker khởi động)
+_wakeup: Optional[asyncio.Event] = None
+
+
+def notify():
+    """Báo cho worker trong tiến trình biết có email mới trong outbox"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def verification_email(verification_code: str):
+    """Tiêu đề và nội dung (text, html) của email xác nhận"""
+    subject = "Xác nhận tài khoản Strava Integration"
 
     # Tạo nội dung email
     text = f"""
@@ -28,15 +47,171 @@ async def send_verification_email(to_email: str, verification_code: str):
     </body>
     </html>
     """
+    return subject, text, html
+
+
+async def enqueue_email(db: AsyncSession, to_email: str, subject: str, text: str, html: str = None) -> EmailOutbox:
+    """Thêm email vào outbox trong transaction hiện tại; người gọi commit rồi gọi notify()"""
+    row = EmailOutbox(
+        to_email=to_email,
+        subject=subject,
+        text_body=text,
+        html_body=html,
+        status="pending",
+        attempts=0,
+        available_at=0,
+    )
+    db.add(row)
+    await db.flush()
+    return row
+
+
+async def enqueue_verification_email(db: AsyncSession, to_email: str, verification_code: str) -> EmailOutbox:
+    """Đưa email xác nhận vào outbox (gửi nền bởi worker)"""
+    subject, text, html = verification_email(verification_code)
+    return await enqueue_email(db, to_email, subject, text, html)
+
+
+async def send_verification_email(to_email: str, verification_code: str):
+    """Gửi email xác nhận đến người dùng (qua outbox, không chờ SMTP)"""
+    async with SessionLocal() as db:
+        await enqueue_verification_email(db, to_email, verification_code)
+        await db.commit()
+    notify()
+
+
+def build_message(row: EmailOutbox) -> str:
+    message = MIMEMultipart("alternative")
+    message["Subject"] = row.subject
+    message["From"] = settings.EMAIL_FROM
+    message["To"] = row.to_email
+    message.attach(MIMEText(row.text_body, "plain"))
+    if row.html_body:
+        message.attach(MIMEText(row.html_body, "html"))
+    return message.as_string()
+
+
+def connect_smtp() -> smtplib.SMTP:
+    """Mở một kết nối SMTP đã STARTTLS và đăng nhập (blocking)"""
+    server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+    try:
+        if settings.SMTP_STARTTLS:
+            server.starttls()
+        if settings.EMAIL_USERNAME:
+            server.login(settings.EMAIL_USERNAME, settings.EMAIL_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def create_pool() -> SMTPPool:
+    return SMTPPool(connect_smtp, settings.SMTP_POOL_SIZE, settings.SMTP_IDLE_TIMEOUT)
+
+
+def _retry_delay(attempts: int) -> int:
+    """Backoff lũy thừa cho lần thử thứ `attempts` (bắt đầu từ 1)"""
+    return min(settings.EMAIL_RETRY_DELAY * 2 ** (attempts - 1), settings.EMAIL_RETRY_MAX_DELAY)
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Địa chỉ hoặc nội dung bị server từ chối vĩnh viễn (5xx): không thử lại"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, MESSAGE_ERRORS) and error.smtp_code >= 500
+
+
+async def drain_outbox(pool: SMTPPool, batch_size: int = None) -> int:
+    """Nhận một lô email đến hạn và gửi qua pool; trả về số email đã lấy
+
+    Lô được nhận bằng một lệnh UPDATE (claim_token + lease) nên nhiều worker có
+    thể chạy song song mà không gửi trùng; lô của worker bị dừng giữa chừng sẽ
+    được gửi lại khi lease hết hạn.
+    """
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    now = int(time.time())
+    claim = uuid.uuid4().hex
+
+    async with SessionLocal() as db:
+        due = (
+            select(EmailOutbox.id)
+            .where(EmailOutbox.status == "pending", EmailOutbox.available_at <= now)
+            .order_by(EmailOutbox.id)
+            .limit(batch_size)
+        )
+        await db.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(due.scalar_subquery()))
+            .values(claim_token=claim, available_at=now + settings.EMAIL_LEASE_SECONDS)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        result = await db.execute(select(EmailOutbox).where(EmailOutbox.claim_token == claim))
+        rows = result.scalars().all()
+        if not rows:
+            return 0
+
+        messages = [(row.id, row.to_email, build_message(row)) for row in rows]
+        previous_attempts = {row.id: row.attempts for row in rows}
+        # Trả kết nối DB trong lúc chờ SMTP
+        await db.rollback()
+        started = time.perf_counter()
+        results = await pool.send_many(settings.EMAIL_FROM, messages)
+        EMAIL_BATCH_SECONDS.observe(time.perf_counter() - started)
+
+        sent = [message_id for message_id, error in results if error is None]
+        EMAILS.inc(("sent",), len(sent))
+        if sent:
+            await db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(sent))
+                .values(status="sent", sent_at=int(time.time()), claim_token=None, last_error=None)
+                .execution_options(synchronize_session=False)
+            )
+
+        now = int(time.time())
+        for message_id, error in results:
+            if error is None:
+                continue
+            print(f"Error sending email {message_id}: {str(error)}")
+            attempts = previous_attempts[message_id] + 1
+            permanent = _is_permanent(error)
+            EMAILS.inc(("failed" if permanent or attempts >= settings.EMAIL_MAX_ATTEMPTS else "retry",))
+            await db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id == message_id)
+                .values(
+                    attempts=attempts,
+                    claim_token=None,
+                    last_error=str(error)[:500],
+                    available_at=now + _retry_delay(attempts),
+                    status="failed" if permanent or attempts >= settings.EMAIL_MAX_ATTEMPTS else "pending",
+                )
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+        return len(rows)
+
 
-    part1 = MIMEText(text, "plain")
-    part2 = MIMEText(html, "html")
+async def run_email_worker(stop: asyncio.Event):
+    """Tác vụ nền: gửi email trong outbox theo lô qua các kết nối SMTP dùng lại"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    pool = create_pool()
 
-    message.attach(part1)
-    message.attach(part2)
+    try:
+        while not stop.is_set():
+            _wakeup.clear()
+            try:
+                while await drain_outbox(pool) and not stop.is_set():
+                    pass
+            except Exception as e:
+                print(f"Error in email worker: {str(e)}")
 
-    # Gửi email
-    with smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT) as server:
-        server.starttls()
-        server.login(settings.EMAIL_USERNAME, settings.EMAIL_PASSWORD)
-        server.sendmail(settings.EMAIL_FROM, to_email, message.as_string())
\ No newline at end of file
+            waiters = [asyncio.ensure_future(stop.wait()), asyncio.ensure_future(_wakeup.wait())]
+            await asyncio.wait(waiters, timeout=settings.EMAIL_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+    finally:
+        await pool.close()
@@ -0,0 +1,58 @@
+# app/services/export_service.py
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, List
+
+from sqlalchemy import Row
+from app.services import activity_service
+
+# Định dạng xuất -> media type
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _ndjson(rows: List[Row]) -> str:
+    columns = activity_service.EXPORT_COLUMNS
+    return "".join(
+        json.dumps(dict(zip(columns, map(_value, row))), ensure_ascii=False) + "\n" for row in rows
+    )
+
+
+def _csv(rows: List[Row], header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(activity_service.EXPORT_COLUMNS)
+    writer.writerows(map(_value, row) for row in rows)
+    return buffer.getvalue()
+
+
+async def export_chunks(user_id: int, export_format: str, compress: bool = False) -> AsyncIterator[bytes]:
+    """Sinh file xuất theo từng lô dòng đọc từ cursor phía server, nén gzip nếu cần
+
+    Bộ nhớ chỉ phụ thuộc vào kích thước lô, không phụ thuộc số hoạt động.
+    """
+    encode = _ndjson if export_format == "ndjson" else _csv
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    def output(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    if export_format == "csv":
+        yield output(_csv([], header=True))
+    async for rows in activity_service.iter_activity_rows(user_id):
+        chunk = output(encode(rows))
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
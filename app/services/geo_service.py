@@ -0,0 +1,313 @@
+# app/services/geo_service.py
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.activity import Activity
+from app.models.activity_cell import ActivityCell
+from app.utils import geo
+
+# Một đoạn polyline được chia thành tối đa chừng này bước khi phủ ô (đoạn dài bất thường, qua kinh tuyến 180)
+MAX_SEGMENT_STEPS = 1000
+
+# Số tham số tối đa trong một câu lệnh IN (SQLite giới hạn số biến mỗi câu lệnh)
+IN_CHUNK = 5000
+
+METERS_PER_DEGREE = 111_320.0
+
+
+def _grid() -> Tuple[float, int, int]:
+    size = settings.GEO_CELL_DEGREES
+    return size, int(math.ceil(180 / size)), int(math.ceil(360 / size))
+
+
+def point_cells(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """Số hiệu ô lưới chứa mỗi điểm: hàng (theo lat) * số cột + cột (theo lng)"""
+    size, rows, columns = _grid()
+    row = np.clip(np.floor((lat + 90) / size).astype(np.int64), 0, rows - 1)
+    column = np.floor((lng + 180) / size).astype(np.int64) % columns
+    return row * columns + column
+
+
+def route_cells(routes: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Các ô mà mỗi tuyến (mảng (N, 2) [lat, lng]) đi qua, tính cho mọi tuyến trong một lượt
+
+    Mỗi đoạn được chia nhỏ để hai điểm liên tiếp cách nhau không quá nửa ô, nên
+    đoạn thẳng dài vẫn phủ đủ các ô ở giữa. Trả về (chỉ số tuyến, ô), không trùng lặp.
+    """
+    lengths = np.fromiter((len(route) for route in routes), dtype=np.int64, count=len(routes))
+    if not lengths.sum():
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    points = np.concatenate([route for route in routes if len(route)])
+    owners = np.repeat(np.arange(len(routes)), lengths)
+
+    # Đoạn nối điểm cuối tuyến này với điểm đầu tuyến sau không thuộc tuyến nào: chỉ giữ điểm đầu
+    deltas = points[1:] - points[:-1]
+    inside = owners[1:] == owners[:-1]
+    step = settings.GEO_CELL_DEGREES / 2
+    steps = np.where(inside, np.clip(np.ceil(np.abs(deltas).max(axis=1) / step), 1, MAX_SEGMENT_STEPS), 1)
+    steps = steps.astype(np.int64)
+    segment = np.repeat(np.arange(len(steps)), steps)
+    fraction = (np.arange(len(segment)) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[segment]
+    dense = points[segment] + deltas[segment] * fraction[:, None]
+    dense = np.concatenate([dense, points[-1:]])
+    dense_owners = np.concatenate([owners[segment], owners[-1:]])
+
+    _, rows, columns = _grid()
+    total = rows * columns
+    keys = np.unique(dense_owners * total + point_cells(dense[:, 0], dense[:, 1]))
+    return keys // total, keys % total
+
+
+def neighbour_cells(cells: np.ndarray) -> np.ndarray:
+    """Mảng (N, 9): mỗi ô và 8 ô kề (chịu sai lệch GPS quanh biên ô)"""
+    _, rows, columns = _grid()
+    row, column = cells // columns, cells % columns
+    offsets = np.array([-1, 0, 1])
+    neighbour_rows = np.clip(row[:, None, None] + offsets[None, :, None], 0, rows - 1)
+    neighbour_columns = (column[:, None, None] + offsets[None, None, :]) % columns
+    return (neighbour_rows * columns + neighbour_columns).reshape(len(cells), 9)
+
+
+def parse_route(polyline: str) -> np.ndarray:
+    """Giải mã polyline do client gửi; polyline không hợp lệ trả về 400"""
+    try:
+        points = geo.decode_polyline(polyline)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid polyline")
+    if not len(points) or np.abs(points[:, 0]).max() > 90 or np.abs(points[:, 1]).max() > 180:
+        raise HTTPException(status_code=400, detail="Invalid polyline")
+    return points
+
+
+async def _replace_cells(db: AsyncSession, user_id: int, routes: Dict[int, Optional[str]]):
+    """Ghi lại các ô của các hoạt động {activity_id: polyline}; polyline rỗng chỉ xóa ô cũ"""
+    await delete_cells(db, list(routes))
+    encoded = [(activity_id, polyline) for activity_id, polyline in routes.items() if polyline]
+    if not encoded:
+        return
+    try:
+        decoded = geo.decode_polylines([polyline for _, polyline in encoded])
+    except ValueError:
+        # Một polyline lỗi không được chặn cả lô: giải mã lại từng cái, bỏ qua cái lỗi
+        decoded = []
+        for _, polyline in encoded:
+            try:
+                decoded.append(geo.decode_polyline(polyline))
+            except ValueError:
+                decoded.append(np.zeros((0, 2)))
+    owners, cells = route_cells(decoded)
+    activity_ids = np.array([activity_id for activity_id, _ in encoded], dtype=np.int64)[owners]
+    rows = [
+        {"user_id": user_id, "cell": cell, "activity_id": activity_id}
+        for activity_id, cell in zip(activity_ids.tolist(), cells.tolist())
+    ]
+    if rows:
+        await db.execute(insert(ActivityCell).on_conflict_do_nothing(), rows)
+
+
+async def update_cells(db: AsyncSession, user_id: int, rows: List[dict], previous: Dict[str, Optional[str]]):
+    """Cập nhật ô lưới cho các dòng vừa upsert có polyline mới hoặc thay đổi
+
+    Không commit; người gọi quyết định ranh giới transaction.
+    """
+    changed = {
+        row["strava_id"]: row["summary_polyline"]
+        for row in rows
+        if row["strava_id"] not in previous or previous[row["strava_id"]] != row["summary_polyline"]
+    }
+    # Hoạt động mới không có polyline thì không có ô nào để ghi hoặc xóa
+    changed = {strava_id: polyline for strava_id, polyline in changed.items() if polyline or strava_id in previous}
+    if not changed:
+        return
+    result = await db.execute(select(Activity.strava_id, Activity.id).where(Activity.strava_id.in_(list(changed))))
+    await _replace_cells(db, user_id, {activity_id: changed[strava_id] for strava_id, activity_id in result.all()})
+
+
+async def delete_cells(db: AsyncSession, activity_ids: List[int]):
+    """Xóa ô lưới của các hoạt động. Không commit"""
+    for offset in range(0, len(activity_ids), IN_CHUNK):
+        await db.execute(
+            delete(ActivityCell).where(ActivityCell.activity_id.in_(activity_ids[offset:offset + IN_CHUNK])),
+            execution_options={"synchronize_session": False},
+        )
+
+
+async def rebuild(db: AsyncSession, user_id: int = None, batch_size: int = 1000) -> int:
+    """Tính lại bảng ô lưới từ polyline đã lưu (toàn bộ hoặc một người dùng), trả về số dòng
+
+    Dùng khi đổi GEO_CELL_DEGREES. Không commit; người gọi quyết định ranh giới transaction.
+    """
+    stmt = delete(ActivityCell)
+    if user_id is not None:
+        stmt = stmt.where(ActivityCell.user_id == user_id)
+    await db.execute(stmt, execution_options={"synchronize_session": False})
+
+    last_id = 0
+    while True:
+        stmt = (
+            select(Activity.id, Activity.user_id, Activity.summary_polyline)
+            .where(Activity.id > last_id, Activity.summary_polyline.is_not(None))
+            .order_by(Activity.id)
+            .limit(batch_size)
+        )
+        if user_id is not None:
+            stmt = stmt.where(Activity.user_id == user_id)
+        batch = (await db.execute(stmt)).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        by_user: Dict[int, Dict[int, str]] = {}
+        for activity_id, owner, polyline in batch:
+            by_user.setdefault(owner, {})[activity_id] = polyline
+        for owner, routes in by_user.items():
+            await _replace_cells(db, owner, routes)
+
+    count = select(func.count()).select_from(ActivityCell)
+    if user_id is not None:
+        count = count.where(ActivityCell.user_id == user_id)
+    return await db.scalar(count)
+
+
+async def find_near(
+        db: AsyncSession,
+        user_id: int,
+        columns: Iterable[str],
+        lat: float,
+        lng: float,
+        radius: float,
+        activity_type: Optional[str] = None,
+        limit: int = 50
+) -> List[dict]:
+    """Hoạt động bắt đầu trong bán kính `radius` mét quanh (lat, lng), gần nhất trước
+
+    Lọc bằng hình chữ nhật bao trên index (user_id, start_lat, start_lng), rồi
+    tính khoảng cách chính xác cho các ứng viên.
+    """
+    columns = list(columns)
+    delta_lat = radius / METERS_PER_DEGREE
+    if abs(lat) + delta_lat >= 90:
+        delta_lng = 180.0  # vòng tròn chứa cực: mọi kinh độ
+    else:
+        delta_lng = min(180.0, delta_lat / math.cos(math.radians(abs(lat) + delta_lat)))
+
+    stmt = select(*(getattr(Activity, column) for column in columns), Activity.start_lat, Activity.start_lng).where(
+        Activity.user_id == user_id,
+        Activity.start_lat.between(lat - delta_lat, lat + delta_lat),
+    )
+    west, east = lng - delta_lng, lng + delta_lng
+    if delta_lng >= 180.0:
+        stmt = stmt.where(Activity.start_lng.is_not(None))
+    elif west < -180 or east > 180:
+        # Hình chữ nhật vắt qua kinh tuyến 180: hai khoảng kinh độ
+        stmt = stmt.where(or_(Activity.start_lng >= (west + 540) % 360 - 180, Activity.start_lng <= (east + 540) % 360 - 180))
+    else:
+        stmt = stmt.where(Activity.start_lng.between(west, east))
+    if activity_type is not None:
+        stmt = stmt.where(Activity.type == activity_type)
+    rows = (await db.execute(stmt)).all()
+    if not rows:
+        return []
+
+    coordinates = np.array([row[-2:] for row in rows], dtype=np.float64)
+    distances = geo.haversine(coordinates[:, 0], coordinates[:, 1], lat, lng)
+    order = np.argsort(distances, kind="stable")
+    order = order[distances[order] <= radius][:limit]
+    return [
+        {**dict(zip(columns, rows[i][:-2])), "start_lat": rows[i][-2], "start_lng": rows[i][-1],
+         "distance_from_point": round(float(distances[i]), 1)}
+        for i in order.tolist()
+    ]
+
+
+async def find_overlapping(
+        db: AsyncSession,
+        user_id: int,
+        columns: Iterable[str],
+        route: np.ndarray,
+        min_overlap: float = 0.5,
+        activity_type: Optional[str] = None,
+        limit: int = 50
+) -> List[dict]:
+    """Hoạt động có tuyến đường trùng với `route` (mảng (N, 2)), chỉ đọc bảng ô lưới
+
+    - overlap: tỷ lệ ô của `route` có tuyến của hoạt động đi qua (chính ô đó hoặc ô kề).
+    - activity_overlap: tỷ lệ ô của hoạt động nằm dọc `route`.
+    Trả về các hoạt động có overlap >= min_overlap, overlap cao trước.
+    """
+    _, query_cells = route_cells([route])
+    # (ô kề, chỉ số ô của route), sắp theo ô kề để tra bằng searchsorted
+    near = neighbour_cells(query_cells)
+    pairs_cell = near.ravel()
+    pairs_query = np.repeat(np.arange(len(query_cells)), 9)
+    order = np.argsort(pairs_cell, kind="stable")
+    pairs_cell, pairs_query = pairs_cell[order], pairs_query[order]
+    candidates = np.unique(pairs_cell)
+
+    matched_ids, matched_cells = [], []
+    for offset in range(0, len(candidates), IN_CHUNK):
+        result = await db.execute(
+            select(ActivityCell.activity_id, ActivityCell.cell).where(
+                ActivityCell.user_id == user_id,
+                ActivityCell.cell.in_(candidates[offset:offset + IN_CHUNK].tolist()),
+            )
+        )
+        for activity_id, cell in result.all():
+            matched_ids.append(activity_id)
+            matched_cells.append(cell)
+    if not matched_ids:
+        return []
+    matched_ids = np.array(matched_ids, dtype=np.int64)
+    matched_cells = np.array(matched_cells, dtype=np.int64)
+
+    # Mỗi ô khớp phủ các ô của route mà nó kề: mở rộng thành cặp (hoạt động, ô route)
+    first = np.searchsorted(pairs_cell, matched_cells, side="left")
+    counts = np.searchsorted(pairs_cell, matched_cells, side="right") - first
+    expanded = np.repeat(np.arange(len(matched_cells)), counts)
+    positions = np.repeat(first - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    covered = np.unique(matched_ids[expanded] * len(query_cells) + pairs_query[positions])
+    activity_ids, covered_counts = np.unique(covered // len(query_cells), return_counts=True)
+    overlap = covered_counts / len(query_cells)
+    keep = overlap >= min_overlap
+    activity_ids, overlap = activity_ids[keep], overlap[keep]
+    if not len(activity_ids):
+        return []
+
+    shared_ids, shared_counts = np.unique(matched_ids, return_counts=True)
+    shared = dict(zip(shared_ids.tolist(), shared_counts.tolist()))
+    scores = dict(zip(activity_ids.tolist(), overlap.tolist()))
+
+    # Tổng số ô của từng ứng viên (lọc theo loại luôn ở đây) để xếp hạng; chỉ đọc
+    # đầy đủ các cột của `limit` hoạt động đứng đầu
+    ranked = []
+    ids = activity_ids.tolist()
+    for offset in range(0, len(ids), IN_CHUNK):
+        stmt = (
+            select(ActivityCell.activity_id, func.count())
+            .where(ActivityCell.activity_id.in_(ids[offset:offset + IN_CHUNK]))
+            .group_by(ActivityCell.activity_id)
+        )
+        if activity_type is not None:
+            stmt = stmt.join(Activity, Activity.id == ActivityCell.activity_id).where(Activity.type == activity_type)
+        for activity_id, total in (await db.execute(stmt)).all():
+            ranked.append((-scores[activity_id], -shared[activity_id] / total, activity_id))
+    ranked = sorted(ranked)[:limit]
+    if not ranked:
+        return []
+
+    columns = list(columns)
+    result = await db.execute(select(*(getattr(Activity, column) for column in columns)).where(
+        Activity.user_id == user_id, Activity.id.in_([activity_id for _, _, activity_id in ranked])
+    ))
+    rows = {row.id: row for row in result.all()}
+    return [
+        {**dict(zip(columns, rows[activity_id])), "overlap": round(-overlap, 4),
+         "activity_overlap": round(-activity_overlap, 4)}
+        for overlap, activity_overlap, activity_id in ranked
+        if activity_id in rows
+    ]
@@ -0,0 +1,303 @@
+# app/services/import_service.py
+import asyncio
+import csv
+import io
+import multiprocessing
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from app.config import settings
+from app.database import SessionLocal
+from app.models.activity import Activity
+from app.services import activity_service, stream_service
+from app.utils import activity_files
+
+ACTIVITIES_CSV = "activities.csv"
+# Định dạng "Activity Date" trong activities.csv, ví dụ "Mar 14, 2021, 7:12:45 AM" (UTC)
+CSV_DATE_FORMAT = "%b %d, %Y, %I:%M:%S %p"
+# Số lỗi tối đa được giữ lại trong báo cáo
+MAX_REPORTED_ERRORS = 50
+
+# Pool tiến trình parse file dùng chung cho mọi lần nhập (tạo trong lifespan)
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+@dataclass
+class ImportReport:
+    """Kết quả nhập một file export của Strava"""
+    total: int = 0
+    imported: int = 0
+    skipped_existing: int = 0
+    files_parsed: int = 0
+    files_failed: int = 0
+    bytes_read: int = 0
+    errors: List[str] = field(default_factory=list)
+    started_at: float = 0.0
+    elapsed: float = 0.0
+
+    def error(self, message: str):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def to_dict(self):
+        elapsed = self.elapsed or 1e-9
+        return {
+            "total": self.total,
+            "imported": self.imported,
+            "skipped_existing": self.skipped_existing,
+            "files_parsed": self.files_parsed,
+            "files_failed": self.files_failed,
+            "errors": self.errors,
+            "elapsed": round(self.elapsed, 3),
+            "activities_per_second": round(self.imported / elapsed, 1),
+            "megabytes_per_second": round(self.bytes_read / 1024 / 1024 / elapsed, 2),
+        }
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value.replace(",", "")) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def read_activities_csv(archive: zipfile.ZipFile) -> List[dict]:
+    """Đọc activities.csv trong file export thành danh sách bản ghi (trùng ID chỉ giữ bản cuối)
+
+    File có các cột trùng tên ("Distance", "Elapsed Time"): bản đầu theo đơn vị hiển
+    thị (km), bản sau theo đơn vị chuẩn (m, giây) nên ưu tiên bản sau.
+    """
+    name = next((n for n in archive.namelist() if n.rsplit("/", 1)[-1] == ACTIVITIES_CSV), None)
+    if name is None:
+        raise HTTPException(status_code=400, detail="activities.csv not found in archive")
+
+    with archive.open(name) as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+        header = next(reader, [])
+        columns: Dict[str, List[int]] = {}
+        for index, column in enumerate(header):
+            columns.setdefault(column.strip(), []).append(index)
+
+        def get(row, column, occurrence=-1):
+            indexes = columns.get(column)
+            if not indexes:
+                return None
+            index = indexes[occurrence]
+            return row[index] if index < len(row) else None
+
+        records = {}
+        for row in reader:
+            activity_id = get(row, "Activity ID")
+            if not activity_id:
+                continue
+            distance = _number(get(row, "Distance"))
+            if distance is not None and len(columns.get("Distance", [])) == 1:
+                distance *= 1000  # bản export cũ chỉ có cột Distance theo km
+            try:
+                start_date = datetime.strptime(get(row, "Activity Date") or "", CSV_DATE_FORMAT)
+                start_date = start_date.replace(tzinfo=timezone.utc)
+            except ValueError:
+                start_date = None
+            records[activity_id.strip()] = {
+                "id": activity_id.strip(),
+                "name": get(row, "Activity Name") or "",
+                "type": get(row, "Activity Type") or "Workout",
+                "start_date": start_date,
+                "distance": distance,
+                "elapsed_time": _number(get(row, "Elapsed Time")),
+                "moving_time": _number(get(row, "Moving Time")),
+                "total_elevation_gain": _number(get(row, "Elevation Gain")),
+                "average_speed": _number(get(row, "Average Speed")),
+                "max_speed": _number(get(row, "Max Speed")),
+                "filename": (get(row, "Filename") or "").strip(),
+            }
+    return list(records.values())
+
+
+def parse_file(filename: str, data: bytes) -> dict:
+    """Parse một file GPX/TCX/FIT trong tiến trình con: trả về summary và streams đã đóng gói
+
+    Việc nén streams cũng chạy ở đây để tiến trình chính chỉ nhận các blob nhỏ.
+    """
+    points = activity_files.read_points(filename, data)
+    streams = activity_files.to_streams(points)
+    return {
+        "summary": activity_files.summarize(points, streams),
+        "streams": stream_service.pack_streams(streams),
+    }
+
+
+def _activity(record: dict, summary: dict) -> Optional[dict]:
+    """Ghép bản ghi CSV với summary từ file thành activity theo định dạng API của Strava"""
+    def pick(key, default=0.0):
+        value = record.get(key)
+        return value if value is not None else summary.get(key, default)
+
+    start_date = pick("start_date", None)
+    if start_date is None:
+        return None
+    distance, moving_time = pick("distance"), pick("moving_time", None) or pick("elapsed_time")
+    average_speed = record.get("average_speed")
+    if average_speed is None:
+        average_speed = distance / moving_time if moving_time else 0.0
+    return {
+        "id": record["id"],
+        "name": record["name"],
+        "type": record["type"],
+        "start_date": start_date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "distance": distance,
+        "moving_time": int(moving_time),
+        "elapsed_time": int(pick("elapsed_time")),
+        "total_elevation_gain": pick("total_elevation_gain"),
+        "average_speed": average_speed,
+        "max_speed": pick("max_speed"),
+        "average_heartrate": summary.get("average_heartrate"),
+        "average_watts": summary.get("average_watts"),
+        "start_latlng": summary.get("start_latlng"),
+        "end_latlng": summary.get("end_latlng"),
+        "map": {"summary_polyline": summary.get("summary_polyline")},
+    }
+
+
+def start_pool(workers: int = None) -> ProcessPoolExecutor:
+    """Tạo pool parse file (nếu chưa có) với `workers` tiến trình (mặc định IMPORT_WORKERS)
+
+    Tiến trình con được tạo bằng spawn, không fork: tiến trình chính đã có các thread
+    của aiosqlite và event loop.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=workers or settings.IMPORT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+async def shutdown_pool():
+    """Đóng pool parse file khi tắt ứng dụng; chờ các tiến trình con trong thread riêng, không chặn event loop"""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Bỏ pool đã hỏng (một tiến trình con chết); lần nhập sau tạo pool mới"""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _existing_ids(strava_ids: List[str]) -> set:
+    existing = set()
+    async with SessionLocal() as db:
+        for offset in range(0, len(strava_ids), 5000):
+            chunk = strava_ids[offset:offset + 5000]
+            result = await db.execute(select(Activity.strava_id).where(Activity.strava_id.in_(chunk)))
+            existing.update(result.scalars())
+    return existing
+
+
+async def _write_batch(user_id: int, batch: List[tuple], report: ImportReport):
+    activities = [activity for activity, _ in batch]
+    async with SessionLocal() as db:
+        await activity_service.ingest_activities(db, user_id, activities)
+        result = await db.execute(
+            select(Activity.strava_id, Activity.id).where(Activity.strava_id.in_([str(a["id"]) for a in activities]))
+        )
+        ids = dict(result.all())
+        rows = [
+            {**row, "activity_id": ids[str(activity["id"])]}
+            for activity, streams in batch
+            for row in streams
+        ]
+        await stream_service.save_packed_streams(db, rows)
+        await db.commit()
+    report.imported += len(activities)
+
+
+async def import_archive(
+        source: BinaryIO,
+        user_id: int,
+        max_in_flight: int = None,
+        batch_size: int = None
+) -> ImportReport:
+    """Nhập file ZIP export của Strava cho một người dùng, không giải nén ra đĩa
+
+    Đọc activities.csv, bỏ qua các hoạt động đã có (theo strava_id), parse các file
+    GPX/TCX/FIT song song trong pool tiến trình dùng chung và ghi theo lô (kèm rollup và
+    streams). File lỗi không làm dừng việc nhập: hoạt động vẫn được nhập từ activities.csv
+    (không có streams) và lỗi được ghi vào báo cáo. Nếu một tiến trình parse chết, pool
+    được thay mới và việc nhập dừng với 503; các lô đã ghi được giữ, nhập lại sẽ bỏ qua chúng.
+    """
+    max_in_flight = max_in_flight or settings.IMPORT_MAX_IN_FLIGHT
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    report = ImportReport(started_at=time.time())
+    started = time.perf_counter()
+
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid ZIP archive")
+
+    with archive:
+        records = await asyncio.to_thread(read_activities_csv, archive)
+        report.total = len(records)
+        existing = await _existing_ids([record["id"] for record in records])
+        pending = [record for record in records if record["id"] not in existing]
+        report.skipped_existing = report.total - len(pending)
+        members = set(archive.namelist())
+
+        loop = asyncio.get_running_loop()
+        pool = start_pool()
+        semaphore = asyncio.Semaphore(max_in_flight)
+        # ZipFile không an toàn khi nhiều thread cùng đọc: đọc tuần tự qua một khóa
+        read_lock = asyncio.Lock()
+
+        async def prepare(record: dict):
+            parsed = {"summary": {}, "streams": []}
+            filename = record["filename"]
+            if filename:
+                async with semaphore:
+                    try:
+                        if filename not in members:
+                            raise FileNotFoundError(f"{filename} missing from archive")
+                        async with read_lock:
+                            data = await asyncio.to_thread(archive.read, filename)
+                        report.bytes_read += archive.getinfo(filename).compress_size
+                        parsed = await loop.run_in_executor(pool, parse_file, filename, data)
+                        report.files_parsed += 1
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        report.files_failed += 1
+                        report.error(f"{record['id']} ({filename}): {type(e).__name__}: {e}")
+            activity = _activity(record, parsed["summary"])
+            if activity is None:
+                report.error(f"{record['id']}: missing start date")
+                return None
+            return activity, parsed["streams"]
+
+        try:
+            for offset in range(0, len(pending), batch_size):
+                prepared = await asyncio.gather(*(prepare(r) for r in pending[offset:offset + batch_size]))
+                batch = [item for item in prepared if item is not None]
+                if batch:
+                    await _write_batch(user_id, batch, report)
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise HTTPException(
+                status_code=503,
+                detail=f"Import worker crashed after {report.imported} activities; retry to import the rest",
+            )
+
+    report.elapsed = time.perf_counter() - started
+    return report
@@ -0,0 +1,44 @@
+# app/services/lease_service.py
+import os
+import socket
+import time
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.dialects.sqlite import insert
+from app.config import settings
+from app.database import SessionLocal
+from app.models.worker_lease import WorkerLease
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def acquire(name: str, owner: str = None, seconds: int = None) -> bool:
+    """Nhận hoặc gia hạn lease `name`; trả về True nếu tiến trình này đang giữ lease
+
+    Lệnh upsert chỉ ghi đè khi lease thuộc về chính `owner` hoặc đã hết hạn, nên
+    khi nhiều worker cùng chạy, mỗi lúc chỉ một tiến trình giữ được lease.
+    """
+    owner = owner or default_owner()
+    now = int(time.time())
+    expires_at = now + (seconds or settings.WORKER_LEASE_SECONDS)
+    stmt = insert(WorkerLease).values(name=name, owner=owner, expires_at=expires_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WorkerLease.name],
+        set_={"owner": owner, "expires_at": expires_at},
+        where=or_(WorkerLease.owner == owner, WorkerLease.expires_at < now),
+    )
+    async with SessionLocal() as db:
+        await db.execute(stmt)
+        await db.commit()
+        return await db.scalar(select(WorkerLease.owner).where(WorkerLease.name == name)) == owner
+
+
+async def release(name: str, owner: str = None):
+    """Trả lease khi dừng để tiến trình khác nhận ngay, không phải chờ hết hạn"""
+    async with SessionLocal() as db:
+        await db.execute(
+            delete(WorkerLease).where(WorkerLease.name == name, WorkerLease.owner == (owner or default_owner()))
+        )
+        await db.commit()
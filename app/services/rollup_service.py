@@ -0,0 +1,163 @@
+# app/services/rollup_service.py
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, delete, func, literal, or_, select, true, union_all
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.activity import Activity
+from app.models.activity_rollup import ActivityRollup
+
+PERIODS = ("week", "month", "year")
+
+VALUE_COLUMNS = ("count", "distance", "moving_time", "total_elevation_gain")
+KEY_COLUMNS = ("user_id", "period", "period_start", "type")
+
+# Sai số cho phép khi so sánh tổng số thực cộng dồn với tổng tính lại từ đầu
+TOLERANCE = 1e-6
+
+
+def _period_start_expr(period: str):
+    """Biểu thức SQL (SQLite) cho ngày bắt đầu kỳ chứa start_date"""
+    if period == "week":
+        # 'weekday 0' tiến tới Chủ nhật (hoặc giữ nguyên), lùi 6 ngày về thứ Hai
+        return func.date(Activity.start_date, "weekday 0", "-6 days")
+    if period == "month":
+        return func.strftime("%Y-%m-01", Activity.start_date)
+    return func.strftime("%Y-01-01", Activity.start_date)
+
+
+def period_start(period: str, day: date) -> date:
+    """Ngày bắt đầu kỳ chứa `day` (khớp với _period_start_expr)"""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def _contributions(where, sign: int = 1):
+    """Phần đóng góp (nhân với `sign`) của các hoạt động thỏa `where` vào mọi kỳ"""
+    activity_type = func.coalesce(Activity.type, "")
+    selects = []
+    for period in PERIODS:
+        start = _period_start_expr(period)
+        selects.append(
+            select(
+                Activity.user_id,
+                literal(period),
+                start,
+                activity_type,
+                func.count() * sign,
+                func.total(Activity.distance) * sign,
+                func.coalesce(func.sum(Activity.moving_time), 0) * sign,
+                func.total(Activity.total_elevation_gain) * sign,
+            )
+            .where(where)
+            .group_by(Activity.user_id, start, activity_type)
+        )
+    return union_all(*selects)
+
+
+async def _apply(db: AsyncSession, where, sign: int):
+    stmt = insert(ActivityRollup).from_select(KEY_COLUMNS + VALUE_COLUMNS, _contributions(where, sign))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[getattr(ActivityRollup, column) for column in KEY_COLUMNS],
+        set_={column: getattr(ActivityRollup, column) + stmt.excluded[column] for column in VALUE_COLUMNS},
+    )
+    await db.execute(stmt)
+
+
+async def add(db: AsyncSession, where):
+    """Cộng các hoạt động thỏa `where` (trạng thái hiện tại trong DB) vào rollup"""
+    await _apply(db, where, 1)
+
+
+async def subtract(db: AsyncSession, where, user_ids=None):
+    """Trừ các hoạt động thỏa `where` khỏi rollup, xóa các kỳ không còn hoạt động nào
+
+    Gọi trước khi sửa hoặc xóa hoạt động, trong cùng transaction.
+    """
+    await _apply(db, where, -1)
+    stmt = delete(ActivityRollup).where(ActivityRollup.count <= 0)
+    if user_ids is not None:
+        stmt = stmt.where(ActivityRollup.user_id.in_(list(user_ids)))
+    await db.execute(stmt, execution_options={"synchronize_session": False})
+
+
+async def rebuild(db: AsyncSession, user_id: int = None) -> int:
+    """Tính lại rollup từ đầu (toàn bộ hoặc một người dùng), trả về số dòng rollup
+
+    Không commit; người gọi quyết định ranh giới transaction.
+    """
+    user_filter = true() if user_id is None else Activity.user_id == user_id
+    stmt = delete(ActivityRollup)
+    if user_id is not None:
+        stmt = stmt.where(ActivityRollup.user_id == user_id)
+    await db.execute(stmt, execution_options={"synchronize_session": False})
+    await add(db, user_filter)
+
+    count = select(func.count()).select_from(ActivityRollup)
+    if user_id is not None:
+        count = count.where(ActivityRollup.user_id == user_id)
+    return await db.scalar(count)
+
+
+async def check(db: AsyncSession, user_id: int = None) -> List[dict]:
+    """So sánh rollup với phép tổng hợp từ đầu trên bảng activities, trả về các khác biệt"""
+    user_filter = true() if user_id is None else Activity.user_id == user_id
+    result = await db.execute(_contributions(user_filter))
+    expected: Dict[tuple, tuple] = {tuple(row[:4]): tuple(row[4:]) for row in result.all()}
+
+    stmt = select(*(getattr(ActivityRollup, column) for column in KEY_COLUMNS + VALUE_COLUMNS))
+    if user_id is not None:
+        stmt = stmt.where(ActivityRollup.user_id == user_id)
+    result = await db.execute(stmt)
+    actual: Dict[tuple, tuple] = {tuple(row[:4]): tuple(row[4:]) for row in result.all()}
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        want, got = expected.get(key), actual.get(key)
+        if want is None or got is None or any(
+                abs(w - g) > TOLERANCE * max(1.0, abs(w)) for w, g in zip(want, got)
+        ):
+            mismatches.append({
+                "key": dict(zip(KEY_COLUMNS, key)),
+                "expected": None if want is None else dict(zip(VALUE_COLUMNS, want)),
+                "actual": None if got is None else dict(zip(VALUE_COLUMNS, got)),
+            })
+    return mismatches
+
+
+async def get_summary(
+        db: AsyncSession,
+        user_id: int,
+        period: str,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        activity_type: Optional[str] = None
+) -> List[ActivityRollup]:
+    """Đọc tổng hợp theo kỳ của người dùng (chỉ từ bảng rollup)"""
+    stmt = select(ActivityRollup).where(ActivityRollup.user_id == user_id, ActivityRollup.period == period)
+    if start is not None:
+        stmt = stmt.where(ActivityRollup.period_start >= period_start(period, start).isoformat())
+    if end is not None:
+        stmt = stmt.where(ActivityRollup.period_start <= end.isoformat())
+    if activity_type is not None:
+        stmt = stmt.where(ActivityRollup.type == activity_type)
+    result = await db.execute(stmt.order_by(ActivityRollup.period_start, ActivityRollup.type))
+    return result.scalars().all()
+
+
+async def get_current(db: AsyncSession, user_id: int, today: date) -> List[ActivityRollup]:
+    """Tổng hợp của tuần, tháng và năm chứa `today`"""
+    current = or_(*(
+        and_(ActivityRollup.period == period, ActivityRollup.period_start == period_start(period, today).isoformat())
+        for period in PERIODS
+    ))
+    result = await db.execute(
+        select(ActivityRollup)
+        .where(ActivityRollup.user_id == user_id, current)
+        .order_by(ActivityRollup.period, ActivityRollup.type)
+    )
+    return result.scalars().all()
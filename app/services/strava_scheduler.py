@@ -0,0 +1,288 @@
+# app/services/strava_scheduler.py
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from app.config import settings
+
+# Độ ưu tiên: số nhỏ hơn được phục vụ trước
+INTERACTIVE = 0
+BACKGROUND = 10
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Lỗi xảy ra trước khi request tới được Strava: thử lại an toàn kể cả với request không idempotent
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _next_quarter_hour(now: float) -> float:
+    """Thời điểm reset của cửa sổ 15 phút (Strava reset ở phút 0, 15, 30, 45)"""
+    return (int(now) // 900 + 1) * 900
+
+
+def _next_utc_midnight(now: float) -> float:
+    """Thời điểm reset của giới hạn theo ngày (nửa đêm UTC)"""
+    today = datetime.fromtimestamp(now, tz=timezone.utc).date()
+    return datetime.combine(today + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc).timestamp()
+
+
+class RateLimitExceeded(Exception):
+    """Hết hạn mức Strava và không thể chờ thêm"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Strava rate limit exceeded, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _parse_pair(value: Optional[str]):
+    try:
+        short, daily = (int(part) for part in value.split(","))
+        return short, daily
+    except (AttributeError, ValueError):
+        return None
+
+
+class RateLimitScheduler:
+    """Bộ lập lịch trung tâm cho mọi request tới Strava
+
+    - Theo dõi hạn mức còn lại (15 phút và theo ngày) từ header
+      X-RateLimit-Limit / X-RateLimit-Usage.
+    - Xếp hàng request theo độ ưu tiên: request của người dùng đi trước các
+      tác vụ nền (backfill, đồng bộ), và tác vụ nền không được dùng phần hạn
+      mức dành riêng cho request tương tác.
+    - Thử lại với backoff có jitter khi gặp 429/5xx hoặc lỗi kết nối.
+    """
+
+    def __init__(
+            self,
+            max_concurrency: int,
+            background_reserve: float,
+            max_retries: int,
+            backoff_base: float,
+            backoff_max: float
+    ):
+        self.max_concurrency = max_concurrency
+        self.background_reserve = background_reserve
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.limit_short: Optional[int] = None
+        self.limit_daily: Optional[int] = None
+        self.usage_short = 0
+        self.usage_daily = 0
+        self._short_reset_at = _next_quarter_hour(time.time())
+        self._daily_reset_at = _next_utc_midnight(time.time())
+        self._blocked_until = 0.0
+
+        self._queue = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+
+    @classmethod
+    def from_settings(cls) -> "RateLimitScheduler":
+        return cls(
+            max_concurrency=settings.STRAVA_MAX_CONCURRENCY,
+            background_reserve=settings.STRAVA_BACKGROUND_RESERVE,
+            max_retries=settings.STRAVA_MAX_RETRIES,
+            backoff_base=settings.STRAVA_BACKOFF_BASE,
+            backoff_max=settings.STRAVA_BACKOFF_MAX,
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def remaining(self):
+        """Hạn mức còn lại (15 phút, theo ngày); None nếu chưa biết"""
+        self._roll_windows(time.time())
+        short = None if self.limit_short is None else max(self.limit_short - self.usage_short, 0)
+        daily = None if self.limit_daily is None else max(self.limit_daily - self.usage_daily, 0)
+        return short, daily
+
+    def snapshot(self) -> dict:
+        """Trạng thái hiện tại: hạn mức, hàng đợi và bộ đếm"""
+        short, daily = self.remaining()
+        now = time.time()
+        return {
+            "limit_15min": self.limit_short,
+            "limit_daily": self.limit_daily,
+            "usage_15min": self.usage_short,
+            "usage_daily": self.usage_daily,
+            "remaining_15min": short,
+            "remaining_daily": daily,
+            "queue_depth": self.queue_depth,
+            "active": self._active,
+            "blocked_for": max(self._blocked_until - now, 0.0),
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+        }
+
+    async def submit(
+            self,
+            send: Callable[[], Awaitable[httpx.Response]],
+            priority: int = INTERACTIVE,
+            max_wait: Optional[float] = None,
+            idempotent: bool = True
+    ) -> httpx.Response:
+        """Gửi request qua bộ lập lịch, thử lại khi gặp 429/5xx hoặc lỗi kết nối
+
+        `max_wait` giới hạn thời gian chờ hạn mức/hàng đợi; quá thời gian này sẽ
+        raise RateLimitExceeded thay vì treo request của người dùng.
+        Request không `idempotent` (ví dụ POST /oauth/token: Strava xoay vòng refresh
+        token, mã ủy quyền chỉ dùng được một lần) chỉ được thử lại khi chắc chắn
+        Strava chưa xử lý: 429 hoặc lỗi trước khi kết nối được.
+        """
+        attempt = 0
+        while True:
+            await self._acquire(priority, max_wait)
+            try:
+                self.requests += 1
+                response = await send()
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, UNSENT_ERRORS)):
+                    raise
+                response = None
+            finally:
+                self._release()
+
+            if response is not None:
+                self._update_budget(response.headers)
+                retry = response.status_code in RETRY_STATUSES and (idempotent or response.status_code == 429)
+                if not retry or attempt >= self.max_retries:
+                    return response
+
+            delay = self._backoff(attempt)
+            if response is not None and response.status_code == 429:
+                self.throttled += 1
+                delay = max(delay, self._retry_after(response))
+                self._block(delay)
+                if max_wait is not None and delay > max_wait:
+                    raise RateLimitExceeded(delay)
+
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        # Exponential backoff với full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry_after(self, response: httpx.Response) -> float:
+        header = response.headers.get("Retry-After")
+        if header and header.isdigit():
+            return float(header)
+
+        now = time.time()
+        short, daily = self.remaining()
+        if daily == 0:
+            return self._daily_reset_at - now
+        if short == 0:
+            return self._short_reset_at - now
+        return 0.0
+
+    def _block(self, delay: float):
+        self._blocked_until = max(self._blocked_until, time.time() + delay)
+
+    def _roll_windows(self, now: float):
+        if now >= self._short_reset_at:
+            self.usage_short = 0
+            self._short_reset_at = _next_quarter_hour(now)
+        if now >= self._daily_reset_at:
+            self.usage_daily = 0
+            self._daily_reset_at = _next_utc_midnight(now)
+
+    def _update_budget(self, headers: httpx.Headers):
+        limits = _parse_pair(headers.get("X-RateLimit-Limit"))
+        usage = _parse_pair(headers.get("X-RateLimit-Usage"))
+        if limits:
+            self.limit_short, self.limit_daily = limits
+        if usage:
+            self._roll_windows(time.time())
+            self.usage_short, self.usage_daily = usage
+        self._dispatch()
+
+    def _allowed(self, priority: int, now: float) -> float:
+        """Trả về 0 nếu request được phép chạy, ngược lại là số giây cần chờ"""
+        if now < self._blocked_until:
+            return self._blocked_until - now
+
+        short, daily = self.remaining()
+        if daily is not None and daily <= 0:
+            return self._daily_reset_at - now
+        if short is None:
+            return 0.0
+
+        # Tác vụ nền không được dùng phần hạn mức dành cho request tương tác
+        reserve = int(self.limit_short * self.background_reserve) if priority > INTERACTIVE else 0
+        if short <= reserve:
+            return self._short_reset_at - now
+        return 0.0
+
+    async def _acquire(self, priority: int, max_wait: Optional[float]):
+        wait = self._allowed(priority, time.time())
+        if max_wait is not None and wait > max_wait:
+            raise RateLimitExceeded(wait)
+        if not self._queue and self._active < self.max_concurrency and not wait:
+            self._start()
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, timeout=max_wait)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Đã được cấp chỗ nhưng bên gọi bị hủy: trả lại chỗ
+                self._release()
+            else:
+                self._queue = [entry for entry in self._queue if entry[2] is not future]
+                heapq.heapify(self._queue)
+            if isinstance(e, asyncio.TimeoutError):
+                raise RateLimitExceeded(self._allowed(priority, time.time())) from None
+            raise
+
+    def _start(self):
+        self._active += 1
+        self.usage_short += 1
+        self.usage_daily += 1
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        now = time.time()
+        while self._queue and self._active < self.max_concurrency:
+            priority, _, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+
+            wait = self._allowed(priority, now)
+            if wait:
+                self._schedule(wait)
+                return
+
+            heapq.heappop(self._queue)
+            self._start()
+            future.set_result(None)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(max(delay, 0.01), self._dispatch)
+
+
+scheduler = RateLimitScheduler.from_settings()
@@ -1,11 +1,151 @@
 # app/services/strava_service.py
+import asyncio
+import re
 import httpx
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 from app.config import settings
+from app.database import SessionLocal
 from app.models.user import User
+from app.services import auth_service, lease_service
+from app.services.strava_scheduler import BACKGROUND, INTERACTIVE, RateLimitExceeded, scheduler
+from app.utils.metrics import Collector, Counter, Histogram
+from app.utils.singleflight import SingleFlight
 import time
 
+try:
+    import h2  # noqa: F401  (httpx cần gói h2 cho HTTP/2, cài qua httpx[http2])
+except ImportError:
+    h2 = None
+
+# HTTP client dùng chung cho toàn bộ ứng dụng (tạo/đóng trong lifespan)
+_client: httpx.AsyncClient = None
+
+STRAVA_REQUEST_SECONDS = Histogram(
+    "strava_request_duration_seconds", "Latency of each HTTP attempt to Strava", ("endpoint",)
+)
+STRAVA_RESPONSES = Counter(
+    "strava_responses", "Strava responses by endpoint and status (error: transport failure)", ("endpoint", "status")
+)
+STRAVA_CALL_SECONDS = Histogram(
+    "strava_call_duration_seconds", "Strava call latency including rate-limit queueing and retries",
+    ("endpoint", "priority"),
+)
+_ID_SEGMENT = re.compile(r"/\d+")
+
+
+def _scheduler_gauges():
+    snapshot = scheduler.snapshot()
+    values = {}
+    for window in ("15min", "daily"):
+        for kind in ("limit", "usage", "remaining"):
+            value = snapshot[f"{kind}_{window}"]
+            if value is not None:
+                values[(window, kind)] = value
+    return values
+
+
+Collector("strava_rate_limit", "Strava rate limit, usage and remaining quota from X-RateLimit headers",
+          ("window", "kind"), _scheduler_gauges)
+Collector("strava_scheduler_state", "Strava request scheduler queue depth, active requests and block time",
+          ("state",), lambda: {(key,): scheduler.snapshot()[key] for key in ("queue_depth", "active", "blocked_for")})
+Collector("strava_scheduler_events", "Strava scheduler requests, retries and throttled waits", ("event",),
+          lambda: {(key,): scheduler.snapshot()[key] for key in ("requests", "retries", "throttled")},
+          metric_type="counter")
+
+
+def start_client(transport: httpx.AsyncBaseTransport = None):
+    """Khởi tạo HTTP client dùng chung với pool kết nối keep-alive"""
+    global _client
+    if _client is not None:
+        return _client
+
+    http2 = settings.STRAVA_HTTP2
+    if http2 and h2 is None:
+        print("STRAVA_HTTP2 is enabled but the 'h2' package is not installed "
+              "(pip install 'httpx[http2]'); falling back to HTTP/1.1")
+        http2 = False
+    _client = httpx.AsyncClient(
+        base_url=settings.STRAVA_BASE_URL,
+        limits=httpx.Limits(
+            max_connections=settings.STRAVA_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.STRAVA_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.STRAVA_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=settings.STRAVA_HTTP_TIMEOUT,
+        http2=http2,
+        transport=transport,
+    )
+    return _client
+
+
+async def close_client():
+    """Đóng HTTP client dùng chung và giải phóng các kết nối"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Lấy HTTP client dùng chung, tự khởi tạo nếu chưa có (ví dụ khi chạy script)"""
+    return _client or start_client()
+
+
+def _timeout(timeout: float = None):
+    """Timeout riêng cho từng lời gọi, mặc định dùng timeout của client"""
+    return httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+
+
+async def _request(
+        method: str, url: str, timeout: float = None, priority: int = INTERACTIVE, idempotent: bool = True, **kwargs
+):
+    """Gửi request tới Strava qua bộ lập lịch theo hạn mức
+
+    Request của người dùng không chờ hạn mức quá STRAVA_INTERACTIVE_MAX_WAIT;
+    khi hết hạn mức, lỗi được trả về dưới dạng 429 kèm Retry-After. Request không
+    `idempotent` không được gửi lại sau lỗi có thể đã tới Strava (xem scheduler.submit).
+    """
+    client = get_client()
+    max_wait = settings.STRAVA_INTERACTIVE_MAX_WAIT if priority <= INTERACTIVE else None
+    endpoint = _ID_SEGMENT.sub("/{id}", url)
+
+    async def send():
+        # Mỗi lần thử (kể cả thử lại trong bộ lập lịch) được đo riêng
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, timeout=_timeout(timeout), **kwargs)
+        except httpx.HTTPError:
+            STRAVA_RESPONSES.inc((endpoint, "error"))
+            raise
+        finally:
+            STRAVA_REQUEST_SECONDS.observe(time.perf_counter() - started, (endpoint,))
+        STRAVA_RESPONSES.inc((endpoint, str(response.status_code)))
+        return response
+
+    started = time.perf_counter()
+    try:
+        response = await scheduler.submit(send, priority=priority, max_wait=max_wait, idempotent=idempotent)
+    except RateLimitExceeded as e:
+        raise _rate_limited(e.retry_after)
+    finally:
+        label = "interactive" if priority <= INTERACTIVE else "background"
+        STRAVA_CALL_SECONDS.observe(time.perf_counter() - started, (endpoint, label))
+
+    if response.status_code == 429:
+        raise _rate_limited(scheduler.snapshot()["blocked_for"])
+    return response
+
+
+def _rate_limited(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Strava rate limit exceeded",
+        headers={"Retry-After": str(int(retry_after) + 1)},
+    )
+
 
 def get_authorization_url():
     """Tạo URL ủy quyền Strava"""
@@ -19,91 +159,259 @@ def get_authorization_url():
     )
 
 
-async def exchange_code_for_token(code: str):
+async def exchange_code_for_token(code: str, timeout: float = None, priority: int = INTERACTIVE):
     """Đổi mã ủy quyền lấy token truy cập"""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://www.strava.com/oauth/token",
-            data={
-                "client_id": settings.STRAVA_CLIENT_ID,
-                "client_secret": settings.STRAVA_CLIENT_SECRET,
-                "code": code,
-                "grant_type": "authorization_code"
-            }
-        )
+    response = await _request(
+        "POST",
+        "/oauth/token",
+        data={
+            "client_id": settings.STRAVA_CLIENT_ID,
+            "client_secret": settings.STRAVA_CLIENT_SECRET,
+            "code": code,
+            "grant_type": "authorization_code"
+        },
+        timeout=timeout,
+        priority=priority,
+        # Gửi lại có thể dùng mã ủy quyền đã bị Strava vô hiệu
+        idempotent=False
+    )
 
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to get Strava token")
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to get Strava token")
 
-        return response.json()
+    return response.json()
 
 
-async def refresh_token(refresh_token: str):
+async def refresh_token(refresh_token: str, timeout: float = None, priority: int = INTERACTIVE):
     """Làm mới token truy cập khi hết hạn"""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://www.strava.com/oauth/token",
-            data={
-                "client_id": settings.STRAVA_CLIENT_ID,
-                "client_secret": settings.STRAVA_CLIENT_SECRET,
-                "refresh_token": refresh_token,
-                "grant_type": "refresh_token"
-            }
-        )
+    response = await _request(
+        "POST",
+        "/oauth/token",
+        data={
+            "client_id": settings.STRAVA_CLIENT_ID,
+            "client_secret": settings.STRAVA_CLIENT_SECRET,
+            "refresh_token": refresh_token,
+            "grant_type": "refresh_token"
+        },
+        timeout=timeout,
+        priority=priority,
+        # Gửi lại có thể dùng refresh token đã bị Strava vô hiệu
+        idempotent=False
+    )
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to refresh Strava token")
+
+    return response.json()
+
+
+# Mỗi người dùng chỉ có một lần làm mới token đang chạy tại một thời điểm
+_refresh_flights = SingleFlight()
+
+
+def _expires_within(expires_at, seconds: int) -> bool:
+    return bool(expires_at) and expires_at - int(time.time()) < seconds
 
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to refresh Strava token")
 
-        return response.json()
+async def _refresh_user_tokens(user_id: int, ahead: int, priority: int) -> auth_service.CurrentUser:
+    """Làm mới token Strava của người dùng trong session DB riêng
 
+    Đọc lại token từ DB trước khi gọi Strava: một lần làm mới khác (ví dụ ở tác
+    vụ nền) có thể vừa ghi refresh token mới, và Strava xoay vòng refresh token.
+    """
+    async with SessionLocal() as db:
+        user = await db.get(User, user_id)
+        if user is None:
+            # Người dùng bị xóa trong lúc chờ
+            raise HTTPException(status_code=404, detail="User not found")
+        if user.strava_refresh_token and _expires_within(user.strava_token_expires_at, ahead):
+            tokens = await refresh_token(user.strava_refresh_token, priority=priority)
 
-async def check_and_refresh_token(user: User, db: Session):
-    """Kiểm tra và làm mới token nếu cần"""
-    current_time = int(time.time())
+            user.strava_access_token = tokens["access_token"]
+            user.strava_refresh_token = tokens["refresh_token"]
+            user.strava_token_expires_at = tokens["expires_at"]
+            await db.commit()
+            auth_service.invalidate_user(user.id)
 
-    # Nếu token sắp hết hạn (còn dưới 1 giờ), làm mới nó
-    if user.strava_token_expires_at and user.strava_token_expires_at - current_time < 3600:
-        tokens = await refresh_token(user.strava_refresh_token)
+        return auth_service.CurrentUser.from_user(user)
 
-        user.strava_access_token = tokens["access_token"]
-        user.strava_refresh_token = tokens["refresh_token"]
-        user.strava_token_expires_at = tokens["expires_at"]
-        db.commit()
 
+async def refresh_user_tokens(user_id: int, ahead: int = None, priority: int = BACKGROUND) -> auth_service.CurrentUser:
+    """Làm mới token của người dùng; các lời gọi đồng thời dùng chung một lần làm mới"""
+    ahead = settings.TOKEN_REFRESH_AHEAD if ahead is None else ahead
+    return await _refresh_flights.do(user_id, lambda: _refresh_user_tokens(user_id, ahead, priority))
+
+
+async def check_and_refresh_token(user, db: AsyncSession, priority: int = INTERACTIVE):
+    """Kiểm tra và làm mới token nếu cần
+
+    Nhận User (ORM) hoặc CurrentUser (snapshot từ cache) và trả về cùng kiểu với token mới.
+    Thông thường token đã được tác vụ nền làm mới trước, nên request hiếm khi phải chờ.
+    """
+    # Nếu token sắp hết hạn, làm mới nó
+    if not _expires_within(user.strava_token_expires_at, settings.TOKEN_REFRESH_INLINE_MARGIN):
+        return user
+
+    refreshed = await refresh_user_tokens(user.id, settings.TOKEN_REFRESH_INLINE_MARGIN, priority)
+    if not isinstance(user, User):
+        return refreshed
+
+    # Cập nhật đối tượng ORM của người gọi mà không đánh dấu là đã thay đổi
+    for field in ("strava_access_token", "strava_refresh_token", "strava_token_expires_at"):
+        set_committed_value(user, field, getattr(refreshed, field))
     return user
 
 
-async def get_activities(access_token: str, after=None, before=None, page=1, per_page=30):
+async def refresh_expiring_tokens(ahead: int = None, batch_size: int = None) -> int:
+    """Làm mới theo lô các token sắp hết hạn, trả về số người dùng đã xử lý"""
+    ahead = settings.TOKEN_REFRESH_AHEAD if ahead is None else ahead
+    batch_size = batch_size or settings.TOKEN_REFRESH_BATCH
+
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(User.id)
+            .where(
+                User.strava_refresh_token.isnot(None),
+                User.strava_token_expires_at < int(time.time()) + ahead,
+            )
+            .order_by(User.strava_token_expires_at)
+            .limit(batch_size)
+        )
+        user_ids = result.scalars().all()
+
+    semaphore = asyncio.Semaphore(settings.TOKEN_REFRESH_CONCURRENCY)
+
+    async def refresh(user_id):
+        async with semaphore:
+            try:
+                await refresh_user_tokens(user_id, ahead)
+            except Exception as e:
+                print(f"Error refreshing Strava token for user {user_id}: {str(e)}")
+
+    await asyncio.gather(*(refresh(user_id) for user_id in user_ids))
+    return len(user_ids)
+
+
+async def run_token_refresher(stop: asyncio.Event):
+    """Tác vụ nền: định kỳ làm mới token trước khi hết hạn (chỉ tiến trình giữ lease "token-refresher")"""
+    owner = lease_service.default_owner()
+    while not stop.is_set():
+        try:
+            if await lease_service.acquire("token-refresher", owner):
+                await refresh_expiring_tokens()
+        except Exception as e:
+            print(f"Error in token refresher: {str(e)}")
+
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.TOKEN_REFRESH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+    try:
+        await lease_service.release("token-refresher", owner)
+    except Exception as e:
+        print(f"Error releasing token refresher lease: {str(e)}")
+
+
+async def get_activities(access_token: str, after=None, before=None, page=1, per_page=30, timeout: float = None, priority: int = INTERACTIVE):
     """Lấy danh sách hoạt động từ Strava API"""
     params = {"page": page, "per_page": per_page}
 
-    if after:
+    if after is not None:
         params["after"] = after
-    if before:
+    if before is not None:
         params["before"] = before
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            "https://www.strava.com/api/v3/athlete/activities",
-            params=params,
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
+    response = await _request(
+        "GET",
+        "/api/v3/athlete/activities",
+        params=params,
+        headers={"Authorization": f"Bearer {access_token}"},
+        timeout=timeout,
+        priority=priority
+    )
 
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Failed to fetch activities from Strava")
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Failed to fetch activities from Strava")
 
-        return response.json()
+    return response.json()
 
 
-async def deauthorize(access_token: str):
+async def iter_activity_pages(access_token: str, after=None, per_page: int = None, concurrency: int = 1,
+                              priority: int = INTERACTIVE):
+    """Tải các trang hoạt động cho tới trang đầu tiên không đầy
+
+    Các trang được tải song song theo từng cửa sổ `concurrency` trang với cùng tham
+    số `after`; mỗi cửa sổ trả về (số trang đã đọc, các hoạt động của cửa sổ).
+    """
+    per_page = per_page or settings.BACKFILL_PER_PAGE
+    page = 1
+    while True:
+        pages = await asyncio.gather(*(
+            get_activities(access_token, after=after, page=page + offset, per_page=per_page, priority=priority)
+            for offset in range(concurrency)
+        ))
+
+        batch = []
+        finished = False
+        read = 0
+        for items in pages:
+            batch.extend(items)
+            read += 1
+            if len(items) < per_page:
+                finished = True
+                break
+        yield read, batch
+
+        if finished:
+            return
+        page += concurrency
+
+
+async def get_activity(access_token: str, activity_id: int, timeout: float = None, priority: int = INTERACTIVE):
+    """Lấy chi tiết một hoạt động từ Strava API"""
+    response = await _request(
+        "GET",
+        f"/api/v3/activities/{activity_id}",
+        headers={"Authorization": f"Bearer {access_token}"},
+        timeout=timeout,
+        priority=priority
+    )
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Failed to fetch activity from Strava")
+
+    return response.json()
+
+
+async def get_activity_streams(access_token: str, activity_id: int, keys, timeout: float = None, priority: int = INTERACTIVE):
+    """Lấy các kênh dữ liệu (streams) của một hoạt động từ Strava API, dạng {kênh: {"data": [...]}}"""
+    response = await _request(
+        "GET",
+        f"/api/v3/activities/{activity_id}/streams",
+        params={"keys": ",".join(keys), "key_by_type": "true"},
+        headers={"Authorization": f"Bearer {access_token}"},
+        timeout=timeout,
+        priority=priority
+    )
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Failed to fetch activity streams from Strava")
+
+    return response.json()
+
+
+async def deauthorize(access_token: str, timeout: float = None, priority: int = INTERACTIVE):
     """Hủy quyền truy cập Strava"""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://www.strava.com/oauth/deauthorize",
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
+    response = await _request(
+        "POST",
+        "/oauth/deauthorize",
+        headers={"Authorization": f"Bearer {access_token}"},
+        timeout=timeout,
+        priority=priority
+    )
 
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to deauthorize Strava access")
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to deauthorize Strava access")
 
-        return response.json()
\ No newline at end of file
+    return response.json()
\ No newline at end of file
@@ -0,0 +1,367 @@
+# app/services/stream_service.py
+import asyncio
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import delete, exists, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import SessionLocal
+from app.models.activity import Activity
+from app.models.activity_stream import ActivityStream
+from app.services import best_effort_service, strava_service
+from app.services.strava_scheduler import BACKGROUND, INTERACTIVE
+from app.utils.activity_files import filled
+from app.utils.singleflight import SingleFlight
+
+# Kênh -> kiểu phần tử khi lưu; latlng là mảng (N, 2)
+CHANNELS = {
+    "time": np.dtype("<i4"),
+    "distance": np.dtype("<f4"),
+    "latlng": np.dtype("<f8"),
+    "altitude": np.dtype("<f4"),
+    "heartrate": np.dtype("<i2"),
+    "cadence": np.dtype("<i2"),
+    "watts": np.dtype("<i2"),
+}
+
+METHODS = ("lttb", "minmax", "none")
+
+# Dòng đánh dấu hoạt động không có streams (ví dụ hoạt động nhập tay), tránh gọi lại Strava ở mỗi lần xem
+EMPTY = "none"
+
+# Các lần tải streams từ Strava đang chạy theo activity_id
+_fetch_flights = SingleFlight()
+
+
+def pack(channel: str, values) -> bytes:
+    """Đóng gói một kênh thành mảng kiểu cố định rồi nén zlib"""
+    array = np.asarray(values, dtype=CHANNELS[channel])
+    return zlib.compress(array.tobytes(), 6)
+
+
+def unpack(channel: str, blob: bytes, dtype: str = None) -> np.ndarray:
+    """Giải nén một kênh về mảng NumPy (latlng có dạng (N, 2))"""
+    array = np.frombuffer(zlib.decompress(blob), dtype=np.dtype(dtype) if dtype else CHANNELS[channel])
+    if channel == "latlng":
+        array = array.reshape(-1, 2)
+    return array
+
+
+def _fill_gaps(channel: str, data):
+    """Lấp các điểm null (cảm biến mất tín hiệu) bằng giá trị gần nhất; None nếu cả kênh đều null"""
+    if isinstance(data, np.ndarray):
+        return data
+    if channel == "latlng":
+        if not any(point is None for point in data):
+            return data
+        lat = filled([None if point is None else point[0] for point in data])
+        lng = filled([None if point is None else point[1] for point in data])
+        return None if lat is None or lng is None else np.column_stack([lat, lng])
+    if None not in data:
+        return data
+    return filled(data)
+
+
+def pack_streams(streams: Dict[str, Any]) -> List[dict]:
+    """Đóng gói các kênh ({kênh: mảng} hoặc dạng key_by_type {kênh: {"data": [...]}}) thành các dòng lưu trữ"""
+    rows = []
+    for channel, stream in streams.items():
+        if channel not in CHANNELS:
+            continue
+        data = _fill_gaps(channel, stream["data"] if isinstance(stream, dict) else stream)
+        if data is None:
+            continue
+        rows.append({
+            "channel": channel,
+            "dtype": CHANNELS[channel].str,
+            "length": len(data),
+            "data": pack(channel, data),
+        })
+    return rows
+
+
+def _unpack_rows(rows: List[dict], channels: Iterable[str]) -> Dict[int, Dict[str, np.ndarray]]:
+    streams = {}
+    for row in rows:
+        streams.setdefault(row["activity_id"], {})
+        if row["channel"] in channels:
+            streams[row["activity_id"]][row["channel"]] = unpack(row["channel"], row["data"], row["dtype"])
+    return streams
+
+
+async def save_packed_streams(db: AsyncSession, rows: List[dict]):
+    """Ghi (upsert) các dòng streams đã đóng gói, mỗi dòng có activity_id; tính luôn best effort
+
+    Không commit; người gọi quyết định ranh giới transaction.
+    """
+    if not rows:
+        return
+    stmt = insert(ActivityStream)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ActivityStream.activity_id, ActivityStream.channel],
+        set_={column: stmt.excluded[column] for column in ("dtype", "length", "data")},
+    )
+    await db.execute(stmt, rows)
+    streams = await asyncio.to_thread(_unpack_rows, rows, best_effort_service.CHANNELS)
+    await best_effort_service.save_efforts(db, streams)
+
+
+async def save_streams(db: AsyncSession, activity_id: int, streams: Dict[str, Any]) -> List[str]:
+    """Lưu các kênh từ phản hồi key_by_type của Strava, trả về danh sách kênh đã lưu
+
+    Không commit; người gọi quyết định ranh giới transaction.
+    """
+    rows = [{**row, "activity_id": activity_id} for row in pack_streams(streams)]
+    # Không có kênh nào: lưu dòng đánh dấu để has_streams không gọi lại Strava
+    marker = {"activity_id": activity_id, "channel": EMPTY, "dtype": "", "length": 0, "data": b""}
+    await save_packed_streams(db, rows or [marker])
+    return [row["channel"] for row in rows]
+
+
+async def load_streams(db: AsyncSession, activity_id: int, channels: Iterable[str]) -> Dict[str, np.ndarray]:
+    """Đọc và giải nén chỉ các kênh được yêu cầu"""
+    result = await db.execute(
+        select(ActivityStream.channel, ActivityStream.dtype, ActivityStream.data).where(
+            ActivityStream.activity_id == activity_id,
+            ActivityStream.channel.in_(list(channels)),
+        )
+    )
+    return {channel: unpack(channel, data, dtype) for channel, dtype, data in result.all()}
+
+
+async def compute_best_efforts(db: AsyncSession, activity_ids: List[int]):
+    """Tính best effort từ streams đã lưu (hoạt động có streams từ trước, hoặc đổi định nghĩa mốc)
+
+    Không commit; người gọi quyết định ranh giới transaction.
+    """
+    if not activity_ids:
+        return
+    result = await db.execute(
+        select(ActivityStream.activity_id, ActivityStream.channel, ActivityStream.dtype, ActivityStream.data).where(
+            ActivityStream.activity_id.in_(activity_ids),
+            ActivityStream.channel.in_(best_effort_service.CHANNELS),
+        )
+    )
+    rows = [row._asdict() for row in result.all()]
+    streams = await asyncio.to_thread(_unpack_rows, rows, best_effort_service.CHANNELS)
+    # Hoạt động không có kênh nào vẫn được đánh dấu đã tính (không có best effort)
+    await best_effort_service.save_efforts(db, {activity_id: streams.get(activity_id, {}) for activity_id in activity_ids})
+
+
+async def has_streams(db: AsyncSession, activity_id: int) -> bool:
+    """Hoạt động đã có streams trong DB hay chưa"""
+    result = await db.execute(
+        select(ActivityStream.channel).where(ActivityStream.activity_id == activity_id).limit(1)
+    )
+    return result.first() is not None
+
+
+async def delete_streams(db: AsyncSession, activity_ids: Iterable[int]) -> int:
+    """Xóa streams của các hoạt động, trả về số dòng đã xóa
+
+    Không commit; người gọi quyết định ranh giới transaction.
+    """
+    activity_ids = list(activity_ids)
+    if not activity_ids:
+        return 0
+    result = await db.execute(
+        delete(ActivityStream).where(ActivityStream.activity_id.in_(activity_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    return result.rowcount
+
+
+async def _fetch_streams(user, activity_id: int, strava_id: str, priority: int = INTERACTIVE):
+    async with SessionLocal() as db:
+        if await has_streams(db, activity_id):
+            return
+        user = await strava_service.check_and_refresh_token(user, db, priority=priority)
+        streams = await strava_service.get_activity_streams(
+            user.strava_access_token, int(strava_id), list(CHANNELS), priority=priority
+        )
+        await save_streams(db, activity_id, streams or {})
+        await db.commit()
+
+
+async def ensure_streams(user, activity: Activity):
+    """Tải streams từ Strava và lưu nếu chưa có; các request đồng thời dùng chung một lần tải"""
+    await _fetch_flights.do(activity.id, lambda: _fetch_streams(user, activity.id, activity.strava_id))
+
+
+async def fetch_missing_streams(user, limit: int = None) -> int:
+    """Tải ở nền streams của các hoạt động chưa có streams (mới nhất trước) và tính best effort
+
+    Gọi sau mỗi lần đồng bộ một người dùng, để hoạt động đến từ đồng bộ, backfill hay
+    webhook có best effort và kỷ lục mà không cần ai mở /streams. Mỗi lần tối đa `limit`
+    hoạt động (mặc định SYNC_STREAMS_PER_RUN); phần còn lại được tải ở các lần sau.
+    Hoạt động không còn trên Strava (404) được lưu dòng đánh dấu để không tải lại.
+    Trả về số hoạt động đã xử lý.
+    """
+    limit = limit or settings.SYNC_STREAMS_PER_RUN
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(Activity.id, Activity.strava_id)
+            .where(Activity.user_id == user.id, ~exists().where(ActivityStream.activity_id == Activity.id))
+            .order_by(Activity.start_date.desc())
+            .limit(limit)
+        )
+        missing = result.all()
+
+    for activity_id, strava_id in missing:
+        try:
+            await _fetch_flights.do(
+                activity_id, lambda: _fetch_streams(user, activity_id, strava_id, priority=BACKGROUND)
+            )
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+            async with SessionLocal() as db:
+                await save_streams(db, activity_id, {})
+                await db.commit()
+    return len(missing)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: trả về chỉ số của `threshold` điểm giữ hình dạng chuỗi
+
+    Mỗi bucket chọn điểm tạo tam giác lớn nhất với điểm đã chọn ở bucket trước
+    và trung bình của bucket sau; diện tích trong một bucket được tính vector hóa.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Biên các bucket cho n - 2 điểm giữa (điểm đầu và cuối luôn được giữ)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Trung bình của từng bucket, dùng làm đỉnh thứ ba của tam giác
+    counts = np.diff(edges)
+    sum_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sum_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    avg_x = np.append(sum_x / counts, x[-1])
+    avg_y = np.append(sum_y / counts, y[-1])
+
+    # Xếp các bucket thành ma trận (bucket, điểm); phần đệm lặp lại điểm đầu
+    # bucket nên không bao giờ được chọn thay cho chính điểm đó
+    starts = edges[:-1]
+    columns = np.arange(counts.max())
+    positions = np.minimum(starts[:, None] + columns, (edges[1:] - 1)[:, None])
+    positions = np.where(columns < counts[:, None], positions, starts[:, None])
+    bucket_x = x[positions]
+    bucket_y = y[positions]
+
+    # Vòng lặp theo bucket là tuần tự (phụ thuộc điểm vừa chọn); dùng float Python
+    # cho các giá trị vô hướng để tránh chi phí của scalar NumPy
+    avg_xs, avg_ys = avg_x.tolist(), avg_y.tolist()
+    indices = [0]
+    ax, ay = x.item(0), y.item(0)
+    for i in range(threshold - 2):
+        cx, cy = avg_xs[i + 1], avg_ys[i + 1]
+        # Hai lần diện tích tam giác (a, điểm trong bucket, trung bình bucket sau)
+        area = np.abs((ax - cx) * (bucket_y[i] - ay) - (ax - bucket_x[i]) * (cy - ay))
+        best = positions.item(i, area.argmax())
+        indices.append(best)
+        ax, ay = x.item(best), y.item(best)
+    indices.append(n - 1)
+    return np.asarray(indices)
+
+
+def minmax(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Chia chuỗi thành threshold/2 bucket bằng nhau, giữ điểm nhỏ nhất và lớn nhất của mỗi bucket"""
+    n = len(y)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return np.arange(n)
+
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    # Bucket cuối có thể chỉ gồm NaN khi n nhỏ; bỏ qua bằng mask
+    valid = ~np.all(np.isnan(padded), axis=1)
+    filled_low = np.where(np.isnan(padded), np.inf, padded)
+    filled_high = np.where(np.isnan(padded), -np.inf, padded)
+    low = offsets + np.argmin(filled_low, axis=1)
+    high = offsets + np.argmax(filled_high, axis=1)
+    return np.unique(np.concatenate([low[valid], high[valid]]))
+
+
+def stride(n: int, threshold: int) -> np.ndarray:
+    """Chọn đều các điểm theo chỉ số (dùng cho latlng, không có trục y để so sánh)"""
+    if threshold >= n:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, threshold).astype(np.int64))
+
+
+def downsample(
+        streams: Dict[str, np.ndarray],
+        x_channel: str,
+        resolution: int,
+        method: str
+) -> Dict[str, dict]:
+    """Giảm số điểm của từng kênh theo trục x, trả về {kênh: {"x": [...], "y": [...]}}"""
+    x = streams.get(x_channel)
+    views = {}
+    for channel, y in streams.items():
+        if channel == x_channel:
+            continue
+        axis = x if x is not None and len(x) == len(y) else np.arange(len(y))
+        if method == "none":
+            index = np.arange(len(y))
+        elif channel == "latlng":
+            index = stride(len(y), resolution)
+        elif method == "minmax":
+            index = minmax(y, resolution)
+        else:
+            index = lttb(axis, y, resolution)
+        views[channel] = {"x": axis[index].tolist(), "y": y[index].tolist()}
+    return views
+
+
+async def get_stream_view(
+        db: AsyncSession,
+        user,
+        activity: Activity,
+        channels: List[str],
+        x_channel: str = "time",
+        resolution: int = 1000,
+        method: str = "lttb"
+) -> dict:
+    """Lấy streams của hoạt động (tải từ Strava ở lần đầu) và giảm mẫu theo độ phân giải"""
+    unknown = [channel for channel in channels + [x_channel] if channel not in CHANNELS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown stream channels: {', '.join(unknown)}")
+    if method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown downsampling method: {method}")
+
+    if not await has_streams(db, activity.id):
+        if not user.strava_access_token:
+            raise HTTPException(status_code=400, detail="No Strava account linked")
+        await db.close()
+        await ensure_streams(user, activity)
+
+    streams = await load_streams(db, activity.id, set(channels) | {x_channel})
+    lengths = {channel: len(values) for channel, values in streams.items()}
+    # Giải nén xong; phần giảm mẫu chạy ngoài event loop
+    views = await asyncio.to_thread(downsample, streams, x_channel, resolution, method)
+    return {
+        "activity_id": activity.id,
+        "x": x_channel,
+        "method": method,
+        "resolution": resolution,
+        "original_size": max(lengths.values(), default=0),
+        "streams": views,
+    }
+
+
+def parse_channels(keys: Optional[str]) -> List[str]:
+    """Tách tham số keys dạng "heartrate,watts"; mặc định là mọi kênh"""
+    if not keys:
+        return list(CHANNELS)
+    return [key.strip() for key in keys.split(",") if key.strip()]
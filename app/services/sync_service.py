@@ -0,0 +1,275 @@
+# app/services/sync_service.py
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import exists, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import SessionLocal
+from app.models.sync_job import SyncJob
+from app.models.user import User
+from app.services import auth_service, backfill_service, stream_service
+from app.utils.metrics import Counter, Histogram
+
+SYNC_CYCLE_SECONDS = Histogram(
+    "sync_cycle_duration_seconds", "Duration of sync worker cycles that claimed jobs",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+SYNC_LAG_SECONDS = Histogram(
+    "sync_job_lag_seconds", "Delay between a sync job becoming due and starting",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200),
+)
+SYNC_JOBS = Counter("sync_jobs", "Sync jobs run by result", ("result",))
+
+
+@dataclass
+class SyncCycle:
+    """Chỉ số của một chu kỳ đồng bộ: thời lượng và độ trễ so với lịch (lag)"""
+    worker_id: str
+    started_at: float
+    duration: float = 0.0
+    claimed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    max_lag: float = 0.0  # giây trễ lớn nhất giữa next_run_at và lúc bắt đầu đồng bộ
+    mean_lag: float = 0.0
+
+    def to_dict(self):
+        return asdict(self)
+
+
+# Các chu kỳ gần nhất của worker trong tiến trình
+_cycles: Deque[SyncCycle] = deque(maxlen=100)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def recent_cycles(limit: int = 20) -> List[dict]:
+    """Chỉ số các chu kỳ gần nhất (mới nhất trước)"""
+    return [cycle.to_dict() for cycle in list(_cycles)[::-1][:limit]]
+
+
+def _next_interval() -> float:
+    # Dàn đều lịch để các người dùng không cùng đến hạn một lúc
+    jitter = settings.SYNC_JITTER
+    return settings.SYNC_INTERVAL * random.uniform(1 - jitter, 1 + jitter)
+
+
+def _retry_delay(failures: int) -> int:
+    """Backoff lũy thừa theo số lần lỗi liên tiếp (bắt đầu từ 1)"""
+    return min(settings.SYNC_RETRY_DELAY * 2 ** (failures - 1), settings.SYNC_RETRY_MAX_DELAY)
+
+
+async def ensure_jobs(db: AsyncSession) -> int:
+    """Tạo job cho các người dùng đã liên kết Strava nhưng chưa có job (đến hạn một chu kỳ sau lần đồng bộ gần nhất)"""
+    missing = (
+        select(User.id, func.coalesce(User.last_synced_at, 0) + settings.SYNC_INTERVAL)
+        .where(
+            User.strava_access_token.is_not(None),
+            ~exists().where(SyncJob.user_id == User.id),
+        )
+    )
+    stmt = insert(SyncJob).from_select(["user_id", "next_run_at"], missing)
+    stmt = stmt.on_conflict_do_nothing(index_elements=[SyncJob.user_id])
+    result = await db.execute(stmt)
+    await db.commit()
+    return result.rowcount
+
+
+async def claim_jobs(db: AsyncSession, claim: str, limit: int, now: int) -> Dict[int, int]:
+    """Nhận tối đa `limit` job đến hạn có lease trống bằng một lệnh UPDATE
+
+    Điều kiện lease được kiểm tra lại ở lệnh UPDATE ngoài nên hai worker không
+    thể cùng giữ một job; trả về {user_id: next_run_at} của các job đã nhận.
+    """
+    lease_free = or_(SyncJob.lease_expires_at.is_(None), SyncJob.lease_expires_at < now)
+    due = (
+        select(SyncJob.user_id)
+        .join(User, User.id == SyncJob.user_id)
+        .where(SyncJob.next_run_at <= now, lease_free, User.strava_access_token.is_not(None))
+        .order_by(SyncJob.next_run_at)
+        .limit(limit)
+    )
+    await db.execute(
+        update(SyncJob)
+        .where(SyncJob.user_id.in_(due.scalar_subquery()), lease_free)
+        .values(lease_owner=claim, lease_expires_at=now + settings.SYNC_LEASE_SECONDS)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    result = await db.execute(select(SyncJob.user_id, SyncJob.next_run_at).where(SyncJob.lease_owner == claim))
+    return dict(result.all())
+
+
+async def _renew_leases(claim: str, in_flight: set, stop: asyncio.Event):
+    """Gia hạn lease của các job đang chạy để job đồng bộ dài không bị worker khác nhận"""
+    interval = settings.SYNC_LEASE_SECONDS / 3
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        if in_flight and not stop.is_set():
+            async with SessionLocal() as db:
+                await db.execute(
+                    update(SyncJob)
+                    .where(SyncJob.lease_owner == claim, SyncJob.user_id.in_(list(in_flight)))
+                    .values(lease_expires_at=int(time.time()) + settings.SYNC_LEASE_SECONDS)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+
+
+async def sync_user(user_id: int) -> Optional[str]:
+    """Đồng bộ hoạt động mới của một người dùng; trả về "skipped" nếu không cần/không thể chạy
+
+    Dùng lại backfill_service (check_and_refresh_token + get_activities từ watermark);
+    lần đầu tải song song nhiều trang, các lần sau chỉ cần một trang. Sau đó tải một
+    phần streams còn thiếu để tính best effort (xem stream_service.fetch_missing_streams).
+    """
+    async with SessionLocal() as db:
+        user = await db.get(User, user_id)
+        if user is None or not user.strava_access_token:
+            return "skipped"
+        progress = await backfill_service.reserve(db, user.id, user.strava_sync_watermark)
+        if progress is None:
+            # Người dùng đang tự đồng bộ (POST /strava/sync) ở một worker nào đó
+            return "skipped"
+        concurrency = None if user.strava_sync_watermark is None else 1
+        await backfill_service.backfill_user(user, db, concurrency=concurrency, progress=progress)
+        principal = auth_service.CurrentUser.from_user(user)
+    await stream_service.fetch_missing_streams(principal)
+    return None
+
+
+async def _finish_job(claim: str, user_id: int, started_at: float, error: Optional[str], skipped: bool):
+    now = int(time.time())
+    values = {"lease_owner": None, "lease_expires_at": None}
+    if not skipped:
+        values.update(last_run_at=int(started_at), last_duration=round(time.time() - started_at, 3))
+        if error is None:
+            values.update(next_run_at=now + int(_next_interval()), last_success_at=now, failures=0, last_error=None)
+        else:
+            async with SessionLocal() as db:
+                failures = (await db.get(SyncJob, user_id)).failures + 1
+            values.update(next_run_at=now + _retry_delay(failures), failures=failures, last_error=error[:500])
+
+    async with SessionLocal() as db:
+        # Chỉ cập nhật khi còn giữ lease (lease hết hạn thì job đã thuộc worker khác)
+        await db.execute(
+            update(SyncJob)
+            .where(SyncJob.user_id == user_id, SyncJob.lease_owner == claim)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def run_cycle(worker_id: str = None, batch_size: int = None, concurrency: int = None) -> SyncCycle:
+    """Một chu kỳ: tạo job còn thiếu, nhận một lô job đến hạn và đồng bộ song song có giới hạn"""
+    worker_id = worker_id or default_worker_id()
+    batch_size = batch_size or settings.SYNC_BATCH_SIZE
+    concurrency = concurrency or settings.SYNC_CONCURRENCY
+    cycle = SyncCycle(worker_id=worker_id, started_at=time.time())
+    claim = f"{worker_id}:{uuid.uuid4().hex[:8]}"
+
+    async with SessionLocal() as db:
+        await ensure_jobs(db)
+        jobs = await claim_jobs(db, claim, batch_size, int(cycle.started_at))
+    cycle.claimed = len(jobs)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    lags = []
+
+    async def run(user_id: int, due_at: int):
+        async with semaphore:
+            started_at = time.time()
+            lags.append(max(0.0, started_at - due_at))
+            SYNC_LAG_SECONDS.observe(lags[-1])
+            in_flight.add(user_id)
+            error = None
+            skipped = False
+            try:
+                skipped = await sync_user(user_id) == "skipped"
+            except Exception as e:
+                # HTTPException không có thông điệp trong str(e)
+                error = f"{type(e).__name__}: {getattr(e, 'detail', None) or e}"
+                print(f"Error syncing user {user_id}: {error}")
+            finally:
+                in_flight.discard(user_id)
+            await _finish_job(claim, user_id, started_at, error, skipped)
+            if skipped:
+                cycle.skipped += 1
+            elif error:
+                cycle.failed += 1
+            else:
+                cycle.succeeded += 1
+            SYNC_JOBS.inc(("skipped" if skipped else "failed" if error else "ok",))
+
+    stop_renewing = asyncio.Event()
+    renewer = asyncio.create_task(_renew_leases(claim, in_flight, stop_renewing))
+    try:
+        await asyncio.gather(*(run(user_id, due_at) for user_id, due_at in jobs.items()))
+    finally:
+        stop_renewing.set()
+        await renewer
+
+    cycle.duration = time.time() - cycle.started_at
+    if lags:
+        cycle.max_lag = max(lags)
+        cycle.mean_lag = sum(lags) / len(lags)
+    _cycles.append(cycle)
+    if cycle.claimed:
+        SYNC_CYCLE_SECONDS.observe(cycle.duration)
+        print(f"Sync cycle {worker_id}: {cycle.claimed} users ({cycle.succeeded} ok, {cycle.failed} failed, "
+              f"{cycle.skipped} skipped) in {cycle.duration:.1f}s, lag max {cycle.max_lag:.0f}s "
+              f"mean {cycle.mean_lag:.0f}s")
+    return cycle
+
+
+async def get_status(db: AsyncSession) -> dict:
+    """Trạng thái hàng đợi đồng bộ: số job đến hạn, độ trễ lớn nhất, số job đang lỗi"""
+    now = int(time.time())
+    due, oldest = (await db.execute(
+        select(func.count(), func.min(SyncJob.next_run_at)).where(SyncJob.next_run_at <= now)
+    )).one()
+    failing = await db.scalar(select(func.count()).where(SyncJob.failures > 0))
+    total = await db.scalar(select(func.count()).select_from(SyncJob))
+    return {
+        "jobs": total,
+        "due": due,
+        "max_lag": now - oldest if oldest is not None else 0,
+        "failing": failing,
+    }
+
+
+async def run_sync_worker(stop: asyncio.Event, worker_id: str = None):
+    """Tác vụ nền: định kỳ đồng bộ mọi người dùng đã liên kết Strava
+
+    Nhiều tiến trình có thể cùng chạy; lease trên bảng job đảm bảo mỗi người
+    dùng chỉ được một worker đồng bộ tại một thời điểm.
+    """
+    worker_id = worker_id or default_worker_id()
+    while not stop.is_set():
+        try:
+            # Còn job đến hạn (lô đầy) thì chạy tiếp ngay
+            while (await run_cycle(worker_id)).claimed >= settings.SYNC_BATCH_SIZE and not stop.is_set():
+                pass
+        except Exception as e:
+            print(f"Error in sync worker: {str(e)}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.SYNC_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,290 @@
+# app/services/training_load_service.py
+"""Tải tập luyện theo ngày và các đường fitness (CTL), fatigue (ATL), form (TSB) của người dùng
+
+Tải của hoạt động: theo công suất (TSS) nếu có average_watts, theo nhịp tim (TRIMP)
+nếu có average_heartrate, còn lại theo moving_time. Chuỗi theo ngày được lưu gọn
+trong bảng training_loads; ghi hoạt động tính lại ngay trong transaction của nó, từ
+ngày sớm nhất bị ảnh hưởng trở đi, tiếp nối từ CTL/ATL đã lưu của ngày trước. Request
+đọc không ghi gì nên không tranh khóa ghi của SQLite với các worker.
+"""
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.activity import Activity
+from app.models.training_load import TrainingLoad
+
+# Số ngày mỗi khối khi tính trung bình lũy thừa: trong khối dùng cumsum, giữa các khối
+# nối tiếp trạng thái; decay^-BLOCK vẫn nằm xa giới hạn của float64 với hằng số 7 ngày
+BLOCK = 128
+
+# Sai số tương đối cho phép khi so sánh chuỗi tính tăng dần với chuỗi tính lại từ đầu
+TOLERANCE = 1e-6
+
+
+class Series(NamedTuple):
+    start_day: Optional[date]
+    loads: np.ndarray
+    ctl: np.ndarray
+    atl: np.ndarray
+
+
+EMPTY = Series(None, np.zeros(0), np.zeros(0), np.zeros(0))
+
+
+def activity_loads(moving_time, average_heartrate, average_watts) -> np.ndarray:
+    """Tải của từng hoạt động (None là thiếu dữ liệu), vector hóa trên các mảng cùng độ dài"""
+    hours = np.nan_to_num(np.asarray(moving_time, dtype=np.float64)) / 3600
+    watts = np.asarray(average_watts, dtype=np.float64)
+    heartrate = np.asarray(average_heartrate, dtype=np.float64)
+    by_power = hours * (watts / settings.TRAINING_FTP) ** 2 * 100
+    # TRIMP của Banister theo tỷ lệ nhịp tim dự trữ
+    reserve = (heartrate - settings.TRAINING_REST_HEARTRATE) / (
+        settings.TRAINING_MAX_HEARTRATE - settings.TRAINING_REST_HEARTRATE
+    )
+    reserve = np.clip(reserve, 0.0, 1.0)
+    by_heartrate = hours * 60 * reserve * 0.64 * np.exp(1.92 * reserve)
+    by_time = hours * settings.TRAINING_LOAD_PER_HOUR
+    return np.where(watts > 0, by_power, np.where(heartrate > 0, by_heartrate, by_time))
+
+
+def ewma(loads: np.ndarray, initial: float, days: int) -> np.ndarray:
+    """y[i] = y[i-1] + (loads[i] - y[i-1]) / days với y[-1] = initial, vector hóa theo trục ngày
+
+    Trong một khối: y[i] = decay^(i+1) * initial + (1/days) * decay^i * cumsum(loads[j] / decay^j).
+    Tải không âm nên cumsum không bị triệt tiêu số học.
+    """
+    decay = 1 - 1 / days
+    powers = decay ** np.arange(BLOCK + 1)
+    result = np.empty(len(loads))
+    state = initial
+    for start in range(0, len(loads), BLOCK):
+        block = loads[start:start + BLOCK]
+        size = len(block)
+        values = powers[1:size + 1] * state + np.cumsum(block / powers[:size]) * powers[:size] / days
+        result[start:start + size] = values
+        state = values[-1]
+    return result
+
+
+def _pack(values: np.ndarray) -> bytes:
+    return zlib.compress(np.asarray(values, dtype="<f8").tobytes(), 6)
+
+
+def _unpack(blob: Optional[bytes]) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(blob), dtype="<f8") if blob else np.zeros(0)
+
+
+async def _daily_loads(db: AsyncSession, user_id: int, since: Optional[date]):
+    """(ngày đầu, tải theo ngày) của các hoạt động từ ngày `since` (UTC); (None, []) nếu không có"""
+    stmt = select(
+        Activity.start_date, Activity.moving_time, Activity.average_heartrate, Activity.average_watts
+    ).where(Activity.user_id == user_id, Activity.start_date.is_not(None))
+    if since is not None:
+        stmt = stmt.where(Activity.start_date >= datetime.combine(since, datetime.min.time()))
+    rows = (await db.execute(stmt)).all()
+    if not rows:
+        return None, np.zeros(0)
+    ordinals = np.fromiter((row[0].toordinal() for row in rows), dtype=np.int64, count=len(rows))
+    first = int(ordinals.min())
+    loads = activity_loads(*zip(*(row[1:] for row in rows)))
+    return date.fromordinal(first), np.bincount(ordinals - first, weights=loads)
+
+
+def _trim(series: Series) -> Series:
+    """Bỏ các ngày không có tải ở cuối chuỗi (giá trị sau ngày cuối được suy ra khi đọc)"""
+    active = np.flatnonzero(series.loads)
+    if not len(active):
+        return EMPTY
+    end = active[-1] + 1
+    return Series(series.start_day, series.loads[:end], series.ctl[:end], series.atl[:end])
+
+
+async def compute(db: AsyncSession, user_id: int, previous: Series = EMPTY, since: Optional[date] = None) -> Series:
+    """Tính chuỗi từ ngày `since`, giữ phần của `previous` trước ngày đó; không có `since` thì tính từ đầu"""
+    keep = 0
+    if since is not None and previous.start_day is not None and since > previous.start_day:
+        keep = min((since - previous.start_day).days, len(previous.loads))
+    if not keep:
+        first, loads = await _daily_loads(db, user_id, None)
+        if first is None:
+            return EMPTY
+        return _trim(Series(
+            first, loads,
+            ewma(loads, 0.0, settings.TRAINING_CTL_DAYS), ewma(loads, 0.0, settings.TRAINING_ATL_DAYS),
+        ))
+
+    since = previous.start_day + timedelta(days=keep)
+    first, tail = await _daily_loads(db, user_id, since)
+    if first is not None:
+        tail = np.concatenate([np.zeros((first - since).days), tail])
+    return _trim(Series(
+        previous.start_day,
+        np.concatenate([previous.loads[:keep], tail]),
+        np.concatenate([previous.ctl[:keep], ewma(tail, previous.ctl[keep - 1], settings.TRAINING_CTL_DAYS)]),
+        np.concatenate([previous.atl[:keep], ewma(tail, previous.atl[keep - 1], settings.TRAINING_ATL_DAYS)]),
+    ))
+
+
+async def mark_dirty(db: AsyncSession, changes: Dict[int, date]):
+    """Đánh dấu chuỗi của mỗi người dùng cần tính lại từ ngày đã cho ({user_id: ngày})
+
+    Gọi khi thêm, sửa hoặc xóa hoạt động, trong cùng transaction. Không commit.
+    """
+    if not changes:
+        return
+    stmt = insert(TrainingLoad)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TrainingLoad.user_id],
+        set_={
+            "dirty_from": func.min(func.coalesce(TrainingLoad.dirty_from, stmt.excluded.dirty_from),
+                                   stmt.excluded.dirty_from),
+            "version": TrainingLoad.version + 1,
+        },
+    )
+    await db.execute(stmt, [
+        {"user_id": user_id, "dirty_from": day, "days": 0, "version": 1} for user_id, day in changes.items()
+    ])
+
+
+async def update_series(db: AsyncSession, changes: Dict[int, date]):
+    """Đánh dấu rồi tính lại ngay chuỗi của mỗi người dùng từ ngày đã cho ({user_id: ngày})
+
+    Gọi khi thêm, sửa hoặc xóa hoạt động, trong cùng transaction ghi. Không commit.
+    """
+    await mark_dirty(db, changes)
+    for user_id in changes:
+        await load_series(db, user_id)
+
+
+async def load_series(db: AsyncSession, user_id: int, save: bool = True) -> Series:
+    """Chuỗi hiện tại của người dùng, tính lại phần đã bị đánh dấu
+
+    `save`: ghi lại phần vừa tính (không commit); chỉ ghi đè khi version chưa đổi kể từ
+    lúc đọc. Không `save` thì chỉ đọc: phần bị đánh dấu được tính trong bộ nhớ.
+    """
+    record = (await db.execute(
+        select(TrainingLoad.start_day, TrainingLoad.loads, TrainingLoad.ctl, TrainingLoad.atl,
+               TrainingLoad.dirty_from, TrainingLoad.version)
+        .where(TrainingLoad.user_id == user_id)
+    )).first()
+    previous = EMPTY
+    if record is not None and record.start_day is not None:
+        previous = Series(record.start_day, _unpack(record.loads), _unpack(record.ctl), _unpack(record.atl))
+        if record.dirty_from is None:
+            return previous
+
+    series = await compute(db, user_id, previous, record.dirty_from if record is not None else None)
+    if not save:
+        return series
+    values = {
+        "start_day": series.start_day,
+        "days": len(series.loads),
+        "loads": _pack(series.loads),
+        "ctl": _pack(series.ctl),
+        "atl": _pack(series.atl),
+        "dirty_from": None,
+    }
+    if record is None:
+        await db.execute(insert(TrainingLoad).values(user_id=user_id, version=0, **values).on_conflict_do_nothing())
+    else:
+        await db.execute(
+            update(TrainingLoad)
+            .where(TrainingLoad.user_id == user_id, TrainingLoad.version == record.version)
+            .values(**values)
+        )
+    return series
+
+
+def window(series: Series, start: date, end: date) -> Dict[str, np.ndarray]:
+    """Các mảng load, ctl, atl, tsb cho từng ngày trong [start, end]
+
+    Trước ngày đầu của chuỗi mọi giá trị bằng 0; sau ngày cuối, tải bằng 0 và CTL/ATL giảm dần.
+    TSB của một ngày là CTL - ATL của ngày hôm trước (độ sẵn sàng khi bắt đầu ngày).
+    """
+    start = start - timedelta(days=1)
+    size = (end - start).days + 1
+    arrays = {"load": np.zeros(size), "ctl": np.zeros(size), "atl": np.zeros(size)}
+    if series.start_day is not None:
+        offset = (start - series.start_day).days
+        stored = len(series.loads)
+        low, high = max(0, offset), min(stored, offset + size)
+        for name, values in (("load", series.loads), ("ctl", series.ctl), ("atl", series.atl)):
+            if low < high:
+                arrays[name][low - offset:high - offset] = values[low:high]
+        after = max(stored, offset)
+        if after < offset + size:
+            elapsed = np.arange(after, offset + size) - (stored - 1)
+            for name, days in (("ctl", settings.TRAINING_CTL_DAYS), ("atl", settings.TRAINING_ATL_DAYS)):
+                arrays[name][after - offset:] = getattr(series, name)[-1] * (1 - 1 / days) ** elapsed
+    arrays["tsb"] = arrays["ctl"][:-1] - arrays["atl"][:-1]
+    for name in ("load", "ctl", "atl"):
+        arrays[name] = arrays[name][1:]
+    return arrays
+
+
+async def get_training_load(db: AsyncSession, user_id: int, start: date, end: date) -> List[dict]:
+    """Tải, CTL, ATL và TSB theo ngày trong [start, end] (đã giới hạn độ dài khoảng); chỉ đọc"""
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    if (end - start).days + 1 > settings.TRAINING_LOAD_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range exceeds {settings.TRAINING_LOAD_MAX_DAYS} days")
+    series = await load_series(db, user_id, save=False)
+    arrays = {name: np.round(values, 2).tolist() for name, values in window(series, start, end).items()}
+    days = [(start + timedelta(days=offset)).isoformat() for offset in range(len(arrays["load"]))]
+    return [
+        {"date": day, "load": load, "ctl": ctl, "atl": atl, "tsb": tsb}
+        for day, load, ctl, atl, tsb in zip(days, arrays["load"], arrays["ctl"], arrays["atl"], arrays["tsb"])
+    ]
+
+
+async def _user_ids(db: AsyncSession, user_id: Optional[int]) -> List[int]:
+    """Người dùng có hoạt động hoặc có chuỗi đã lưu"""
+    stmt = select(Activity.user_id).union(select(TrainingLoad.user_id))
+    if user_id is not None:
+        stmt = select(Activity.user_id).where(Activity.user_id == user_id).union(
+            select(TrainingLoad.user_id).where(TrainingLoad.user_id == user_id)
+        )
+    return sorted(uid for uid in (await db.execute(stmt)).scalars() if uid is not None)
+
+
+async def rebuild(db: AsyncSession, user_id: Optional[int] = None) -> int:
+    """Tính lại từ đầu chuỗi của mọi người dùng (hoặc một người dùng), trả về số chuỗi; không commit"""
+    stmt = delete(TrainingLoad)
+    if user_id is not None:
+        stmt = stmt.where(TrainingLoad.user_id == user_id)
+    await db.execute(stmt)
+    user_ids = await _user_ids(db, user_id)
+    for uid in user_ids:
+        await load_series(db, uid)
+    return len(user_ids)
+
+
+async def check(db: AsyncSession, user_id: Optional[int] = None) -> List[dict]:
+    """So sánh chuỗi đã lưu (kèm phần bị đánh dấu tính trong bộ nhớ) với chuỗi tính lại từ đầu; chỉ đọc"""
+    mismatches = []
+    for uid in await _user_ids(db, user_id):
+        stored, expected = await load_series(db, uid, save=False), await compute(db, uid)
+        if stored.start_day != expected.start_day or len(stored.loads) != len(expected.loads):
+            mismatches.append({
+                "user_id": uid,
+                "stored": [str(stored.start_day), len(stored.loads)],
+                "expected": [str(expected.start_day), len(expected.loads)],
+            })
+            continue
+        for name in ("loads", "ctl", "atl"):
+            got, want = getattr(stored, name), getattr(expected, name)
+            differs = np.flatnonzero(np.abs(got - want) > TOLERANCE * np.maximum(1.0, np.abs(want)))
+            if len(differs):
+                day = stored.start_day + timedelta(days=int(differs[0]))
+                mismatches.append({
+                    "user_id": uid, "series": name, "day": day.isoformat(),
+                    "stored": float(got[differs[0]]), "expected": float(want[differs[0]]),
+                })
+    return mismatches
@@ -0,0 +1,183 @@
+# app/services/webhook_service.py
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import SessionLocal
+from app.models.user import User
+from app.models.webhook_event import WebhookEvent
+from app.services import activity_service, auth_service, detail_service, lease_service, strava_service
+from app.services.strava_scheduler import BACKGROUND
+
+# Đánh thức worker ngay khi có sự kiện mới (tạo khi worker khởi động)
+_wakeup: Optional[asyncio.Event] = None
+
+
+def notify():
+    """Báo cho worker trong tiến trình biết có sự kiện mới"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def enqueue_event(db: AsyncSession, event: dict) -> WebhookEvent:
+    """Lưu sự kiện webhook vào hàng đợi trong DB"""
+    row = WebhookEvent(
+        object_type=event["object_type"],
+        object_id=event["object_id"],
+        aspect_type=event["aspect_type"],
+        owner_id=event["owner_id"],
+        updates=json.dumps(event.get("updates") or {}),
+        event_time=event.get("event_time"),
+        status="pending",
+        attempts=0,
+        available_at=0,
+    )
+    db.add(row)
+    await db.commit()
+    notify()
+    return row
+
+
+async def _fetch_activities(user, activity_ids: List[int]):
+    """Tải song song (có giới hạn) các hoạt động; trả về (đã tải, không còn truy cập được)"""
+    semaphore = asyncio.Semaphore(settings.WEBHOOK_FETCH_CONCURRENCY)
+    fetched, missing = [], []
+
+    async def fetch(activity_id):
+        async with semaphore:
+            try:
+                fetched.append(await strava_service.get_activity(
+                    user.strava_access_token, activity_id, priority=BACKGROUND
+                ))
+            except HTTPException as e:
+                if e.status_code != 404:
+                    raise
+                missing.append(activity_id)
+
+    await asyncio.gather(*(fetch(activity_id) for activity_id in activity_ids))
+    return fetched, missing
+
+
+async def _apply_owner_events(db: AsyncSession, user: Optional[User], events: List[dict]):
+    """Áp dụng các sự kiện của một vận động viên: upsert/xóa hoạt động, hủy ủy quyền"""
+    if user is None:
+        return
+
+    # Chỉ trạng thái cuối cùng của mỗi hoạt động trong lô là quan trọng
+    final: Dict[int, str] = {}
+    for event in events:
+        if event["object_type"] == "athlete":
+            if event["updates"].get("authorized") == "false":
+                user.strava_access_token = None
+                user.strava_refresh_token = None
+                user.strava_token_expires_at = None
+        elif event["object_type"] == "activity":
+            final[event["object_id"]] = event["aspect_type"]
+
+    deleted = [activity_id for activity_id, aspect in final.items() if aspect == "delete"]
+    changed = [activity_id for activity_id, aspect in final.items() if aspect != "delete"]
+
+    if changed and user.strava_access_token:
+        user = await strava_service.check_and_refresh_token(user, db, priority=BACKGROUND)
+        fetched, missing = await _fetch_activities(user, changed)
+        await activity_service.ingest_activities(db, user.id, fetched)
+        # Phản hồi /activities/{id} là bản chi tiết: lưu luôn vào cache chi tiết
+        await detail_service.save_details(db, fetched)
+        deleted.extend(missing)
+
+    await activity_service.delete_activities(db, deleted)
+
+
+async def drain_events(batch_size: int = None) -> int:
+    """Xử lý một lô sự kiện đang chờ, gộp theo vận động viên; trả về số sự kiện đã lấy"""
+    batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+    now = int(time.time())
+
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(WebhookEvent)
+            .where(WebhookEvent.status == "pending", WebhookEvent.available_at <= now)
+            .order_by(WebhookEvent.id)
+            .limit(batch_size)
+        )
+        by_owner = defaultdict(list)
+        for row in result.scalars():
+            by_owner[row.owner_id].append({
+                "id": row.id,
+                "object_type": row.object_type,
+                "object_id": row.object_id,
+                "aspect_type": row.aspect_type,
+                "updates": json.loads(row.updates or "{}"),
+            })
+        if not by_owner:
+            return 0
+
+        result = await db.execute(select(User).where(User.strava_athlete_id.in_(list(by_owner))))
+        users = {user.strava_athlete_id: user for user in result.scalars()}
+
+        for owner_id, events in by_owner.items():
+            ids = [event["id"] for event in events]
+            try:
+                await _apply_owner_events(db, users.get(owner_id), events)
+                await db.execute(update(WebhookEvent).where(WebhookEvent.id.in_(ids)).values(status="done"))
+                await db.commit()
+                if owner_id in users:
+                    auth_service.invalidate_user(users[owner_id].id)
+            except Exception as e:
+                await db.rollback()
+                print(f"Error processing webhook events for athlete {owner_id}: {str(e)}")
+                await db.execute(
+                    update(WebhookEvent)
+                    .where(WebhookEvent.id.in_(ids))
+                    .values(
+                        attempts=WebhookEvent.attempts + 1,
+                        last_error=str(e)[:500],
+                        available_at=now + settings.WEBHOOK_RETRY_DELAY * (WebhookEvent.attempts + 1),
+                        status=case(
+                            (WebhookEvent.attempts + 1 >= settings.WEBHOOK_MAX_ATTEMPTS, "failed"),
+                            else_="pending",
+                        ),
+                    )
+                )
+                await db.commit()
+                # Đối tượng User đã bị expire sau rollback; nạp lại cho các nhóm sau
+                result = await db.execute(select(User).where(User.strava_athlete_id.in_(list(by_owner))))
+                users = {user.strava_athlete_id: user for user in result.scalars()}
+
+        return sum(len(events) for events in by_owner.values())
+
+
+async def run_webhook_worker(stop: asyncio.Event):
+    """Tác vụ nền: xử lý hàng đợi sự kiện webhook theo lô
+
+    Khi chạy nhiều worker, chỉ tiến trình giữ lease "webhook-worker" xử lý hàng đợi
+    để sự kiện của một vận động viên vẫn được áp dụng theo thứ tự; sự kiện nhận ở
+    tiến trình khác được xử lý ở lần poll kế tiếp.
+    """
+    global _wakeup
+    _wakeup = asyncio.Event()
+    owner = lease_service.default_owner()
+
+    while not stop.is_set():
+        _wakeup.clear()
+        try:
+            while not stop.is_set() and await lease_service.acquire("webhook-worker", owner) and await drain_events():
+                pass
+        except Exception as e:
+            print(f"Error in webhook worker: {str(e)}")
+
+        waiters = [asyncio.ensure_future(stop.wait()), asyncio.ensure_future(_wakeup.wait())]
+        await asyncio.wait(waiters, timeout=settings.WEBHOOK_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters:
+            waiter.cancel()
+
+    try:
+        await lease_service.release("webhook-worker", owner)
+    except Exception as e:
+        print(f"Error releasing webhook worker lease: {str(e)}")
@@ -0,0 +1,219 @@
+# app/utils/activity_files.py
+import gzip
+import io
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.utils.geo import encode_polyline
+
+try:
+    import fitparse
+except ImportError:  # FIT chỉ được hỗ trợ khi đã cài fitparse
+    fitparse = None
+
+# Hệ số đổi tọa độ FIT (semicircle) sang độ
+SEMICIRCLE_TO_DEGREES = 180.0 / 2 ** 31
+EARTH_RADIUS_M = 6_371_000.0
+# Tốc độ tối thiểu (m/s) để một đoạn được tính vào moving_time
+MOVING_SPEED = 0.5
+# Số điểm tối đa của summary polyline (lấy mẫu đều từ latlng)
+POLYLINE_POINTS = 200
+
+
+class UnsupportedFileError(ValueError):
+    """Định dạng file hoạt động không được hỗ trợ"""
+
+
+def _local(tag: str) -> str:
+    # Bỏ namespace: "{http://www.topografix.com/GPX/1/1}trkpt" -> "trkpt"
+    return tag.rsplit("}", 1)[-1]
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_gpx(data: bytes) -> List[dict]:
+    """Đọc các điểm track từ GPX (kèm extension hr/cad/power của Garmin)"""
+    points = []
+    for _, element in ET.iterparse(io.BytesIO(data)):
+        if _local(element.tag) != "trkpt":
+            continue
+        point = {"lat": _float(element.get("lat")), "lng": _float(element.get("lon"))}
+        for child in element.iter():
+            name = _local(child.tag)
+            if name == "time":
+                point["time"] = _parse_time(child.text)
+            elif name == "ele":
+                point["altitude"] = _float(child.text)
+            elif name == "hr":
+                point["heartrate"] = _float(child.text)
+            elif name == "cad":
+                point["cadence"] = _float(child.text)
+            elif name in ("power", "watts"):
+                point["watts"] = _float(child.text)
+        if "time" in point:
+            points.append(point)
+        element.clear()
+    return points
+
+
+def parse_tcx(data: bytes) -> List[dict]:
+    """Đọc các Trackpoint từ TCX"""
+    points = []
+    # File TCX từ Garmin thường có khoảng trắng trước khai báo XML
+    for _, element in ET.iterparse(io.BytesIO(data.lstrip())):
+        if _local(element.tag) != "Trackpoint":
+            continue
+        point = {}
+        for child in element.iter():
+            name = _local(child.tag)
+            if name == "Time":
+                point["time"] = _parse_time(child.text)
+            elif name == "LatitudeDegrees":
+                point["lat"] = _float(child.text)
+            elif name == "LongitudeDegrees":
+                point["lng"] = _float(child.text)
+            elif name == "AltitudeMeters":
+                point["altitude"] = _float(child.text)
+            elif name == "DistanceMeters":
+                point["distance"] = _float(child.text)
+            elif name == "HeartRateBpm":
+                values = [_float(value.text) for value in child if _local(value.tag) == "Value"]
+                point["heartrate"] = values[0] if values else None
+            elif name == "Cadence":
+                point["cadence"] = _float(child.text)
+            elif name == "Watts":
+                point["watts"] = _float(child.text)
+        if "time" in point:
+            points.append(point)
+        element.clear()
+    return points
+
+
+def parse_fit(data: bytes) -> List[dict]:
+    """Đọc các bản ghi "record" từ FIT (cần fitparse)"""
+    if fitparse is None:
+        raise UnsupportedFileError("FIT files require the optional 'fitparse' package")
+
+    points = []
+    for record in fitparse.FitFile(io.BytesIO(data)).get_messages("record"):
+        values = record.get_values()
+        timestamp = values.get("timestamp")
+        if timestamp is None:
+            continue
+        lat, lng = values.get("position_lat"), values.get("position_long")
+        points.append({
+            "time": timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc),
+            "lat": None if lat is None else lat * SEMICIRCLE_TO_DEGREES,
+            "lng": None if lng is None else lng * SEMICIRCLE_TO_DEGREES,
+            "altitude": values.get("enhanced_altitude", values.get("altitude")),
+            "distance": values.get("distance"),
+            "heartrate": values.get("heart_rate"),
+            "cadence": values.get("cadence"),
+            "watts": values.get("power"),
+        })
+    return points
+
+
+PARSERS = {".gpx": parse_gpx, ".tcx": parse_tcx, ".fit": parse_fit}
+
+
+def read_points(filename: str, data: bytes) -> List[dict]:
+    """Chọn parser theo phần mở rộng (hỗ trợ .gz) và trả về danh sách điểm"""
+    name = filename.lower()
+    if name.endswith(".gz"):
+        data = gzip.decompress(data)
+        name = name[:-3]
+    for extension, parser in PARSERS.items():
+        if name.endswith(extension):
+            return parser(data)
+    raise UnsupportedFileError(f"Unsupported activity file: {filename}")
+
+
+def filled(values: List[Optional[float]]) -> Optional[np.ndarray]:
+    """Mảng float với giá trị thiếu được lấp bằng giá trị gần nhất trước đó (hoặc sau đó)"""
+    array = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    missing = np.isnan(array)
+    if missing.all():
+        return None
+    if missing.any():
+        index = np.where(missing, 0, np.arange(len(array)))
+        np.maximum.accumulate(index, out=index)
+        array = array[index]
+        # Các điểm thiếu ở đầu lấy giá trị hợp lệ đầu tiên
+        first = np.argmax(~missing)
+        array[:first] = array[first]
+    return array
+
+
+def haversine_distance(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """Quãng đường cộng dồn (m) dọc theo các tọa độ, tính vector hóa"""
+    lat, lng = np.radians(lat), np.radians(lng)
+    a = (np.sin(np.diff(lat) / 2) ** 2
+         + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2)
+    steps = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return np.concatenate([[0.0], np.cumsum(steps)])
+
+
+def to_streams(points: List[dict]) -> Dict[str, np.ndarray]:
+    """Chuyển danh sách điểm thành các kênh streams cùng độ dài (time tính bằng giây từ điểm đầu)"""
+    if not points:
+        return {}
+    start = points[0]["time"]
+    streams = {"time": np.array([(point["time"] - start).total_seconds() for point in points])}
+
+    lat = filled([point.get("lat") for point in points])
+    lng = filled([point.get("lng") for point in points])
+    if lat is not None and lng is not None:
+        streams["latlng"] = np.column_stack([lat, lng])
+
+    for channel in ("altitude", "distance", "heartrate", "cadence", "watts"):
+        values = filled([point.get(channel) for point in points])
+        if values is not None:
+            streams[channel] = values
+
+    if "distance" not in streams and "latlng" in streams:
+        streams["distance"] = haversine_distance(lat, lng)
+    return streams
+
+
+def summarize(points: List[dict], streams: Dict[str, np.ndarray]) -> dict:
+    """Tổng hợp từ streams: thời điểm bắt đầu, thời gian, quãng đường, độ cao leo được,
+    nhịp tim và công suất trung bình, tọa độ và polyline
+    """
+    if not points:
+        return {}
+    time_s = streams["time"]
+    summary = {"start_date": points[0]["time"], "elapsed_time": int(time_s[-1])}
+
+    if "distance" in streams:
+        distance = streams["distance"]
+        summary["distance"] = float(distance[-1])
+        dt = np.diff(time_s)
+        speed = np.divide(np.diff(distance), dt, out=np.zeros_like(dt), where=dt > 0)
+        summary["moving_time"] = int(dt[speed > MOVING_SPEED].sum())
+        summary["max_speed"] = float(speed.max()) if len(speed) else 0.0
+    if "altitude" in streams:
+        summary["total_elevation_gain"] = float(np.clip(np.diff(streams["altitude"]), 0, None).sum())
+    for channel, key in (("heartrate", "average_heartrate"), ("watts", "average_watts")):
+        if channel in streams:
+            summary[key] = round(float(np.mean(streams[channel])), 1)
+    if "latlng" in streams:
+        latlng = streams["latlng"]
+        summary["start_latlng"] = latlng[0].tolist()
+        summary["end_latlng"] = latlng[-1].tolist()
+        step = max(1, -(-len(latlng) // POLYLINE_POINTS))
+        summary["summary_polyline"] = encode_polyline(np.concatenate([latlng[::step], latlng[-1:]]))
+    return summary
@@ -0,0 +1,22 @@
+# app/utils/etag.py
+import hashlib
+from typing import Iterable, Optional
+
+
+def compute_etag(rows: Iterable[tuple]) -> str:
+    """Tính ETag mạnh từ các dòng kết quả (thay đổi khi bất kỳ giá trị nào thay đổi)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(repr(row).encode())
+        digest.update(b"\n")
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Kiểm tra header If-None-Match (so sánh yếu theo RFC 9110) với ETag hiện tại"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
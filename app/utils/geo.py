@@ -0,0 +1,83 @@
+# app/utils/geo.py
+"""Mã hóa/giải mã polyline (định dạng Google, độ chính xác 1e-5) và khoảng cách trên mặt cầu, vector hóa bằng NumPy"""
+from typing import List, Sequence
+
+import numpy as np
+
+EARTH_RADIUS = 6_371_000.0  # mét
+PRECISION = 1e5
+
+# Mỗi giá trị được tách thành các nhóm 5 bit; số nguyên 64 bit cần tối đa 13 nhóm
+_MAX_CHUNKS = 13
+
+
+def decode_polylines(polylines: Sequence[str]) -> List[np.ndarray]:
+    """Giải mã nhiều polyline trong một lượt NumPy, mỗi polyline thành mảng (N, 2) [lat, lng]
+
+    Polyline không hợp lệ (ký tự ngoài khoảng, giá trị bị cắt cụt, số giá trị lẻ) gây ValueError.
+    """
+    encoded = [polyline.encode("ascii") for polyline in polylines]
+    if not encoded:
+        return []
+    chars = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.int64) - 63
+    if len(chars) and (chars.min() < 0 or chars.max() > 63):
+        raise ValueError("Invalid polyline character")
+    lengths = np.fromiter((len(polyline) for polyline in encoded), dtype=np.int64, count=len(encoded))
+    bounds = np.cumsum(lengths)
+
+    # Ký tự cuối của mỗi giá trị không có bit tiếp nối 0x20
+    last = (chars & 0x20) == 0
+    if len(chars) and not last[bounds[lengths > 0] - 1].all():
+        raise ValueError("Truncated polyline")
+    value_index = np.cumsum(last) - last
+    value_starts = np.flatnonzero(np.r_[True, last[:-1]]) if len(chars) else np.zeros(0, dtype=np.int64)
+    position = np.arange(len(chars)) - value_starts[value_index]
+    if len(chars) and position.max() >= _MAX_CHUNKS:
+        raise ValueError("Polyline value too long")
+    values = np.add.reduceat((chars & 0x1F) << (5 * position), value_starts) if len(chars) else value_starts
+    # Zigzag: bit thấp nhất là dấu
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    # Số giá trị của mỗi polyline (mỗi polyline kết thúc bằng một giá trị trọn vẹn)
+    counts = np.diff(np.r_[0, np.cumsum(last)][np.r_[0, bounds]])
+    if (counts % 2).any():
+        raise ValueError("Polyline has an odd number of values")
+    # Giá trị là hiệu so với điểm trước: cộng dồn riêng trong từng polyline
+    pairs = values.reshape(-1, 2)
+    offsets = np.r_[0, np.cumsum(counts // 2)]
+    totals = np.cumsum(pairs, axis=0)
+    result = []
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        base = totals[start - 1] if start > 0 else 0
+        result.append((totals[start:end] - base) / PRECISION)
+    return result
+
+
+def decode_polyline(polyline: str) -> np.ndarray:
+    """Giải mã một polyline thành mảng (N, 2) [lat, lng]"""
+    return decode_polylines([polyline])[0]
+
+
+def encode_polyline(points) -> str:
+    """Mã hóa mảng (N, 2) [lat, lng] thành polyline"""
+    points = np.round(np.asarray(points, dtype=np.float64).reshape(-1, 2) * PRECISION).astype(np.int64)
+    if not len(points):
+        return ""
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    shifts = 5 * np.arange(_MAX_CHUNKS)
+    chunks = (values[:, None] >> shifts) & 0x1F
+    # Số nhóm 5 bit của mỗi giá trị (ít nhất 1)
+    sizes = 1 + ((values[:, None] >> shifts[1:]) > 0).sum(axis=1)
+    used = np.arange(_MAX_CHUNKS) < sizes[:, None]
+    more = np.arange(_MAX_CHUNKS) < (sizes - 1)[:, None]
+    chars = (chunks | np.where(more, 0x20, 0)) + 63
+    return chars[used].astype(np.uint8).tobytes().decode("ascii")
+
+
+def haversine(lat, lng, lat0: float, lng0: float) -> np.ndarray:
+    """Khoảng cách (mét) từ các điểm (lat, lng) tới (lat0, lng0)"""
+    lat, lng = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lng, dtype=np.float64))
+    lat0, lng0 = np.radians(lat0), np.radians(lng0)
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * np.cos(lat0) * np.sin((lng - lng0) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -0,0 +1,112 @@
+# app/utils/instrumentation.py
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.utils.metrics import Counter, Gauge, Histogram
+
+HTTP_REQUESTS = Counter(
+    "http_requests", "HTTP requests by route template, method and status", ("method", "route", "status")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route")
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served", ("method",))
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Database queries issued per HTTP request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in database queries per HTTP request", ("route",)
+)
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Database query latency by statement type", ("statement",))
+
+# Thống kê DB của request hiện tại: [số truy vấn, tổng thời gian]
+_request_db: ContextVar[Optional[list]] = ContextVar("request_db", default=None)
+STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "WITH")
+
+
+class MetricsMiddleware:
+    """Middleware ASGI đo độ trễ, số request đang xử lý và số truy vấn DB theo route
+
+    Nhãn route là mẫu đường dẫn (ví dụ /activities/{activity_id}) lấy từ endpoint
+    đã khớp, nên số chuỗi metric không tăng theo giá trị tham số.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[object, str] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        route = self._routes.get(endpoint)
+        if route is None:
+            route = "unmatched"
+            for candidate in scope["app"].routes:
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    route = candidate.path
+                    break
+            self._routes[endpoint] = route
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+        HTTP_IN_FLIGHT.inc((method,))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec((method,))
+            _request_db.reset(token)
+            route = self._route(scope)
+            HTTP_REQUESTS.inc((method, route, str(status[0])))
+            HTTP_REQUEST_SECONDS.observe(elapsed, (method, route))
+            HTTP_REQUEST_DB_QUERIES.observe(stats[0], (route,))
+            HTTP_REQUEST_DB_SECONDS.observe(stats[1], (route,))
+
+
+def _statement_type(statement: str) -> str:
+    word = statement.lstrip()[:8].split(None, 1)
+    word = word[0].upper() if word else ""
+    return word if word in STATEMENTS else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    DB_QUERY_SECONDS.observe(elapsed, (_statement_type(statement),))
+    stats = _request_db.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def instrument_engine(engine: Engine):
+    """Đo thời gian mỗi truy vấn bằng sự kiện của engine (sync engine của AsyncEngine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def uninstrument_engine(engine: Engine):
+    event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+    event.remove(engine, "after_cursor_execute", _after_cursor_execute)
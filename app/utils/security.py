@@ -1,10 +1,26 @@
 # app/utils/security.py
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from app.config import settings
+from app.utils.metrics import Collector, Counter, Histogram
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+# Pool riêng cho bcrypt và số tác vụ băm đang chờ/chạy
+_hash_executor: Executor = None
+_hash_pending = 0
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds", "bcrypt time: compute in the pool and wait for a pool slot",
+    ("operation", "phase"),
+)
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected", "bcrypt tasks rejected with 503 because the pool was full")
+Collector("password_hash_pending", "bcrypt tasks waiting or running in the pool", (), lambda: {(): _hash_pending})
 
 
 def verify_password(plain_password, hashed_password):
@@ -17,6 +33,71 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+def verify_and_update_password(plain_password, hashed_password):
+    """Xác minh mật khẩu, trả về hash mới nếu hash cũ dùng cost đã lỗi thời"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def get_hash_executor() -> Executor:
+    """Lấy (hoặc tạo) pool dùng cho bcrypt theo cấu hình"""
+    global _hash_executor
+    if _hash_executor is None:
+        if settings.PASSWORD_HASH_EXECUTOR == "process":
+            _hash_executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+        else:
+            _hash_executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+            )
+    return _hash_executor
+
+
+def shutdown_hash_executor():
+    """Đóng pool bcrypt khi tắt ứng dụng"""
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
+
+def _timed(fn, *args):
+    # Chạy trong pool: đo riêng thời gian tính bcrypt, không gồm thời gian chờ
+    started = time.perf_counter()
+    return fn(*args), time.perf_counter() - started
+
+
+async def _run_hashing(operation: str, fn, *args):
+    """Chạy hàm bcrypt trong pool; từ chối với 503 khi hàng đợi đã đầy"""
+    global _hash_pending
+    if _hash_pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        PASSWORD_HASH_REJECTED.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry later",
+            headers={"Retry-After": "1"},
+        )
+
+    _hash_pending += 1
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        result, compute = await loop.run_in_executor(get_hash_executor(), _timed, fn, *args)
+    finally:
+        _hash_pending -= 1
+    PASSWORD_HASH_SECONDS.observe(compute, (operation, "compute"))
+    PASSWORD_HASH_SECONDS.observe(max(time.perf_counter() - started - compute, 0.0), (operation, "wait"))
+    return result
+
+
+async def get_password_hash_async(password):
+    """Tạo hash mật khẩu trong pool bcrypt"""
+    return await _run_hashing("hash", get_password_hash, password)
+
+
+async def verify_and_update_password_async(plain_password, hashed_password):
+    """Xác minh mật khẩu trong pool bcrypt, trả về (hợp lệ, hash mới hoặc None)"""
+    return await _run_hashing("verify", verify_and_update_password, plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Tạo JWT token"""
     to_encode = data.copy()
@@ -0,0 +1,76 @@
+# app/utils/serialization.py
+"""Mã hóa nhanh dữ liệu đọc từ DB thành bytes của response: JSON (orjson) hoặc MessagePack
+
+Dữ liệu từ DB là tin cậy nên không đi qua response model của pydantic và
+jsonable_encoder; route vẫn khai báo response_model để giữ tài liệu OpenAPI.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence
+
+import orjson
+from fastapi import Response
+
+try:
+    import msgpack
+except ImportError:  # MessagePack chỉ được hỗ trợ khi đã cài msgpack
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+_MSGPACK_ALIASES = (MSGPACK, "application/x-msgpack")
+
+
+def rows_to_dicts(columns: Sequence[str], rows: Iterable[tuple]) -> list:
+    """Ghép tên cột với từng dòng kết quả (dòng thuần, không phải đối tượng ORM)"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _quality(accept: str) -> Dict[str, float]:
+    qualities = {}
+    for part in accept.split(","):
+        media_type, *params = part.strip().lower().split(";")
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[media_type.strip()] = q
+    return qualities
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Chọn định dạng theo header Accept: MessagePack khi client ưu tiên nó (và đã cài msgpack), còn lại JSON"""
+    if not accept or msgpack is None:
+        return JSON
+    qualities = _quality(accept)
+    packed = max((qualities.get(alias, 0.0) for alias in _MSGPACK_ALIASES))
+    plain = max(qualities.get(JSON, 0.0), qualities.get("application/*", 0.0), qualities.get("*/*", 0.0))
+    return MSGPACK if packed > 0 and packed >= plain else JSON
+
+
+def _msgpack_default(value):
+    # MessagePack không có kiểu ngày giờ chung: dùng chuỗi ISO 8601 như JSON
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode(content, media_type: str = JSON) -> bytes:
+    if media_type == MSGPACK:
+        return msgpack.packb(content, default=_msgpack_default)
+    return orjson.dumps(content)
+
+
+def render(content, media_type: str = JSON, status_code: int = 200, headers: dict = None) -> Response:
+    """Response đã mã hóa sẵn; luôn kèm Vary: Accept vì nội dung phụ thuộc header Accept"""
+    response = Response(encode(content, media_type), status_code=status_code, media_type=media_type, headers=headers)
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+def variant_etag(etag: str, media_type: str) -> str:
+    """ETag mạnh phải khác nhau giữa các biểu diễn (JSON/MessagePack) của cùng dữ liệu"""
+    return etag if media_type == JSON else f'{etag[:-1]}-msgpack"'
@@ -0,0 +1,25 @@
+# app/utils/singleflight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Gộp các lời gọi đồng thời cùng khóa thành một lần thực thi duy nhất
+
+    Lời gọi đầu tiên chạy `fn`; các lời gọi đến trong lúc đó chờ và nhận chung
+    kết quả (hoặc exception). Việc hủy một bên chờ không hủy tác vụ chung.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
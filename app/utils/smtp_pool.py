@@ -0,0 +1,97 @@
+# app/utils/smtp_pool.py
+import asyncio
+import smtplib
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+# Lỗi chỉ liên quan đến một email (người nhận/nội dung bị từ chối); kết nối vẫn dùng được
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class SMTPConnection:
+    """Một kết nối SMTP đã xác thực, được giữ mở và dùng lại cho nhiều email
+
+    smtplib là blocking nên mọi thao tác chạy trong thread (asyncio.to_thread);
+    mỗi kết nối chỉ được dùng bởi một tác vụ tại một thời điểm.
+    """
+
+    def __init__(self, factory: Callable[[], smtplib.SMTP], idle_timeout: float):
+        self._factory = factory
+        self._idle_timeout = idle_timeout
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _ensure(self) -> smtplib.SMTP:
+        if self._smtp is not None and time.monotonic() - self._last_used > self._idle_timeout:
+            # Server thường tự ngắt kết nối rảnh; kiểm tra bằng NOOP trước khi dùng lại
+            try:
+                self._smtp.noop()
+            except smtplib.SMTPException:
+                self._close()
+        if self._smtp is None:
+            self._smtp = self._factory()
+        return self._smtp
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
+
+    def _send(self, from_addr: str, to_addr: str, message: str):
+        try:
+            self._ensure().sendmail(from_addr, [to_addr], message)
+        except smtplib.SMTPServerDisconnected:
+            # Kết nối bị đóng phía server: mở lại và thử đúng một lần
+            self._smtp = None
+            self._ensure().sendmail(from_addr, [to_addr], message)
+        except MESSAGE_ERRORS:
+            raise
+        except (smtplib.SMTPException, OSError):
+            self._close()
+            raise
+        self._last_used = time.monotonic()
+
+    async def send(self, from_addr: str, to_addr: str, message: str):
+        await asyncio.to_thread(self._send, from_addr, to_addr, message)
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+
+class SMTPPool:
+    """Pool nhỏ các kết nối SMTP dùng lại; gửi một lô email song song trên các kết nối"""
+
+    def __init__(self, factory: Callable[[], smtplib.SMTP], size: int = 2, idle_timeout: float = 60.0):
+        self._connections = [SMTPConnection(factory, idle_timeout) for _ in range(max(1, size))]
+
+    async def send_many(self, from_addr: str, messages: List[Tuple[int, str, str]]) -> List[Tuple[int, Optional[Exception]]]:
+        """Gửi các email (id, người nhận, nội dung); trả về (id, lỗi hoặc None) cho từng email"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in messages:
+            queue.put_nowait(item)
+        results = []
+
+        async def consume(connection: SMTPConnection):
+            while not queue.empty():
+                message_id, to_addr, message = queue.get_nowait()
+                try:
+                    await connection.send(from_addr, to_addr, message)
+                    results.append((message_id, None))
+                except Exception as e:
+                    results.append((message_id, e))
+                    if not isinstance(e, MESSAGE_ERRORS):
+                        # Lỗi kết nối: để các kết nối còn lại gửi phần còn lại
+                        return
+
+        await asyncio.gather(*(consume(connection) for connection in self._connections))
+        while not queue.empty():
+            message_id, _, _ = queue.get_nowait()
+            results.append((message_id, ConnectionError("no SMTP connection available")))
+        return results
+
+    async def close(self):
+        await asyncio.gather(*(connection.close() for connection in self._connections))
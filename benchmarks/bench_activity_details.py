@@ -0,0 +1,178 @@
+# benchmarks/bench_activity_details.py
+"""Kiểm tra và benchmark cache chi tiết hoạt động (/activities/{id}/details), dùng fake Strava cục bộ
+
+Chạy: python -m benchmarks.bench_activity_details [--activities 200] [--concurrency 50] [--latency 0.1]
+
+- Lần xem đầu: `--concurrency` request đồng thời cho cùng hoạt động chỉ gọi Strava một lần;
+  mỗi hoạt động chưa xem tốn đúng một lời gọi.
+- Xem lại: từ LRU trong tiến trình, rồi từ bảng activity_details (LRU trống, như tiến
+  trình khác hoặc sau khi khởi động lại); không lời gọi Strava nào. So với gọi
+  /activities/{id} của Strava ở mỗi lần xem.
+- Đổi hoạt động: đồng bộ thấy tên mới -> lần đọc kế tiếp trả bản cũ ngay (stale) và
+  tải lại ở nền đúng một lần; sự kiện webhook lưu luôn chi tiết mới (không thêm lời gọi);
+  xóa hoạt động xóa chi tiết.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import httpx  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.activity import Activity  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import activity_service, auth_service, detail_service, strava_service, webhook_service  # noqa: E402
+from app.utils.security import create_access_token  # noqa: E402
+from tests.fakes import create_app  # noqa: E402
+
+
+def detail_calls(fake) -> int:
+    """Số lời gọi /api/v3/activities/{id} (không tính streams) fake Strava đã nhận"""
+    return sum(count for path, count in fake.state.calls.items()
+               if path.startswith("/api/v3/activities/") and not path.endswith("/streams"))
+
+
+def median_ms(samples: list) -> float:
+    return statistics.median(samples) * 1000
+
+
+async def principal_of(user_id: int):
+    async with SessionLocal() as db:
+        return auth_service.CurrentUser.from_user(await db.get(User, user_id))
+
+
+async def settle():
+    """Chờ các lần tải lại nền của detail_service chạy xong"""
+    while detail_service._revalidating:
+        await asyncio.gather(*list(detail_service._revalidating.values()))
+
+
+async def main(count: int, concurrency: int, latency: float):
+    fake = create_app(num_activities=count, rate_limit=(10 ** 6, 10 ** 7))
+    fake.state.latency = latency
+    strava_service.start_client(transport=httpx.ASGITransport(app=fake))
+    try:
+        await init_db()
+        async with SessionLocal() as db:
+            user = User(username="details", email="details@example.com", is_active=True, is_verified=True,
+                        strava_athlete_id=1, strava_access_token="access", strava_refresh_token="refresh",
+                        strava_token_expires_at=int(time.time()) + 6 * 3600)
+            db.add(user)
+            await db.commit()
+            await activity_service.ingest_activities(db, user.id, fake.state.activities)
+            await db.commit()
+            result = await db.execute(select(Activity.id, Activity.strava_id).where(Activity.user_id == user.id))
+            ids = {int(strava_id): activity_id for activity_id, strava_id in result.all()}
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': 'details'})}"}
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+            async def view(strava_id: int, expect: str = None) -> dict:
+                started = time.perf_counter()
+                response = await client.get(f"/activities/{ids[strava_id]}/details", headers=headers)
+                elapsed = time.perf_counter() - started
+                assert response.status_code == 200, response.text
+                if expect is not None:
+                    assert response.headers["X-Cache"] == expect, (response.headers["X-Cache"], expect)
+                return {"elapsed": elapsed, "body": response.json(), "cache": response.headers["X-Cache"]}
+
+            # Lần xem đầu đồng thời: một lời gọi Strava
+            responses = await asyncio.gather(*(view(1) for _ in range(concurrency)))
+            assert detail_calls(fake) == 1, detail_calls(fake)
+            assert len({str(response["body"]) for response in responses}) == 1
+            assert responses[0]["body"]["laps"] and responses[0]["body"]["segment_efforts"]
+            print(f"cold: {concurrency} concurrent views of one activity -> {detail_calls(fake)} Strava call "
+                  f"(p50 {median_ms([r['elapsed'] for r in responses]):.1f}ms)")
+
+            cold = [(await view(strava_id, "miss"))["elapsed"] for strava_id in range(2, count + 1)]
+            assert detail_calls(fake) == count
+            print(f"cold: {count - 1} more activities -> {count - 1} more Strava calls (p50 {median_ms(cold):.1f}ms)")
+
+            timings = {"endpoint warm (memory LRU)": [], "endpoint warm (activity_details table)": [],
+                       "no cache (Strava every view)": []}
+            for strava_id in range(1, count + 1):
+                timings["endpoint warm (memory LRU)"].append((await view(strava_id, "hit"))["elapsed"])
+            detail_service.memory.clear()
+            for strava_id in range(1, count + 1):
+                timings["endpoint warm (activity_details table)"].append((await view(strava_id, "hit"))["elapsed"])
+            assert detail_calls(fake) == count
+            print(f"warm: {2 * count} repeat views -> 0 Strava calls")
+
+            # Riêng phần tra cache (không tính xác thực và HTTP)
+            principal = await principal_of(user.id)
+            service = {"get_details (memory LRU)": [], "get_details (activity_details table)": []}
+            for name in service:
+                for strava_id in range(1, count + 1):
+                    if name.endswith("table)"):
+                        detail_service.memory.pop(ids[strava_id])
+                    async with SessionLocal() as db:
+                        started = time.perf_counter()
+                        await detail_service.get_details(db, principal, ids[strava_id])
+                        service[name].append(time.perf_counter() - started)
+            timings.update(service)
+
+            before = detail_calls(fake)
+            for strava_id in range(1, min(count, 50) + 1):
+                started = time.perf_counter()
+                await strava_service.get_activity("access", strava_id)
+                timings["no cache (Strava every view)"].append(time.perf_counter() - started)
+            uncached = detail_calls(fake) - before
+            for name, samples in timings.items():
+                print(f"  {name:40s} {median_ms(samples):8.2f}ms")
+
+            # Đồng bộ thấy hoạt động đã đổi tên và mô tả: bản cũ trả ngay, tải lại nền một lần
+            fake.state.activities[0] = {**fake.state.activities[0], "name": "Renamed", "description": "Edited"}
+            async with SessionLocal() as db:
+                await activity_service.ingest_activities(db, user.id, fake.state.activities)
+                await db.commit()
+            before = detail_calls(fake)
+            responses = await asyncio.gather(*(view(1) for _ in range(concurrency)))
+            assert all(r["cache"] == "stale" and r["body"]["description"] == "Easy session #1" for r in responses)
+            await settle()
+            assert detail_calls(fake) - before == 1, detail_calls(fake) - before
+            assert (await view(1, "hit"))["body"]["description"] == "Edited"
+            assert detail_calls(fake) - before == 1
+            # Đồng bộ lại không có thay đổi: không đánh dấu cũ
+            async with SessionLocal() as db:
+                await activity_service.ingest_activities(db, user.id, fake.state.activities)
+                await db.commit()
+            await view(1, "hit")
+            print(f"sync change: {concurrency} concurrent stale reads -> 1 background Strava call, then fresh")
+
+            # Webhook: chi tiết vừa tải khi áp dụng sự kiện được lưu luôn
+            fake.state.activities[1] = {**fake.state.activities[1], "description": "From webhook"}
+            async with SessionLocal() as db:
+                await webhook_service.enqueue_event(db, {
+                    "object_type": "activity", "object_id": 2, "aspect_type": "update", "owner_id": 1,
+                    "updates": {"title": "x"},
+                })
+            before = detail_calls(fake)
+            await webhook_service.drain_events()
+            assert detail_calls(fake) - before == 1  # lời gọi của chính webhook
+            assert (await view(2, "hit"))["body"]["description"] == "From webhook"
+            assert detail_calls(fake) - before == 1
+            print("webhook update: details refreshed by the event's own fetch, next view is a hit without a call")
+
+            async with SessionLocal() as db:
+                await activity_service.delete_activities(db, [3])
+                await db.commit()
+            response = await client.get(f"/activities/{ids[3]}/details", headers=headers)
+            assert response.status_code == 404
+            print(f"delete: details removed ({response.status_code}); {uncached} uncached fetches for comparison")
+    finally:
+        await strava_service.close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activities", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.1, help="độ trễ mỗi request của fake Strava (giây)")
+    args = parser.parse_args()
+    asyncio.run(main(args.activities, args.concurrency, args.latency))
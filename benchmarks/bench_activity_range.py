@@ -0,0 +1,134 @@
+# benchmarks/bench_activity_range.py
+"""Kiểm tra query plan và benchmark truy vấn hoạt động theo khoảng ngày trên 1 triệu dòng
+
+Chạy: python -m benchmarks.bench_activity_range [--rows 1000000] [--users 1000]
+
+- EXPLAIN QUERY PLAN của activity_service.range_query phải dùng index
+  ix_activities_user_start (không lọc loại) và ix_activities_user_type_start
+  (lọc loại), không quét toàn bảng và không cần B-tree tạm để sắp xếp (ở quy mô
+  1 triệu dòng; kiểm thử hồi quy trên DB nhỏ: tests/test_services/test_activity_indexes.py).
+- So sánh độ trễ truy vấn "hôm nay", "30 ngày" và "30 ngày, lọc loại" khi có và
+  không có các index này (như schema cũ chỉ có index trên id và strava_id).
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import insert, text  # noqa: E402
+
+from app.database import SessionLocal, engine, init_db  # noqa: E402
+from app.models import activity_stream  # noqa: E402,F401  (đăng ký bảng activity_streams)
+from app.models.activity import Activity  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import activity_service  # noqa: E402
+
+TYPES = ("Run", "Ride", "Swim", "Walk")
+INDEXES = {"ix_activities_user_start", "ix_activities_user_type_start"}
+TODAY = date(2026, 6, 30)
+
+
+async def populate(rows: int, users: int):
+    await init_db()
+    async with SessionLocal() as db:
+        db.add_all(User(username=f"user{i}", email=f"user{i}@example.com", is_active=True) for i in range(users))
+        await db.commit()
+
+    rng = random.Random(0)
+    span = 3 * 365 * 24 * 3600
+    origin = datetime.combine(TODAY, datetime.min.time()) - timedelta(seconds=span)
+    started = time.perf_counter()
+    batch_size = 50_000
+    for offset in range(0, rows, batch_size):
+        batch = [
+            {
+                "strava_id": str(offset + i),
+                "user_id": rng.randrange(1, users + 1),
+                "name": f"Activity {offset + i}",
+                "type": rng.choice(TYPES),
+                "start_date": origin + timedelta(seconds=rng.randrange(span + 86400)),
+                "distance": rng.uniform(1000, 40000),
+                "moving_time": rng.randrange(600, 14400),
+                "elapsed_time": rng.randrange(600, 16000),
+                "total_elevation_gain": rng.uniform(0, 500),
+                "average_speed": rng.uniform(2, 9),
+                "max_speed": rng.uniform(5, 15),
+            }
+            for i in range(min(batch_size, rows - offset))
+        ]
+        async with SessionLocal() as db:
+            await db.execute(insert(Activity), batch)
+            await db.commit()
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE"))
+    print(f"inserted {rows} activities for {users} users in {time.perf_counter() - started:.1f}s")
+
+
+def queries(user_id: int):
+    return {
+        "today": activity_service.range_query(user_id, TODAY, TODAY),
+        "30 days": activity_service.range_query(user_id, TODAY - timedelta(days=29), TODAY),
+        "30 days, Run": activity_service.range_query(user_id, TODAY - timedelta(days=29), TODAY, "Run"),
+    }
+
+
+async def explain(stmt):
+    sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    async with engine.connect() as conn:
+        result = await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)
+        return [row[-1] for row in result.all()]
+
+
+async def check_plans():
+    expected = {"today": "ix_activities_user_start", "30 days": "ix_activities_user_start",
+                "30 days, Run": "ix_activities_user_type_start"}
+    for name, stmt in queries(1).items():
+        plan = await explain(stmt)
+        print(f"plan {name:13s} {' | '.join(plan)}")
+        assert any(f"USING INDEX {expected[name]}" in step or f"USING COVERING INDEX {expected[name]}" in step
+                   for step in plan), f"{name}: expected {expected[name]} in {plan}"
+        assert not any(step.startswith("SCAN activities") and "INDEX" not in step for step in plan), plan
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+async def measure(users: int, repeat: int):
+    rng = random.Random(1)
+    timings = {}
+    async with SessionLocal() as db:
+        for _ in range(repeat):
+            for name, stmt in queries(rng.randrange(1, users + 1)).items():
+                started = time.perf_counter()
+                (await db.execute(stmt)).scalars().all()
+                timings.setdefault(name, []).append(time.perf_counter() - started)
+    for name, values in timings.items():
+        values.sort()
+        print(f"  {name:13s} p50={values[len(values) // 2] * 1000:8.2f}ms  p99={values[int(len(values) * 0.99)] * 1000:8.2f}ms")
+
+
+async def main(rows: int, users: int, repeat: int):
+    await populate(rows, users)
+    await check_plans()
+    print("query plans use the composite indexes")
+
+    print("with indexes:")
+    await measure(users, repeat)
+
+    async with engine.begin() as conn:
+        for name in INDEXES:
+            await conn.execute(text(f"DROP INDEX {name}"))
+    print("without indexes (old schema):")
+    await measure(users, max(repeat // 20, 3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.users, args.repeat))
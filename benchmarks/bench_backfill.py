@@ -0,0 +1,63 @@
+# benchmarks/bench_backfill.py
+"""Benchmark backfill lịch sử hoạt động: tải tuần tự so với tải song song theo cửa sổ
+
+Chạy: python -m benchmarks.bench_backfill [--activities 5000] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models.user import User
+from app.models.activity import Activity
+from app.services import strava_service, backfill_service
+from tests.fakes import create_app
+
+
+async def run(num_activities: int, latency: float, concurrency: int):
+    fake = create_app(num_activities=num_activities, latency=latency)
+    strava_service.start_client(transport=httpx.ASGITransport(app=fake))
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    db = async_sessionmaker(engine, expire_on_commit=False)()
+    user = User(username="bench", email="bench@example.com", strava_access_token="token",
+                strava_refresh_token="refresh", strava_token_expires_at=int(time.time()) + 6 * 3600)
+    db.add(user)
+    await db.commit()
+
+    try:
+        started = time.perf_counter()
+        progress = await backfill_service.backfill_user(user, db, concurrency=concurrency)
+        elapsed = time.perf_counter() - started
+        stored = await db.scalar(select(func.count(Activity.id)))
+    finally:
+        await db.close()
+        await engine.dispose()
+        await strava_service.close_client()
+
+    assert stored == num_activities, (stored, num_activities)
+    print(f"concurrency={concurrency:2d}  pages={progress.pages:3d}  "
+          f"activities={stored}  {elapsed:6.2f}s  {stored / elapsed:8.0f} act/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activities", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for concurrency in (1, 4, 8):
+        asyncio.run(run(args.activities, args.latency, concurrency))
+
+
+if __name__ == "__main__":
+    main()
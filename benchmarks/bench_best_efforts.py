@@ -0,0 +1,125 @@
+# benchmarks/bench_best_efforts.py
+"""Kiểm tra và benchmark best effort (1k/5k/10k/half marathon, công suất 5/20/60 phút) và kỷ lục cá nhân
+
+Chạy: python -m benchmarks.bench_best_efforts [--steps 200] [--activities 200]
+
+- Đối chứng bằng tests/reference.py (duyệt trực tiếp mọi cặp điểm / mọi cửa sổ),
+  cũng dùng trong tests/test_services/test_best_efforts.py.
+- Kỷ lục: chuỗi thao tác ngẫu nhiên lưu streams, đổi loại/ngày và xóa hoạt động;
+  sau mỗi bước bảng kỷ lục phải khớp với kỷ lục tính lại từ đầu (best_effort_service.check).
+- Benchmark: thời gian tính mọi mốc cho `--activities` hoạt động 1-3 giờ (1 mẫu/giây),
+  vector hóa so với duyệt trực tiếp.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import numpy as np  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models.activity import Activity  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import activity_service, best_effort_service, stream_service  # noqa: E402
+from tests.fakes import make_activity  # noqa: E402
+from tests.reference import brute_force, random_streams  # noqa: E402
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+async def check_records(steps: int, seed: int):
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    async with SessionLocal() as db:
+        users = [User(username=f"records{i}", email=f"records{i}@example.com", is_active=True) for i in range(2)]
+        db.add_all(users)
+        await db.commit()
+        user_ids = [user.id for user in users]
+
+    summaries = {}  # strava_id -> (user_id, summary)
+    activity_ids = {}  # strava_id -> id
+    saved_streams = {}  # strava_id -> streams (để tạo hoạt động trùng thành tích)
+    next_id = 1
+    for step in range(steps):
+        async with SessionLocal() as db:
+            operation = rng.random()
+            if operation < 0.5 or not summaries:
+                user_id = rng.choice(user_ids)
+                summary = make_activity(next_id, EPOCH + timedelta(hours=rng.randrange(0, 24 * 90)))
+                summary["type"] = rng.choice(("Run", "Ride"))
+                await activity_service.ingest_activities(db, user_id, [summary])
+                activity_ids[str(next_id)] = await db.scalar(select(Activity.id).where(Activity.strava_id == str(next_id)))
+                if saved_streams and rng.random() < 0.2:
+                    # Cùng streams với một hoạt động trước: bằng thành tích, hoạt động sớm hơn giữ kỷ lục
+                    streams = saved_streams[rng.choice(list(saved_streams))]
+                else:
+                    streams = random_streams(np_rng, rng.choice([300, 2000, 5000]), watts=rng.random() < 0.7)
+                await stream_service.save_streams(db, activity_ids[str(next_id)], streams)
+                summaries[str(next_id)] = (user_id, summary)
+                saved_streams[str(next_id)] = streams
+                next_id += 1
+            elif operation < 0.75:
+                strava_id = rng.choice(list(summaries))
+                user_id, summary = summaries[strava_id]
+                if rng.random() < 0.5:
+                    summary["type"] = "Ride" if summary["type"] == "Run" else "Run"
+                else:
+                    summary["start_date"] = (EPOCH + timedelta(hours=rng.randrange(0, 24 * 90))).strftime("%Y-%m-%dT%H:%M:%SZ")
+                await activity_service.ingest_activities(db, user_id, [summary])
+            elif operation < 0.9:
+                # Streams mới cho hoạt động đã có (tính lại, thành tích có thể kém đi)
+                strava_id = rng.choice(list(summaries))
+                streams = random_streams(np_rng, rng.choice([300, 2000]), watts=rng.random() < 0.7)
+                await stream_service.save_streams(db, activity_ids[strava_id], streams)
+                saved_streams[strava_id] = streams
+            else:
+                strava_id = rng.choice(list(summaries))
+                await activity_service.delete_activities(db, [strava_id])
+                del summaries[strava_id], saved_streams[strava_id]
+            await db.commit()
+            mismatches = await best_effort_service.check(db)
+            assert not mismatches, f"step {step}: {mismatches[:3]}"
+    async with SessionLocal() as db:
+        records = await best_effort_service.rebuild(db)
+        assert not await best_effort_service.check(db)
+        await db.rollback()
+    print(f"records: {steps} random saves/edits/deletes, personal records always match a rebuild ({records} records)")
+
+
+def benchmark(count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    activities = [random_streams(rng, int(rng.integers(3600, 3 * 3600))) for _ in range(count)]
+    points = sum(len(streams["time"]) for streams in activities)
+    started = time.perf_counter()
+    for streams in activities:
+        best_effort_service.compute(streams)
+    vectorized = time.perf_counter() - started
+
+    sample = activities[:max(1, min(3, count))]
+    started = time.perf_counter()
+    for streams in sample:
+        brute_force(streams)
+    brute = (time.perf_counter() - started) / len(sample)
+    print(f"{count} activities ({points} points): vectorized {vectorized * 1000:.0f}ms "
+          f"({vectorized / count * 1000:.2f}ms/activity); brute force {brute * 1000:.0f}ms/activity "
+          f"(~{brute * count:.0f}s for all, {brute / (vectorized / count):.0f}x)")
+
+
+async def main(args):
+    await init_db()
+    await check_records(args.steps, args.seed)
+    benchmark(args.activities, args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--activities", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,151 @@
+# benchmarks/bench_db_load.py
+"""Load test: độ trễ đọc của API khi có ghi DB đồng thời
+
+Chạy: python -m benchmarks.bench_db_load [--seconds 5] [--concurrency 20]
+
+Một thread bên ngoài giữ khóa ghi SQLite định kỳ (mô phỏng một lần ghi chậm),
+trong khi ứng dụng liên tục upsert các lô hoạt động nhỏ và các client đọc
+`/activities/{id}`. So sánh ba pha:
+- chỉ đọc;
+- đọc + ghi qua AsyncSession (lớp DB mới, chờ khóa ngoài event loop);
+- đọc + ghi bằng sqlite3 đồng bộ ngay trên event loop (như lớp DB cũ).
+Với lớp DB async, p50/p99 của pha 2 phải gần với pha 1.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import httpx  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import activity_service  # noqa: E402
+from app.utils.security import create_access_token  # noqa: E402
+from tests.fakes import make_activity  # noqa: E402
+
+DB_PATH = settings.DATABASE_URL.split(":///", 1)[1]
+
+
+async def setup():
+    await init_db()
+    async with SessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", is_active=True, is_verified=True)
+        db.add(user)
+        await db.commit()
+        now = datetime.now(timezone.utc)
+        await activity_service.ingest_activities(
+            db, user.id, [make_activity(i, now - timedelta(hours=i)) for i in range(1, 1001)]
+        )
+        await db.commit()
+        return user.id
+
+
+def hold_write_lock(stop: threading.Event, hold: float, pause: float):
+    # Một tiến trình khác giữ khóa ghi trong `hold` giây, lặp lại định kỳ
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    while not stop.is_set():
+        conn.execute("BEGIN IMMEDIATE")
+        time.sleep(hold)
+        conn.execute("COMMIT")
+        time.sleep(pause)
+    conn.close()
+
+
+def make_batch(start_id: int, batch: int):
+    now = datetime.now(timezone.utc)
+    return [make_activity(start_id + i, now - timedelta(minutes=i)) for i in range(batch)]
+
+
+async def async_writer(user_id: int, stop: asyncio.Event, start_id: int, batch: int):
+    writes = 0
+    while not stop.is_set():
+        async with SessionLocal() as db:
+            await activity_service.ingest_activities(db, user_id, make_batch(start_id + writes, batch))
+            await db.commit()
+        writes += batch
+    return writes
+
+
+async def blocking_writer(user_id: int, stop: asyncio.Event, start_id: int, batch: int):
+    # Mô phỏng lớp DB đồng bộ cũ: chờ khóa và commit ngay trên event loop
+    conn = sqlite3.connect(DB_PATH, timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000)
+    writes = 0
+    while not stop.is_set():
+        rows = [activity_service.activity_row(item, user_id) for item in make_batch(start_id + writes, batch)]
+        conn.executemany(
+            "INSERT OR REPLACE INTO activities (strava_id, user_id, name, type, start_date, distance, "
+            "moving_time, elapsed_time, total_elevation_gain, average_speed, max_speed) VALUES "
+            "(:strava_id, :user_id, :name, :type, :start_date, :distance, :moving_time, :elapsed_time, "
+            ":total_elevation_gain, :average_speed, :max_speed)",
+            [{**row, "start_date": row["start_date"].isoformat()} for row in rows],
+        )
+        conn.commit()
+        writes += batch
+        await asyncio.sleep(0)
+    conn.close()
+    return writes
+
+
+async def readers(client, headers, seconds: float, concurrency: int):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def reader(n):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get(f"/activities/{1 + n}", headers=headers)
+            assert response.status_code == 200, response.text
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(reader(n) for n in range(concurrency)))
+    latencies.sort()
+    return len(latencies), latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def report(name, seconds, count, p50, p99, writes=None):
+    line = f"{name:16s} {count / seconds:7.0f} req/s  p50={p50 * 1000:7.1f}ms  p99={p99 * 1000:7.1f}ms"
+    if writes is not None:
+        line += f"  ({writes / seconds:.0f} rows/s written)"
+    print(line)
+
+
+async def main(seconds: float, concurrency: int, batch: int, hold: float):
+    user_id = await setup()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+        report("reads only", seconds, *await readers(client, headers, seconds, concurrency))
+
+        for name, writer, start_id in (("async writes", async_writer, 1_000_000),
+                                       ("blocking writes", blocking_writer, 5_000_000)):
+            lock_stop = threading.Event()
+            lock_thread = threading.Thread(target=hold_write_lock, args=(lock_stop, hold, hold / 2), daemon=True)
+            lock_thread.start()
+
+            stop = asyncio.Event()
+            write_task = asyncio.create_task(writer(user_id, stop, start_id, batch))
+            result = await readers(client, headers, seconds, concurrency)
+            stop.set()
+            writes = await write_task
+            lock_stop.set()
+            lock_thread.join()
+            report(name, seconds, *result, writes=writes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--hold", type=float, default=0.2, help="thời gian giữ khóa ghi bên ngoài (giây)")
+    args = parser.parse_args()
+    asyncio.run(main(args.seconds, args.concurrency, args.batch, args.hold))
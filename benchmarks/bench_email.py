@@ -0,0 +1,165 @@
+# benchmarks/bench_email.py
+"""Benchmark đăng ký (chỉ đưa email vào outbox) và thông lượng worker gửi email
+
+Chạy: python -m benchmarks.bench_email [--registrations 100] [--emails 500] [--handshake-ms 50]
+
+Dùng server SMTP giả lập (benchmarks.fake_smtp) với độ trễ bắt tay cấu hình được.
+- Độ trễ POST /auth/register: chỉ ghi outbox, so với một lần gửi SMTP trực tiếp
+  như mã cũ (kết nối + đăng nhập + gửi cho mỗi email); worker nền trong lifespan
+  phải gửi hết email xác nhận.
+- Thông lượng gửi: một kết nối mới cho mỗi email (cách cũ) so với drain_outbox
+  dùng pool 1 và 4 kết nối giữ mở; số lần đăng nhập SMTP được in kèm.
+- Thử lại: người nhận bị từ chối tạm thời (451) được hẹn gửi lại theo backoff,
+  bị từ chối vĩnh viễn (550) chuyển sang failed ngay.
+"""
+import argparse
+import asyncio
+import os
+import smtplib
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("TOKEN_REFRESHER_ENABLED", "false")
+os.environ.setdefault("WEBHOOK_WORKER_ENABLED", "false")
+os.environ.setdefault("SMTP_SERVER", "127.0.0.1")
+os.environ.setdefault("SMTP_PORT", "8025")
+os.environ.setdefault("SMTP_STARTTLS", "false")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import delete, select  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.email_outbox import EmailOutbox  # noqa: E402
+from app.services import email_service  # noqa: E402
+from app.utils.smtp_pool import SMTPPool  # noqa: E402
+from benchmarks.fake_smtp import FakeSMTPServer  # noqa: E402
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def send_inline(to_email: str, code: str):
+    """Cách cũ: mở kết nối, đăng nhập và gửi cho từng email"""
+    subject, text, html = email_service.verification_email(code)
+    row = EmailOutbox(to_email=to_email, subject=subject, text_body=text, html_body=html)
+    with smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT) as server:
+        if settings.SMTP_STARTTLS:
+            server.starttls()
+        server.login(settings.EMAIL_USERNAME, settings.EMAIL_PASSWORD)
+        server.sendmail(settings.EMAIL_FROM, to_email, email_service.build_message(row))
+
+
+def registrations(smtp: FakeSMTPServer, count: int):
+    before = len(smtp.messages)
+    latencies = []
+    with TestClient(app) as client:
+        for i in range(count):
+            started = time.perf_counter()
+            response = client.post("/auth/register", json={
+                "username": f"user{i}", "email": f"user{i}@example.com", "password": "SecurePass456"
+            })
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 201, response.text
+
+        # Worker nền trong lifespan gửi hết email xác nhận
+        deadline = time.time() + 60
+        while len(smtp.messages) - before < count and time.time() < deadline:
+            time.sleep(0.05)
+    delivered = len(smtp.messages) - before
+    assert delivered == count, f"worker delivered {delivered}/{count} verification emails"
+
+    inline = []
+    for i in range(min(count, 20)):
+        started = time.perf_counter()
+        send_inline(f"inline{i}@example.com", "123456")
+        inline.append(time.perf_counter() - started)
+
+    print(f"register (enqueue only): p50={percentile(latencies, 0.5) * 1000:7.2f}ms  "
+          f"p95={percentile(latencies, 0.95) * 1000:7.2f}ms; worker delivered {delivered} emails")
+    print(f"inline SMTP send (old):   p50={percentile(inline, 0.5) * 1000:7.2f}ms  added to every registration")
+
+
+async def enqueue(count: int, prefix: str):
+    async with SessionLocal() as db:
+        await db.execute(delete(EmailOutbox))
+        for i in range(count):
+            await email_service.enqueue_verification_email(db, f"{prefix}{i}@example.com", "123456")
+        await db.commit()
+
+
+async def throughput(smtp: FakeSMTPServer, count: int):
+    started = time.perf_counter()
+    for i in range(count // 5):
+        await asyncio.to_thread(send_inline, f"old{i}@example.com", "123456")
+    rate = count // 5 / (time.perf_counter() - started)
+    print(f"connection per email (old): {rate:8.1f} emails/s")
+
+    for size in (1, 4):
+        await enqueue(count, f"pool{size}-")
+        logins = smtp.logins
+        pool = SMTPPool(email_service.connect_smtp, size, settings.SMTP_IDLE_TIMEOUT)
+        started = time.perf_counter()
+        while await email_service.drain_outbox(pool):
+            pass
+        elapsed = time.perf_counter() - started
+        await pool.close()
+        async with SessionLocal() as db:
+            statuses = (await db.execute(select(EmailOutbox.status))).scalars().all()
+        assert statuses.count("sent") == count, f"{statuses.count('sent')}/{count} sent"
+        print(f"outbox, pool of {size} connections: {count / elapsed:8.1f} emails/s  "
+              f"({smtp.logins - logins} SMTP logins for {count} emails)")
+
+
+async def retries():
+    async with SessionLocal() as db:
+        await db.execute(delete(EmailOutbox))
+        for to_email in ("ok@example.com", "tempfail@example.com", "bounce@example.com"):
+            await email_service.enqueue_verification_email(db, to_email, "123456")
+        await db.commit()
+
+    pool = email_service.create_pool()
+    now = int(time.time())
+    await email_service.drain_outbox(pool)
+    # Email bị hẹn lại chưa đến hạn nên lượt sau không lấy gì
+    assert await email_service.drain_outbox(pool) == 0
+    await pool.close()
+
+    async with SessionLocal() as db:
+        rows = {row.to_email: row for row in (await db.execute(select(EmailOutbox))).scalars()}
+    assert rows["ok@example.com"].status == "sent"
+    assert rows["bounce@example.com"].status == "failed" and rows["bounce@example.com"].attempts == 1
+    tempfail = rows["tempfail@example.com"]
+    assert tempfail.status == "pending" and tempfail.attempts == 1
+    assert tempfail.available_at >= now + settings.EMAIL_RETRY_DELAY
+    print(f"retries: 451 rescheduled in {tempfail.available_at - now}s, 550 marked failed")
+
+
+async def outbox(smtp: FakeSMTPServer, emails: int):
+    # Kết nối DB của TestClient thuộc event loop khác
+    await engine.dispose()
+    await throughput(smtp, emails)
+    await retries()
+
+
+def main(registration_count: int, emails: int, handshake_ms: float):
+    smtp = FakeSMTPServer(settings.SMTP_PORT, handshake_delay=handshake_ms / 1000).start()
+    try:
+        registrations(smtp, registration_count)
+        asyncio.run(outbox(smtp, emails))
+    finally:
+        smtp.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--registrations", type=int, default=100)
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--handshake-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    main(args.registrations, args.emails, args.handshake_ms)
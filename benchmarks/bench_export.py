@@ -0,0 +1,171 @@
+# benchmarks/bench_export.py
+"""Kiểm tra bộ nhớ khi xuất toàn bộ lịch sử hoạt động qua /activities/export
+
+Chạy: python -m benchmarks.bench_export [--rows 500000] [--max-growth-mb 64]
+
+Tạo một người dùng có `--rows` hoạt động, chạy ứng dụng bằng uvicorn trong tiến
+trình con và tải file xuất (NDJSON, CSV, NDJSON gzip) theo luồng. RSS của tiến
+trình server được lấy mẫu liên tục; mức tăng RSS đỉnh so với trước khi xuất phải
+nhỏ hơn `--max-growth-mb`, bất kể số dòng. Đồng thời đo độ trễ của các trang
+lịch sử theo cursor ở đầu và cuối lịch sử. Kiểm thử tương ứng (không qua HTTP):
+tests/test_services/test_export.py.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("TOKEN_REFRESHER_ENABLED", "false")
+os.environ.setdefault("WEBHOOK_WORKER_ENABLED", "false")
+
+import httpx  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models import activity_stream  # noqa: E402,F401  (đăng ký bảng activity_streams)
+from app.models.activity import Activity  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import activity_service  # noqa: E402
+from app.utils.security import create_access_token  # noqa: E402
+
+ORIGIN = datetime(2010, 1, 1)
+
+
+async def populate(rows: int):
+    await init_db()
+    async with SessionLocal() as db:
+        db.add(User(username="bench", email="bench@example.com", is_active=True))
+        await db.commit()
+
+    rng = random.Random(0)
+    for offset in range(0, rows, 50_000):
+        batch = [
+            {
+                "strava_id": str(offset + i),
+                "user_id": 1,
+                "name": f"Morning run #{offset + i}",
+                "type": rng.choice(("Run", "Ride")),
+                "start_date": ORIGIN + timedelta(minutes=13 * (offset + i)),
+                "distance": rng.uniform(1000, 40000),
+                "moving_time": rng.randrange(600, 14400),
+                "elapsed_time": rng.randrange(600, 16000),
+                "total_elevation_gain": rng.uniform(0, 500),
+                "average_speed": rng.uniform(2, 9),
+                "max_speed": rng.uniform(5, 15),
+            }
+            for i in range(min(50_000, rows - offset))
+        ]
+        async with SessionLocal() as db:
+            await db.execute(insert(Activity), batch)
+            await db.commit()
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class RssSampler(threading.Thread):
+    """Lấy mẫu RSS của tiến trình server trong lúc tải"""
+
+    def __init__(self, pid: int, interval: float = 0.02):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0.0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            self.peak = max(self.peak, rss_mb(self.pid))
+            time.sleep(self.interval)
+
+    def stop(self) -> float:
+        self.running = False
+        self.join()
+        return self.peak
+
+
+def start_server(port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=os.environ.copy(),
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+
+def export(client: httpx.Client, pid: int, params: dict):
+    baseline = rss_mb(pid)
+    sampler = RssSampler(pid)
+    sampler.start()
+    started = time.perf_counter()
+    size = lines = 0
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if params.get("gzip") else None
+    with client.stream("GET", "/activities/export", params=params) as response:
+        assert response.status_code == 200, response.read()
+        # Đọc byte thô để đếm đúng kích thước truyền; tự giải nén khi có gzip
+        for chunk in response.iter_raw():
+            size += len(chunk)
+            lines += (decompressor.decompress(chunk) if decompressor else chunk).count(b"\n")
+    elapsed = time.perf_counter() - started
+    peak = sampler.stop()
+    return lines, size, elapsed, baseline, peak
+
+
+def main(rows: int, max_growth_mb: float, port: int):
+    asyncio.run(populate(rows))
+    server = start_server(port)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", headers=headers, timeout=600) as client:
+            for params in ({"format": "ndjson"}, {"format": "csv"}, {"format": "ndjson", "gzip": True}):
+                lines, size, elapsed, baseline, peak = export(client, server.pid, params)
+                expected = rows + (1 if params["format"] == "csv" else 0)
+                assert lines == expected, f"{params}: expected {expected} lines, got {lines}"
+                growth = peak - baseline
+                print(f"export {str(params):36s} {lines} lines  {size / 1024 / 1024:7.1f}MB in {elapsed:5.1f}s  "
+                      f"server RSS {baseline:6.1f}MB -> peak {peak:6.1f}MB (+{growth:.1f}MB)")
+                assert growth < max_growth_mb, f"RSS grew by {growth:.1f}MB (bound {max_growth_mb}MB)"
+
+            # Trang đầu và trang gần cuối lịch sử (tương đương OFFSET ~rows với phân trang cũ)
+            deep = activity_service.encode_cursor(ORIGIN + timedelta(minutes=13 * 1000), 1001)
+            for name, cursor in (("first page", None), ("deep page", deep)):
+                started = time.perf_counter()
+                for _ in range(20):
+                    params = {"limit": 50, **({"cursor": cursor} if cursor else {})}
+                    response = client.get("/activities/history", params=params)
+                    assert response.status_code == 200, response.text
+                    assert len(response.json()["items"]) == 50
+                print(f"history {name}: {(time.perf_counter() - started) / 20 * 1000:.2f}ms per page")
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"peak RSS growth stayed under {max_growth_mb}MB for {rows} rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--max-growth-mb", type=float, default=64.0)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    main(args.rows, args.max_growth_mb, args.port)
@@ -0,0 +1,249 @@
+# benchmarks/bench_geo.py
+"""Kiểm tra và benchmark chỉ mục địa lý (ô lưới) của hoạt động
+
+Chạy: python -m benchmarks.bench_geo [--activities 100000] [--queries 10]
+
+- Giải mã polyline: decode_polylines (NumPy, cả lô một lượt) so với vòng lặp
+  Python từng ký tự; hai cách phải cho cùng tọa độ.
+- Ghi `--activities` hoạt động (tuyến lặp lại quanh một thành phố, có nhiễu) qua
+  ingest_activities, đo thời gian ghi kèm lập chỉ mục ô lưới.
+- /activities/near: find_near (index (user_id, start_lat, start_lng)) so với đọc
+  mọi điểm xuất phát rồi lọc; /activities/overlap: find_overlapping (bảng ô lưới)
+  so với giải mã mọi polyline của người dùng mỗi request. Kết quả phải trùng nhau.
+- Sửa polyline và xóa một phần hoạt động, rồi so bảng ô lưới với geo_service.rebuild.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import numpy as np  # noqa: E402
+from sqlalchemy import func, select, text  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models import activity_stream  # noqa: E402,F401  (đăng ký bảng activity_streams)
+from app.models.activity import Activity  # noqa: E402
+from app.models.activity_cell import ActivityCell  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import activity_service, geo_service  # noqa: E402
+from app.utils import geo  # noqa: E402
+from tests.fakes import make_activity  # noqa: E402
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+CENTER = (21.03, 105.85)
+
+
+def decode_python(polyline: str) -> list:
+    """Giải mã polyline bằng vòng lặp Python (cách làm thông thường), để so sánh"""
+    points, index, lat, lng = [], 0, 0, 0
+    while index < len(polyline):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(polyline[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / 1e5, lng / 1e5))
+    return points
+
+
+def make_routes(rng: np.random.Generator, count: int) -> list:
+    """Các tuyến gốc: đi dạo ngẫu nhiên 5-15 km từ các điểm trong bán kính ~20 km quanh CENTER"""
+    routes = []
+    for _ in range(count):
+        points = int(rng.integers(40, 120))
+        start = np.array(CENTER) + rng.normal(0, 0.08, 2)
+        heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.3, points))
+        step = rng.uniform(0.0008, 0.0012)
+        routes.append(start + np.cumsum(np.column_stack([np.cos(heading), np.sin(heading)]) * step, axis=0))
+    return routes
+
+
+def make_items(routes: list, count: int, seed: int, first_id: int = 1) -> list:
+    """Hoạt động chạy lại các tuyến gốc với nhiễu GPS ~10 m"""
+    rng = np.random.default_rng(seed)
+    items = []
+    for offset in range(count):
+        activity_id = first_id + offset
+        route = routes[int(rng.integers(len(routes)))]
+        route = np.round(route + rng.normal(0, 0.0001, route.shape), 5)
+        item = make_activity(activity_id, EPOCH + timedelta(hours=6 * activity_id))
+        item.update({
+            "start_latlng": route[0].tolist(),
+            "end_latlng": route[-1].tolist(),
+            "map": {"summary_polyline": geo.encode_polyline(route)},
+        })
+        items.append(item)
+    return items
+
+
+def median_ms(samples: list) -> float:
+    return statistics.median(samples) * 1000
+
+
+async def brute_near(db, user_id, lat, lng, radius, limit):
+    rows = (await db.execute(
+        select(Activity.id, Activity.start_lat, Activity.start_lng)
+        .where(Activity.user_id == user_id, Activity.start_lat.is_not(None))
+    )).all()
+    ids = np.array([row[0] for row in rows])
+    points = np.array([row[1:] for row in rows], dtype=np.float64)
+    distances = geo.haversine(points[:, 0], points[:, 1], lat, lng)
+    order = np.argsort(distances, kind="stable")
+    return ids[order[distances[order] <= radius][:limit]].tolist()
+
+
+async def brute_overlap(db, user_id, route, min_overlap, limit):
+    """Cùng định nghĩa overlap với find_overlapping, nhưng giải mã mọi polyline của người dùng"""
+    rows = (await db.execute(
+        select(Activity.id, Activity.summary_polyline)
+        .where(Activity.user_id == user_id, Activity.summary_polyline.is_not(None))
+    )).all()
+    owners, cells = geo_service.route_cells(geo.decode_polylines([polyline for _, polyline in rows]))
+    _, query_cells = geo_service.route_cells([route])
+    near = geo_service.neighbour_cells(query_cells)
+    query_set = set(near.ravel().tolist())
+    by_activity = {}
+    for owner, cell in zip(owners.tolist(), cells.tolist()):
+        by_activity.setdefault(owner, []).append(cell)
+    ranked = []
+    for owner, activity_cells in by_activity.items():
+        shared = [cell for cell in activity_cells if cell in query_set]
+        if not shared:
+            continue
+        shared = set(shared)
+        covered = sum(1 for row in near.tolist() if shared.intersection(row))
+        overlap = covered / len(query_cells)
+        if overlap >= min_overlap:
+            ranked.append((-overlap, -len(shared) / len(activity_cells), rows[owner][0]))
+    return [activity_id for _, _, activity_id in sorted(ranked)[:limit]]
+
+
+async def snapshot(db) -> set:
+    result = await db.execute(select(ActivityCell.user_id, ActivityCell.cell, ActivityCell.activity_id))
+    return set(result.all())
+
+
+async def main(count: int, queries: int, seed: int):
+    await init_db()
+    rng = np.random.default_rng(seed)
+    routes = make_routes(rng, max(10, count // 200))
+    items = make_items(routes, count, seed)
+    polylines = [item["map"]["summary_polyline"] for item in items]
+
+    started = time.perf_counter()
+    decoded = geo.decode_polylines(polylines)
+    vectorized = time.perf_counter() - started
+    started = time.perf_counter()
+    reference = [decode_python(polyline) for polyline in polylines]
+    python = time.perf_counter() - started
+    assert all(np.allclose(a, b) for a, b in zip(decoded, reference))
+    points = sum(len(route) for route in decoded)
+    print(f"decode {count} polylines ({points} points): NumPy {vectorized * 1000:.0f}ms, "
+          f"Python loop {python * 1000:.0f}ms ({python / vectorized:.1f}x)")
+    started = time.perf_counter()
+    _, cells = geo_service.route_cells(decoded)
+    print(f"grid cells of all routes: {(time.perf_counter() - started) * 1000:.0f}ms "
+          f"({len(cells) / count:.1f} cells/activity, {settings.GEO_CELL_DEGREES}° cells)")
+
+    async with SessionLocal() as db:
+        users = [User(username=f"geo{i}", email=f"geo{i}@example.com", is_active=True) for i in range(2)]
+        db.add_all(users)
+        await db.commit()
+        user_id, other_id = users[0].id, users[1].id
+
+    started = time.perf_counter()
+    for offset in range(0, count, 1000):
+        async with SessionLocal() as db:
+            await activity_service.ingest_activities(db, user_id, items[offset:offset + 1000])
+            await db.commit()
+    elapsed = time.perf_counter() - started
+    # Người dùng thứ hai chạy cùng các tuyến: kết quả không được lẫn sang
+    async with SessionLocal() as db:
+        await activity_service.ingest_activities(db, other_id, make_items(routes, 2000, seed + 1, first_id=count + 1))
+        await db.commit()
+        cell_rows = await db.scalar(select(func.count()).select_from(ActivityCell))
+    print(f"ingest {count} activities with grid index: {elapsed:.1f}s ({count / elapsed:.0f}/s), {cell_rows} cell rows")
+
+    query_rng = random.Random(seed)
+    async with SessionLocal() as db:
+        plan = (await db.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM activities WHERE user_id = 1 AND start_lat BETWEEN 21 AND 21.1 "
+            "AND start_lng BETWEEN 105 AND 106"
+        ))).all()
+        print("near plan:", "; ".join(row[-1] for row in plan))
+        plan = (await db.execute(text(
+            "EXPLAIN QUERY PLAN SELECT activity_id, cell FROM activity_cells WHERE user_id = 1 AND cell IN (1, 2, 3)"
+        ))).all()
+        print("overlap plan:", "; ".join(row[-1] for row in plan))
+
+        timings = {"near (index)": [], "near (scan all starts)": [], "overlap (grid index)": [],
+                   "overlap (decode all polylines)": []}
+        found = {"near": 0, "overlap": 0}
+        for _ in range(queries):
+            lat, lng = routes[query_rng.randrange(len(routes))][0] + np.array([0.001, -0.001])
+            started = time.perf_counter()
+            near = await geo_service.find_near(db, user_id, activity_service.EXPORT_COLUMNS, lat, lng, 1000, None, 50)
+            timings["near (index)"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            expected = await brute_near(db, user_id, lat, lng, 1000, 50)
+            timings["near (scan all starts)"].append(time.perf_counter() - started)
+            assert [item["id"] for item in near] == expected
+            found["near"] += len(near)
+
+            route = routes[query_rng.randrange(len(routes))]
+            route = route[:max(2, len(route) // 2)]
+            started = time.perf_counter()
+            overlapping = await geo_service.find_overlapping(
+                db, user_id, activity_service.EXPORT_COLUMNS, route, 0.8, None, 50
+            )
+            timings["overlap (grid index)"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            expected = await brute_overlap(db, user_id, route, 0.8, 50)
+            timings["overlap (decode all polylines)"].append(time.perf_counter() - started)
+            assert [item["id"] for item in overlapping] == expected
+            found["overlap"] += len(overlapping)
+    print(f"{queries} queries (median), results identical to brute force; "
+          f"avg {found['near'] / queries:.0f} near / {found['overlap'] / queries:.0f} overlapping results")
+    for name, samples in timings.items():
+        print(f"  {name:34s} {median_ms(samples):8.1f}ms")
+
+    # Sửa polyline, xóa một phần: bảng ô lưới phải khớp với tính lại từ đầu
+    edits = make_items(routes, 1000, seed + 2)
+    for item in edits:
+        item["id"] = query_rng.randrange(1, count + 1)
+        if query_rng.random() < 0.2:
+            item["map"] = {"summary_polyline": ""}
+    async with SessionLocal() as db:
+        await activity_service.ingest_activities(db, user_id, edits)
+        await activity_service.delete_activities(db, query_rng.sample(range(1, count + 1), 500))
+        await db.commit()
+        incremental = await snapshot(db)
+        await geo_service.rebuild(db)
+        rebuilt = await snapshot(db)
+        await db.rollback()
+    assert incremental == rebuilt, f"{len(incremental ^ rebuilt)} cell rows differ from rebuild"
+    print(f"after 1000 edits and 500 deletes: grid index matches rebuild ({len(rebuilt)} rows)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activities", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=10, help="mỗi truy vấn overlap đối chứng giải mã mọi polyline")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.activities, args.queries, args.seed))
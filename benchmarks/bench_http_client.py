@@ -0,0 +1,101 @@
+# benchmarks/bench_http_client.py
+"""So sánh client tạo mới mỗi lời gọi với HTTP client dùng chung khi tải đồng thời
+
+Chạy: python -m benchmarks.bench_http_client [--requests 2000] [--concurrency 50] [--tls]
+
+Mặc định fake Strava chạy HTTP thường trên localhost nên chỉ đo chi phí mở kết nối
+TCP, không có bắt tay TLS như khi gọi www.strava.com. Với --tls, fake Strava chạy
+HTTPS bằng chứng chỉ tự ký (tạo bằng lệnh openssl) để đo cả chi phí bắt tay mà
+client dùng chung tránh được; độ trễ mạng thật tới Strava vẫn không được đo. Khi đó
+client chỉ tin chứng chỉ tự ký (SSL_CERT_FILE) nên việc nạp bộ CA mỗi lần tạo client
+rẻ hơn thực tế (bộ CA của certifi): per-call client với --tls có thể còn nhanh hơn với HTTP.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+
+import httpx
+
+from app.config import settings
+from app.services import strava_service
+from tests.fakes import FakeStravaServer, create_app
+
+
+async def per_call_client(base_url: str):
+    # Cách cũ: mỗi lời gọi mở một AsyncClient (một kết nối TCP, và bắt tay TLS nếu --tls)
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        response = await client.get("/api/v3/athlete/activities", params={"per_page": 30})
+        response.raise_for_status()
+
+
+async def shared_client(base_url: str):
+    await strava_service.get_activities("token", per_page=30)
+
+
+async def run(fn, base_url: str, requests: int, concurrency: int):
+    strava_service.start_client()
+    try:
+        return await measure(fn, base_url, requests, concurrency)
+    finally:
+        await strava_service.close_client()
+
+
+async def measure(fn, base_url: str, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await fn(base_url)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+
+def self_signed_cert() -> tuple:
+    """Chứng chỉ tự ký cho 127.0.0.1; client httpx tin chứng chỉ này qua SSL_CERT_FILE"""
+    directory = tempfile.mkdtemp()
+    certfile, keyfile = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+         "-keyout", keyfile, "-out", certfile],
+        check=True, capture_output=True,
+    )
+    os.environ["SSL_CERT_FILE"] = certfile
+    return certfile, keyfile
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--tls", action="store_true", help="fake Strava chạy HTTPS (chứng chỉ tự ký)")
+    args = parser.parse_args()
+
+    certfile, keyfile = self_signed_cert() if args.tls else (None, None)
+    # Hạn mức đủ lớn để bộ lập lịch không chặn các lời gọi của client dùng chung
+    app = create_app(num_activities=30, rate_limit=(10 ** 9, 10 ** 9))
+    with FakeStravaServer(app, ssl_certfile=certfile, ssl_keyfile=keyfile) as server:
+        settings.STRAVA_BASE_URL = server.url
+
+        for name, fn in (("per-call client", per_call_client), ("shared client", shared_client)):
+            app.state.connections.clear()
+            elapsed, p50, p99 = asyncio.run(run(fn, server.url, args.requests, args.concurrency))
+            print(
+                f"{name:16s} {args.requests / elapsed:8.0f} req/s  "
+                f"p50={p50 * 1000:6.1f}ms  p99={p99 * 1000:6.1f}ms  "
+                f"connections={len(app.state.connections)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
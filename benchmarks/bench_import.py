@@ -0,0 +1,177 @@
+# benchmarks/bench_import.py
+"""Benchmark nhập file ZIP export tài khoản Strava
+
+Chạy: python -m benchmarks.bench_import [--activities 200] [--points 3600] [--workers 4]
+
+Tạo một file export giả lập (activities.csv kèm các file .gpx.gz và .tcx.gz từ
+make_streams, cùng vài file hỏng/thiếu), rồi nhập với 1 tiến trình và với
+`--workers` tiến trình, in thông lượng. Kiểm tra:
+- mọi hoạt động trong activities.csv đều được nhập, file hỏng chỉ mất streams;
+- streams đã lưu khớp với dữ liệu gốc;
+- nhập lại cùng file không thêm hoạt động nào (khử trùng theo strava_id).
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import os
+import tempfile
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import numpy as np  # noqa: E402
+from sqlalchemy import delete, func, select  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models import activity_rollup, activity_stream  # noqa: E402,F401  (đăng ký bảng)
+from app.models.activity import Activity  # noqa: E402
+from app.models.activity_stream import ActivityStream  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import import_service, rollup_service, stream_service  # noqa: E402
+from tests.fakes import make_streams  # noqa: E402
+
+EPOCH = datetime(2023, 1, 1, 6, tzinfo=timezone.utc)
+HEADER = ["Activity ID", "Activity Date", "Activity Name", "Activity Type", "Activity Description",
+          "Elapsed Time", "Distance", "Filename", "Elapsed Time", "Moving Time", "Distance",
+          "Max Speed", "Average Speed", "Elevation Gain"]
+
+
+def gpx(start: datetime, streams: dict) -> bytes:
+    points = "".join(
+        f'<trkpt lat="{lat}" lon="{lng}"><ele>{ele}</ele>'
+        f"<time>{(start + timedelta(seconds=t)).strftime('%Y-%m-%dT%H:%M:%SZ')}</time>"
+        f"<extensions><gpxtpx:TrackPointExtension><gpxtpx:hr>{hr}</gpxtpx:hr>"
+        f"<gpxtpx:cad>{cad}</gpxtpx:cad></gpxtpx:TrackPointExtension></extensions></trkpt>"
+        for t, (lat, lng), ele, hr, cad in zip(streams["time"], streams["latlng"], streams["altitude"],
+                                               streams["heartrate"], streams["cadence"])
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1" '
+        'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">'
+        f"<trk><trkseg>{points}</trkseg></trk></gpx>"
+    ).encode()
+
+
+def tcx(start: datetime, streams: dict) -> bytes:
+    points = "".join(
+        f"<Trackpoint><Time>{(start + timedelta(seconds=t)).strftime('%Y-%m-%dT%H:%M:%SZ')}</Time>"
+        f"<Position><LatitudeDegrees>{lat}</LatitudeDegrees><LongitudeDegrees>{lng}</LongitudeDegrees></Position>"
+        f"<AltitudeMeters>{ele}</AltitudeMeters><DistanceMeters>{dist}</DistanceMeters>"
+        f"<HeartRateBpm><Value>{hr}</Value></HeartRateBpm></Trackpoint>"
+        for t, (lat, lng), ele, dist, hr in zip(streams["time"], streams["latlng"], streams["altitude"],
+                                                streams["distance"], streams["heartrate"])
+    )
+    return (
+        '  <?xml version="1.0" encoding="UTF-8"?>'
+        '<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">'
+        f"<Activities><Activity Sport=\"Running\"><Lap><Track>{points}</Track></Lap></Activity></Activities>"
+        "</TrainingCenterDatabase>"
+    ).encode()
+
+
+def build_archive(activities: int, points: int) -> bytes:
+    """Tạo file export: mỗi 10 hoạt động có một file hỏng và một file bị thiếu"""
+    rows, files = [], {}
+    for i in range(1, activities + 1):
+        start = EPOCH + timedelta(hours=30 * i)
+        streams = make_streams(i, points)
+        if i % 10 == 3:
+            filename, data = f"activities/{i}.gpx.gz", gzip.compress(b"<gpx><trk><trkpt lat=")
+        elif i % 10 == 7:
+            filename, data = f"activities/{i}.fit.gz", None
+        elif i % 2:
+            filename, data = f"activities/{i}.gpx.gz", gzip.compress(gpx(start, streams), 1)
+        else:
+            filename, data = f"activities/{i}.tcx.gz", gzip.compress(tcx(start, streams), 1)
+        if data is not None:
+            files[filename] = data
+        distance = streams["distance"][-1]
+        rows.append([
+            str(10 ** 10 + i), start.strftime("%b %d, %Y, %I:%M:%S %p"), f"Import {i}", "Run" if i % 3 else "Ride", "",
+            str(points - 1), f"{distance / 1000:.2f}", filename, str(points - 1), str(points - 1), f"{distance:.1f}",
+            "", "", "",
+        ])
+
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(HEADER)
+    writer.writerows(rows)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("activities.csv", text.getvalue())
+        for filename, data in files.items():
+            # File đã nén gzip: lưu nguyên (ZIP_STORED) như bản export của Strava
+            archive.writestr(filename, data, compress_type=zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+
+async def reset():
+    async with SessionLocal() as db:
+        await db.execute(delete(ActivityStream))
+        await db.execute(delete(Activity))
+        await db.commit()
+        await rollup_service.rebuild(db)
+        await db.commit()
+
+
+async def verify(activities: int, points: int):
+    async with SessionLocal() as db:
+        count = (await db.execute(select(func.count()).select_from(Activity))).scalar()
+        assert count == activities, f"expected {activities} activities, got {count}"
+        with_streams = (await db.execute(select(func.count(func.distinct(ActivityStream.activity_id))))).scalar()
+        expected = activities - sum(1 for i in range(1, activities + 1) if i % 10 in (3, 7))
+        assert with_streams == expected, f"expected {expected} activities with streams, got {with_streams}"
+
+        # So sánh streams của một file GPX và một file TCX với dữ liệu gốc
+        for i in (1, 2):
+            activity = (await db.execute(select(Activity).where(Activity.strava_id == str(10 ** 10 + i)))).scalar_one()
+            loaded = await stream_service.load_streams(db, activity.id, ["time", "latlng", "heartrate", "distance"])
+            source = make_streams(i, points)
+            assert np.array_equal(loaded["time"], source["time"])
+            assert np.allclose(loaded["latlng"], source["latlng"], atol=1e-6)
+            assert np.array_equal(loaded["heartrate"], source["heartrate"])
+            assert abs(activity.distance - source["distance"][-1]) < 1.0
+        assert not await rollup_service.check(db)
+
+
+async def main(activities: int, points: int, workers: int):
+    await init_db()
+    async with SessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", is_active=True)
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+    data = build_archive(activities, points)
+    print(f"archive: {activities} activities x {points} points, {len(data) / 1024 / 1024:.1f}MB")
+
+    for count in sorted({1, workers}):
+        await reset()
+        import_service.start_pool(count)
+        report = await import_service.import_archive(io.BytesIO(data), user_id)
+        await import_service.shutdown_pool()
+        result = report.to_dict()
+        print(f"workers={count}: imported {result['imported']} in {result['elapsed']:.2f}s  "
+              f"{result['activities_per_second']} activities/s  {result['megabytes_per_second']} MB/s  "
+              f"({result['files_parsed']} files parsed, {result['files_failed']} failed)")
+        await verify(activities, points)
+    for error in report.errors[:3]:
+        print(f"  error: {error}")
+
+    report = await import_service.import_archive(io.BytesIO(data), user_id)
+    await import_service.shutdown_pool()
+    assert report.imported == 0 and report.skipped_existing == activities, report.to_dict()
+    print(f"re-import: {report.skipped_existing} skipped as existing, 0 imported")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activities", type=int, default=200)
+    parser.add_argument("--points", type=int, default=3600)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.activities, args.points, args.workers))
@@ -0,0 +1,77 @@
+# benchmarks/bench_ingest.py
+"""So sánh ghi 10k hoạt động bằng vòng lặp ORM (SELECT + add từng dòng) và bằng bulk upsert
+
+Chạy: python -m benchmarks.bench_ingest [--activities 10000]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models import user  # noqa: F401  (đăng ký bảng users)
+from app.models.activity import Activity
+from app.services import activity_service
+from tests.fakes import make_activity
+
+
+async def orm_loop(db, user_id, activities):
+    # Cách cũ trong get_today_activities: một SELECT cho mỗi hoạt động
+    for data in activities:
+        result = await db.execute(select(Activity).where(Activity.strava_id == str(data["id"])))
+        if not result.scalars().first():
+            db.add(Activity(**activity_service.activity_row(data, user_id)))
+    await db.commit()
+
+
+async def bulk_upsert(db, user_id, activities):
+    await activity_service.ingest_activities(db, user_id, activities)
+    await db.commit()
+
+
+async def new_engine():
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+
+async def run(name, fn, activities):
+    engine = await new_engine()
+    async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+        started = time.perf_counter()
+        await fn(db, 1, activities)
+        insert_time = time.perf_counter() - started
+
+        # Lần thứ hai: toàn bộ đã tồn tại (đồng bộ lại)
+        started = time.perf_counter()
+        await fn(db, 1, activities)
+        resync_time = time.perf_counter() - started
+
+        assert await db.scalar(select(func.count(Activity.id))) == len(activities)
+    await engine.dispose()
+    return insert_time, resync_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activities", type=int, default=10000)
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    activities = [make_activity(i, now - timedelta(hours=i)) for i in range(1, args.activities + 1)]
+
+    for name, fn in (("orm loop", orm_loop), ("bulk upsert", bulk_upsert)):
+        insert_time, resync_time = asyncio.run(run(name, fn, activities))
+        print(f"{name:12s} insert={insert_time:6.2f}s  resync={resync_time:6.2f}s  "
+              f"{args.activities / insert_time:8.0f} act/s")
+
+
+if __name__ == "__main__":
+    main()
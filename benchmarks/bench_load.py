@@ -0,0 +1,273 @@
+# benchmarks/bench_load.py
+"""Load test toàn bộ ứng dụng qua HTTP, xuất kết quả JSON để so sánh giữa các commit
+
+Chạy: python -m benchmarks.bench_load [--concurrency 1,10,50] [--duration 10] [--output result.json]
+      python -m benchmarks.bench_load --compare baseline.json [--output result.json]
+
+- Khởi động fake Strava (OAuth token, danh sách hoạt động có phân trang, header
+  rate limit, độ trễ cấu hình được) và ứng dụng (python -m app.server với
+  `--workers` worker) thành các tiến trình riêng, trên một DB SQLite tạm.
+- Chuẩn bị `--users` người dùng qua chính API: đăng ký, đăng nhập, liên kết
+  Strava (POST /strava/callback), đồng bộ (POST /strava/sync) và lấy id hoạt động.
+- Với mỗi mức đồng thời, `concurrency` client chạy vòng kín trong `--duration`
+  giây (sau `--warmup` giây khởi động), chọn ngẫu nhiên thao tác theo `--mix`
+  (register, login, today = /activities/today, detail = /activities/{id}).
+- In JSON: throughput, số lỗi, p50/p95/p99 (ms) tổng và theo từng thao tác, kèm
+  commit git và cấu hình; `--compare` in chênh lệch so với một file JSON trước đó.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+OPERATIONS = ("register", "login", "today", "detail")
+DEFAULT_MIX = "register=1,login=4,today=10,detail=25"
+PASSWORD = "BenchPass123"
+
+
+def percentile(values: list, q: float) -> float:
+    """Percentile theo hạng gần nhất trên danh sách đã sắp xếp"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def summarize(latencies: list, errors: int, duration: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def start_process(args: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", *args], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited: {process.stderr.read()}")
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+class Workload:
+    """Trạng thái dùng chung của các client: người dùng đã chuẩn bị, token và id hoạt động"""
+
+    def __init__(self, client: httpx.AsyncClient, seed: int, activities: int):
+        self.client = client
+        self.activities = activities  # số hoạt động mỗi người dùng trên fake Strava
+        self.rng = random.Random(seed)
+        self.users = []  # (username, headers, activity_ids)
+        self.registered = 0
+
+    def new_username(self) -> str:
+        self.registered += 1
+        return f"load{self.registered}"
+
+    async def register(self, username: str) -> httpx.Response:
+        return await self.client.post(
+            "/auth/register", json={"username": username, "email": f"{username}@example.com", "password": PASSWORD}
+        )
+
+    async def login(self, username: str) -> httpx.Response:
+        return await self.client.post("/auth/login", data={"username": username, "password": PASSWORD})
+
+    async def prepare_user(self) -> tuple:
+        """Đăng ký, đăng nhập, liên kết Strava và đồng bộ một người dùng; trả về (username, headers, id hoạt động)"""
+        username = self.new_username()
+        (await self.register(username)).raise_for_status()
+        response = await self.login(username)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        (await self.client.post("/strava/callback", json={"code": "bench"}, headers=headers)).raise_for_status()
+        (await self.client.post("/strava/sync", headers=headers)).raise_for_status()
+        # Tiến độ đồng bộ nằm trong tiến trình đã nhận request: với nhiều worker, chờ qua dữ liệu trong DB
+        deadline = time.time() + 60
+        while True:
+            response = await self.client.get("/activities/history", params={"limit": 500}, headers=headers)
+            response.raise_for_status()
+            activity_ids = [item["id"] for item in response.json()["items"]]
+            if len(activity_ids) >= min(self.activities, 500):
+                return username, headers, activity_ids
+            assert time.time() < deadline, f"{username}: only {len(activity_ids)} activities synced"
+            await asyncio.sleep(0.05)
+
+    async def run(self, operation: str) -> httpx.Response:
+        if operation == "register":
+            return await self.register(self.new_username())
+        username, headers, activity_ids = self.rng.choice(self.users)
+        if operation == "login":
+            return await self.login(username)
+        if operation == "today":
+            return await self.client.get("/activities/today", headers=headers)
+        return await self.client.get(f"/activities/{self.rng.choice(activity_ids)}", headers=headers)
+
+
+async def run_level(workload: Workload, mix: dict, concurrency: int, duration: float, warmup: float) -> dict:
+    """Chạy `concurrency` client vòng kín; chỉ ghi nhận các request bắt đầu sau giai đoạn khởi động"""
+    operations, weights = list(mix), list(mix.values())
+    latencies = {operation: [] for operation in operations}
+    errors = {operation: 0 for operation in operations}
+    started = time.perf_counter()
+    measure_from, deadline = started + warmup, started + warmup + duration
+
+    async def client():
+        while True:
+            operation = workload.rng.choices(operations, weights)[0]
+            begin = time.perf_counter()
+            if begin >= deadline:
+                return
+            try:
+                response = await workload.run(operation)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if begin >= measure_from:
+                latencies[operation].append(time.perf_counter() - begin)
+                errors[operation] += not ok
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    # Các request cuối có thể kết thúc sau hạn chót: tính trên thời gian đo thực tế
+    elapsed = max(duration, time.perf_counter() - measure_from)
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        "concurrency": concurrency,
+        "duration": round(elapsed, 2),
+        **summarize(everything, sum(errors.values()), elapsed),
+        "operations": {
+            operation: summarize(latencies[operation], errors[operation], elapsed)
+            for operation in operations if latencies[operation]
+        },
+    }
+
+
+def compare(result: dict, baseline: dict):
+    """In chênh lệch throughput và percentile so với một lần chạy trước (cùng mức đồng thời)"""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    print(f"compared with {baseline.get('commit', '?')} ({baseline.get('timestamp', '?')}):", file=sys.stderr)
+    for level in result["levels"]:
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        deltas = [
+            f"{key} {before[key]:.1f} -> {level[key]:.1f} ({(level[key] / before[key] - 1) * 100 if before[key] else 0:+.1f}%)"
+            for key in ("throughput", "p50_ms", "p95_ms", "p99_ms")
+        ]
+        print(f"  c={level['concurrency']:<4d} " + "  ".join(deltas), file=sys.stderr)
+
+
+async def main(args):
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    unknown = set(mix) - set(OPERATIONS)
+    assert not unknown, f"unknown operations: {unknown}"
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    workdir = tempfile.mkdtemp()
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    app_url = f"http://127.0.0.1:{args.port}"
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{workdir}/load.db",
+        "STRAVA_BASE_URL": fake_url,
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+    }
+    # Worker nền (email, đồng bộ định kỳ) chỉ gây nhiễu cho phép đo, trừ khi được bật rõ ràng
+    for name in ("EMAIL_WORKER_ENABLED", "SYNC_WORKER_ENABLED"):
+        env.setdefault(name, "false")
+
+    fake = start_process(
+        ["tests.fakes", "--port", str(args.fake_port), "--activities", str(args.activities),
+         "--latency", str(args.strava_latency), "--spacing-hours", "2", "--rate-limit", "1000000,10000000",
+         "--per-token"],
+        env,
+    )
+    server = start_process(["app.server", "--port", str(args.port), "--workers", str(args.workers)], env)
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    try:
+        async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=60.0) as client:
+            await wait_ready(client, f"{fake_url}/docs", fake)
+            await wait_ready(client, "/", server)
+            workload = Workload(client, args.seed, args.activities)
+            for _ in range(args.users):
+                workload.users.append(await workload.prepare_user())
+
+            result = {
+                "commit": git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "cpus": os.cpu_count(),
+                "config": {
+                    "mix": mix, "users": args.users, "activities_per_user": args.activities,
+                    "duration": args.duration, "warmup": args.warmup, "strava_latency": args.strava_latency,
+                    "bcrypt_rounds": args.bcrypt_rounds, "seed": args.seed, "workers": args.workers,
+                },
+                "levels": [],
+            }
+            for concurrency in levels:
+                level = await run_level(workload, mix, concurrency, args.duration, args.warmup)
+                result["levels"].append(level)
+                print(f"c={concurrency:<4d} {level['throughput']:8.1f} req/s  p50={level['p50_ms']:7.1f}ms  "
+                      f"p95={level['p95_ms']:7.1f}ms  p99={level['p99_ms']:7.1f}ms  errors={level['errors']}",
+                      file=sys.stderr)
+    finally:
+        for process in (server, fake):
+            process.terminate()
+            process.wait()
+
+    # JSON ra stdout (bảng tóm tắt ở stderr) để có thể chuyển thẳng vào file hoặc jq
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", default="1,10,50", help="các mức đồng thời, cách nhau bởi dấu phẩy")
+    parser.add_argument("--duration", type=float, default=10.0, help="thời gian đo mỗi mức (giây)")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="trọng số các thao tác: register, login, today, detail")
+    parser.add_argument("--users", type=int, default=20, help="số người dùng chuẩn bị trước")
+    parser.add_argument("--activities", type=int, default=100, help="số hoạt động mỗi người dùng trên fake Strava")
+    parser.add_argument("--strava-latency", type=float, default=0.05, help="độ trễ mỗi request của fake Strava (giây)")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="số worker của python -m app.server")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--fake-port", type=int, default=8781)
+    parser.add_argument("--output", help="ghi JSON kết quả vào file")
+    parser.add_argument("--compare", help="file JSON của lần chạy trước để so sánh")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+# benchmarks/bench_login_storm.py
+"""Benchmark thông lượng đăng nhập và độ phản hồi của endpoint khác khi có "bão" đăng nhập
+
+Chạy: python -m benchmarks.bench_login_storm [--logins 200] [--concurrency 50]
+
+So sánh bcrypt chạy thẳng trên event loop (như trước) với bcrypt trong pool
+riêng. Trong lúc đăng nhập dồn dập, một client đo độ trễ của `GET /`.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import httpx  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.utils import security  # noqa: E402
+
+
+async def inline_hashing(operation, fn, *args):
+    # Cách cũ: bcrypt chạy ngay trên event loop
+    return fn(*args)
+
+
+async def setup(users: int):
+    await init_db()
+    hashed = security.get_password_hash("SecurePass456")
+    async with SessionLocal() as db:
+        db.add_all([
+            User(username=f"user{i}", email=f"user{i}@example.com", hashed_password=hashed,
+                 is_active=True, is_verified=True)
+            for i in range(users)
+        ])
+        await db.commit()
+
+
+async def storm(client, logins: int, concurrency: int, users: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def login(i):
+        async with semaphore:
+            response = await client.post(
+                "/auth/login", data={"username": f"user{i % users}", "password": "SecurePass456"}
+            )
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login(i) for i in range(logins)))
+    return time.perf_counter() - started, statuses
+
+
+async def probe(client, stop: asyncio.Event):
+    # Độ trễ tính từ thời điểm request lẽ ra được gửi, gồm cả thời gian event loop bị chặn
+    latencies = []
+    while not stop.is_set():
+        scheduled = time.perf_counter() + 0.01
+        await asyncio.sleep(0.01)
+        await client.get("/")
+        latencies.append(time.perf_counter() - scheduled)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[-1]
+
+
+async def run(name: str, logins: int, concurrency: int, users: int):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, stop))
+        elapsed, statuses = await storm(client, logins, concurrency, users)
+        stop.set()
+        p50, worst = await probe_task
+    print(f"{name:8s} {logins / elapsed:6.1f} logins/s  statuses={statuses}  "
+          f"GET / p50={p50 * 1000:7.1f}ms max={worst * 1000:7.1f}ms")
+
+
+async def main(logins: int, concurrency: int, users: int):
+    await setup(users)
+
+    pooled = security._run_hashing
+    security._run_hashing = inline_hashing
+    await run("inline", logins, concurrency, users)
+    security._run_hashing = pooled
+    await run(security.settings.PASSWORD_HASH_EXECUTOR, logins, concurrency, users)
+    security.shutdown_hash_executor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.users))
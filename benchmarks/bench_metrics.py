@@ -0,0 +1,122 @@
+# benchmarks/bench_metrics.py
+"""Đo chi phí của lớp đo lường (middleware, sự kiện engine) trên mỗi request
+
+Chạy: python -m benchmarks.bench_metrics [--requests 1000] [--rounds 7]
+
+Gọi thẳng ứng dụng ASGI (không qua mạng) cho một route không dùng DB và hai route
+có truy vấn DB. Trong cùng một tiến trình, các vòng đo xen kẽ giữa bật và tắt đo
+lường (gỡ MetricsMiddleware và sự kiện engine) theo thứ tự ABBA để loại nhiễu;
+lấy trung vị thời gian/request của mỗi chế độ. In chi phí tăng thêm theo µs và %,
+cùng thời gian render /metrics.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ["METRICS_ENABLED"] = "true"
+
+from sqlalchemy import event, insert  # noqa: E402
+
+from app.database import SessionLocal, engine, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.activity import Activity  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.utils import instrumentation  # noqa: E402
+from app.utils.metrics import render  # noqa: E402
+from app.utils.security import create_access_token  # noqa: E402
+
+ROUTES = ("/", "/activities/history?limit=20", "/activities/1")
+
+
+async def call(path: str, headers: list) -> int:
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": headers, "client": ("127.0.0.1", 1234), "server": ("test", 80),
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+def set_instrumented(enabled: bool, middleware: list):
+    if enabled == event.contains(engine.sync_engine, "before_cursor_execute",
+                                 instrumentation._before_cursor_execute):
+        return
+    if enabled:
+        app.user_middleware = middleware
+        instrumentation.instrument_engine(engine.sync_engine)
+    else:
+        app.user_middleware = [m for m in middleware if m.cls is not instrumentation.MetricsMiddleware]
+        instrumentation.uninstrument_engine(engine.sync_engine)
+    app.middleware_stack = app.build_middleware_stack()
+
+
+async def seed() -> list:
+    await init_db()
+    async with SessionLocal() as db:
+        db.add(User(username="bench", email="bench@example.com", is_active=True, is_verified=True))
+        await db.commit()
+        origin = datetime(2024, 1, 1)
+        await db.execute(insert(Activity), [
+            {"strava_id": str(i), "user_id": 1, "name": f"Run {i}", "type": "Run",
+             "start_date": origin + timedelta(hours=i), "distance": 5000.0, "moving_time": 1500,
+             "elapsed_time": 1600, "total_elevation_gain": 10.0, "average_speed": 3.3, "max_speed": 5.0}
+            for i in range(1, 201)
+        ])
+        await db.commit()
+    return [(b"authorization", f"Bearer {create_access_token({'sub': 'bench'})}".encode())]
+
+
+async def main(requests: int, rounds: int, max_overhead_us: float, max_overhead_pct: float):
+    headers = await seed()
+    middleware = list(app.user_middleware)
+    assert any(m.cls is instrumentation.MetricsMiddleware for m in middleware)
+
+    for path in ROUTES:
+        for _ in range(200):
+            assert await call(path, headers) == 200, path
+        timings = {False: [], True: []}
+        for i in range(rounds):
+            # Đảo thứ tự mỗi vòng (ABBA) để độ trôi theo thời gian không bị tính là chi phí
+            for enabled in ((False, True) if i % 2 == 0 else (True, False)):
+                set_instrumented(enabled, middleware)
+                started = time.perf_counter()
+                for _ in range(requests):
+                    await call(path, headers)
+                timings[enabled].append((time.perf_counter() - started) / requests * 1e6)
+        off, on = (sorted(timings[mode])[rounds // 2] for mode in (False, True))
+        overhead = on - off
+        print(f"{path:32s} off {off:8.1f}µs  on {on:8.1f}µs  overhead {overhead:+6.1f}µs "
+              f"({overhead / off * 100:+5.1f}%)")
+        # Route có DB dao động vài chục µs giữa các vòng nên chấp nhận cả ngưỡng tương đối
+        assert overhead < max_overhead_us or overhead / off * 100 < max_overhead_pct, \
+            f"{path}: overhead {overhead:.1f}µs"
+
+    started = time.perf_counter()
+    for _ in range(100):
+        text = render()
+    print(f"render /metrics: {(time.perf_counter() - started) / 100 * 1e6:.0f}µs for {len(text)} bytes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--max-overhead-us", type=float, default=50.0)
+    parser.add_argument("--max-overhead-pct", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.rounds, args.max_overhead_us, args.max_overhead_pct))
@@ -0,0 +1,100 @@
+# benchmarks/bench_polling.py
+"""Benchmark: client poll /activities/today liên tục, dùng fake Strava cục bộ
+
+Chạy: python -m benchmarks.bench_polling [--users 20] [--clients 5] [--seconds 5] [--latency 0.2]
+
+Mỗi người dùng có `--clients` client cùng poll, mỗi client nghỉ `--interval`
+giây giữa hai request. So sánh ba pha:
+- luôn đồng bộ (ACTIVITY_FRESHNESS_SECONDS=0, như trước: mỗi request gọi Strava,
+  chỉ còn gộp các request đồng thời);
+- cửa sổ tươi: request trong cửa sổ trả lời từ DB;
+- cửa sổ tươi + If-None-Match: client gửi lại ETag và nhận 304 không có body.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import httpx  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import strava_service  # noqa: E402
+from app.utils.security import create_access_token  # noqa: E402
+from tests.fakes import create_app  # noqa: E402
+
+
+async def setup(users: int):
+    await init_db()
+    async with SessionLocal() as db:
+        db.add_all(
+            User(username=f"user{i}", email=f"user{i}@example.com", is_active=True, is_verified=True,
+                 strava_access_token="access", strava_refresh_token="refresh",
+                 strava_token_expires_at=int(time.time()) + 6 * 3600)
+            for i in range(users)
+        )
+        await db.commit()
+    return [{"Authorization": f"Bearer {create_access_token({'sub': f'user{i}'})}"} for i in range(users)]
+
+
+async def poll(client, headers, seconds: float, clients: int, interval: float, use_etag: bool):
+    latencies = []
+    statuses = {}
+    deadline = time.perf_counter() + seconds
+
+    async def poller(user_headers):
+        etag = None
+        while time.perf_counter() < deadline:
+            request_headers = dict(user_headers)
+            if use_etag and etag:
+                request_headers["If-None-Match"] = etag
+            started = time.perf_counter()
+            response = await client.get("/activities/today", headers=request_headers)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            assert response.status_code in (200, 304), response.text
+            etag = response.headers.get("ETag", etag)
+            await asyncio.sleep(interval)
+
+    await asyncio.gather(*(poller(h) for h in headers for _ in range(clients)))
+    latencies.sort()
+    return len(latencies), latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], statuses
+
+
+async def main(users: int, clients: int, seconds: float, interval: float, latency: float):
+    fake = create_app(num_activities=200, latency=latency, spacing_hours=0.1, rate_limit=(10 ** 6, 10 ** 7))
+    strava_service.start_client(transport=httpx.ASGITransport(app=fake))
+    headers = await setup(users)
+
+    phases = (
+        ("always sync", 0, False),
+        ("freshness window", 60, False),
+        ("window + etag", 60, True),
+    )
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+            for name, freshness, use_etag in phases:
+                settings.ACTIVITY_FRESHNESS_SECONDS = freshness
+                fake.state.calls.clear()
+                count, p50, p99, statuses = await poll(client, headers, seconds, clients, interval, use_etag)
+                upstream = fake.state.calls.get("/api/v3/athlete/activities", 0)
+                print(f"{name:17s} {count / seconds:7.0f} req/s  p50={p50 * 1000:7.1f}ms  p99={p99 * 1000:7.1f}ms  "
+                      f"upstream={upstream:5d}  statuses={statuses}")
+    finally:
+        await strava_service.close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=5, help="số client poll đồng thời cho mỗi người dùng")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--interval", type=float, default=0.1, help="thời gian nghỉ giữa hai lần poll (giây)")
+    parser.add_argument("--latency", type=float, default=0.2, help="độ trễ giả lập của Strava (giây)")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.clients, args.seconds, args.interval, args.latency))
@@ -0,0 +1,80 @@
+# benchmarks/bench_rate_limit.py
+"""Mô phỏng backfill chạy hết tốc lực cùng lúc với request của người dùng dưới hạn mức Strava
+
+Chạy: python -m benchmarks.bench_rate_limit [--limit 100] [--seconds 3]
+
+Fake Strava có hạn mức 15 phút nhỏ. Backfill (ưu tiên BACKGROUND) được dừng ở
+phần hạn mức dành riêng, còn request tương tác vẫn được phục vụ trước và chỉ
+nhận 429 (kèm Retry-After) khi hạn mức thật sự cạn.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import httpx  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models import activity  # noqa: E402,F401  (đăng ký bảng activities)
+from app.models.user import User  # noqa: E402
+from app.services import backfill_service, strava_service  # noqa: E402
+from app.services.strava_scheduler import scheduler  # noqa: E402
+from tests.fakes import create_app  # noqa: E402
+
+
+async def interactive(stop: asyncio.Event, results: dict):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await strava_service.get_activities("token", per_page=30)
+            results["ok"].append(time.perf_counter() - started)
+        except HTTPException as e:
+            results.setdefault(e.status_code, 0)
+            results[e.status_code] += 1
+        await asyncio.sleep(0.05)
+
+
+async def main(limit: int, seconds: float):
+    await init_db()
+    fake = create_app(num_activities=50_000, spacing_hours=0.1, latency=0.02, rate_limit=(limit, 30000))
+    strava_service.start_client(transport=httpx.ASGITransport(app=fake))
+
+    async with SessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", strava_access_token="token",
+                    strava_refresh_token="refresh", strava_token_expires_at=int(time.time()) + 6 * 3600)
+        db.add(user)
+        await db.commit()
+        user_id = user.id  # backfill bị hủy rollback session và làm hết hạn các thuộc tính của user
+
+        results = {"ok": []}
+        stop = asyncio.Event()
+        backfill = asyncio.create_task(backfill_service.backfill_user(user, db, concurrency=8))
+        user_traffic = asyncio.create_task(interactive(stop, results))
+
+        await asyncio.sleep(seconds)
+        stop.set()
+        await user_traffic
+        backfill.cancel()
+        await asyncio.gather(backfill, return_exceptions=True)
+
+    await strava_service.close_client()
+
+    async with SessionLocal() as db:
+        progress = await backfill_service.get_progress(db, user_id)
+    ok = sorted(results.pop("ok"))
+    print(f"upstream limit={limit}/15min  upstream calls={fake.state.usage[0]}")
+    print(f"backfill pages fetched: {progress.pages}")
+    print(f"interactive ok={len(ok)} p50={ok[len(ok) // 2] * 1000 if ok else 0:.0f}ms  errors={results}")
+    print(f"scheduler: {scheduler.snapshot()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.limit, args.seconds))
@@ -0,0 +1,158 @@
+# benchmarks/bench_rollups.py
+"""Kiểm tra và benchmark bảng rollup tuần/tháng/năm
+
+Chạy: python -m benchmarks.bench_rollups [--steps 200] [--activities 200000]
+
+- Kiểm tra ngẫu nhiên: chuỗi thao tác thêm, sửa (đổi loại, quãng đường, ngày sang
+  tuần/tháng/năm khác) và xóa hoạt động qua ingest_activities/delete_activities;
+  sau mỗi bước rollup phải khớp với phép tổng hợp từ đầu (rollup_service.check),
+  và rebuild phải cho cùng kết quả.
+- Benchmark: đọc tổng hợp theo tuần từ rollup so với GROUP BY trên bảng activities.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models import activity_stream  # noqa: E402,F401  (đăng ký bảng activity_streams)
+from app.models.activity import Activity  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import activity_service, rollup_service  # noqa: E402
+from tests.fakes import make_activity  # noqa: E402
+
+TYPES = ("Run", "Ride", "Swim", "Walk")
+EPOCH = datetime(2024, 12, 20, tzinfo=timezone.utc)
+
+
+def random_activity(rng: random.Random, activity_id: int):
+    item = make_activity(activity_id, EPOCH + timedelta(hours=rng.randrange(0, 24 * 60)))
+    item["type"] = rng.choice(TYPES)
+    item["distance"] = round(rng.uniform(100, 50000), 1)
+    item["moving_time"] = rng.randrange(60, 20000)
+    item["total_elevation_gain"] = round(rng.uniform(0, 800), 1)
+    return item
+
+
+async def create_users(count: int):
+    async with SessionLocal() as db:
+        users = [User(username=f"user{i}", email=f"user{i}@example.com", is_active=True) for i in range(count)]
+        db.add_all(users)
+        await db.commit()
+        return [user.id for user in users]
+
+
+async def consistency(steps: int, seed: int):
+    rng = random.Random(seed)
+    user_ids = await create_users(3)
+    owner = {}
+    next_id = 1
+
+    for step in range(steps):
+        async with SessionLocal() as db:
+            operation = rng.random()
+            if operation < 0.5 or not owner:
+                user_id = rng.choice(user_ids)
+                batch = []
+                for _ in range(rng.randrange(1, 30)):
+                    batch.append(random_activity(rng, next_id))
+                    owner[next_id] = user_id
+                    next_id += 1
+                await activity_service.ingest_activities(db, user_id, batch)
+            elif operation < 0.8:
+                # Sửa các hoạt động đã có (gồm cả bản trùng trong cùng lô)
+                ids = rng.sample(sorted(owner), min(len(owner), rng.randrange(1, 20)))
+                user_id = owner[ids[0]]
+                ids = [activity_id for activity_id in ids if owner[activity_id] == user_id]
+                batch = [random_activity(rng, activity_id) for activity_id in ids + ids[:1]]
+                await activity_service.ingest_activities(db, user_id, batch)
+            else:
+                ids = rng.sample(sorted(owner), min(len(owner), rng.randrange(1, 10)))
+                await activity_service.delete_activities(db, ids + [10 ** 9])
+                for activity_id in ids:
+                    del owner[activity_id]
+
+            if rng.random() < 0.1:
+                # Transaction bị hủy không được để lại phần đóng góp nào
+                await db.rollback()
+                async with SessionLocal() as check_db:
+                    ids = (await check_db.execute(select(Activity.strava_id))).scalars().all()
+                owner = {int(strava_id): owner.get(int(strava_id)) for strava_id in ids}
+                owner = {k: v for k, v in owner.items() if v is not None}
+            else:
+                await db.commit()
+
+        async with SessionLocal() as db:
+            mismatches = await rollup_service.check(db)
+        assert not mismatches, f"step {step}: {mismatches[:3]}"
+
+    async with SessionLocal() as db:
+        before = await db.execute(select(func.count()).select_from(Activity))
+        await rollup_service.rebuild(db)
+        await db.commit()
+        assert not await rollup_service.check(db)
+    print(f"consistency: {steps} random insert/update/delete steps, {before.scalar()} activities, "
+          f"rollups match from-scratch aggregation after every step")
+
+
+async def benchmark(activities: int, repeat: int = 20):
+    rng = random.Random(1)
+    async with SessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", is_active=True)
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+    started = time.perf_counter()
+    for offset in range(0, activities, 5000):
+        async with SessionLocal() as db:
+            batch = [random_activity(rng, 10 ** 7 + offset + i) for i in range(min(5000, activities - offset))]
+            await activity_service.ingest_activities(db, user_id, batch)
+            await db.commit()
+    print(f"ingest {activities} activities with incremental rollups: {time.perf_counter() - started:.2f}s")
+
+    week = rollup_service._period_start_expr("week")
+    group_by = (
+        select(week, Activity.type, func.count(), func.total(Activity.distance), func.sum(Activity.moving_time))
+        .where(Activity.user_id == user_id)
+        .group_by(week, Activity.type)
+    )
+
+    async with SessionLocal() as db:
+        for name, query in (
+                ("rollup read", lambda: rollup_service.get_summary(db, user_id, "week")),
+                ("GROUP BY scan", lambda: db.execute(group_by)),
+        ):
+            best = float("inf")
+            for _ in range(repeat):
+                started = time.perf_counter()
+                await query()
+                best = min(best, time.perf_counter() - started)
+            print(f"{name:14s} weekly summary: {best * 1000:8.2f}ms")
+
+        started = time.perf_counter()
+        rows = await rollup_service.rebuild(db, user_id)
+        await db.commit()
+        print(f"rebuild: {rows} rollup rows in {time.perf_counter() - started:.2f}s")
+
+
+async def main(steps: int, activities: int, seed: int):
+    await init_db()
+    await consistency(steps, seed)
+    await benchmark(activities)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--activities", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main(args.steps, args.activities, args.seed))
@@ -0,0 +1,112 @@
+# benchmarks/bench_serialization.py
+"""So sánh đường tuần tự hóa cũ và mới của danh sách hoạt động
+
+Chạy: python -m benchmarks.bench_serialization [--activities 10000] [--repeat 5]
+
+- Cũ: đọc đối tượng ORM (select(Activity)), kiểm tra lại qua response model
+  List[ActivityResponse] và jsonable_encoder (serialize_response của FastAPI), rồi
+  mã hóa bằng json của thư viện chuẩn (JSONResponse).
+- Mới: chỉ đọc các cột trả về thành dòng thuần và mã hóa thẳng bằng orjson
+  (và MessagePack nếu đã cài msgpack).
+In thời gian đọc DB và tuần tự hóa (trung vị của `--repeat` lần) và kiểm tra hai
+đường cho ra cùng bytes JSON.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.main import app  # noqa: E402,F401  (đăng ký bảng)
+from app.models.activity import Activity  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.routes.activities import router  # noqa: E402
+from app.services import activity_service  # noqa: E402
+from app.utils import serialization  # noqa: E402
+
+
+async def seed(count: int) -> int:
+    await init_db()
+    async with SessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", is_active=True, is_verified=True)
+        db.add(user)
+        await db.commit()
+        origin = datetime(2020, 1, 1)
+        await db.execute(insert(Activity), [
+            {"strava_id": str(i), "user_id": user.id, "name": f"Morning Run {i}", "type": "Run" if i % 3 else "Ride",
+             "start_date": origin + timedelta(hours=6 * i, seconds=i % 60), "distance": 5000.0 + i % 1000 / 10,
+             "moving_time": 1500 + i % 600, "elapsed_time": 1600 + i % 600, "total_elevation_gain": float(i % 120),
+             "average_speed": 3.2 + i % 10 / 100, "max_speed": 5.1}
+            for i in range(1, count + 1)
+        ])
+        await db.commit()
+        return user.id
+
+
+def timed(samples: dict, name: str, started: float):
+    samples.setdefault(name, []).append(time.perf_counter() - started)
+
+
+async def main(count: int, repeat: int):
+    user_id = await seed(count)
+    route = next(r for r in router.routes if r.path == "/activities" and "GET" in r.methods)
+    query = activity_service.range_query(user_id, limit=count)
+    samples = {}
+
+    for _ in range(repeat):
+        async with SessionLocal() as db:
+            started = time.perf_counter()
+            activities = (await db.execute(query)).scalars().all()
+            timed(samples, "fetch ORM objects", started)
+
+            started = time.perf_counter()
+            content = await serialize_response(field=route.secure_cloned_response_field,
+                                               response_content=activities, is_coroutine=True)
+            old = JSONResponse(content).body
+            timed(samples, "serialize: response model + json", started)
+
+        async with SessionLocal() as db:
+            started = time.perf_counter()
+            rows = (await db.execute(activity_service.as_rows(query))).all()
+            timed(samples, "fetch column rows", started)
+
+            started = time.perf_counter()
+            new = serialization.encode(serialization.rows_to_dicts(activity_service.EXPORT_COLUMNS, rows))
+            timed(samples, "serialize: rows + orjson", started)
+
+            if serialization.msgpack is not None:
+                started = time.perf_counter()
+                packed = serialization.encode(serialization.rows_to_dicts(activity_service.EXPORT_COLUMNS, rows),
+                                              serialization.MSGPACK)
+                timed(samples, "serialize: rows + msgpack", started)
+
+    assert len(activities) == len(rows) == count
+    assert old == new, "orjson output differs from the response-model path"
+    print(f"{count} activities, median of {repeat} runs (JSON {len(new) / 1024:.0f} KiB"
+          + (f", MessagePack {len(packed) / 1024:.0f} KiB)" if serialization.msgpack is not None else ")"))
+    for name, values in samples.items():
+        print(f"  {name:36s} {statistics.median(values) * 1000:8.1f}ms")
+    medians = {name: statistics.median(values) for name, values in samples.items()}
+    old_total = medians["fetch ORM objects"] + medians["serialize: response model + json"]
+    new_total = medians["fetch column rows"] + medians["serialize: rows + orjson"]
+    print(f"  {'total old / new':36s} {old_total * 1000:8.1f}ms / {new_total * 1000:.1f}ms "
+          f"({old_total / new_total:.1f}x)")
+    if serialization.msgpack is None:
+        print("  (msgpack not installed: MessagePack path skipped)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activities", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.activities, args.repeat))
@@ -0,0 +1,113 @@
+# benchmarks/bench_server.py
+"""Benchmark khởi động nguội và throughput 1 so với N worker của python -m app.server
+
+Chạy: python -m benchmarks.bench_server [--workers 4] [--concurrency 10,50] [--duration 10] [--runs 3]
+
+- Thời gian import app.main (trung vị nhiều lần, mỗi lần một tiến trình mới).
+- Thời gian từ lúc chạy lệnh đến response 200 đầu tiên của GET /: DB mới, DB đã
+  có schema, N worker; và `uvicorn app.main:app --workers N` trên DB mới (mỗi
+  worker tự migrate) kèm số worker khởi động lỗi do chạy DDL đồng thời.
+- Throughput/p50/p99 bằng benchmarks.bench_load với --workers 1 và --workers N.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PORT = 8790
+
+
+def import_time(runs: int) -> float:
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    samples = [float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+               for _ in range(runs)]
+    return statistics.median(samples)
+
+
+def time_to_ready(command: list, env: dict, timeout: float = 60.0) -> tuple:
+    """Chạy lệnh, chờ GET / trả 200; trả về (giây, stderr của tiến trình)"""
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", *command], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        while True:
+            assert process.poll() is None, f"{command} exited"
+            assert time.perf_counter() - started < timeout, f"{command} not ready after {timeout}s"
+            try:
+                if httpx.get(f"http://127.0.0.1:{PORT}/", timeout=1.0).status_code == 200:
+                    elapsed = time.perf_counter() - started
+                    break
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        # Cho các worker còn lại khởi động xong trước khi dừng
+        time.sleep(2.0)
+    finally:
+        process.terminate()
+        stderr = process.communicate()[1]
+    return elapsed, stderr
+
+
+def cold_start(workers: int, runs: int):
+    base_env = {**os.environ, "EMAIL_WORKER_ENABLED": "false", "SYNC_WORKER_ENABLED": "false"}
+    server = ["app.server", "--port", str(PORT)]
+
+    def env_for(db_dir: str) -> dict:
+        return {**base_env, "DATABASE_URL": f"sqlite+aiosqlite:///{db_dir}/server.db"}
+
+    existing = env_for(tempfile.mkdtemp())
+    rows = [
+        ("app.server, 1 worker, new DB", server + ["--workers", "1"], env_for(tempfile.mkdtemp())),
+        ("app.server, 1 worker, existing DB", server + ["--workers", "1"], existing),
+        (f"app.server, {workers} workers, existing DB", server + ["--workers", str(workers)], existing),
+        (f"uvicorn --workers {workers}, new DB (migrate per worker)",
+         ["uvicorn", "app.main:app", "--port", str(PORT), "--workers", str(workers), "--log-level", "info"],
+         {**env_for(tempfile.mkdtemp()), "MIGRATE_ON_STARTUP": "true"}),
+    ]
+    time_to_ready(server + ["--workers", "1"], existing)  # tạo schema cho các dòng "existing DB"
+    for name, command, env in rows:
+        samples, failed = [], 0
+        for _ in range(runs):
+            if "new DB" in name:
+                env = {**env, "DATABASE_URL": f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/server.db"}
+            elapsed, stderr = time_to_ready(command, env)
+            samples.append(elapsed)
+            failed += stderr.count("Application startup failed")
+        print(f"{name:52s} ready in {statistics.median(samples):5.2f}s (median of {runs})"
+              + (f"  ({failed} worker startups failed)" if failed else ""))
+
+
+def throughput(workers: int, concurrency: str, duration: float, bcrypt_rounds: int):
+    results = {}
+    for count in (1, workers):
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_load", "--workers", str(count), "--concurrency", concurrency,
+                 "--duration", str(duration), "--bcrypt-rounds", str(bcrypt_rounds), "--output", output.name],
+                check=True, stdout=subprocess.DEVNULL,
+            )
+            results[count] = {level["concurrency"]: level for level in json.load(open(output.name))["levels"]}
+    for level in results[1]:
+        one, many = results[1][level], results[workers][level]
+        print(f"c={level:<4d} 1 worker {one['throughput']:7.1f} req/s p50={one['p50_ms']:6.1f}ms "
+              f"p99={one['p99_ms']:7.1f}ms | {workers} workers {many['throughput']:7.1f} req/s "
+              f"p50={many['p50_ms']:6.1f}ms p99={many['p99_ms']:7.1f}ms ({many['throughput'] / one['throughput']:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", default="10,50")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--runs", type=int, default=3, help="số lần đo mỗi kiểu khởi động")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    args = parser.parse_args()
+    print(f"import app.main: {import_time(args.runs) * 1000:.0f}ms (cpus: {os.cpu_count()})")
+    cold_start(args.workers, args.runs)
+    throughput(args.workers, args.concurrency, args.duration, args.bcrypt_rounds)
@@ -0,0 +1,168 @@
+# benchmarks/bench_streams.py
+"""Benchmark: lưu trữ và giảm mẫu streams của hoạt động dài (mặc định 10 giờ, 1 điểm/giây)
+
+Chạy: python -m benchmarks.bench_streams [--hours 10] [--resolution 1000]
+
+- Kích thước: JSON thô của Strava so với mảng kiểu cố định nén zlib, theo từng kênh.
+- Độ trễ: đọc + giải nén một kênh so với mọi kênh; LTTB và min/max ở vài độ phân giải;
+  endpoint /activities/{id}/streams lần đầu (tải từ fake Strava) và các lần sau.
+- Bộ nhớ: đỉnh cấp phát (tracemalloc) khi đọc một kênh, mọi kênh và khi parse JSON thô.
+- Kiểm tra LTTB vector hóa cho cùng kết quả với cài đặt thuần Python.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import activity_service, strava_service, stream_service  # noqa: E402
+from app.utils.security import create_access_token  # noqa: E402
+from tests.fakes import create_app, make_streams  # noqa: E402
+
+
+def reference_lttb(x, y, threshold):
+    # Cài đặt LTTB thuần Python theo bài báo gốc (Steinarsson, 2013), để so sánh
+    n = len(y)
+    edges = [int(v) for v in np.linspace(1, n - 1, threshold - 1)]
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            cx = sum(x[next_start:next_end]) / (next_end - next_start)
+            cy = sum(y[next_start:next_end]) / (next_end - next_start)
+        else:
+            cx, cy = x[n - 1], y[n - 1]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def atimed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def peak_memory(fn):
+    tracemalloc.start()
+    await fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+async def main(hours: float, resolution: int):
+    points = int(hours * 3600)
+    raw = make_streams(1, points)
+
+    print(f"{points} points per channel ({hours:g}h at 1Hz)")
+    json_total = packed_total = 0
+    for channel, values in raw.items():
+        json_size = len(json.dumps(values))
+        packed_size = len(stream_service.pack(channel, values))
+        json_total += json_size
+        packed_total += packed_size
+        print(f"  {channel:10s} json={json_size / 1024:8.1f}KB  packed={packed_size / 1024:7.1f}KB  "
+              f"({json_size / packed_size:4.1f}x)")
+    print(f"  {'total':10s} json={json_total / 1024:8.1f}KB  packed={packed_total / 1024:7.1f}KB  "
+          f"({json_total / packed_total:4.1f}x)")
+
+    time_s = np.asarray(raw["time"])
+    heartrate = np.asarray(raw["heartrate"], dtype=np.float64)
+    fast = stream_service.lttb(time_s, heartrate, resolution).tolist()
+    slow = reference_lttb(raw["time"], [float(v) for v in raw["heartrate"]], resolution)
+    assert fast == slow, "vectorized LTTB differs from the reference implementation"
+    print(f"lttb matches reference implementation ({resolution} points)")
+
+    for threshold in (500, 1000, 2000):
+        lttb_s = timed(lambda: stream_service.lttb(time_s, heartrate, threshold))
+        minmax_s = timed(lambda: stream_service.minmax(heartrate, threshold))
+        print(f"  resolution={threshold:5d}  lttb={lttb_s * 1000:6.2f}ms  minmax={minmax_s * 1000:6.2f}ms")
+    reference_s = timed(lambda: reference_lttb(raw["time"], raw["heartrate"], resolution), repeat=1)
+    print(f"  pure-python lttb at {resolution}: {reference_s * 1000:.1f}ms")
+
+    fake = create_app(num_activities=1, rate_limit=(10 ** 6, 10 ** 7))
+    fake.state.stream_points = points
+    strava_service.start_client(transport=httpx.ASGITransport(app=fake))
+    try:
+        await init_db()
+        async with SessionLocal() as db:
+            user = User(username="bench", email="bench@example.com", is_active=True, is_verified=True,
+                        strava_access_token="access", strava_refresh_token="refresh",
+                        strava_token_expires_at=int(time.time()) + 6 * 3600)
+            db.add(user)
+            await db.commit()
+            await activity_service.ingest_activities(db, user.id, fake.state.activities)
+            await db.commit()
+        activity_id = 1
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+            async def request(**params):
+                response = await client.get(f"/activities/{activity_id}/streams", params=params, headers=headers)
+                assert response.status_code == 200, response.text
+                return response
+
+            started = time.perf_counter()
+            await request(keys="heartrate", resolution=resolution)
+            print(f"endpoint cold (fetch from Strava + store): {(time.perf_counter() - started) * 1000:.1f}ms")
+            for params in ({"keys": "heartrate"}, {"keys": "heartrate", "method": "minmax"},
+                           {"keys": "heartrate,watts,altitude,cadence,latlng"}):
+                elapsed = await atimed(lambda: request(resolution=resolution, **params))
+                print(f"endpoint warm {params}: {elapsed * 1000:.1f}ms")
+
+        async def load(channels):
+            async with SessionLocal() as db:
+                await stream_service.load_streams(db, activity_id, channels)
+
+        for name, channels in (("one channel", ["heartrate"]), ("all channels", list(stream_service.CHANNELS))):
+            elapsed = await atimed(lambda: load(channels))
+            peak = await peak_memory(lambda: load(channels))
+            print(f"load {name:12s} {elapsed * 1000:6.1f}ms  peak={peak / 1024 / 1024:6.2f}MB")
+
+        body = json.dumps({key: {"data": values} for key, values in raw.items()})
+
+        async def parse_json():
+            json.loads(body)
+
+        print(f"parse raw json       peak={await peak_memory(parse_json) / 1024 / 1024:6.2f}MB")
+    finally:
+        await strava_service.close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=10.0)
+    parser.add_argument("--resolution", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.hours, args.resolution))
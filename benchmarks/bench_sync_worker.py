@@ -0,0 +1,152 @@
+# benchmarks/bench_sync_worker.py
+"""Kiểm tra và benchmark worker đồng bộ định kỳ nhiều người dùng
+
+Chạy: python -m benchmarks.bench_sync_worker [--users 200] [--workers 4] [--latency 0.02]
+
+- Sharding: chạy `--workers` tiến trình `python -m app.cli sync-worker` trên cùng
+  DB và fake Strava (mỗi access token có bộ hoạt động riêng). Mỗi người dùng phải
+  được đồng bộ đúng một lần (fake Strava đếm lời gọi theo token), job của token
+  bị thu hồi được hẹn thử lại theo backoff; in số người dùng mỗi worker xử lý.
+- Đồng thời có giới hạn: đánh dấu mọi job đến hạn rồi chạy một chu kỳ trong tiến
+  trình với SYNC_CONCURRENCY 1 và 8, in thời lượng chu kỳ và lag.
+"""
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("BACKFILL_CONCURRENCY", "1")
+os.environ.setdefault("SYNC_BATCH_SIZE", "10")
+os.environ.setdefault("SYNC_POLL_INTERVAL", "0.2")
+# Chỉ đo đồng bộ danh sách hoạt động, không tải streams sau mỗi lần đồng bộ
+os.environ.setdefault("SYNC_STREAMS_PER_RUN", "0")
+
+from sqlalchemy import func, select, update  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models import activity_rollup, activity_stream, sync_job  # noqa: E402,F401  (đăng ký bảng)
+from app.models.activity import Activity  # noqa: E402
+from app.models.sync_job import SyncJob  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import strava_service, sync_service  # noqa: E402
+from tests.fakes import FakeStravaServer, create_app  # noqa: E402
+
+ACTIVITIES_PER_USER = 30
+REVOKED_EVERY = 40
+
+
+async def create_users(count: int):
+    await init_db()
+    expires_at = int(time.time()) + 6 * 3600
+    async with SessionLocal() as db:
+        db.add_all(
+            User(username=f"user{i}", email=f"user{i}@example.com", is_active=True,
+                 strava_access_token=f"revoked-{i}" if i % REVOKED_EVERY == 0 else f"token-{i}",
+                 strava_refresh_token=f"refresh-{i}", strava_token_expires_at=expires_at)
+            for i in range(count)
+        )
+        # Người dùng chưa liên kết Strava không có job
+        db.add(User(username="unlinked", email="unlinked@example.com", is_active=True))
+        await db.commit()
+
+
+async def idle() -> bool:
+    async with SessionLocal() as db:
+        status = await sync_service.get_status(db)
+        leased = await db.scalar(select(func.count()).where(SyncJob.lease_owner.is_not(None)))
+    return status["jobs"] > 0 and status["due"] == 0 and not leased
+
+
+async def run_workers(count: int, fake_url: str, users: int):
+    env = {**os.environ, "STRAVA_BASE_URL": fake_url}
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "app.cli", "sync-worker", "--worker-id", f"w{i}"],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        )
+        for i in range(count)
+    ]
+    started = time.perf_counter()
+    try:
+        deadline = time.time() + 120
+        while not await idle():
+            assert time.time() < deadline, "workers did not finish"
+            await asyncio.sleep(0.2)
+        elapsed = time.perf_counter() - started
+    finally:
+        for worker in workers:
+            worker.terminate()
+    outputs = [worker.communicate()[0] for worker in workers]
+
+    handled = {}
+    for output in outputs:
+        for worker_id, claimed in re.findall(r"Sync cycle (\S+): (\d+) users", output):
+            handled[worker_id] = handled.get(worker_id, 0) + int(claimed)
+    print(f"{count} worker processes synced {users} users in {elapsed:.1f}s; users per worker: "
+          + ", ".join(f"{worker_id}={n}" for worker_id, n in sorted(handled.items())))
+    assert sum(handled.values()) == users, (handled, outputs)
+
+
+async def check(fake, users: int):
+    revoked = [i for i in range(users) if i % REVOKED_EVERY == 0]
+    for i in range(users):
+        token = f"Bearer {'revoked' if i in revoked else 'token'}-{i}"
+        calls = fake.state.calls_by_token.get(token, 0)
+        assert calls == 1, f"user{i} was synced {calls} times"
+
+    async with SessionLocal() as db:
+        stored = await db.scalar(select(func.count(Activity.id)))
+        assert stored == (users - len(revoked)) * ACTIVITIES_PER_USER, stored
+        jobs = {job.user_id: job for job in (await db.execute(select(SyncJob))).scalars()}
+        users_by_name = dict((await db.execute(select(User.username, User.id))).all())
+    assert len(jobs) == users, "one job per linked user"
+    now = time.time()
+    for i in revoked:
+        job = jobs[users_by_name[f"user{i}"]]
+        assert job.failures == 1 and job.last_error, job.last_error
+        assert now + 30 < job.next_run_at <= now + 61, "revoked user retried after SYNC_RETRY_DELAY"
+    ok = [job for job in jobs.values() if not job.failures]
+    assert all(job.next_run_at > now + 3000 and job.last_success_at for job in ok)
+    print(f"every user synced exactly once; {len(revoked)} revoked users rescheduled with backoff")
+
+
+async def concurrency(users: int):
+    strava_service.start_client()
+    try:
+        for value in (1, 8):
+            async with SessionLocal() as db:
+                await db.execute(update(SyncJob).values(next_run_at=int(time.time()) - 60, failures=0))
+                await db.commit()
+            cycle = await sync_service.run_cycle("bench", batch_size=users, concurrency=value)
+            assert cycle.claimed == users
+            print(f"SYNC_CONCURRENCY={value}: cycle of {cycle.claimed} users in {cycle.duration:5.2f}s  "
+                  f"lag max {cycle.max_lag:5.1f}s mean {cycle.mean_lag:5.1f}s")
+    finally:
+        await strava_service.close_client()
+
+
+async def main(users: int, workers: int, latency: float, port: int):
+    fake = create_app(num_activities=ACTIVITIES_PER_USER, latency=latency)
+    fake.state.per_token = True
+    with FakeStravaServer(fake, port) as server:
+        settings.STRAVA_BASE_URL = server.url
+        await create_users(users)
+        await run_workers(workers, server.url, users)
+        await check(fake, users)
+        await concurrency(users)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.workers, args.latency, args.port))
@@ -0,0 +1,98 @@
+# benchmarks/bench_token_refresh.py
+"""Kiểm tra single-flight khi làm mới token và đo tác vụ làm mới nền, dùng fake Strava cục bộ
+
+Chạy: python -m benchmarks.bench_token_refresh [--callers 100] [--users 500]
+
+- `--callers` lời gọi check_and_refresh_token đồng thời cho cùng một người dùng
+  phải tạo ra đúng một request tới /oauth/token.
+- Tác vụ nền làm mới token của `--users` người dùng sắp hết hạn theo lô.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import httpx  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models import activity  # noqa: E402,F401  (đăng ký bảng activities)
+from app.models.user import User  # noqa: E402
+from app.services import auth_service, strava_service  # noqa: E402
+from tests.fakes import create_app  # noqa: E402
+
+
+def expiring_user(i: int):
+    return User(username=f"user{i}", email=f"user{i}@example.com", is_active=True, is_verified=True,
+                strava_access_token="old-access", strava_refresh_token=f"old-refresh-{i}",
+                strava_token_expires_at=int(time.time()) + 60)
+
+
+async def single_flight(fake, callers: int, latency: float):
+    async with SessionLocal() as db:
+        user = expiring_user(0)
+        db.add(user)
+        await db.commit()
+        snapshot = auth_service.CurrentUser.from_user(user)
+
+    fake.state.latency = latency
+    fake.state.calls.clear()
+
+    async def call():
+        async with SessionLocal() as db:
+            return await strava_service.check_and_refresh_token(snapshot, db)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(call() for _ in range(callers)))
+    elapsed = time.perf_counter() - started
+
+    refreshes = fake.state.calls.get("/oauth/token", 0)
+    tokens = {result.strava_access_token for result in results}
+    assert refreshes == 1, f"expected exactly one refresh, got {refreshes}"
+    assert len(tokens) == 1 and "old-access" not in tokens, tokens
+    print(f"single-flight: {callers} concurrent callers -> {refreshes} refresh in {elapsed * 1000:.0f}ms")
+
+
+async def background(fake, users: int, latency: float):
+    async with SessionLocal() as db:
+        db.add_all(expiring_user(i) for i in range(1, users + 1))
+        await db.commit()
+
+    fake.state.latency = latency
+    fake.state.calls.clear()
+
+    started = time.perf_counter()
+    while await strava_service.refresh_expiring_tokens():
+        pass
+    elapsed = time.perf_counter() - started
+
+    async with SessionLocal() as db:
+        stale = await db.scalar(select(func.count(User.id)).where(User.strava_access_token == "old-access"))
+    assert stale == 0, f"{stale} users still have the old token"
+    print(f"background:    {users} users refreshed with {fake.state.calls.get('/oauth/token', 0)} calls "
+          f"in {elapsed:.2f}s (concurrency={settings.TOKEN_REFRESH_CONCURRENCY}, "
+          f"batch={settings.TOKEN_REFRESH_BATCH})")
+
+
+async def main(callers: int, users: int, latency: float):
+    await init_db()
+    fake = create_app(num_activities=0)
+    strava_service.start_client(transport=httpx.ASGITransport(app=fake))
+    try:
+        await single_flight(fake, callers, latency)
+        await background(fake, users, latency)
+    finally:
+        await strava_service.close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--callers", type=int, default=100)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main(args.callers, args.users, args.latency))
@@ -0,0 +1,268 @@
+# benchmarks/bench_training_load.py
+"""Kiểm tra và benchmark chuỗi tải tập luyện (CTL/ATL/TSB) tính tăng dần
+
+Chạy: python -m benchmarks.bench_training_load [--years 10] [--steps 200] [--reads 50]
+
+- Đúng đắn: training_load_service.ewma (vector hóa theo khối) so với vòng lặp
+  Python từng ngày; chuỗi thao tác ngẫu nhiên thêm, sửa (ngày, moving_time, nhịp
+  tim, công suất) và xóa hoạt động xen với các lần đọc; sau mỗi lần ghi chuỗi đã
+  lưu không còn bị đánh dấu và phải khớp với cách tính từ đầu bằng Python thuần.
+- Benchmark trên `--years` năm dữ liệu hằng ngày của một người dùng: ghi hoạt động
+  hôm nay và sửa hoạt động nhiều năm trước (kèm tính lại chuỗi), đọc 90 ngày, so
+  với tính lại toàn bộ lịch sử ở mỗi request.
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import numpy as np  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models.activity import Activity  # noqa: E402
+from app.models.training_load import TrainingLoad  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import activity_service, training_load_service  # noqa: E402
+from tests.fakes import make_activity  # noqa: E402
+
+
+def make_item(activity_id: int, day: date, rng: random.Random) -> dict:
+    """Hoạt động trong ngày với công suất, nhịp tim hoặc chỉ thời gian"""
+    start = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc) + timedelta(minutes=rng.randrange(0, 1440))
+    item = make_activity(activity_id, start)
+    item["moving_time"] = rng.randrange(900, 3 * 3600)
+    kind = rng.random()
+    item["average_watts"] = round(rng.uniform(120, 300), 1) if kind < 0.3 else None
+    item["average_heartrate"] = round(rng.uniform(110, 175), 1) if kind < 0.8 else None
+    return item
+
+
+def python_loads(row) -> float:
+    """Tải của một hoạt động, viết lại bằng Python thuần để đối chứng activity_loads"""
+    moving_time, heartrate, watts = row
+    hours = (moving_time or 0) / 3600
+    if watts is not None and watts > 0:
+        return hours * (watts / settings.TRAINING_FTP) ** 2 * 100
+    if heartrate is not None and heartrate > 0:
+        reserve = (heartrate - settings.TRAINING_REST_HEARTRATE) / (
+            settings.TRAINING_MAX_HEARTRATE - settings.TRAINING_REST_HEARTRATE
+        )
+        reserve = min(max(reserve, 0.0), 1.0)
+        return hours * 60 * reserve * 0.64 * math.exp(1.92 * reserve)
+    return hours * settings.TRAINING_LOAD_PER_HOUR
+
+
+def python_ewma(loads, initial: float, days: int) -> list:
+    values, state = [], initial
+    for load in loads:
+        state += (load - state) / days
+        values.append(state)
+    return values
+
+
+async def naive_training_load(db, user_id: int, start: date, end: date) -> dict:
+    """Cách làm không lưu trạng thái: đọc mọi hoạt động và tính lại cả lịch sử ở mỗi request"""
+    rows = (await db.execute(
+        select(Activity.start_date, Activity.moving_time, Activity.average_heartrate, Activity.average_watts)
+        .where(Activity.user_id == user_id)
+    )).all()
+    daily = {}
+    for row in rows:
+        day = row[0].date()
+        daily[day] = daily.get(day, 0.0) + python_loads(row[1:])
+    first = min(daily) if daily else start
+    first = min(first, start - timedelta(days=1))
+    days = [first + timedelta(days=offset) for offset in range((end - first).days + 1)]
+    loads = [daily.get(day, 0.0) for day in days]
+    ctl = python_ewma(loads, 0.0, settings.TRAINING_CTL_DAYS)
+    atl = python_ewma(loads, 0.0, settings.TRAINING_ATL_DAYS)
+    skip = (start - first).days
+    return {
+        "load": loads[skip:],
+        "ctl": ctl[skip:],
+        "atl": atl[skip:],
+        "tsb": [c - a for c, a in zip(ctl[skip - 1:-1], atl[skip - 1:-1])],
+    }
+
+
+def assert_close(response: list, expected: dict, label: str):
+    """So sánh phản hồi (làm tròn 2 chữ số) với kết quả đối chứng"""
+    for name, want in expected.items():
+        got = np.array([day[name] for day in response])
+        want = np.asarray(want)
+        assert got.shape == want.shape, f"{label} {name}: {got.shape} != {want.shape}"
+        assert np.allclose(got, want, rtol=0, atol=0.0051), f"{label} {name}: max diff {np.abs(got - want).max()}"
+
+
+def check_ewma(seed: int):
+    rng = np.random.default_rng(seed)
+    for size in (0, 1, 5, 127, 128, 129, 1000, 3653):
+        loads = rng.exponential(60, size) * (rng.random(size) < 0.7)
+        initial = float(rng.uniform(0, 120))
+        for days in (settings.TRAINING_ATL_DAYS, settings.TRAINING_CTL_DAYS):
+            expected = python_ewma(loads.tolist(), initial, days)
+            assert np.allclose(training_load_service.ewma(loads, initial, days), expected, rtol=1e-12, atol=1e-12)
+    print("ewma: vectorized blocks match the day-by-day recurrence")
+
+
+async def check_incremental(steps: int, seed: int):
+    rng = random.Random(seed)
+    epoch = date(2020, 1, 1)
+    async with SessionLocal() as db:
+        users = [User(username=f"load{i}", email=f"load{i}@example.com", is_active=True) for i in range(2)]
+        db.add_all(users)
+        await db.commit()
+        user_ids = [user.id for user in users]
+
+    items = {}  # strava_id -> (user_id, item)
+    next_id = 1_000_000
+    reads = 0
+    for step in range(steps):
+        async with SessionLocal() as db:
+            operation = rng.random()
+            if operation < 0.45 or not items:
+                user_id = rng.choice(user_ids)
+                item = make_item(next_id, epoch + timedelta(days=rng.randrange(0, 400)), rng)
+                await activity_service.ingest_activities(db, user_id, [item])
+                items[str(next_id)] = (user_id, item)
+                next_id += 1
+            elif operation < 0.75:
+                strava_id = rng.choice(list(items))
+                user_id, item = items[strava_id]
+                edit = make_item(int(strava_id), epoch + timedelta(days=rng.randrange(0, 400)), rng)
+                field = rng.choice(("start_date", "moving_time", "average_heartrate", "average_watts", "name"))
+                item[field] = edit[field]
+                await activity_service.ingest_activities(db, user_id, [item])
+            else:
+                strava_id = rng.choice(list(items))
+                await activity_service.delete_activities(db, [strava_id])
+                del items[strava_id]
+            await db.commit()
+            assert not (await db.execute(
+                select(TrainingLoad.user_id).where(TrainingLoad.dirty_from.is_not(None))
+            )).all(), f"step {step}: series left dirty"
+
+            if rng.random() < 0.5:
+                user_id = rng.choice(user_ids)
+                start = epoch + timedelta(days=rng.randrange(-30, 420))
+                end = start + timedelta(days=rng.randrange(0, 120))
+                response = await training_load_service.get_training_load(db, user_id, start, end)
+                assert_close(response, await naive_training_load(db, user_id, start, end), f"step {step}")
+                mismatches = await training_load_service.check(db)
+                assert not mismatches, f"step {step}: {mismatches[:3]}"
+                reads += 1
+    async with SessionLocal() as db:
+        await training_load_service.rebuild(db)
+        assert not await training_load_service.check(db)
+        await db.rollback()
+    print(f"incremental: {steps} random inserts/edits/deletes, {reads} reads match a from-scratch Python computation")
+
+
+def median_ms(samples: list) -> float:
+    return statistics.median(samples) * 1000
+
+
+async def benchmark(years: int, reads: int, seed: int):
+    rng = random.Random(seed)
+    today = datetime.utcnow().date()
+    first = today - timedelta(days=365 * years)
+    async with SessionLocal() as db:
+        user = User(username="loadbench", email="loadbench@example.com", is_active=True)
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+    items, next_id = [], 2_000_000
+    for offset in range((today - first).days):
+        day = first + timedelta(days=offset)
+        for _ in range(rng.choice((0, 1, 1, 1, 2))):
+            items.append(make_item(next_id, day, rng))
+            next_id += 1
+    async with SessionLocal() as db:
+        for offset in range(0, len(items), 1000):
+            await activity_service.ingest_activities(db, user_id, items[offset:offset + 1000])
+        await db.commit()
+
+    start, end = today - timedelta(days=89), today
+    timings = {name: [] for name in (
+        "rebuild (full computation)", "read 90 days", "ingest today's activity + recompute",
+        f"ingest edit {years // 2} years ago + recompute", "recompute whole history per request",
+    )}
+    async with SessionLocal() as db:
+        started = time.perf_counter()
+        await training_load_service.rebuild(db, user_id)
+        await db.commit()
+        timings["rebuild (full computation)"].append(time.perf_counter() - started)
+        stored = await db.get(TrainingLoad, user_id)
+        size = len(stored.loads) + len(stored.ctl) + len(stored.atl)
+        print(f"{years} years: {len(items)} activities, {stored.days} days stored in {size / 1024:.0f} KiB")
+
+    old = [item for item in items if item["start_date"] < (today - timedelta(days=365 * years // 2)).isoformat()]
+    for _ in range(reads):
+        async with SessionLocal() as db:
+            item = make_item(next_id, today, rng)
+            next_id += 1
+            started = time.perf_counter()
+            await activity_service.ingest_activities(db, user_id, [item])
+            await db.commit()
+            timings["ingest today's activity + recompute"].append(time.perf_counter() - started)
+
+            item = old[-1 - rng.randrange(0, 30)]
+            item["moving_time"] = rng.randrange(900, 3 * 3600)
+            started = time.perf_counter()
+            await activity_service.ingest_activities(db, user_id, [item])
+            await db.commit()
+            timings[f"ingest edit {years // 2} years ago + recompute"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            response = await training_load_service.get_training_load(db, user_id, start, end)
+            timings["read 90 days"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            expected = await naive_training_load(db, user_id, start, end)
+            timings["recompute whole history per request"].append(time.perf_counter() - started)
+            assert_close(response, expected, "benchmark")
+
+    async with SessionLocal() as db:
+        assert not await training_load_service.check(db, user_id)
+        count = await db.scalar(select(func.count()).select_from(Activity).where(Activity.user_id == user_id))
+    print(f"{reads} rounds of writes and 90-day reads (median), results identical to a full Python recomputation "
+          f"({count} activities)")
+    for name, samples in timings.items():
+        print(f"  {name:44s} {median_ms(samples):8.2f}ms")
+
+    loads = np.random.default_rng(seed).exponential(60, (today - first).days)
+    started = time.perf_counter()
+    for _ in range(20):
+        training_load_service.ewma(loads, 0.0, settings.TRAINING_CTL_DAYS)
+    vectorized = (time.perf_counter() - started) / 20
+    started = time.perf_counter()
+    python_ewma(loads.tolist(), 0.0, settings.TRAINING_CTL_DAYS)
+    python = time.perf_counter() - started
+    print(f"ewma over {len(loads)} days: vectorized {vectorized * 1000:.3f}ms, Python loop {python * 1000:.3f}ms "
+          f"({python / vectorized:.1f}x)")
+
+
+async def main(args):
+    await init_db()
+    check_ewma(args.seed)
+    await check_incremental(args.steps, args.seed)
+    await benchmark(args.years, args.reads, args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
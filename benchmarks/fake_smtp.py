@@ -0,0 +1,105 @@
+# benchmarks/fake_smtp.py
+"""Server SMTP giả lập tối giản để benchmark và kiểm tra worker gửi email
+
+Hỗ trợ EHLO/HELO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, RSET, NOOP, QUIT. Độ trễ
+bắt tay (`handshake_delay`, thay cho TCP + TLS + đăng nhập tới server thật) và độ
+trễ mỗi email (`message_delay`) cấu hình được. Người nhận chứa "bounce" bị từ chối
+vĩnh viễn (550), chứa "tempfail" bị từ chối tạm thời (451).
+"""
+import asyncio
+import threading
+from typing import List
+
+
+class FakeSMTPServer:
+    """Chạy server SMTP trong thread riêng với event loop riêng"""
+
+    def __init__(self, port: int = 8025, handshake_delay: float = 0.05, message_delay: float = 0.002):
+        self.port = port
+        self.handshake_delay = handshake_delay
+        self.message_delay = message_delay
+        self.messages: List[tuple] = []
+        self.connections = 0
+        self.logins = 0
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+
+        async def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await asyncio.sleep(self.handshake_delay / 2)
+        await reply("220 fake-smtp ready")
+        sender, recipients = None, []
+        try:
+            while True:
+                line = (await reader.readline()).decode().rstrip("\r\n")
+                if not line:
+                    break
+                command = line.split(" ", 1)[0].upper()
+                argument = line[len(command):].strip()
+                if command == "EHLO":
+                    writer.write(b"250-fake-smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                    await writer.drain()
+                elif command == "HELO":
+                    await reply("250 fake-smtp")
+                elif command == "AUTH":
+                    if argument.upper().startswith("LOGIN"):
+                        await reply("334 VXNlcm5hbWU6")
+                        await reader.readline()
+                        await reply("334 UGFzc3dvcmQ6")
+                        await reader.readline()
+                    await asyncio.sleep(self.handshake_delay / 2)
+                    self.logins += 1
+                    await reply("235 2.7.0 Authentication successful")
+                elif command == "MAIL":
+                    sender, recipients = argument, []
+                    await reply("250 OK")
+                elif command == "RCPT":
+                    if "bounce" in argument:
+                        await reply("550 5.1.1 User unknown")
+                    elif "tempfail" in argument:
+                        await reply("451 4.3.0 Try again later")
+                    else:
+                        recipients.append(argument)
+                        await reply("250 OK")
+                elif command == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    size = 0
+                    while (chunk := await reader.readline()) not in (b".\r\n", b""):
+                        size += len(chunk)
+                    await asyncio.sleep(self.message_delay)
+                    self.messages.append((sender, recipients, size))
+                    await reply("250 OK queued")
+                elif command in ("RSET", "NOOP"):
+                    await reply("250 OK")
+                elif command == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def start(self) -> "FakeSMTPServer":
+        self._thread.start()
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", self.port), self._loop
+        )
+        self._server = future.result()
+        return self
+
+    def stop(self):
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,85 @@
+# tests/conftest.py
+import os
+import tempfile
+import time
+from datetime import datetime
+from itertools import count
+
+# DB tạm cho cả phiên kiểm thử; phải đặt trước khi import app (settings đọc lúc import)
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import pytest  # noqa: E402
+
+from app.database import Base, SessionLocal, engine, init_db  # noqa: E402
+from app.main import app  # noqa: E402,F401  (đăng ký mọi bảng)
+from app.models.user import User  # noqa: E402
+from app.services import auth_service, detail_service, strava_service  # noqa: E402
+from tests.fakes import make_activity  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db_ready():
+    """DB trống cho mỗi test; đóng HTTP client và kết nối DB (gắn với event loop của test) sau test
+
+    Xóa dữ liệu của test trước và các cache trong tiến trình (id được SQLite cấp lại từ đầu).
+    """
+    await init_db()
+    async with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            await conn.execute(table.delete())
+    auth_service.principal_cache.clear()
+    auth_service._tokens_by_user.clear()
+    detail_service.memory.clear()
+    detail_service._failed.clear()
+    yield
+    await strava_service.close_client()
+    await engine.dispose()
+
+
+
+@pytest.fixture
+def user_factory(db_ready):
+    """Tạo người dùng: `await user_factory(linked=True, **fields)` -> User (tên và email không trùng)
+
+    `linked`: có token Strava còn hạn 6 giờ; `fields` ghi đè các cột.
+    """
+    numbers = count(1)
+
+    async def create(linked: bool = False, **fields) -> User:
+        number = next(numbers)
+        values = {"username": f"user{number}", "email": f"user{number}@example.com", "is_active": True}
+        if linked:
+            values.update(strava_access_token="access", strava_refresh_token="refresh",
+                          strava_token_expires_at=int(time.time()) + 6 * 3600)
+        values.update(fields)
+        async with SessionLocal() as db:
+            user = User(**values)
+            db.add(user)
+            await db.commit()
+            return user
+
+    return create
+
+
+@pytest.fixture
+def activity_factory():
+    """Tạo hoạt động theo định dạng API của Strava: `activity_factory(start, **fields)` -> dict
+
+    id không trùng trong test (và không trùng với id của fake Strava); `fields` ghi đè các trường.
+    """
+    strava_ids = count(1_000_000)
+
+    def create(start: datetime, **fields) -> dict:
+        return {**make_activity(next(strava_ids), start), **fields}
+
+    return create
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: kiểm thử chạy lâu (bỏ qua bằng -m 'not slow')")
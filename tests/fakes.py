@@ -0,0 +1,256 @@
+# tests/fakes.py
+"""Fake Strava API chạy cục bộ cho kiểm thử và benchmark, không cần mạng
+
+Chạy riêng: python -m tests.fakes [--port 8765] [--activities 100]
+"""
+import asyncio
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Form, Request
+from fastapi.responses import JSONResponse
+
+from app.utils.geo import encode_polyline
+
+
+# Một số tuyến lặp lại (vòng quanh các điểm xuất phát khác nhau) để truy vấn trùng tuyến có kết quả
+ROUTES = 7
+
+
+def make_route(activity_id: int) -> np.ndarray:
+    """Tuyến (N, 2) [lat, lng] của một activity: một trong ROUTES vòng chạy, lệch nhẹ theo id"""
+    route = activity_id % ROUTES
+    angle = np.linspace(0, 2 * np.pi, 40)
+    radius = 0.01 + 0.004 * route
+    jitter = (activity_id % 11) * 1e-5
+    lat = 21.0 + 0.05 * route + radius * np.sin(angle) + jitter
+    lng = 105.8 + 0.04 * route + radius * (1 - np.cos(angle)) / np.cos(np.radians(21.0)) + jitter
+    return np.round(np.column_stack([lat, lng]), 5)
+
+
+def make_activity(activity_id: int, start: datetime):
+    """Tạo một activity summary giống định dạng của Strava"""
+    route = make_route(activity_id)
+    return {
+        "id": activity_id,
+        "name": f"Activity {activity_id}",
+        "type": "Run" if activity_id % 3 else "Ride",
+        "start_date": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "distance": 5000.0 + activity_id % 1000,
+        "moving_time": 1500 + activity_id % 600,
+        "elapsed_time": 1600 + activity_id % 600,
+        "total_elevation_gain": float(activity_id % 120),
+        "average_speed": 3.2,
+        "max_speed": 5.1,
+        "average_heartrate": 135.0 + activity_id % 30,
+        "average_watts": 160.0 + activity_id % 80 if activity_id % 3 == 0 else None,
+        "start_latlng": route[0].tolist(),
+        "end_latlng": route[-1].tolist(),
+        "map": {"id": f"a{activity_id}", "summary_polyline": encode_polyline(route)},
+    }
+
+
+def make_detail(activity: dict) -> dict:
+    """Bản chi tiết (DetailedActivity) của một activity summary: mô tả, gear, lap, split và segment effort"""
+    activity_id, moving_time, distance = activity["id"], activity["moving_time"], activity["distance"]
+    kilometres = max(1, int(distance // 1000))
+    split_time = moving_time // kilometres
+    return {
+        **activity,
+        "description": activity.get("description") or f"Easy session #{activity_id}",
+        "calories": round(moving_time * 0.25, 1),
+        "device_name": "Garmin Forerunner 965",
+        "gear_id": "g123",
+        "gear": {"id": "g123", "primary": True, "name": "Daily trainers", "distance": 812345.0},
+        "laps": [
+            {"id": activity_id * 100 + lap, "name": f"Lap {lap + 1}", "lap_index": lap + 1, "distance": 1000.0,
+             "elapsed_time": split_time + 5, "moving_time": split_time, "average_speed": 1000 / split_time}
+            for lap in range(kilometres)
+        ],
+        "splits_metric": [
+            {"split": split + 1, "distance": 1000.0, "elapsed_time": split_time + 5, "moving_time": split_time,
+             "elevation_difference": float(split % 5 - 2), "average_speed": 1000 / split_time, "pace_zone": 2}
+            for split in range(kilometres)
+        ],
+        "segment_efforts": [
+            {"id": activity_id * 1000 + effort, "name": f"Segment {effort}", "elapsed_time": 240 + effort * 30,
+             "moving_time": 235 + effort * 30, "start_index": effort * 300, "end_index": effort * 300 + 240,
+             "segment": {"id": 5000 + effort, "name": f"Segment {effort}", "distance": 800.0 + effort * 100,
+                         "average_grade": 1.5, "city": "Hanoi", "country": "Vietnam"}}
+            for effort in range(3)
+        ],
+    }
+
+
+def make_streams(activity_id: int, points: int):
+    """Tạo streams giả lập (1 điểm/giây) cho một activity, giống định dạng key_by_type của Strava"""
+    rng = np.random.default_rng(activity_id)
+    time_s = np.arange(points)
+    speed = np.clip(3.0 + np.cumsum(rng.normal(0, 0.05, points)), 0.5, 8.0)
+    heading = np.cumsum(rng.normal(0, 0.02, points))
+    lat = 21.0 + np.cumsum(speed * np.cos(heading)) / 111_000
+    lng = 105.8 + np.cumsum(speed * np.sin(heading)) / 104_000
+    return {
+        "time": time_s.tolist(),
+        "distance": np.round(np.cumsum(speed), 1).tolist(),
+        "latlng": np.round(np.column_stack([lat, lng]), 6).tolist(),
+        "altitude": np.round(20 + 10 * np.sin(time_s / 600) + np.cumsum(rng.normal(0, 0.05, points)), 1).tolist(),
+        "heartrate": np.clip(140 + 15 * np.sin(time_s / 900) + rng.normal(0, 3, points), 60, 200).astype(int).tolist(),
+        "cadence": np.clip(85 + rng.normal(0, 4, points), 0, 120).astype(int).tolist(),
+        "watts": np.clip(220 + 60 * np.sin(time_s / 300) + rng.normal(0, 25, points), 0, 1500).astype(int).tolist(),
+    }
+
+
+def create_app(
+        num_activities: int = 100,
+        latency: float = 0.0,
+        spacing_hours: float = 6.0,
+        rate_limit: tuple = (600, 30000)
+):
+    """Tạo ứng dụng fake Strava với số activity, độ trễ và hạn mức cấu hình được"""
+    app = FastAPI()
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    activities = [
+        make_activity(i + 1, now - timedelta(hours=spacing_hours * (num_activities - i)))
+        for i in range(num_activities)
+    ]
+
+    app.state.activities = activities
+    app.state.epochs = [_epoch(a) for a in activities]
+    app.state.index = {a["id"]: i for i, a in enumerate(activities)}
+    app.state.latency = latency
+    app.state.stream_points = None  # số điểm streams; None: một điểm mỗi giây của elapsed_time
+    app.state.calls = {}
+    app.state.calls_by_token = {}  # số lời gọi danh sách hoạt động theo access token
+    app.state.per_token = False  # True: mỗi access token có bộ id hoạt động riêng
+    app.state.token_offsets = {}
+    app.state.connections = set()
+    app.state.rate_limit = rate_limit
+    app.state.usage = [0, 0]
+
+    @app.middleware("http")
+    async def track(request: Request, call_next):
+        app.state.connections.add(tuple(request.scope.get("client") or ()))
+        app.state.calls[request.url.path] = app.state.calls.get(request.url.path, 0) + 1
+        app.state.usage = [app.state.usage[0] + 1, app.state.usage[1] + 1]
+        limit, usage = app.state.rate_limit, app.state.usage
+        headers = {
+            "X-RateLimit-Limit": f"{limit[0]},{limit[1]}",
+            "X-RateLimit-Usage": f"{usage[0]},{usage[1]}",
+        }
+        if usage[0] > limit[0] or usage[1] > limit[1]:
+            return JSONResponse({"message": "Rate Limit Exceeded"}, status_code=429, headers=headers)
+
+        if app.state.latency:
+            await asyncio.sleep(app.state.latency)
+        response = await call_next(request)
+        response.headers.update(headers)
+        return response
+
+    @app.post("/oauth/token")
+    async def token(grant_type: str = Form(...)):
+        return {
+            "token_type": "Bearer",
+            "access_token": f"access-{time.time_ns()}",
+            "refresh_token": f"refresh-{time.time_ns()}",
+            "expires_at": int(time.time()) + 6 * 3600,
+            "athlete": {"id": 1},
+        }
+
+    @app.post("/oauth/deauthorize")
+    async def deauthorize():
+        return {"access_token": "revoked"}
+
+    @app.get("/api/v3/athlete/activities")
+    async def athlete_activities(
+            request: Request, after: int = None, before: int = None, page: int = 1, per_page: int = 30
+    ):
+        token = request.headers.get("Authorization", "")
+        app.state.calls_by_token[token] = app.state.calls_by_token.get(token, 0) + 1
+        if "revoked" in token:
+            return JSONResponse({"message": "Authorization Error"}, status_code=401)
+        epochs = app.state.epochs
+        lo = bisect.bisect_right(epochs, after) if after is not None else 0
+        hi = bisect.bisect_left(epochs, before) if before is not None else len(epochs)
+        items = app.state.activities[lo:hi]
+        if after is None or before is not None:
+            items = list(reversed(items))
+        start = (page - 1) * per_page
+        items = items[start:start + per_page]
+        if app.state.per_token:
+            offset = app.state.token_offsets.setdefault(token, len(app.state.token_offsets) * 10 ** 7)
+            items = [{**item, "id": item["id"] + offset} for item in items]
+        return JSONResponse(items)
+
+    @app.get("/api/v3/activities/{activity_id}")
+    async def activity_detail(activity_id: int):
+        index = app.state.index.get(activity_id)
+        if index is None:
+            return JSONResponse({"message": "Record Not Found"}, status_code=404)
+        return make_detail(app.state.activities[index])
+
+    @app.get("/api/v3/activities/{activity_id}/streams")
+    async def activity_streams(activity_id: int, keys: str = "", key_by_type: bool = True):
+        index = app.state.index.get(activity_id)
+        if index is None:
+            return JSONResponse({"message": "Record Not Found"}, status_code=404)
+        points = app.state.stream_points or app.state.activities[index]["elapsed_time"]
+        streams = make_streams(activity_id, points)
+        wanted = set(keys.split(",")) | {"time", "distance"} if keys else set(streams)
+        return {key: {"data": data, "original_size": points, "resolution": "high", "series_type": "distance"}
+                for key, data in streams.items() if key in wanted}
+
+    return app
+
+
+def _epoch(activity):
+    return int(datetime.strptime(activity["start_date"], "%Y-%m-%dT%H:%M:%SZ")
+               .replace(tzinfo=timezone.utc).timestamp())
+
+
+class FakeStravaServer:
+    """Chạy fake Strava bằng uvicorn trong một thread riêng (HTTPS nếu có chứng chỉ)"""
+
+    def __init__(self, app: FastAPI, port: int = 8765, ssl_certfile: str = None, ssl_keyfile: str = None):
+        self.app = app
+        self.port = port
+        self.scheme = "https" if ssl_certfile else "http"
+        self.server = uvicorn.Server(uvicorn.Config(
+            app, port=port, log_level="warning", ssl_certfile=ssl_certfile, ssl_keyfile=ssl_keyfile
+        ))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self):
+        return f"{self.scheme}://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chạy fake Strava như một tiến trình riêng")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--activities", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="độ trễ mỗi request (giây)")
+    parser.add_argument("--spacing-hours", type=float, default=6.0)
+    parser.add_argument("--rate-limit", default="600,30000", help="hạn mức 15 phút,ngày")
+    parser.add_argument("--per-token", action="store_true", help="mỗi access token có bộ id hoạt động riêng")
+    args = parser.parse_args()
+    fake = create_app(args.activities, args.latency, args.spacing_hours,
+                      tuple(int(x) for x in args.rate_limit.split(",")))
+    fake.state.per_token = args.per_token
+    uvicorn.run(fake, port=args.port, log_level="warning")
@@ -0,0 +1,70 @@
+# tests/reference.py
+"""Cách tính best effort trực tiếp (duyệt mọi cặp điểm) để đối chiếu với best_effort_service"""
+import numpy as np
+
+from app.services import best_effort_service
+
+
+def random_streams(rng: np.random.Generator, points: int, watts: bool = True) -> dict:
+    """Streams 1 mẫu/giây có các đoạn dừng, trùng giây và nhiễu GPS trên quãng đường"""
+    steps = rng.choice([0, 1, 1, 1, 1, 1, 2, 3], size=points - 1)
+    pauses = rng.random(points - 1) < 0.002
+    steps = np.where(pauses, rng.integers(6, 600, size=points - 1), steps)
+    time_s = np.concatenate([[0], np.cumsum(steps)]) + int(rng.integers(0, 5))
+    speed = np.clip(3.0 + np.cumsum(rng.normal(0, 0.05, points)), 0.5, 8.0)
+    distance = np.cumsum(speed * np.concatenate([[0], np.minimum(steps, 3)])) + rng.normal(0, 0.5, points)
+    streams = {"time": time_s.astype(np.int32), "distance": np.round(distance, 1).astype(np.float32)}
+    if watts:
+        streams["watts"] = np.clip(220 + 60 * np.sin(time_s / 300) + rng.normal(0, 25, points), 0, 1500).astype(np.int16)
+    return streams
+
+
+def brute_times(time_s, distance) -> dict:
+    """Duyệt trực tiếp: với mỗi điểm bắt đầu, điểm kết thúc đầu tiên đủ quãng đường"""
+    time_s = [int(t) for t in time_s]
+    cumulative, best_so_far = [], float("-inf")
+    for value in distance.astype(np.float64):
+        best_so_far = max(best_so_far, value)
+        cumulative.append(best_so_far)
+    efforts = {}
+    for name, target in best_effort_service.DISTANCE_EFFORTS.items():
+        best = None
+        for i in range(len(cumulative)):
+            for j in range(i + 1, len(cumulative)):
+                if cumulative[j] >= cumulative[i] + target:
+                    if best is None or time_s[j] - time_s[i] < best[0]:
+                        best = (float(time_s[j] - time_s[i]), time_s[i] - time_s[0], time_s[j] - time_s[0])
+                    break
+        if best is not None:
+            efforts[name] = best
+    return efforts
+
+
+def brute_powers(time_s, watts) -> dict:
+    """Duyệt trực tiếp: công suất từng giây bằng vòng lặp, rồi cộng từng cửa sổ"""
+    time_s = [int(t) for t in time_s]
+    power = [0.0] * (time_s[-1] - time_s[0] + 1)
+    for k in range(len(time_s)):
+        second = time_s[k] - time_s[0]
+        power[second] = float(watts[k])
+        if k + 1 < len(time_s):
+            gap = time_s[k + 1] - time_s[k]
+            for extra in range(1, gap):
+                power[second + extra] = float(watts[k]) if gap <= best_effort_service.POWER_MAX_GAP else 0.0
+    efforts = {}
+    for name, duration in best_effort_service.POWER_EFFORTS.items():
+        best = None
+        for start in range(len(power) - duration + 1):
+            total = sum(power[start:start + duration])
+            if best is None or total > best[0]:
+                best = (total, start)
+        if best is not None:
+            efforts[name] = (best[0] / duration, best[1], best[1] + duration)
+    return efforts
+
+
+def brute_force(streams: dict) -> dict:
+    efforts = brute_times(streams["time"], streams["distance"])
+    if "watts" in streams:
+        efforts.update(brute_powers(streams["time"], streams["watts"]))
+    return efforts
@@ -0,0 +1,62 @@
+# tests/test_services/test_activity_indexes.py
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, insert, text
+
+from app.database import Base
+from app.models.activity import Activity
+from app.models.user import User
+from app.services import activity_service
+
+TODAY = date(2026, 6, 30)
+
+
+@pytest.fixture(scope="module")
+def plans_engine(tmp_path_factory):
+    """DB SQLite nhỏ riêng cho việc kiểm tra query plan, đã ANALYZE"""
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans')}/plans.db")
+    Base.metadata.create_all(engine)
+    rng = random.Random(0)
+    origin = datetime.combine(TODAY, datetime.min.time()) - timedelta(days=365)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"username": f"plan{i}", "email": f"plan{i}@example.com"} for i in range(50)])
+        conn.execute(insert(Activity), [
+            {
+                "strava_id": str(i),
+                "user_id": rng.randrange(1, 51),
+                "name": f"Activity {i}",
+                "type": rng.choice(("Run", "Ride", "Swim", "Walk")),
+                "start_date": origin + timedelta(minutes=rng.randrange(366 * 24 * 60)),
+                "distance": rng.uniform(1000, 40000),
+            }
+            for i in range(5000)
+        ])
+        conn.execute(text("ANALYZE"))
+    yield engine
+    engine.dispose()
+
+
+def query_plan(engine, stmt) -> list:
+    sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+
+
+@pytest.mark.parametrize("start, end, activity_type, index", [
+    (TODAY, TODAY, None, "ix_activities_user_start"),
+    (TODAY - timedelta(days=29), TODAY, None, "ix_activities_user_start"),
+    (TODAY - timedelta(days=29), TODAY, "Run", "ix_activities_user_type_start"),
+    (None, None, "Ride", "ix_activities_user_type_start"),
+])
+@pytest.mark.parametrize("rows", [False, True], ids=["orm", "list-rows"])
+def test_range_queries_use_composite_indexes(plans_engine, start, end, activity_type, index, rows):
+    stmt = activity_service.range_query(7, start, end, activity_type, limit=100)
+    if rows:
+        stmt = activity_service.as_rows(stmt)
+    plan = query_plan(plans_engine, stmt)
+
+    assert any(f"USING INDEX {index} " in step for step in plan), plan
+    assert not any(step.startswith("SCAN") for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
@@ -0,0 +1,39 @@
+# tests/test_services/test_activity_sync.py
+import httpx
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.activity import Activity
+from app.models.user import User
+from app.services import activity_service, strava_service
+from tests.fakes import create_app
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("db_ready")]
+
+
+async def test_recent_sync_reads_every_page_before_marking_fresh(user_factory, monkeypatch):
+    monkeypatch.setattr(settings, "BACKFILL_PER_PAGE", 30)
+    fake = create_app(num_activities=75, spacing_hours=0.05)
+    strava_service.start_client(httpx.ASGITransport(app=fake))
+    user = await user_factory(linked=True)
+
+    await activity_service.sync_recent_activities(user.id, after=0)
+
+    async with SessionLocal() as db:
+        stored = await db.scalar(select(func.count(Activity.id)).where(Activity.user_id == user.id))
+        user = await db.get(User, user.id)
+    assert stored == 75
+    assert fake.state.calls["/api/v3/athlete/activities"] == 3
+    assert user.last_synced_at is not None
+
+
+async def test_recent_sync_of_deleted_user_is_not_found():
+    fake = create_app(num_activities=1)
+    strava_service.start_client(httpx.ASGITransport(app=fake))
+    with pytest.raises(HTTPException) as raised:
+        await activity_service.sync_recent_activities(10 ** 9, after=0)
+    assert raised.value.status_code == 404
+    assert not fake.state.calls
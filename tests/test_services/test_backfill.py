@@ -0,0 +1,69 @@
+# tests/test_services/test_backfill.py
+import asyncio
+import time
+
+import httpx
+import pytest
+from sqlalchemy import update
+
+from app.database import SessionLocal
+from app.models.sync_job import SyncJob
+from app.models.user import User
+from app.services import backfill_service, strava_service
+from tests.fakes import create_app
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("db_ready")]
+
+
+async def reserve(user_id: int):
+    # Mỗi lần gọi một session riêng, như hai worker khác nhau
+    async with SessionLocal() as db:
+        return await backfill_service.reserve(db, user_id)
+
+
+async def progress(user_id: int):
+    async with SessionLocal() as db:
+        return await backfill_service.get_progress(db, user_id)
+
+
+async def test_only_one_worker_reserves_a_backfill(user_factory):
+    user = await user_factory(linked=True)
+    assert await progress(user.id) is None
+
+    reserved = [p for p in await asyncio.gather(*(reserve(user.id) for _ in range(10))) if p is not None]
+    assert len(reserved) == 1
+    assert (await progress(user.id)).running
+
+    async with SessionLocal() as db:
+        await backfill_service.finish(db, reserved[0])
+    assert not (await progress(user.id)).running
+    assert await reserve(user.id) is not None
+
+
+async def test_progress_is_stored_for_every_worker(user_factory):
+    fake = create_app(num_activities=45, spacing_hours=0.05)
+    strava_service.start_client(httpx.ASGITransport(app=fake))
+    user = await user_factory(linked=True)
+
+    async with SessionLocal() as db:
+        user = await db.get(User, user.id)
+        local = await backfill_service.backfill_user(user, db, per_page=10, concurrency=2)
+
+    stored = await progress(user.id)
+    assert stored.to_dict() == local.to_dict()
+    assert (stored.running, stored.error, stored.activities, stored.pages) == (False, None, 45, 5)
+    assert stored.watermark is not None and stored.finished_at >= stored.started_at
+
+
+async def test_expired_lease_is_reported_and_taken_over(user_factory):
+    user = await user_factory(linked=True)
+    assert await reserve(user.id) is not None
+    assert await reserve(user.id) is None
+
+    # Tiến trình giữ lease chết: lease hết hạn mà không được trả
+    async with SessionLocal() as db:
+        await db.execute(update(SyncJob).values(backfill_expires_at=int(time.time()) - 1))
+        await db.commit()
+    stored = await progress(user.id)
+    assert not stored.running and stored.error == "Backfill interrupted"
+    assert await reserve(user.id) is not None
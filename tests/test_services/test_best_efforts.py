@@ -0,0 +1,97 @@
+# tests/test_services/test_best_efforts.py
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models.activity import Activity
+from app.services import activity_service, best_effort_service, stream_service
+from tests.reference import brute_force, random_streams
+
+
+def assert_matches_brute_force(streams: dict):
+    expected, actual = brute_force(streams), best_effort_service.compute(streams)
+    assert expected.keys() == actual.keys()
+    for name, (want, want_start, want_end) in expected.items():
+        got, got_start, got_end = actual[name]
+        assert got == pytest.approx(want, rel=1e-6, abs=1e-6), name
+        assert (got_start, got_end) == (want_start, want_end), name
+    return actual
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_streams_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    points = int(rng.choice([2, 5, 50, 400, 1500]))
+    assert_matches_brute_force(random_streams(rng, points, watts=bool(rng.random() < 0.8)))
+
+
+def steady(seconds: int, speed: float = 4.0, watts: int = 250, start: int = 0, start_distance: float = 0.0) -> dict:
+    time_s = np.arange(start, start + seconds + 1)
+    return {
+        "time": time_s.astype(np.int32),
+        "distance": (start_distance + speed * (time_s - start)).astype(np.float32),
+        "watts": np.full(len(time_s), watts, dtype=np.int16),
+    }
+
+
+def test_activity_shorter_than_targets():
+    # 800 m, 4 phút: chưa đủ 1k và chưa đủ 5 phút công suất
+    assert assert_matches_brute_force(steady(200)) == {}
+    # 3 km, 12.5 phút: chỉ có 1k và 5 phút
+    efforts = assert_matches_brute_force(steady(750))
+    assert set(efforts) == {"1k", "5min"}
+    assert efforts["1k"][0] == 250.0 and efforts["5min"][0] == 250.0
+
+
+def test_pause_in_time_stream():
+    # Chạy 10 phút, dừng 15 phút (không có mẫu), chạy tiếp 10 phút với watts cao hơn
+    before = steady(600, speed=4.0, watts=200)
+    after = steady(600, speed=5.0, watts=300, start=600 + 900, start_distance=float(before["distance"][-1]))
+    streams = {channel: np.concatenate([before[channel], after[channel]]) for channel in before}
+    efforts = assert_matches_brute_force(streams)
+
+    # 1k nhanh nhất nằm trọn trong đoạn sau, không tính thời gian dừng
+    assert efforts["1k"][0] == 200.0 and efforts["1k"][1] >= 1500
+    # 5k phải đi qua đoạn dừng nên tính cả 900 giây dừng (elapsed)
+    assert efforts["5k"][0] > 900
+    # Khoảng trống dài hơn POWER_MAX_GAP được coi là 0 W: 20 phút tốt nhất gồm 601 giây 300 W và phần dừng
+    assert efforts["5min"][0] == pytest.approx(300.0)
+    assert efforts["20min"][0] == pytest.approx(300.0 * 601 / 1200)
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("db_ready")
+async def test_record_moves_to_next_best_when_holder_is_deleted(user_factory, activity_factory):
+    user = await user_factory()
+    async with SessionLocal() as db:
+        start = datetime(2024, 3, 1, 7, tzinfo=timezone.utc)
+        summaries = [activity_factory(start + timedelta(days=day), type="Run") for day in range(3)]
+        await activity_service.ingest_activities(db, user.id, summaries)
+        ids = dict((await db.execute(
+            select(Activity.strava_id, Activity.id).where(Activity.user_id == user.id)
+        )).all())
+        # Nhanh nhất, nhì, ba
+        for summary, speed in zip(summaries, (5.0, 4.0, 3.0)):
+            await stream_service.save_streams(db, ids[str(summary["id"])], steady(1500, speed=speed))
+        await db.commit()
+
+    async def record_holder():
+        async with SessionLocal() as db:
+            assert await best_effort_service.check(db, user.id) == []
+            records = await best_effort_service.get_records(db, user.id, "Run")
+        return {record["effort"]: (record["activity_id"], record.get("elapsed_time")) for record in records}
+
+    assert (await record_holder())["1k"] == (ids[str(summaries[0]["id"])], 200.0)
+    for deleted, (next_best, elapsed) in zip(summaries[:2], ((summaries[1], 250.0), (summaries[2], 334.0))):
+        async with SessionLocal() as db:
+            await activity_service.delete_activities(db, [deleted["id"]])
+            await db.commit()
+        assert (await record_holder())["1k"] == (ids[str(next_best["id"])], elapsed)
+
+    async with SessionLocal() as db:
+        await activity_service.delete_activities(db, [summaries[2]["id"]])
+        await db.commit()
+    assert await record_holder() == {}
@@ -0,0 +1,214 @@
+# tests/test_services/test_email_outbox.py
+import asyncio
+import socket
+import time
+
+import httpx
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from sqlalchemy import delete, select, update
+
+from app.config import settings
+from app.database import SessionLocal
+from app.main import app
+from app.models.email_outbox import EmailOutbox
+from app.models.user import User
+from app.services import email_service
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("db_ready")]
+
+
+class Mailbox:
+    """Handler aiosmtpd: lưu email nhận được; người nhận chứa "bounce" bị từ chối vĩnh viễn (550),
+    chứa "tempfail" bị từ chối tạm thời (451). Đếm số lần đăng nhập để kiểm tra kết nối được dùng lại.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.logins = 0
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if "bounce" in address:
+            return "550 5.1.1 User unknown"
+        if "tempfail" in address:
+            return "451 4.3.0 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.mail_from, tuple(envelope.rcpt_tos)))
+        return "250 OK"
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        self.logins += 1
+        return AuthResult(success=True)
+
+    def recipients(self) -> list:
+        return [to for _, rcpt_tos in self.messages for to in rcpt_tos]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def mailbox(monkeypatch):
+    handler = Mailbox()
+    port = free_port()
+    controller = Controller(handler, hostname="127.0.0.1", port=port,
+                            authenticator=handler.authenticate, auth_require_tls=False)
+    controller.start()
+    monkeypatch.setattr(settings, "SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", port)
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    yield handler
+    controller.stop()
+
+
+@pytest.fixture
+async def outbox(db_ready):
+    """Outbox trống trước mỗi test (DB dùng chung cả phiên)"""
+    async with SessionLocal() as db:
+        await db.execute(delete(EmailOutbox))
+        await db.commit()
+
+
+async def enqueue(*recipients: str):
+    async with SessionLocal() as db:
+        for to_email in recipients:
+            await email_service.enqueue_verification_email(db, to_email, "123456")
+        await db.commit()
+
+
+async def outbox_rows() -> dict:
+    async with SessionLocal() as db:
+        return {row.to_email: row for row in (await db.execute(select(EmailOutbox))).scalars()}
+
+
+async def drain_all(pool) -> int:
+    total = 0
+    while (claimed := await email_service.drain_outbox(pool)):
+        total += claimed
+    return total
+
+
+@pytest.mark.usefixtures("outbox")
+async def test_register_commits_user_and_email_together(monkeypatch):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+        response = await client.post("/auth/register", json={
+            "username": "outbox-ok", "email": "outbox-ok@example.com", "password": "SecurePass456"
+        })
+        assert response.status_code == 201, response.text
+        assert set(await outbox_rows()) == {"outbox-ok@example.com"}
+
+        # Lỗi sau khi tạo người dùng nhưng trước khi commit: không còn người dùng nào thiếu email xác nhận
+        async def broken_enqueue(*args, **kwargs):
+            raise RuntimeError("crash before commit")
+
+        monkeypatch.setattr(email_service, "enqueue_verification_email", broken_enqueue)
+        with pytest.raises(RuntimeError):
+            await client.post("/auth/register", json={
+                "username": "outbox-crash", "email": "outbox-crash@example.com", "password": "SecurePass456"
+            })
+
+    async with SessionLocal() as db:
+        assert (await db.execute(select(User).where(User.username == "outbox-crash"))).first() is None
+        assert (await db.execute(select(User).where(User.username == "outbox-ok"))).first() is not None
+    assert set(await outbox_rows()) == {"outbox-ok@example.com"}
+
+
+@pytest.mark.usefixtures("outbox")
+async def test_concurrent_workers_claim_each_email_once(mailbox):
+    recipients = [f"claim{i}@example.com" for i in range(30)]
+    await enqueue(*recipients)
+    pools = [email_service.create_pool() for _ in range(3)]
+    try:
+        await asyncio.gather(*(drain_all(pool) for pool in pools))
+    finally:
+        await asyncio.gather(*(pool.close() for pool in pools))
+
+    assert sorted(mailbox.recipients()) == sorted(recipients)
+    rows = await outbox_rows()
+    assert all(row.status == "sent" and row.claim_token is None and row.attempts == 0 for row in rows.values())
+
+
+class CrashingPool:
+    """Worker dừng sau khi đã nhận lô nhưng trước khi gửi"""
+
+    async def send_many(self, from_addr, messages):
+        raise RuntimeError("worker crashed")
+
+
+@pytest.mark.usefixtures("outbox")
+async def test_claimed_batch_is_resent_after_lease_expires(mailbox, monkeypatch):
+    monkeypatch.setattr(settings, "EMAIL_LEASE_SECONDS", 1)
+    await enqueue("lease1@example.com", "lease2@example.com")
+    with pytest.raises(RuntimeError):
+        await email_service.drain_outbox(CrashingPool())
+
+    pool = email_service.create_pool()
+    try:
+        # Lô còn trong lease của worker đã dừng: worker khác chưa được nhận
+        assert await email_service.drain_outbox(pool) == 0
+        await asyncio.sleep(1.1)
+        assert await drain_all(pool) == 2
+    finally:
+        await pool.close()
+    assert sorted(mailbox.recipients()) == ["lease1@example.com", "lease2@example.com"]
+
+
+@pytest.mark.usefixtures("outbox")
+async def test_failures_retry_with_backoff(mailbox, monkeypatch):
+    monkeypatch.setattr(settings, "EMAIL_MAX_ATTEMPTS", 3)
+    await enqueue("ok@example.com", "tempfail@example.com", "bounce@example.com")
+    pool = email_service.create_pool()
+    try:
+        now = int(time.time())
+        assert await email_service.drain_outbox(pool) == 3
+        # Email bị hẹn lại chưa đến hạn
+        assert await email_service.drain_outbox(pool) == 0
+
+        rows = await outbox_rows()
+        assert rows["ok@example.com"].status == "sent"
+        assert rows["bounce@example.com"].status == "failed" and rows["bounce@example.com"].attempts == 1
+        tempfail = rows["tempfail@example.com"]
+        assert tempfail.status == "pending" and tempfail.attempts == 1 and "451" in tempfail.last_error
+        assert now + settings.EMAIL_RETRY_DELAY <= tempfail.available_at <= now + settings.EMAIL_RETRY_DELAY + 2
+
+        delays = []
+        for attempt in (2, 3):
+            async with SessionLocal() as db:
+                await db.execute(update(EmailOutbox).where(EmailOutbox.id == tempfail.id).values(available_at=0))
+                await db.commit()
+            now = int(time.time())
+            assert await email_service.drain_outbox(pool) == 1
+            tempfail = (await outbox_rows())["tempfail@example.com"]
+            assert tempfail.attempts == attempt
+            delays.append(tempfail.available_at - now)
+    finally:
+        await pool.close()
+
+    assert settings.EMAIL_RETRY_DELAY * 2 <= delays[0] <= settings.EMAIL_RETRY_DELAY * 2 + 2
+    # Hết số lần thử: không gửi lại nữa
+    assert tempfail.status == "failed"
+    assert mailbox.recipients() == ["ok@example.com"]
+
+
+@pytest.mark.usefixtures("outbox")
+async def test_pool_reuses_connections_across_batches(mailbox, monkeypatch):
+    monkeypatch.setattr(settings, "SMTP_POOL_SIZE", 2)
+    monkeypatch.setattr(settings, "EMAIL_BATCH_SIZE", 10)
+    recipients = [f"pooled{i}@example.com" for i in range(40)]
+    await enqueue(*recipients)
+    pool = email_service.create_pool()
+    try:
+        assert await drain_all(pool) == 40
+    finally:
+        await pool.close()
+
+    assert sorted(mailbox.recipients()) == sorted(recipients)
+    # 4 lô, 40 email: mỗi kết nối của pool chỉ đăng nhập một lần
+    assert mailbox.logins == 2
@@ -0,0 +1,126 @@
+# tests/test_services/test_export.py
+import csv
+import gc
+import gzip
+import io
+import json
+import os
+import random
+import zlib
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+
+from app.database import SessionLocal
+from app.models.activity import Activity
+from app.services import activity_service, export_service
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("db_ready")]
+
+ORIGIN = datetime(2012, 1, 1)
+NAMES = ("Morning run", 'Chạy "tempo", 10km', "Ride\nwith newline", "Đạp xe ☀️", "")
+
+
+async def export_user(user_factory, name: str, rows: int) -> int:
+    """Người dùng có `rows` hoạt động sinh ngẫu nhiên (tên có dấu phẩy, ngoặc kép, xuống dòng, giá trị NULL)"""
+    user = await user_factory()
+    async with SessionLocal() as db:
+        rng = random.Random(rows)
+        for offset in range(0, rows, 50_000):
+            # Ghi bằng bảng (Core): ORM tách lô thành nhiều câu lệnh theo các cột NULL của từng dòng
+            await db.execute(insert(Activity.__table__), [
+                {
+                    "strava_id": f"{name}-{offset + i}",
+                    "user_id": user.id,
+                    "name": rng.choice(NAMES) + f" #{offset + i}",
+                    "type": rng.choice(("Run", "Ride", None)),
+                    "start_date": ORIGIN + timedelta(minutes=13 * (offset + i)),
+                    "distance": rng.uniform(1000, 40000),
+                    "moving_time": rng.randrange(600, 14400),
+                    "elapsed_time": rng.randrange(600, 16000),
+                    "total_elevation_gain": rng.uniform(0, 500) if i % 7 else None,
+                    "average_speed": rng.uniform(2, 9),
+                    "max_speed": rng.uniform(5, 15),
+                }
+                for i in range(min(50_000, rows - offset))
+            ])
+        await db.commit()
+        return user.id
+
+
+async def expected_rows(user_id: int) -> list:
+    async with SessionLocal() as db:
+        result = await db.execute(activity_service.as_rows(activity_service.range_query(user_id)))
+        return [dict(zip(activity_service.EXPORT_COLUMNS, row)) for row in result.all()]
+
+
+def parse(data: bytes, export_format: str) -> list:
+    """Đọc lại file xuất thành danh sách dict với kiểu giá trị như trong DB"""
+    text = data.decode()
+    if export_format == "ndjson":
+        items = [json.loads(line) for line in text.splitlines()]
+    else:
+        reader = csv.DictReader(io.StringIO(text, newline=""))
+        assert tuple(reader.fieldnames) == activity_service.EXPORT_COLUMNS
+        items = []
+        for item in reader:
+            for column in ("id", "moving_time", "elapsed_time"):
+                item[column] = int(item[column])
+            for column in ("distance", "total_elevation_gain", "average_speed", "max_speed"):
+                item[column] = float(item[column]) if item[column] else None
+            item["type"] = item["type"] or None
+            items.append(item)
+    for item in items:
+        item["start_date"] = datetime.fromisoformat(item["start_date"])
+    return items
+
+
+@pytest.mark.parametrize("compress", [False, True], ids=["plain", "gzip"])
+@pytest.mark.parametrize("export_format", ["ndjson", "csv"])
+async def test_export_round_trips(user_factory, export_format, compress):
+    user_id = await export_user(user_factory, f"export-{export_format}-{compress}", 2500)
+    data = b"".join([chunk async for chunk in export_service.export_chunks(user_id, export_format, compress)])
+    if compress:
+        data = gzip.decompress(data)
+    assert parse(data, export_format) == await expected_rows(user_id)
+
+
+def rss() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def stream_peak(user_id: int, export_format: str, compress: bool) -> tuple:
+    """Tải file xuất theo luồng (không giữ lại nội dung), trả về (số dòng, mức tăng RSS đỉnh so với trước khi xuất)"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if compress else None
+    lines = 0
+    gc.collect()
+    baseline = peak = rss()
+    async for chunk in export_service.export_chunks(user_id, export_format, compress):
+        lines += (decompressor.decompress(chunk) if compress else chunk).count(b"\n")
+        peak = max(peak, rss())
+    return lines, peak - baseline
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="đọc RSS từ /proc (Linux)")
+@pytest.mark.parametrize("export_format, compress", [("csv", False), ("ndjson", True)], ids=["csv", "ndjson-gzip"])
+async def test_export_memory_does_not_grow_with_rows(user_factory, export_format, compress):
+    small, large = 20_000, 500_000
+    sizes = {}
+    for rows in (small, large):
+        user_id = await export_user(user_factory, f"export-memory-{rows}", rows)
+        lines, peak = await stream_peak(user_id, export_format, compress)
+        # Tên có xuống dòng nằm trong chuỗi JSON đã escape hoặc trong trường CSV có ngoặc kép
+        async with SessionLocal() as db:
+            newlines = len((await db.execute(
+                select(Activity.id).where(Activity.user_id == user_id, Activity.name.contains("\n"))
+            )).all())
+        header = 1 if export_format == "csv" else 0
+        assert lines == rows + header + (newlines if export_format == "csv" else 0)
+        sizes[rows] = peak
+
+    # 25 lần số dòng nhưng RSS đỉnh gần như không đổi (chỉ phụ thuộc EXPORT_BATCH_SIZE)
+    assert sizes[large] < sizes[small] + 16 * 1024 * 1024, sizes
+    assert sizes[large] < 64 * 1024 * 1024, sizes
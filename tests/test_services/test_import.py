@@ -0,0 +1,81 @@
+# tests/test_services/test_import.py
+import csv
+import io
+import os
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import import_service
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("db_ready")]
+
+EPOCH = datetime(2023, 5, 1, 6, tzinfo=timezone.utc)
+HEADER = ["Activity ID", "Activity Date", "Activity Name", "Activity Type", "Filename"]
+
+
+def crash_or_parse(filename: str, data: bytes) -> dict:
+    """parse_file, nhưng tiến trình con chết ngay khi gặp file crash.gpx (chạy trong pool)"""
+    if filename.endswith("crash.gpx"):
+        os._exit(1)
+    return import_service.parse_file(filename, data)
+
+
+def gpx(start: datetime) -> bytes:
+    points = "".join(
+        f'<trkpt lat="{10 + i * 1e-4}" lon="{20 + i * 1e-4}"><ele>{5 + i}</ele>'
+        f"<time>{(start + timedelta(seconds=i)).strftime('%Y-%m-%dT%H:%M:%SZ')}</time></trkpt>"
+        for i in range(60)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+        f"<trk><trkseg>{points}</trkseg></trk></gpx>"
+    ).encode()
+
+
+def archive(first_id: int, filenames: list) -> io.BytesIO:
+    buffer, rows = io.BytesIO(), io.StringIO()
+    writer = csv.writer(rows)
+    writer.writerow(HEADER)
+    with zipfile.ZipFile(buffer, "w") as output:
+        for offset, filename in enumerate(filenames):
+            start = EPOCH + timedelta(days=offset)
+            writer.writerow([first_id + offset, start.strftime(import_service.CSV_DATE_FORMAT),
+                             f"Run {offset}", "Run", filename])
+            output.writestr(filename, gpx(start))
+        output.writestr(import_service.ACTIVITIES_CSV, rows.getvalue())
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture
+async def importer(user_factory):
+    yield (await user_factory()).id
+    await import_service.shutdown_pool()
+
+
+async def test_imports_share_one_pool(importer):
+    pool = import_service.start_pool(2)
+    report = await import_service.import_archive(archive(8_100_000, ["activities/a.gpx", "activities/b.gpx"]), importer)
+    assert (report.imported, report.files_parsed, report.files_failed) == (2, 2, 0)
+    report = await import_service.import_archive(archive(8_100_010, ["activities/c.gpx"]), importer)
+    assert report.imported == 1
+    assert import_service.start_pool() is pool
+
+
+async def test_worker_crash_aborts_import_and_replaces_pool(importer, monkeypatch):
+    filenames = ["activities/a.gpx", "activities/crash.gpx", "activities/c.gpx"]
+    pool = import_service.start_pool(1)
+    monkeypatch.setattr(import_service, "parse_file", crash_or_parse)
+    with pytest.raises(HTTPException) as raised:
+        await import_service.import_archive(archive(8_200_000, filenames), importer, batch_size=1)
+    assert raised.value.status_code == 503
+    assert "after 1 activities" in raised.value.detail
+
+    # Pool hỏng đã được bỏ; lần nhập lại bỏ qua lô đã ghi và nhập phần còn lại
+    monkeypatch.undo()
+    report = await import_service.import_archive(archive(8_200_000, filenames), importer, batch_size=1)
+    assert import_service.start_pool() is not pool
+    assert (report.skipped_existing, report.imported, report.files_failed) == (1, 2, 0)
@@ -0,0 +1,83 @@
+# tests/test_services/test_rollups.py
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models.activity_rollup import ActivityRollup
+from app.services import activity_service, rollup_service
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("db_ready")]
+
+
+def at(year: int, month: int, day: int, hour: int = 7) -> datetime:
+    return datetime(year, month, day, hour, tzinfo=timezone.utc)
+
+
+async def ingest(user_id: int, items: list):
+    async with SessionLocal() as db:
+        await activity_service.ingest_activities(db, user_id, items)
+        await db.commit()
+        assert await rollup_service.check(db, user_id) == []
+
+
+async def delete(user_id: int, items: list):
+    async with SessionLocal() as db:
+        await activity_service.delete_activities(db, [item["id"] for item in items])
+        await db.commit()
+        assert await rollup_service.check(db, user_id) == []
+
+
+async def test_insert_update_delete_match_full_aggregation(user_factory, activity_factory):
+    user_id = (await user_factory()).id
+    items = [activity_factory(at(2023, 12, 28) + timedelta(days=day)) for day in range(10)]
+    await ingest(user_id, items)
+
+    # Sửa số liệu, đổi loại và dời ngày qua ranh giới tuần, tháng và năm
+    items[0] = {**items[0], "distance": items[0]["distance"] + 1234.5, "moving_time": 4000}
+    items[1] = {**items[1], "type": "Swim"}
+    items[2] = {**items[2], "start_date": "2024-01-02T07:00:00Z"}
+    items[5] = {**items[5], "start_date": "2023-12-31T23:30:00Z", "type": "Ride"}
+    await ingest(user_id, items)
+
+    # Lô trộn hoạt động mới và hoạt động đã có; lặp lại lô không đổi gì
+    items.append(activity_factory(at(2024, 2, 29)))
+    await ingest(user_id, items[-3:])
+    await ingest(user_id, items[-3:])
+
+    await delete(user_id, items[:4])
+    await delete(user_id, items[4:])
+    async with SessionLocal() as db:
+        rows = await db.execute(select(ActivityRollup).where(ActivityRollup.user_id == user_id))
+        assert rows.first() is None
+
+
+async def test_random_operations_match_full_aggregation(user_factory, activity_factory):
+    rng = random.Random(12)
+    user_ids = [(await user_factory()).id for _ in range(2)]
+    owned = {}  # strava_id -> (user_id, item)
+    for _ in range(150):
+        operation = rng.random()
+        if operation < 0.45 or not owned:
+            user_id = rng.choice(user_ids)
+            batch = [activity_factory(at(2022, 1, 1) + timedelta(hours=rng.randrange(0, 24 * 800)))
+                     for _ in range(rng.randrange(1, 4))]
+            owned.update({item["id"]: (user_id, item) for item in batch})
+            await ingest(user_id, batch)
+        elif operation < 0.8:
+            strava_id = rng.choice(list(owned))
+            user_id, item = owned[strava_id]
+            field = rng.choice(("start_date", "type", "distance", "moving_time", "total_elevation_gain"))
+            changed = activity_factory(at(2022, 1, 1) + timedelta(hours=rng.randrange(0, 24 * 800)))
+            item = {**item, field: changed[field] if field != "type" else rng.choice(("Run", "Ride", "Walk"))}
+            owned[strava_id] = (user_id, item)
+            await ingest(user_id, [item])
+        else:
+            strava_id = rng.choice(list(owned))
+            user_id, item = owned.pop(strava_id)
+            await delete(user_id, [item])
+
+    async with SessionLocal() as db:
+        assert await rollup_service.check(db) == []
@@ -0,0 +1,138 @@
+# tests/test_services/test_streams.py
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.activity import Activity
+from app.services import (
+    activity_service, auth_service, best_effort_service, strava_service, stream_service, sync_service
+)
+from tests.fakes import create_app
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("db_ready")]
+
+SIZE = 600
+
+
+def dropout_streams() -> dict:
+    """Streams dạng key_by_type có các đoạn null như khi cảm biến mất tín hiệu"""
+    heartrate = [130 + i % 20 for i in range(SIZE)]
+    cadence = [85] * SIZE
+    watts = [200 + i % 50 for i in range(SIZE)]
+    latlng = [[52.0 + i * 1e-5, 4.0 + i * 1e-5] for i in range(SIZE)]
+    heartrate[:5] = [None] * 5
+    heartrate[100:140] = [None] * 40
+    cadence[-3:] = [None] * 3
+    watts[300] = None
+    latlng[50] = None
+    return {
+        "time": {"data": list(range(SIZE))},
+        "distance": {"data": [i * 3.5 for i in range(SIZE)]},
+        "heartrate": {"data": heartrate},
+        "cadence": {"data": cadence},
+        "watts": {"data": watts},
+        "latlng": {"data": latlng},
+        "altitude": {"data": [None] * SIZE},
+    }
+
+
+class StreamsEndpoint:
+    def __init__(self, responses: dict):
+        self.responses = responses
+        self.calls = Counter()
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        strava_id = int(request.url.path.split("/")[-2])
+        self.calls[strava_id] += 1
+        return httpx.Response(200, json=self.responses[strava_id])
+
+
+@pytest.fixture
+def setup_activities(user_factory, activity_factory):
+    """`await setup_activities(strava_ids)` -> (người dùng đã liên kết Strava, các hoạt động đã ghi)"""
+    async def setup(strava_ids) -> tuple:
+        user = await user_factory(linked=True)
+        start = datetime(2024, 5, 1, 7, tzinfo=timezone.utc)
+        async with SessionLocal() as db:
+            await activity_service.ingest_activities(
+                db, user.id, [activity_factory(start + timedelta(days=i), id=strava_id)
+                              for i, strava_id in enumerate(strava_ids)]
+            )
+            await db.commit()
+            activities = (await db.execute(
+                select(Activity).where(Activity.user_id == user.id).order_by(Activity.strava_id)
+            )).scalars().all()
+        return auth_service.CurrentUser.from_user(user), activities
+
+    return setup
+
+
+async def test_null_samples_are_filled_before_packing(setup_activities):
+    endpoint = StreamsEndpoint({910001: dropout_streams()})
+    strava_service.start_client(httpx.MockTransport(endpoint))
+    user, (activity,) = await setup_activities([910001])
+
+    async with SessionLocal() as db:
+        view = await stream_service.get_stream_view(db, user, activity, list(stream_service.CHANNELS), method="none")
+    streams = view["streams"]
+    assert view["original_size"] == SIZE
+    assert "altitude" not in streams  # kênh chỉ gồm null không được lưu
+    assert streams["heartrate"]["y"][:5] == [130 + 5] * 5
+    assert streams["heartrate"]["y"][100:140] == [130 + 99 % 20] * 40
+    assert streams["cadence"]["y"][-3:] == [85] * 3
+    assert streams["watts"]["y"][300] == 200 + 299 % 50
+    assert streams["latlng"]["y"][50] == pytest.approx([52.0 + 49e-5, 4.0 + 49e-5])
+
+    async with SessionLocal() as db:
+        efforts = await best_effort_service.get_activity_efforts(db, activity.id)
+    power = [effort for effort in efforts if "average_watts" in effort]
+    assert power and all(np.isfinite(effort["average_watts"]) for effort in power)
+    assert endpoint.calls[910001] == 1
+
+
+async def test_activity_without_streams_is_fetched_once(setup_activities):
+    endpoint = StreamsEndpoint({920001: {}})
+    strava_service.start_client(httpx.MockTransport(endpoint))
+    user, (activity,) = await setup_activities([920001])
+
+    for _ in range(3):
+        async with SessionLocal() as db:
+            view = await stream_service.get_stream_view(db, user, activity, ["heartrate"])
+        assert view["streams"] == {} and view["original_size"] == 0
+
+    async with SessionLocal() as db:
+        assert await stream_service.has_streams(db, activity.id)
+        activity = await db.get(Activity, activity.id)
+        assert activity.best_efforts_version == best_effort_service.VERSION
+    assert endpoint.calls[920001] == 1
+
+
+async def test_sync_fetches_missing_streams_in_the_background(setup_activities, monkeypatch):
+    monkeypatch.setattr(settings, "SYNC_STREAMS_PER_RUN", 4)
+    fake = create_app(num_activities=6)
+    strava_service.start_client(httpx.ASGITransport(app=fake))
+    # Hoạt động cũ đã bị xóa trên Strava: streams trả 404, được lưu dòng đánh dấu
+    user, (gone,) = await setup_activities([930001])
+
+    processed = []
+    for _ in range(3):
+        await sync_service.sync_user(user.id)
+        async with SessionLocal() as db:
+            processed.append(await db.scalar(
+                select(func.count(Activity.id))
+                .where(Activity.user_id == user.id, Activity.best_efforts_version.is_not(None))
+            ))
+    streams_calls = sum(count for path, count in fake.state.calls.items() if path.endswith("/streams"))
+    assert processed == [4, 7, 7]
+    assert streams_calls == 7
+
+    async with SessionLocal() as db:
+        assert await stream_service.has_streams(db, gone.id)
+        records = await best_effort_service.get_records(db, user.id)
+    assert records
@@ -0,0 +1,129 @@
+# tests/test_services/test_token_refresh.py
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.database import SessionLocal
+from app.models.user import User
+from app.services import auth_service, strava_service
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("db_ready")]
+
+
+class TokenEndpoint:
+    """Endpoint /oauth/token giả: đếm số lần làm mới, trả token mới sau độ trễ nhỏ"""
+
+    def __init__(self, latency: float = 0.05, failures=()):
+        self.latency = latency
+        self.calls = 0
+        # Kết quả của các lần gọi đầu: mã lỗi HTTP hoặc lớp lỗi httpx
+        self.failures = list(failures)
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/oauth/token"
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, int):
+                return httpx.Response(failure, json={"message": "error"})
+            raise failure("simulated", request=request)
+        return httpx.Response(200, json={
+            "access_token": f"new-access-{self.calls}",
+            "refresh_token": f"new-refresh-{self.calls}",
+            "expires_at": int(time.time()) + 6 * 3600,
+        })
+
+
+@pytest.fixture
+def expiring_user(user_factory):
+    """Người dùng có token Strava hết hạn sau 60 giây (cần làm mới)"""
+    return lambda: user_factory(strava_access_token="old-access", strava_refresh_token="old-refresh",
+                                strava_token_expires_at=int(time.time()) + 60)
+
+
+async def test_concurrent_callers_share_one_refresh(expiring_user):
+    endpoint = TokenEndpoint()
+    strava_service.start_client(httpx.MockTransport(endpoint))
+    snapshot = auth_service.CurrentUser.from_user(await expiring_user())
+
+    async def call():
+        async with SessionLocal() as db:
+            return await strava_service.check_and_refresh_token(snapshot, db)
+
+    results = await asyncio.gather(*(call() for _ in range(100)))
+
+    assert endpoint.calls == 1
+    assert {result.strava_access_token for result in results} == {"new-access-1"}
+    async with SessionLocal() as db:
+        stored = await db.get(User, snapshot.id)
+        assert stored.strava_refresh_token == "new-refresh-1"
+
+
+async def test_fresh_token_is_not_refreshed(expiring_user):
+    endpoint = TokenEndpoint()
+    strava_service.start_client(httpx.MockTransport(endpoint))
+    user = await expiring_user()
+    async with SessionLocal() as db:
+        user = await db.get(User, user.id)
+        user.strava_token_expires_at = int(time.time()) + 6 * 3600
+        await db.commit()
+        assert await strava_service.check_and_refresh_token(user, db) is user
+    assert endpoint.calls == 0
+
+
+async def test_deleted_user_is_reported_not_crashed(expiring_user):
+    endpoint = TokenEndpoint()
+    strava_service.start_client(httpx.MockTransport(endpoint))
+    user = await expiring_user()
+    snapshot = auth_service.CurrentUser.from_user(user)
+    async with SessionLocal() as db:
+        await db.delete(await db.get(User, user.id))
+        await db.commit()
+
+    async with SessionLocal() as db:
+        with pytest.raises(HTTPException) as error:
+            await strava_service.check_and_refresh_token(snapshot, db)
+    assert error.value.status_code == 404
+    assert endpoint.calls == 0
+
+
+async def test_deauthorized_user_is_not_refreshed(expiring_user):
+    endpoint = TokenEndpoint()
+    strava_service.start_client(httpx.MockTransport(endpoint))
+    user = await expiring_user()
+    snapshot = auth_service.CurrentUser.from_user(user)
+    async with SessionLocal() as db:
+        stored = await db.get(User, user.id)
+        stored.strava_access_token = stored.strava_refresh_token = stored.strava_token_expires_at = None
+        await db.commit()
+
+    async with SessionLocal() as db:
+        refreshed = await strava_service.check_and_refresh_token(snapshot, db)
+    assert refreshed.strava_access_token is None
+    assert endpoint.calls == 0
+
+
+@pytest.mark.parametrize("failure", [502, httpx.ReadError, httpx.ReadTimeout])
+async def test_token_request_is_not_replayed_after_it_may_have_reached_strava(failure, monkeypatch):
+    monkeypatch.setattr(strava_service.scheduler, "backoff_base", 0.001)
+    endpoint = TokenEndpoint(latency=0, failures=[failure, failure])
+    strava_service.start_client(httpx.MockTransport(endpoint))
+    with pytest.raises((HTTPException, httpx.TransportError)):
+        await strava_service.refresh_token("old-refresh")
+    with pytest.raises((HTTPException, httpx.TransportError)):
+        await strava_service.exchange_code_for_token("code")
+    assert endpoint.calls == 2
+
+
+@pytest.mark.parametrize("failure", [429, httpx.ConnectError])
+async def test_token_request_is_retried_when_strava_did_not_process_it(failure, monkeypatch):
+    monkeypatch.setattr(strava_service.scheduler, "backoff_base", 0.001)
+    endpoint = TokenEndpoint(latency=0, failures=[failure])
+    strava_service.start_client(httpx.MockTransport(endpoint))
+    tokens = await strava_service.refresh_token("old-refresh")
+    assert tokens["refresh_token"] == "new-refresh-2"
+    assert endpoint.calls == 2
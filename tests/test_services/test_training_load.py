@@ -0,0 +1,88 @@
+# tests/test_services/test_training_load.py
+import random
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import event, select
+
+from app.database import SessionLocal, engine
+from app.models.training_load import TrainingLoad
+from app.services import activity_service, training_load_service
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("db_ready")]
+
+
+def activity(activity_factory, day: date, rng: random.Random) -> dict:
+    """Hoạt động trong ngày với moving_time và (thường có) nhịp tim ngẫu nhiên"""
+    start = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc) + timedelta(hours=rng.randrange(24))
+    return activity_factory(
+        start,
+        moving_time=rng.randrange(900, 3 * 3600),
+        average_heartrate=round(rng.uniform(110, 175), 1) if rng.random() < 0.7 else None,
+    )
+
+
+async def assert_current(db, user_id: int):
+    """Chuỗi đã lưu không còn bị đánh dấu và khớp với tính lại từ đầu"""
+    dirty = await db.scalar(select(TrainingLoad.dirty_from).where(TrainingLoad.user_id == user_id))
+    assert dirty is None
+    assert await training_load_service.check(db, user_id) == []
+
+
+async def test_writes_recompute_series(user_factory, activity_factory):
+    rng = random.Random(24)
+    epoch = date(2021, 1, 1)
+    user_id = (await user_factory()).id
+    items = {}
+    for _ in range(60):
+        async with SessionLocal() as db:
+            operation = rng.random()
+            if operation < 0.5 or not items:
+                item = activity(activity_factory, epoch + timedelta(days=rng.randrange(300)), rng)
+                items[item["id"]] = item
+                await activity_service.ingest_activities(db, user_id, [item])
+            elif operation < 0.8:
+                item = items[rng.choice(list(items))]
+                edit = activity(activity_factory, epoch + timedelta(days=rng.randrange(300)), rng)
+                field = rng.choice(("start_date", "moving_time", "average_heartrate"))
+                item[field] = edit[field]
+                await activity_service.ingest_activities(db, user_id, [item])
+            else:
+                await activity_service.delete_activities(db, [items.pop(rng.choice(list(items)))["id"]])
+            await db.commit()
+            await assert_current(db, user_id)
+
+
+async def test_read_does_not_write(user_factory, activity_factory):
+    rng = random.Random(7)
+    user_id = (await user_factory()).id
+    items = [activity(activity_factory, date(2022, 3, 1) + timedelta(days=day), rng) for day in range(200)]
+    async with SessionLocal() as db:
+        await activity_service.ingest_activities(db, user_id, items)
+        # Dấu dirty_from còn sót (như dữ liệu ghi trước khi tính lại lúc ghi): lần đọc
+        # vẫn trả chuỗi đúng nhưng không ghi phần tính lại
+        await training_load_service.mark_dirty(db, {user_id: date(2022, 5, 1)})
+        await db.commit()
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.lstrip().split(None, 1)[0].upper())
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        async with SessionLocal() as db:
+            start, end = date(2022, 4, 1), date(2022, 10, 31)
+            response = await training_load_service.get_training_load(db, user_id, start, end)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+    assert statements and set(statements) <= {"SELECT"}, statements
+
+    async with SessionLocal() as db:
+        expected = training_load_service.window(await training_load_service.compute(db, user_id), start, end)
+        assert await db.scalar(
+            select(TrainingLoad.dirty_from).where(TrainingLoad.user_id == user_id)
+        ) == date(2022, 5, 1)
+    for name, values in expected.items():
+        assert np.allclose([day[name] for day in response], values, rtol=0, atol=0.0051), name